@@ -0,0 +1,134 @@
+# coding=utf-8
+"""
+Compare writing, building and reading a synthetic project stored as a
+directory tree with the same project stored as an archive
+
+Usage: python benchmarks/archive.py [OBJECTS ...]
+
+"""
+import argparse
+import os
+from os import path
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import build as build_benchmark  # noqa: E402
+from pg_lifecycle import (archive, build, common, generate, manifest,  # noqa
+                          project, writer)
+
+
+def render(count):
+    """Return the content and manifest records of a project with ``count``
+    tables spread over 20 schemas
+
+    """
+    contents, files = [], []
+    for offset in range(0, 20):
+        schema = 'schema_{}'.format(offset)
+        filename = path.join('schemata', '{}.sql'.format(schema))
+        contents.append((filename, 'CREATE SCHEMA {};\n'.format(schema)))
+        files.append(generate.DDLFile(offset + 1, filename, set(), set()))
+    for dump_id in range(21, count + 21):
+        schema = 'schema_{}'.format(dump_id % 20)
+        filename = path.join('tables', schema, 'table_{}.sql'.format(dump_id))
+        contents.append((filename, build_benchmark.TABLE.format(
+            schema=schema, id=dump_id)))
+        files.append(generate.DDLFile(
+            dump_id, filename, {count + dump_id * 2, count + dump_id * 2 + 1},
+            {dump_id % 20 + 1}))
+    return contents, files
+
+
+def write_directory(project_path, contents, files, jobs):
+    os.makedirs(project_path)
+    output = writer.Writer(project_path, jobs)
+    for filename, content in contents:
+        output.add(filename, content)
+    output.close()
+    manifest.write(path.join(project_path, common.MANIFEST), files)
+
+
+def write_archive(project_path, contents, files):
+    output = archive.Writer(project_path)
+    for filename, content in contents:
+        output.add(filename, content)
+    output.add(common.MANIFEST, manifest.dumps(files))
+    output.close()
+
+
+def assemble(project_path):
+    args = argparse.Namespace(project=project_path, diff=False,
+                              no_cache=True, file=os.devnull)
+    builder = build.Build(args)
+    with open(os.devnull, 'wb') as handle:
+        builder.assemble(builder.plan(), handle)
+    builder.project.close()
+
+
+def lookup(project_path, dump_ids):
+    """Read the files of the objects by dump_id"""
+    value = project.Project(project_path)
+    for dump_id in dump_ids:
+        value.read_bytes(value.manifest.get(dump_id).path)
+    value.close()
+
+
+def disk_usage(project_path):
+    if path.isfile(project_path):
+        return os.stat(project_path).st_blocks * 512
+    total = 0
+    for dir_path, _dirs, filenames in os.walk(project_path):
+        for name in filenames:
+            total += os.stat(path.join(dir_path, name)).st_blocks * 512
+    return total
+
+
+def timed(label, method):
+    start = time.perf_counter()
+    method()
+    duration = time.perf_counter() - start
+    print('{:<36} {:>10.2f} ms'.format(label, duration * 1000))
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('objects', nargs='*', type=int,
+                        default=[10000, 100000])
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--dir', help='Directory to write the projects in')
+    args = parser.parse_args()
+    for count in args.objects:
+        tmpdir = tempfile.mkdtemp(dir=args.dir)
+        try:
+            contents, files = render(count)
+            dump_ids = random.Random(count).sample(
+                range(21, count + 21), min(count, 1000))
+            directory = path.join(tmpdir, 'project')
+            archive_path = path.join(tmpdir, 'project.pgl')
+            print('{} objects'.format(count))
+            timed('  directory: write ({} jobs)'.format(args.jobs),
+                  lambda: write_directory(
+                      directory, contents, files, args.jobs))
+            timed('  archive: write',
+                  lambda: write_archive(archive_path, contents, files))
+            timed('  directory: build', lambda: assemble(directory))
+            timed('  archive: build', lambda: assemble(archive_path))
+            timed('  directory: {} lookups'.format(len(dump_ids)),
+                  lambda: lookup(directory, dump_ids))
+            timed('  archive: {} lookups'.format(len(dump_ids)),
+                  lambda: lookup(archive_path, dump_ids))
+            print('  disk usage: {:.1f} MB directory, {:.1f} MB archive'
+                  .format(disk_usage(directory) / 1048576,
+                          disk_usage(archive_path) / 1048576))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# coding=utf-8
+"""
+Measure build time and memory for synthetic projects
+
+Usage: python benchmarks/build.py [OBJECTS ...]
+
+"""
+import argparse
+import os
+from os import path
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pg_lifecycle import build, common, generate, manifest  # noqa: E402
+
+TABLE = """-- DDL for {schema}.table_{id}
+
+CREATE TABLE {schema}.table_{id} (
+    id integer NOT NULL,
+    parent_id integer,
+    value text
+);
+
+-- CONSTRAINTs for {schema}.table_{id}
+
+ALTER TABLE ONLY {schema}.table_{id}
+    ADD CONSTRAINT table_{id}_pkey PRIMARY KEY (id);
+
+-- INDEXs for {schema}.table_{id}
+
+CREATE INDEX table_{id}_value_idx ON {schema}.table_{id} USING btree (value);
+"""
+
+
+def synthesize(project_path, count):
+    """Write a project with ``count`` tables spread over 20 schemas"""
+    files = []
+    for offset in range(0, 20):
+        schema = 'schema_{}'.format(offset)
+        os.makedirs(path.join(project_path, 'tables', schema))
+        filename = path.join('schemata', '{}.sql'.format(schema))
+        os.makedirs(path.join(project_path, 'schemata'), exist_ok=True)
+        with open(path.join(project_path, filename), 'w') as handle:
+            handle.write('CREATE SCHEMA {};\n'.format(schema))
+        files.append(generate.DDLFile(offset + 1, filename, set(), set()))
+    for dump_id in range(21, count + 21):
+        schema = 'schema_{}'.format(dump_id % 20)
+        filename = path.join('tables', schema, 'table_{}.sql'.format(dump_id))
+        with open(path.join(project_path, filename), 'w') as handle:
+            handle.write(TABLE.format(schema=schema, id=dump_id))
+        files.append(generate.DDLFile(
+            dump_id, filename, {count + dump_id * 2, count + dump_id * 2 + 1},
+            {dump_id % 20 + 1}))
+    manifest.write(path.join(project_path, common.MANIFEST), files)
+
+
+def timed(label, method):
+    start = time.perf_counter()
+    method()
+    print('{:<36} {:>10.2f} ms'.format(
+        label, (time.perf_counter() - start) * 1000))
+
+
+def run(args):
+    """Order and assemble the project, returning the bytes written"""
+    builder = build.Build(args)
+    with open(os.devnull, 'wb') as handle:
+        written = builder.assemble(builder.plan(), handle)
+    builder.project.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('objects', nargs='*', type=int,
+                        default=[10000, 50000, 100000])
+    for count in parser.parse_args().objects:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            synthesize(tmpdir, count)
+            args = argparse.Namespace(project=tmpdir, diff=False,
+                                      no_cache=True, file=os.devnull)
+            start = time.perf_counter()
+            written = run(args)
+            duration = time.perf_counter() - start
+            tracemalloc.start()
+            run(args)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{:>7} objects: {:>8.2f} s {:>8.1f} MB peak {:>10} bytes '
+                  '{:>8.1f} us/object'.format(
+                      count, duration, peak / 1048576, written,
+                      duration / count * 1000000))
+            args.no_cache = False
+            timed('  cached: cold build', lambda: build.Build(args).run())
+            timed('  cached: no-op rebuild', lambda: build.Build(args).run())
+            changed = path.join(tmpdir, 'tables', 'schema_1',
+                                'table_{}.sql'.format(count // 2 + 1))
+            with open(changed, 'a') as handle:
+                handle.write('\nCOMMENT ON TABLE x IS NULL;\n')
+            timed('  cached: one file changed',
+                  lambda: build.Build(args).run())
+
+
+if __name__ == '__main__':
+    main()
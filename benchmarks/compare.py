@@ -0,0 +1,87 @@
+# coding=utf-8
+"""
+Measure comparing two synthetic projects with a handful of differences
+
+The target project is a copy of the source with a few files changed, one
+file removed and the dependencies of one file changed. Each comparison is
+timed without the cached hash trees, with them cached, and after touching
+every file so that each is hashed again.
+
+Usage: python benchmarks/compare.py [OBJECTS ...]
+
+"""
+import argparse
+import os
+from os import path
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pg_lifecycle import common, compare, manifest, project  # noqa: E402
+
+import build as build_benchmark  # noqa: E402
+
+
+def modify(project_path):
+    """Change, remove and change the dependencies of a few files"""
+    file_path = path.join(project_path, common.MANIFEST)
+    with manifest.Manifest.open(file_path) as value:
+        entries = list(value)
+    for entry in entries[-5:]:
+        with open(path.join(project_path, entry.path), 'a') as handle:
+            handle.write('\nCOMMENT ON TABLE {} IS NULL;\n'.format(entry.tag))
+    os.unlink(path.join(project_path, entries[-6].path))
+    entries[-7] = entries[-7]._replace(dependencies=(1, ))
+    manifest.write(file_path, entries[:-6] + entries[-5:])
+
+
+def run(source, target, use_cache):
+    """Compare the projects, returning the number of changes"""
+    trees = [compare.Tree(project.Project(value), use_cache)
+             for value in (source, target)]
+    for tree in trees:
+        tree.load()
+        tree.project.close()
+    return len(compare.compare(*trees))
+
+
+def timed(label, method):
+    start = time.perf_counter()
+    value = method()
+    print('  {:<34} {:>10.2f} ms {:>6} changes'.format(
+        label, (time.perf_counter() - start) * 1000, value))
+
+
+def touch(project_path):
+    """Update the modification time of every file in the project"""
+    for dir_path, _dirs, files in os.walk(project_path):
+        for name in files:
+            os.utime(path.join(dir_path, name))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('objects', nargs='*', type=int,
+                        default=[10000, 100000])
+    args = parser.parse_args()
+    for count in args.objects:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = path.join(tmpdir, 'source')
+            target = path.join(tmpdir, 'target')
+            build_benchmark.synthesize(source, count)
+            shutil.copytree(source, target)
+            modify(target)
+            print('{} objects'.format(count))
+            timed('without cache', lambda: run(source, target, False))
+            timed('cold cache', lambda: run(source, target, True))
+            timed('warm cache', lambda: run(source, target, True))
+            touch(target)
+            timed('warm cache, target touched',
+                  lambda: run(source, target, True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# coding=utf-8
+"""
+Measure deploy time for a synthetic project against a PostgreSQL server
+
+Each run deploys into a new database that is dropped afterwards, so the
+connecting user must be able to create databases.
+
+Usage: python benchmarks/deploy.py [-h HOST] [-p PORT] [-U USERNAME]
+                                   [--tables TABLES] [--online] [JOBS ...]
+
+"""
+import argparse
+import getpass
+import os
+from os import path
+import sys
+import tempfile
+import time
+
+import psycopg2
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pg_lifecycle import deploy  # noqa: E402
+
+import build as build_benchmark  # noqa: E402
+
+
+def execute(args, statement):
+    """Execute the statement outside of a transaction in the postgres
+    database.
+
+    """
+    conn = psycopg2.connect(host=args.host, port=args.port,
+                            user=args.username, dbname='postgres')
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(statement)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(conflict_handler='resolve')
+    parser.add_argument('-h', '--host', default='localhost')
+    parser.add_argument('-p', '--port', type=int, default=5432)
+    parser.add_argument('-U', '--username', default=getpass.getuser())
+    parser.add_argument('--tables', type=int, default=20000)
+    parser.add_argument('--online', action='store_true',
+                        help='Deploy constraints and indexes online')
+    parser.add_argument('jobs', nargs='*', type=int, default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        build_benchmark.synthesize(tmpdir, args.tables)
+        for jobs in args.jobs:
+            dbname = 'pg_lifecycle_benchmark_{}'.format(os.getpid())
+            execute(args, 'CREATE DATABASE {}'.format(dbname))
+            try:
+                start = time.perf_counter()
+                deploy.Deploy(argparse.Namespace(
+                    project=tmpdir, diff=False, dry_run=False, jobs=jobs,
+                    online=args.online,
+                    host=args.host, port=args.port, username=args.username,
+                    dbname=dbname, role=None, password=False,
+                    no_password=True)).run()
+                duration = time.perf_counter() - start
+                print('{:>7} tables {:>3} jobs: {:>8.2f} s {:>8.1f} '
+                      'tables/s'.format(args.tables, jobs, duration,
+                                        args.tables / duration))
+            finally:
+                execute(args, 'DROP DATABASE {}'.format(dbname))
+
+
+if __name__ == '__main__':
+    main()
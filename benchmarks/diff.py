@@ -0,0 +1,94 @@
+# coding=utf-8
+"""
+Measure build --diff time for synthetic projects and catalog snapshots
+
+Usage: python benchmarks/diff.py [OBJECTS ...]
+
+"""
+import argparse
+import os
+from os import path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pg_lifecycle import build, catalog  # noqa: E402
+
+import build as build_benchmark  # noqa: E402
+
+
+def snapshot(file_path, count):
+    """Write a snapshot matching a project synthesized for ``count`` tables,
+    with an extra column in every 100th table and the index missing from
+    every 100th table.
+
+    """
+    objects = []
+    for offset in range(0, 20):
+        objects.extend(catalog._schemas(
+            {'name': 'schema_{}'.format(offset), 'comment': None}))
+    for dump_id in range(21, count + 21):
+        name = 'schema_{}.table_{}'.format(dump_id % 20, dump_id)
+        columns = [
+            ['id', 'integer', None, True, None, False, None, False],
+            ['parent_id', 'integer', None, False, None, False, None, False],
+            ['value', 'text', None, False, None, False, None, False]]
+        if not dump_id % 100:
+            columns.append(
+                ['extra', 'text', None, False, None, False, None, False])
+        objects.extend(catalog._relations({
+            'kind': 'r', 'persistence': 'p', 'name': name, 'query': None,
+            'partition_key': None, 'owned_by': None, 'columns': columns,
+            'checks': None, 'comment': None}))
+        objects.extend(catalog._constraints({
+            'kind': 'p', 'validated': True, 'table_name': name,
+            'table_kind': 'r', 'name': 'table_{}_pkey'.format(dump_id),
+            'definition': 'PRIMARY KEY (id)', 'comment': None}))
+        if dump_id % 100 != 1:
+            objects.extend(catalog._indexes({
+                'name': 'schema_{}.table_{}_value_idx'.format(
+                    dump_id % 20, dump_id),
+                'definition': 'CREATE INDEX table_{0}_value_idx ON {1} '
+                              'USING btree (value)'.format(dump_id, name),
+                'comment': None}))
+    catalog.Snapshot(objects).save(file_path)
+    return len(objects)
+
+
+def timed(label, method):
+    start = time.perf_counter()
+    value = method()
+    print('{:<36} {:>10.2f} ms'.format(
+        label, (time.perf_counter() - start) * 1000))
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('objects', nargs='*', type=int,
+                        default=[10000, 50000])
+    for count in parser.parse_args().objects:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tables = count // 3
+            build_benchmark.synthesize(tmpdir, tables)
+            snapshot_path = path.join(tmpdir, 'snapshot.json')
+            objects = snapshot(snapshot_path, tables)
+            print('{:>7} objects, {} catalog queries'.format(
+                objects, len(catalog.QUERIES)))
+            timed('  load snapshot', lambda: catalog.load(snapshot_path))
+            args = argparse.Namespace(
+                project=tmpdir, diff=True, no_cache=True, file=os.devnull,
+                snapshot=snapshot_path)
+            timed('  diff: uncached',
+                  lambda: build.Build(args).run())
+            args.no_cache = False
+            timed('  diff: cold fingerprint cache',
+                  lambda: build.Build(args).run())
+            timed('  diff: warm fingerprint cache',
+                  lambda: build.Build(args).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""
+Compare the catalog extractor with pg_dump against a PostgreSQL server
+
+Loads ``tests/fixtures/extract.sql``, and optionally a synthetic project,
+into a new database, then times dumping it with pg_dump and reading the
+table of contents against extracting it from the catalog. The two tables of
+contents are compared by the desc, namespace and tag of each entry and the
+normalised DDL of the entries that both have. Exits with a non-zero status
+if they differ. The database is dropped afterwards, so the connecting user
+must be able to create databases and roles.
+
+Usage: python benchmarks/extract.py [-h HOST] [-p PORT] [-U USERNAME]
+                                    [--tables TABLES]
+
+"""
+import argparse
+import getpass
+import os
+from os import path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pgdumplib import directory
+import psycopg2
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pg_lifecycle import deploy, extract, sql  # noqa: E402
+
+import build as build_benchmark  # noqa: E402
+
+FIXTURE = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                    'tests', 'fixtures', 'extract.sql')
+
+SKIP = {'DATABASE', 'DATABASE PROPERTIES'}
+
+
+def execute(args, statement, dbname='postgres'):
+    """Execute the statement outside of a transaction"""
+    conn = psycopg2.connect(host=args.host, port=args.port,
+                            user=args.username, dbname=dbname)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(statement)
+    conn.close()
+
+
+def entries(reader):
+    """Return the entries of a table of contents keyed for comparison"""
+    values = {}
+    for entry in reader.toc.entries:
+        if entry.desc in SKIP:
+            continue
+        values[(entry.desc, entry.namespace or '', entry.tag)] = \
+            sql.normalize(entry.defn or '')
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(conflict_handler='resolve')
+    parser.add_argument('-h', '--host', default='localhost')
+    parser.add_argument('-p', '--port', type=int, default=5432)
+    parser.add_argument('-U', '--username', default=getpass.getuser())
+    parser.add_argument('--tables', type=int, default=0)
+    args = parser.parse_args()
+    dbname = 'pg_lifecycle_benchmark_{}'.format(os.getpid())
+    connect_args = argparse.Namespace(
+        host=args.host, port=args.port, username=args.username,
+        dbname=dbname, role=None, password=False, no_password=True,
+        no_owner=False, no_privileges=False)
+    execute(args, 'CREATE DATABASE {}'.format(dbname))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        with open(FIXTURE, 'r') as handle:
+            execute(args, handle.read(), dbname)
+        if args.tables:
+            build_benchmark.synthesize(path.join(tmpdir, 'project'),
+                                       args.tables)
+            deploy.Deploy(argparse.Namespace(
+                project=path.join(tmpdir, 'project'), diff=False,
+                dry_run=False, jobs=os.cpu_count() or 1,
+                **vars(connect_args))).run()
+
+        start = time.perf_counter()
+        subprocess.check_call([
+            'pg_dump', '-Fd', '--schema-only', '-h', args.host,
+            '-p', str(args.port), '-U', args.username, '-w',
+            '-f', path.join(tmpdir, 'dump'), dbname])
+        expected = entries(directory.Reader(path.join(tmpdir, 'dump')))
+        dumped = time.perf_counter() - start
+
+        start = time.perf_counter()
+        conn = psycopg2.connect(host=args.host, port=args.port,
+                                user=args.username, dbname=dbname)
+        extractor = extract.Extractor(conn, connect_args)
+        unsupported = extractor.unsupported()
+        actual = entries(extractor.extract())
+        conn.close()
+        extracted = time.perf_counter() - start
+    finally:
+        shutil.rmtree(tmpdir)
+        execute(args, 'DROP DATABASE {}'.format(dbname))
+        execute(args, 'DROP ROLE IF EXISTS pg_lifecycle_reader')
+
+    print('pg_dump:   {:>8.3f} s {:>7} entries'.format(
+        dumped, len(expected)))
+    print('extractor: {:>8.3f} s {:>7} entries'.format(
+        extracted, len(actual)))
+    if unsupported:
+        print('Unsupported: {}'.format(', '.join(unsupported)))
+    failed = bool(unsupported)
+    for label, keys in [('Missing', sorted(set(expected) - set(actual))),
+                        ('Extra', sorted(set(actual) - set(expected))),
+                        ('Different', sorted(
+                            key for key in set(expected) & set(actual)
+                            if expected[key] != actual[key]))]:
+        for key in keys:
+            failed = True
+            print('{}: {}'.format(label, ' '.join(key)))
+            if label == 'Different':
+                print('  pg_dump:   {}'.format(expected[key]))
+                print('  extractor: {}'.format(actual[key]))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+# coding=utf-8
+"""
+Measure generate-project throughput and peak memory per phase for
+synthetic directory format dumps
+
+Each case synthesizes a dump of the given shape and size, then generates a
+project from it in a new process so that the memory high-water mark of each
+phase is not inflated by earlier cases. Results are appended to a JSON lines
+file keyed by git commit, and each case is compared with the most recent
+result for the same case from a different commit.
+
+Shapes:
+
+- ``tables``: tables with a primary key, an index and a foreign key
+- ``functions``: functions with eight overloads of each name
+- ``partitions``: partitioned tables with nested partitions
+- ``acls``: tables with many privileges and column comments
+
+With ``--full``, each case is also generated with the dump fully loaded,
+unless the installed pgdumplib can not load the table of contents, in which
+case the mode is skipped.
+
+Usage: python benchmarks/generate.py [--shape SHAPE] [--full]
+                                     [--results FILE] [OBJECTS ...]
+
+"""
+import argparse
+import datetime
+import json
+import os
+from os import path
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import pgdumplib  # noqa: E402
+
+from pg_lifecycle import common, generate, metrics  # noqa: E402
+
+PROJECT_PATH = path.dirname(path.dirname(path.abspath(__file__)))
+RESULTS = path.join(
+    path.dirname(common.DUMP_CACHE_DIR), 'benchmarks', 'generate.jsonl')
+SCHEMAS = 20
+SECTIONS = ['None', common.PRE_DATA, common.DATA, common.POST_DATA]
+SHAPES = ['tables', 'functions', 'partitions', 'acls']
+
+TABLE = """\
+CREATE TABLE {schema}.{name} (
+    id bigint NOT NULL,
+    parent_id bigint,
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    value text
+);
+"""
+
+
+class Dump:
+    """Table of contents entries for a synthetic dump"""
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, desc, tag, defn, namespace='', dependencies=(),
+            section=common.PRE_DATA):
+        """Add an entry, returning its dump_id"""
+        dump_id = len(self.entries) + 1
+        self.entries.append((dump_id, tag, desc, section, defn, namespace,
+                             list(dependencies)))
+        return dump_id
+
+    def schemas(self):
+        """Add the directives and schemas, returning the schema dump_ids"""
+        self.add(common.ENCODING, common.ENCODING,
+                 "SET client_encoding = 'UTF8';\n")
+        self.add(common.STDSTRINGS, common.STDSTRINGS,
+                 "SET standard_conforming_strings = 'on';\n")
+        return {'schema_{}'.format(offset): self.add(
+            common.SCHEMA, 'schema_{}'.format(offset),
+            'CREATE SCHEMA schema_{};\n'.format(offset))
+            for offset in range(0, SCHEMAS)}
+
+    def write(self, dump_path):
+        """Write the table of contents in the directory dump format"""
+        os.makedirs(dump_path)
+        now = datetime.datetime.now()
+        with open(path.join(dump_path, 'toc.dat'), 'wb') as handle:
+            handle.write(b'PGDMP' + bytes([1, 13, 0, 4, 8, 5]))
+            for value in [0, now.second, now.minute, now.hour, now.day,
+                          now.month - 1, now.year - 1900, 0]:
+                _write_int(handle, value)
+            for value in ['benchmark', '13.4', '13.4']:
+                _write_str(handle, value)
+            _write_int(handle, len(self.entries))
+            for (dump_id, tag, desc, section, defn, namespace,
+                 dependencies) in self.entries:
+                _write_int(handle, dump_id)
+                _write_int(handle, 0)
+                for value in ['0', '0', tag, desc]:
+                    _write_str(handle, value)
+                _write_int(handle, SECTIONS.index(section) + 1)
+                for value in [defn, '', '', namespace, '', 'postgres',
+                              'false']:
+                    _write_str(handle, value)
+                for value in dependencies:
+                    _write_str(handle, str(value))
+                _write_int(handle, -1)
+                _write_int(handle, 0)
+
+
+def _write_int(handle, value):
+    handle.write(struct.pack('<BI', 1 if value < 0 else 0, abs(value)))
+
+
+def _write_str(handle, value):
+    value = value.encode('utf-8')
+    _write_int(handle, len(value))
+    handle.write(value)
+
+
+def tables(count):
+    dump = Dump()
+    schemas = dump.schemas()
+    previous = None
+    for offset in range(0, count):
+        schema = 'schema_{}'.format(offset % SCHEMAS)
+        name = 'table_{}'.format(offset)
+        table = dump.add(common.TABLE, name,
+                         TABLE.format(schema=schema, name=name), schema,
+                         [schemas[schema]])
+        pkey = dump.add(
+            common.CONSTRAINT, '{0} {0}_pkey'.format(name),
+            'ALTER TABLE ONLY {}.{}\n    ADD CONSTRAINT {}_pkey PRIMARY '
+            'KEY (id);\n'.format(schema, name, name), schema, [table],
+            common.POST_DATA)
+        dump.add(common.INDEX, '{}_value_idx'.format(name),
+                 'CREATE INDEX {0}_value_idx ON {1}.{0} USING btree '
+                 '(value);\n'.format(name, schema), schema, [table],
+                 common.POST_DATA)
+        if previous:
+            dump.add(common.FK_CONSTRAINT, '{0} {0}_parent_fkey'.format(name),
+                     'ALTER TABLE ONLY {}.{}\n    ADD CONSTRAINT '
+                     '{}_parent_fkey FOREIGN KEY (parent_id) REFERENCES '
+                     '{}(id);\n'.format(schema, name, name, previous[1]),
+                     schema, [table, previous[0]], common.POST_DATA)
+        previous = pkey, '{}.{}'.format(schema, name)
+    return dump
+
+
+def functions(count):
+    dump = Dump()
+    schemas = dump.schemas()
+    types = ['integer', 'bigint', 'text', 'numeric', 'date', 'boolean',
+             'uuid', 'jsonb']
+    for offset in range(0, count):
+        schema = 'schema_{}'.format(offset // 8 % SCHEMAS)
+        name = 'function_{}'.format(offset // 8)
+        arguments = ', '.join(['value {}'.format(types[offset % 8])] * (
+            1 + offset % 3))
+        tag = '{}({})'.format(name, arguments)
+        function = dump.add(
+            common.FUNCTION, tag,
+            'CREATE FUNCTION {}.{} RETURNS text\n    LANGUAGE sql '
+            'IMMUTABLE\n    AS $$SELECT $1::text$$;\n'.format(schema, tag),
+            schema, [schemas[schema]])
+        dump.add(common.COMMENT, 'FUNCTION {}'.format(tag),
+                 "COMMENT ON FUNCTION {}.{} IS 'Overload {}';\n".format(
+                     schema, tag, offset % 8), schema, [function])
+        dump.add(common.ACL, 'FUNCTION {}'.format(tag),
+                 'GRANT ALL ON FUNCTION {}.{} TO app;\n'.format(schema, tag),
+                 schema, [function])
+    return dump
+
+
+def partitions(count, depth=3, fanout=4):
+    dump = Dump()
+    schemas = dump.schemas()
+    per_tree = sum(fanout ** level for level in range(0, depth + 1))
+    for tree in range(0, max(1, count // per_tree)):
+        schema = 'schema_{}'.format(tree % SCHEMAS)
+        parents = [(dump.add(
+            common.TABLE, 'events_{}'.format(tree),
+            TABLE.format(schema=schema, name='events_{}'.format(tree))[:-2] +
+            '\nPARTITION BY RANGE (id);\n', schema, [schemas[schema]]),
+            'events_{}'.format(tree), 0, fanout ** depth * 1000)]
+        for level in range(1, depth + 1):
+            children = []
+            for parent, parent_name, low, high in parents:
+                width = (high - low) // fanout
+                for offset in range(0, fanout):
+                    name = '{}_{}'.format(parent_name, offset)
+                    start = low + offset * width
+                    defn = TABLE.format(schema=schema, name=name)
+                    if level < depth:
+                        defn = defn[:-2] + '\nPARTITION BY RANGE (id);\n'
+                    child = dump.add(common.TABLE, name, defn, schema,
+                                     [schemas[schema]])
+                    dump.add(common.TABLE_ATTACH, name,
+                             'ALTER TABLE ONLY {0}.{1} ATTACH PARTITION '
+                             "{0}.{2} FOR VALUES FROM ('{3}') TO ('{4}');\n"
+                             .format(schema, parent_name, name, start,
+                                     start + width),
+                             schema, [parent, child])
+                    children.append((child, name, start, start + width))
+            parents = children
+    return dump
+
+
+def acls(count, grants=10, columns=4):
+    dump = Dump()
+    schemas = dump.schemas()
+    for offset in range(0, count):
+        schema = 'schema_{}'.format(offset % SCHEMAS)
+        name = 'table_{}'.format(offset)
+        table = dump.add(common.TABLE, name,
+                         TABLE.format(schema=schema, name=name), schema,
+                         [schemas[schema]])
+        dump.add(common.COMMENT, 'TABLE {}'.format(name),
+                 "COMMENT ON TABLE {}.{} IS 'Table {}';\n".format(
+                     schema, name, offset), schema, [table])
+        for column in ['id', 'parent_id', 'created_at', 'value'][:columns]:
+            dump.add(common.COMMENT, 'COLUMN {}.{}'.format(name, column),
+                     "COMMENT ON COLUMN {}.{}.{} IS 'Column {}';\n".format(
+                         schema, name, column, column), schema, [table])
+        dump.add(common.ACL, 'TABLE {}'.format(name), ''.join(
+            'GRANT SELECT,INSERT,UPDATE ON TABLE {}.{} TO role_{};\n'.format(
+                schema, name, role) for role in range(0, grants)),
+            schema, [table])
+    return dump
+
+
+def case(shape, count, mode, dump_path, project_path):
+    """Generate the project, returning the recorded metrics"""
+    metrics.enable('generate-project')
+    args = argparse.Namespace(
+        archive=False, collapse_partitions=False, dbname=None,
+        dest=[project_path], dump_cache=False, extractor='pg_dump',
+        force=False, from_dump=dump_path, gitkeep=False, host=None, jobs=1,
+        port=None, remove_empty=False, role=None,
+        streaming=mode == 'streaming', username=None)
+    generate.Generate(args).run()
+    value = metrics._METRICS.as_dict()
+    value.update({'shape': shape, 'objects': count, 'mode': mode})
+    return value
+
+
+def full_supported():
+    """Return ``None`` if the installed pgdumplib can load a directory
+    format dump's table of contents, otherwise the error it fails with, so
+    that the ``full`` mode can be skipped.
+
+    """
+    from pgdumplib import directory
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        dump_path = path.join(tmpdir, 'dump')
+        tables(1).write(dump_path)
+        directory.Reader(dump_path)
+    except (TypeError, ValueError) as error:
+        return str(error)
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
+
+def commit():
+    """Return the current git commit, marked if the tree has changes"""
+    try:
+        value = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_PATH,
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=PROJECT_PATH, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return '{}+dirty'.format(value) if dirty else value
+
+
+def entries(result):
+    for counter in result['counters']:
+        if counter['name'] == 'toc_entries':
+            return counter['value']
+    return 0
+
+
+def previous(results_path, result):
+    """Return the most recent result for the same case from a different
+    commit
+
+    """
+    value = None
+    try:
+        with open(results_path, 'r') as handle:
+            for line in handle:
+                row = json.loads(line)
+                if row['commit'] != result['commit'] and all(
+                        row[key] == result[key]
+                        for key in ['shape', 'objects', 'mode']):
+                    value = row
+    except (OSError, ValueError):
+        pass
+    return value
+
+
+def report(result, baseline, threshold):
+    total = entries(result)
+    print('{} {} objects ({} entries), {}: {:.2f} s, {:.1f} MB peak'.format(
+        result['shape'], result['objects'], total, result['mode'],
+        result['wall_seconds'], result['max_rss_bytes'] / 1048576))
+    print('  {:<32} {:>9} {:>9} {:>12} {:>9}'.format(
+        'phase', 'wall s', 'CPU s', 'entries/s', 'RSS MB'))
+    for phase in result['phases']:
+        if phase['wall_seconds'] < 0.0005:
+            continue
+        print('  {:<32} {:>9.3f} {:>9.3f} {:>12.0f} {:>9.1f}'.format(
+            phase['name'], phase['wall_seconds'], phase['cpu_seconds'],
+            total / phase['wall_seconds'], phase['max_rss_bytes'] / 1048576))
+    if baseline:
+        wall = _change(result['wall_seconds'], baseline['wall_seconds'])
+        rss = _change(result['max_rss_bytes'], baseline['max_rss_bytes'])
+        flag = ' REGRESSION' if max(wall, rss) > threshold else ''
+        print('  vs {}: {:+.1f}% wall, {:+.1f}% peak memory{}'.format(
+            baseline['commit'], wall, rss, flag))
+
+
+def _change(value, baseline):
+    return (value - baseline) / baseline * 100 if baseline else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('objects', nargs='*', type=int,
+                        default=[10000, 50000])
+    parser.add_argument('--shape', action='append', choices=SHAPES,
+                        help='Shapes to benchmark (default: all)')
+    parser.add_argument('--full', action='store_true',
+                        help='Also generate with the dump fully loaded '
+                        'instead of streaming it')
+    parser.add_argument('--results', default=RESULTS,
+                        help='JSON lines file to append results to')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent change reported as a regression')
+    parser.add_argument('--case', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        shape, count, mode, dump_path = args.case
+        project_path = tempfile.mkdtemp()
+        shutil.rmtree(project_path)
+        try:
+            print(json.dumps(case(shape, int(count), mode, dump_path,
+                                  project_path)))
+        finally:
+            shutil.rmtree(project_path, ignore_errors=True)
+        return
+    modes = ['streaming']
+    if args.full:
+        error = full_supported()
+        if error:
+            print('Skipping the full mode, pgdumplib {} can not load the '
+                  'table of contents: {}'.format(
+                      pgdumplib.__version__, error))
+        else:
+            modes.append('full')
+    revision = commit()
+    os.makedirs(path.dirname(path.abspath(args.results)), exist_ok=True)
+    for shape in args.shape or SHAPES:
+        for count in args.objects:
+            tmpdir = tempfile.mkdtemp()
+            try:
+                start = time.perf_counter()
+                dump_path = path.join(tmpdir, 'dump')
+                globals()[shape](count).write(dump_path)
+                print('Synthesized {} {} in {:.2f} s'.format(
+                    count, shape, time.perf_counter() - start))
+                for mode in modes:
+                    process = subprocess.run(
+                        [sys.executable, path.abspath(__file__), '--case',
+                         shape, str(count), mode, dump_path],
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    if process.returncode:
+                        print('{} {} objects, {}: failed: {}'.format(
+                            shape, count, mode, process.stderr.decode(
+                                'utf-8').strip().splitlines()[-1]))
+                        continue
+                    result = json.loads(
+                        process.stdout.decode('utf-8').splitlines()[-1])
+                    result['commit'] = revision
+                    result['date'] = datetime.datetime.now().isoformat()
+                    report(result, previous(args.results, result),
+                           args.threshold)
+                    with open(args.results, 'a') as handle:
+                        handle.write(json.dumps(result) + '\n')
+            finally:
+                shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# coding=utf-8
+"""
+Measure building, ordering and querying synthetic dependency graphs
+
+Each node depends upon up to ``--fanout`` random earlier nodes, which is
+denser than the dependencies of a typical project.
+
+Usage: python benchmarks/graph.py [NODES ...] [--fanout FANOUT]
+
+"""
+import argparse
+from os import path
+import random
+import sys
+import time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pg_lifecycle import graph  # noqa: E402
+
+
+def synthesize(count, fanout):
+    """Return the parents of each node of a random acyclic graph"""
+    generator = random.Random(count)
+    return [[generator.randrange(0, position)
+             for _offset in range(0, min(position, fanout))]
+            for position in range(0, count)]
+
+
+def timed(label, method):
+    start = time.perf_counter()
+    value = method()
+    print('  {:<34} {:>10.2f} ms'.format(
+        label, (time.perf_counter() - start) * 1000))
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('nodes', nargs='*', type=int,
+                        default=[10000, 200000])
+    parser.add_argument('--fanout', type=int, default=3)
+    args = parser.parse_args()
+    for count in args.nodes:
+        parents = synthesize(count, args.fanout)
+        print('{} nodes, {} edges'.format(
+            count, sum(len(values) for values in parents)))
+        value = timed('build', lambda: graph.Graph(parents))
+        timed('order', value.order)
+        waves = timed('waves', value.waves)
+        timed('dependents of the first node',
+              lambda: value.descendants([0]))
+        timed('dependencies of the last node',
+              lambda: value.ancestors([count - 1]))
+        print('  {} levels, up to {} nodes in a level'.format(
+            len(waves), max(len(wave) for wave in waves)))
+        parents[0].append(count - 1)
+        cyclic = graph.Graph(parents)
+        try:
+            timed('order with a cycle', cyclic.order)
+        except graph.CycleError as error:
+            print('  cycle of {} nodes'.format(len(error.cycle) - 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# coding=utf-8
+"""
+Compare loading the legacy pickled manifest with the binary manifest
+
+Usage: python benchmarks/manifest_load.py [OBJECTS]
+
+"""
+import os
+from os import path
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pg_lifecycle import generate, manifest  # noqa: E402
+
+
+def synthesize(count):
+    """Return a list of DDLFile values shaped like a large project"""
+    rng = random.Random(count)
+    files = []
+    for dump_id in range(1, count + 1):
+        files.append(generate.DDLFile(
+            dump_id, 'tables/schema_{}/table_{}.sql'.format(
+                dump_id % 50, dump_id),
+            set(range(count + dump_id * 4, count + dump_id * 4 + 3)),
+            set(rng.randrange(1, dump_id + 1) for _i in range(3)),
+            'TABLE', 'schema_{}'.format(dump_id % 50),
+            'table_{}'.format(dump_id)))
+    return files
+
+
+def timed(label, method):
+    start = time.perf_counter()
+    result = method()
+    print('{:<36} {:>10.2f} ms'.format(
+        label, (time.perf_counter() - start) * 1000))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    files = synthesize(count)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy_path = path.join(tmpdir, 'legacy.pgl')
+        binary_path = path.join(tmpdir, 'binary.pgl')
+        with open(legacy_path, 'wb') as handle:
+            pickle.dump(files, handle)
+        manifest.write(binary_path, files)
+        print('{} objects: pickle {} bytes, binary {} bytes'.format(
+            count, os.stat(legacy_path).st_size,
+            os.stat(binary_path).st_size))
+        target = count // 2
+
+        def legacy_lookup():
+            with open(legacy_path, 'rb') as handle:
+                values = pickle.load(handle)
+            return [f for f in values if f.id == target][0]
+
+        def binary_lookup():
+            with manifest.Manifest.open(binary_path) as value:
+                return value.get(target)
+
+        def binary_walk():
+            with manifest.Manifest.open(binary_path) as value:
+                return sum(len(value.dependencies(offset))
+                           for offset in range(0, len(value)))
+
+        timed('pickle: load + lookup one object', legacy_lookup)
+        timed('binary: open + lookup one object', binary_lookup)
+        timed('binary: walk every dependency list', binary_walk)
+        timed('convert pickle to binary',
+              lambda: manifest.convert(legacy_path))
+
+
+if __name__ == '__main__':
+    main()
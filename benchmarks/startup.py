@@ -0,0 +1,78 @@
+# coding=utf-8
+"""
+Measure CLI startup time and check that the action modules and their
+dependencies are not imported until an action is run
+
+Exits with a non-zero status if the median startup time of any command
+exceeds the budget or a deferred module is imported by the CLI module, so
+it can be used as a check in CI.
+
+Usage: python benchmarks/startup.py [--runs RUNS] [--budget MS]
+
+"""
+import argparse
+import os
+from os import path
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_PATH = path.dirname(path.dirname(path.abspath(__file__)))
+
+COMMANDS = [['--help'], ['--version'], ['build', '--help'],
+            ['generate-project', '--help']]
+
+DEFERRED = ['pg_lifecycle.build', 'pg_lifecycle.catalog',
+            'pg_lifecycle.deploy', 'pg_lifecycle.fleet',
+            'pg_lifecycle.generate', 'pg_lifecycle.manifest', 'pgdumplib',
+            'psycopg2', 'pickle', 'sqlite3', 'subprocess']
+
+RUN = 'from pg_lifecycle import cli; cli.run()'
+
+IMPORTED = """\
+import sys
+from pg_lifecycle import cli
+print(','.join(name for name in {!r} if name in sys.modules))
+""".format(DEFERRED)
+
+
+def execute(arguments):
+    """Run the python interpreter, returning the wall time in ms"""
+    environment = dict(os.environ, PYTHONPATH=PROJECT_PATH)
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + arguments, env=environment,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=150.0,
+                        help='Maximum median startup time in ms')
+    args = parser.parse_args()
+    failed = False
+    baseline = statistics.median(
+        execute(['-c', 'pass']) for _run in range(0, args.runs))
+    print('{:<36} {:>8.1f} ms'.format('python -c pass', baseline))
+    for command in COMMANDS:
+        value = statistics.median(
+            execute(['-c', RUN] + command) for _run in range(0, args.runs))
+        over = value > args.budget
+        failed = failed or over
+        print('{:<36} {:>8.1f} ms{}'.format(
+            'pg_lifecycle {}'.format(' '.join(command)), value,
+            ' over budget of {:.0f} ms'.format(args.budget) if over else ''))
+    imported = subprocess.check_output(
+        [sys.executable, '-c', IMPORTED],
+        env=dict(os.environ, PYTHONPATH=PROJECT_PATH)).decode(
+            'utf-8').strip()
+    if imported:
+        failed = True
+        print('Imported by pg_lifecycle.cli: {}'.format(imported))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
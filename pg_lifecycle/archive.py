@@ -0,0 +1,236 @@
+# coding=utf-8
+"""
+Project Archives
+
+A project archive is a single SQLite database that holds the content of
+every project file, including the manifest, keyed by the file's project
+relative path. Files are looked up by path with the primary key and by
+dump_id with the manifest, so the project can be built, diffed and deployed
+without extracting it.
+
+"""
+import logging
+import os
+from os import path
+import sqlite3
+import threading
+import time
+from urllib import parse
+
+from pg_lifecycle import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+HEADER = b'SQLite format 3\x00'
+
+CREATE = """\
+CREATE TABLE files (
+  path TEXT NOT NULL PRIMARY KEY,
+  content BLOB NOT NULL,
+  modified INTEGER NOT NULL
+) WITHOUT ROWID"""
+
+INSERT = 'INSERT INTO files (path, content, modified) VALUES (?, ?, ?)'
+SELECT = 'SELECT content FROM files WHERE path = ?'
+STAMPS = 'SELECT path, modified, length(content) FROM files'
+
+
+def is_archive(file_path):
+    """Return ``True`` if the path is a project archive
+
+    :param str file_path: The path to check
+    :rtype: bool
+
+    """
+    if not path.isfile(file_path):
+        return False
+    with open(file_path, 'rb') as handle:
+        return handle.read(len(HEADER)) == HEADER
+
+
+class Archive:
+    """Read-only access to a project archive, opened on first use. The
+    connection is shared by the threads of a deploy, so reads are
+    serialized with a lock.
+
+    :param str file_path: The path to the archive
+
+    """
+    def __init__(self, file_path):
+        self.path = file_path
+        self.lock = threading.Lock()
+        self._connection = None
+        self._directories = None
+        self._stamps = None
+
+    @property
+    def connection(self):
+        """Return the connection to the archive, opening it on first access.
+
+        :rtype: sqlite3.Connection
+
+        """
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                'file:{}?mode=ro'.format(parse.quote(self.path)), uri=True,
+                check_same_thread=False)
+        return self._connection
+
+    def close(self):
+        """Close the archive if it was opened"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._directories = None
+            self._stamps = None
+
+    def read(self, file_path):
+        """Return the content of the file in the archive.
+
+        :param str file_path: The project relative path
+        :rtype: bytes
+        :raises: FileNotFoundError
+
+        """
+        with self.lock:
+            row = self.connection.execute(SELECT, (file_path, )).fetchone()
+        if row is None:
+            raise FileNotFoundError(
+                '{} is not in {}'.format(file_path, self.path))
+        return bytes(row[0])
+
+    def scan(self, directory):
+        """Return the modification time in nanoseconds and the size of
+        each file directly in the directory of the archive, by name.
+
+        :param str directory: The project relative directory
+        :rtype: dict
+
+        """
+        if self._directories is None:
+            self._directories = {}
+            for file_path, value in self._load_stamps().items():
+                parent, _sep, name = file_path.rpartition('/')
+                self._directories.setdefault(parent, {})[name] = value
+        return self._directories.get(directory, {})
+
+    def stat(self, file_path):
+        """Return the modification time in nanoseconds and the size of the
+        file in the archive. The values for every file are loaded on first
+        use.
+
+        :param str file_path: The project relative path
+        :rtype: tuple(int, int)
+        :raises: FileNotFoundError
+
+        """
+        self._load_stamps()
+        if file_path not in self._stamps:
+            raise FileNotFoundError(
+                '{} is not in {}'.format(file_path, self.path))
+        return self._stamps[file_path]
+
+    def _load_stamps(self):
+        """Return the modification time and size of every file, loading
+        them on first use.
+
+        :rtype: dict
+
+        """
+        if self._stamps is None:
+            with self.lock:
+                self._stamps = {
+                    row[0]: (row[1], row[2])
+                    for row in self.connection.execute(STAMPS)}
+        return self._stamps
+
+
+class Writer:
+    """Writes project files to a new archive in a single transaction. The
+    archive is written to a temporary file that replaces the destination
+    when it is closed, so an interrupted generation does not leave a
+    partial archive behind. The temporary file is removed when the writer
+    is aborted.
+
+    Provides the same interface as :class:`pg_lifecycle.writer.Writer`.
+
+    :param str file_path: The path of the archive to write
+    :param int max_pending: Flush after this many files have been added
+
+    """
+    def __init__(self, file_path, max_pending=None):
+        self.file_path = file_path
+        self.temp_path = '{}.{}'.format(file_path, os.getpid())
+        self.max_pending = max_pending
+        self.connection = None
+        self.paths = set({})
+        self.pending = []
+
+    def add(self, filename, content):
+        """Add a file to be written on the next flush.
+
+        :param str filename: The path of the file relative to the project
+        :param content: The file content
+        :type content: str or bytes
+        :raises: ValueError
+
+        """
+        if filename in self.paths:
+            raise ValueError('Path Already Exists: {}'.format(filename))
+        self.paths.add(filename)
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self.pending.append(
+            (filename, content, int(time.time() * 1000000000)))
+        if self.max_pending and len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def abort(self):
+        """Discard the pending files and remove the temporary archive"""
+        self.pending = []
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+        if path.exists(self.temp_path):
+            LOGGER.debug('Removing %s', self.temp_path)
+            os.unlink(self.temp_path)
+
+    def close(self):
+        """Write any pending files, commit and move the archive into
+        place
+
+        """
+        self.flush()
+        if self.connection:
+            with metrics.phase('write'):
+                self.connection.commit()
+            self.connection.close()
+            self.connection = None
+            os.replace(self.temp_path, self.file_path)
+            LOGGER.debug('Wrote %i files to %s',
+                         len(self.paths), self.file_path)
+
+    def flush(self):
+        """Write all of the pending files, returning the number of files
+        that were written.
+
+        :rtype: int
+
+        """
+        pending, self.pending = self.pending, []
+        with metrics.phase('write'):
+            if not self.connection:
+                self._create()
+            self.connection.executemany(INSERT, pending)
+        metrics.count('files_written', len(pending))
+        metrics.count('bytes_written', sum(len(row[1]) for row in pending))
+        return len(pending)
+
+    def _create(self):
+        """Create the temporary archive"""
+        if path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+        self.connection = sqlite3.connect(self.temp_path)
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute(CREATE)
@@ -3,14 +3,336 @@
 Builds DDL
 
 """
+import collections
+import contextlib
+import logging
+import os
+import sys
+
+import psycopg2
+
+from pg_lifecycle import (cache, catalog, common, connection, diff, graph,
+                          metrics, project)
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 65536
+
+DEFERRED = common.POST_DATA_OBJ_TYPES
+
+Node = collections.namedtuple(
+    'Node', ['dump_id', 'path', 'included', 'dependencies'])
 
 
 class Build:
-    """Builds DDL for the project"""
+    """Builds DDL for the project
+
+    Files are ordered by the dependencies recorded in the project manifest
+    and written to the output as a stream, one file at a time. Constraints
+    and indexes that are bundled with their parent object are deferred until
+    every file has been written, matching the pre-data/post-data split that
+    pg_dump uses.
 
-    def __init__(self, args):
+    :param argparse.namespace args: The parsed cli arguments
+    :param pg_lifecycle.project.Project source: The project to build,
+        opened from ``--project`` if not passed
+
+    """
+
+    def __init__(self, args, source=None):
         self.args = args
+        self.project = source or project.Project(
+            getattr(args, 'project', '.'))
 
     def run(self):
         """Implement as core logic for building DDL"""
-        raise NotImplementedError
+        if self.args.diff:
+            changes = self.diff()
+            with self._output() as handle, metrics.phase('diff'):
+                written = changes.write(handle)
+            metrics.count('statements', written)
+            LOGGER.info('Wrote %i statements to change %s',
+                        written, self.database())
+        elif self.args.no_cache:
+            plan = self._plan()
+            with self._output() as handle:
+                self.assemble(plan, handle)
+        else:
+            with cache.BuildCache(self.project) as build_cache:
+                with metrics.phase('cache_check'):
+                    unchanged = build_cache.unchanged()
+                if not unchanged:
+                    digest = build_cache.manifest_digest()
+                    plan = build_cache.plan(digest) or self._plan()
+                    temp_path = build_cache.temp_path()
+                    with open(temp_path, 'wb',
+                              buffering=CHUNK_SIZE) as handle:
+                        self.assemble(plan, handle, build_cache)
+                    build_cache.save(digest, plan, temp_path)
+                LOGGER.info('Build cache: %i hits, %i misses',
+                            build_cache.hits, build_cache.misses)
+                metrics.count('cache_hits', build_cache.hits)
+                metrics.count('cache_misses', build_cache.misses)
+                with self._output() as handle, metrics.phase('output'):
+                    build_cache.copy(
+                        [0, os.stat(build_cache.output_path).st_size],
+                        handle)
+                    build_cache.flush(handle)
+        self.project.close()
+
+    def assemble(self, plan, handle, build_cache=None):
+        """Write the DDL for the planned files to the handle, returning the
+        number of bytes written. Only one file is held in memory at a time.
+        When a build cache is passed, the DDL for files that are unchanged
+        since the last build is copied from the previous output and the
+        location of each file's DDL in the new output is recorded.
+
+        :param list plan: The ordered file paths and inclusion state
+        :param file handle: The binary file handle to write to
+        :param pg_lifecycle.cache.BuildCache build_cache: The build cache
+        :rtype: int
+
+        """
+        with metrics.phase('assemble'):
+            written = self._assemble(plan, handle, build_cache)
+        metrics.count('ddl_bytes', written)
+        LOGGER.info('Wrote %i bytes of DDL for %i files', written, len(plan))
+        return written
+
+    def _assemble(self, plan, handle, build_cache):
+        """Write the DDL for the planned files to the handle, returning the
+        number of bytes written.
+
+        :param list plan: The ordered file paths and inclusion state
+        :param file handle: The binary file handle to write to
+        :param pg_lifecycle.cache.BuildCache build_cache: The build cache
+        :rtype: int
+
+        """
+        deferred, written = collections.defaultdict(list), 0
+        for file_path, included in plan:
+            segment, start = None, written
+            if build_cache:
+                segment = build_cache.lookup(file_path, included)
+            if segment:
+                written += build_cache.copy(segment[0], handle)
+                sections = segment[1]
+            else:
+                content = self.project.read_bytes(file_path)
+                if build_cache:
+                    build_cache.flush(handle)
+                    build_cache.record(file_path, included, content)
+                ddl, sections = divide(content.decode('utf-8'), included)
+                written += _write(handle, ddl)
+            if build_cache:
+                build_cache.segment(file_path, None, start, written - start)
+            for child_type in sections:
+                deferred[child_type].append(
+                    (file_path, bool(segment), sections[child_type]))
+        for child_type in DEFERRED:
+            for file_path, cached, section in deferred[child_type]:
+                start = written
+                if cached:
+                    written += build_cache.copy(section, handle)
+                else:
+                    if build_cache:
+                        build_cache.flush(handle)
+                    written += _write(handle, section)
+                if build_cache:
+                    build_cache.segment(
+                        file_path, child_type, start, written - start)
+        if build_cache:
+            build_cache.flush(handle)
+        return written
+
+    def database(self):
+        """Return a description of the database being built against
+
+        :rtype: str
+
+        """
+        if getattr(self.args, 'snapshot', None):
+            return self.args.snapshot
+        return '{}:{}/{}'.format(
+            self.args.host, self.args.port, self.args.dbname)
+
+    def diff(self, plan=None, fingerprint_cache=None):
+        """Return the diff between the project and the database.
+
+        :param list plan: The build plan, built from the project if not
+            passed
+        :param pg_lifecycle.cache.FingerprintCache fingerprint_cache: The
+            fingerprint cache, opened for the project if not passed
+        :rtype: pg_lifecycle.diff.Diff
+
+        """
+        if fingerprint_cache is None and \
+                not getattr(self.args, 'no_cache', False):
+            fingerprint_cache = cache.FingerprintCache(self.project)
+        snapshot = self.snapshot()
+        if plan is None:
+            plan = self._plan()
+        return diff.Diff(self.project, snapshot, plan, fingerprint_cache,
+                         getattr(self.args, 'allow_drop_columns', False))
+
+    def nodes(self):
+        """Return the build plan as a list of nodes in build order. Each
+        node has the dump_id of the file's object, the file path, if the
+        object the file is for was already included by an earlier file, in
+        which case only the file's children are written, and the positions
+        of the nodes it depends upon.
+
+        :rtype: list
+        :raises: ValueError
+
+        """
+        manifest = self.project.manifest
+        with metrics.phase('order'):
+            offsets, dependencies = self._order()
+        positions = {offset: position
+                     for position, offset in enumerate(offsets)}
+        values, emitted = [], {}
+        for position, offset in enumerate(offsets):
+            entry = manifest[offset]
+            parents = set(positions[parent]
+                          for parent in dependencies.parents(offset))
+            included = entry.id in emitted
+            if included:
+                parents.add(emitted[entry.id])
+            values.append(Node(entry.id, entry.path, included, parents))
+            if entry.id >= 0:
+                emitted.setdefault(entry.id, position)
+            for dump_id in entry.includes:
+                emitted.setdefault(dump_id, position)
+        return values
+
+    def order(self):
+        """Return the manifest entries ordered so that every file comes
+        after the files it depends upon. Dependencies upon bundled children
+        are resolved to the file that includes them.
+
+        :rtype: list
+        :raises: ValueError
+
+        """
+        manifest = self.project.manifest
+        return [manifest[offset] for offset in self._order()[0]]
+
+    def plan(self):
+        """Return the build plan, a list of the ordered file paths and if the
+        object each file is for was already included by an earlier file, in
+        which case only the file's children are written.
+
+        :rtype: list
+        :raises: ValueError
+
+        """
+        return [[node.path, node.included] for node in self.nodes()]
+
+    def snapshot(self):
+        """Return the catalog snapshot to build changes against, loading it
+        from the ``--snapshot`` file if one was specified or reading it from
+        the database, exiting if it can not be loaded.
+
+        :rtype: pg_lifecycle.catalog.Snapshot
+
+        """
+        try:
+            with metrics.phase('snapshot'):
+                if getattr(self.args, 'snapshot', None):
+                    return catalog.load(self.args.snapshot)
+                conn = connection.connect(self.args)
+                try:
+                    return catalog.fetch(conn)
+                finally:
+                    conn.close()
+        except (OSError, ValueError, psycopg2.Error) as error:
+            common.exit_application(
+                'Failed to load the catalog for {}: {}'.format(
+                    self.database(), str(error).strip()), 3)
+
+    def _order(self):
+        """Return the manifest offsets in build order and the dependency
+        graph of the files, with a node for each manifest offset.
+
+        :rtype: tuple(list, pg_lifecycle.graph.Graph)
+        :raises: ValueError
+
+        """
+        manifest = self.project.manifest
+        owners = {}
+        for offset in range(0, len(manifest)):
+            owners.setdefault(manifest[offset].id, offset)
+        for offset in range(0, len(manifest)):
+            for dump_id in manifest.includes(offset):
+                owners.setdefault(dump_id, offset)
+        owners.pop(-1, None)
+
+        parents = []
+        for offset in range(0, len(manifest)):
+            values = set([])
+            for dump_id in manifest.dependencies(offset):
+                parent = owners.get(dump_id)
+                if parent is not None and parent != offset:
+                    values.add(parent)
+            parents.append(values)
+
+        dependencies = graph.Graph(parents)
+        try:
+            return dependencies.order(), dependencies
+        except graph.CycleError as error:
+            paths = [manifest[offset].path for offset in error.cycle]
+            raise graph.CycleError(paths, 'Dependency cycle: {}'.format(
+                ' -> '.join(paths)))
+
+    @contextlib.contextmanager
+    def _output(self):
+        """Return the binary handle to write the built DDL to"""
+        if self.args.file == 'stdout':
+            yield sys.stdout.buffer
+            sys.stdout.buffer.flush()
+        else:
+            with open(self.args.file, 'wb', buffering=CHUNK_SIZE) as handle:
+                yield handle
+
+    def _plan(self):
+        """Return the build plan, exiting if the project can not be ordered
+
+        :rtype: list
+
+        """
+        try:
+            return self.plan()
+        except ValueError as error:
+            common.exit_application(str(error), 3)
+
+
+def divide(content, included=False):
+    """Divide the content of a project file into the DDL that is written in
+    build order and the DDL for each type of deferred child object.
+
+    :param str content: The file content
+    :param bool included: The file's object was included by another file,
+        so only its children are written
+    :rtype: tuple(str, dict)
+
+    """
+    values, deferred = [], collections.OrderedDict()
+    for child_type, ddl in project.sections(content):
+        if child_type in DEFERRED:
+            deferred[child_type] = deferred.get(child_type, '') + \
+                '\n{}'.format(ddl)
+        elif child_type or not included:
+            values.append(ddl)
+    return ''.join(values), deferred
+
+
+def _write(handle, ddl):
+    """Write the DDL to the handle in fixed size chunks, returning the number
+    of bytes written.
+
+    """
+    data = memoryview(ddl.encode('utf-8'))
+    for offset in range(0, len(data), CHUNK_SIZE):
+        handle.write(data[offset:offset + CHUNK_SIZE])
+    return len(data)
@@ -0,0 +1,478 @@
+# coding=utf-8
+"""
+Project Caches
+
+Project caches are stored in the ``.pgl-cache`` directory inside of the
+project, or next to the project archive. Database dumps are cached in the
+user's cache directory.
+
+"""
+import array
+import hashlib
+import json
+import logging
+import os
+from os import path
+import shutil
+import threading
+
+from pg_lifecycle import common
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR = '.pgl-cache'
+CHUNK_SIZE = 65536
+
+
+class BuildCache:
+    """Reusable build state for a project: the build plan for the current
+    manifest, and the content hash and location in the last build output of
+    each file's DDL.
+
+    The modification time and size of the manifest and every file in the
+    last build are stored in a separate stamp file so that an unchanged
+    project is detected without loading the rest of the cache. The content
+    hash of a file is only recomputed when its modification time or size
+    has changed.
+
+    :param pg_lifecycle.project.Project project: The project to cache
+        builds for
+
+    """
+    def __init__(self, project):
+        self.path = path.join(project.cache_path, 'build')
+        self.project = project
+        self.output_path = path.join(self.path, 'output.sql')
+        self.files = {}
+        self.hits, self.misses = 0, 0
+        self.source = None
+        self.stamps = {}
+        self._run = None
+        self._state = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def state(self):
+        """Return the state of the last build, loading it on first access.
+
+        :rtype: dict
+
+        """
+        if self._state is None:
+            self._state = load_json(path.join(self.path, 'state.json'), {})
+            if not path.exists(self.output_path):
+                self._state = {}
+        return self._state
+
+    def close(self):
+        """Close the previous build output if it was opened"""
+        if self.source:
+            self.source.close()
+            self.source = None
+
+    def copy(self, segment, handle):
+        """Copy a segment of the previous build output to the handle,
+        returning the number of bytes copied. Contiguous segments are
+        coalesced and copied when :meth:`flush` is called.
+
+        :param list segment: The offset and length of the segment
+        :param file handle: The binary file handle to write to
+        :rtype: int
+
+        """
+        if self._run and self._run[0] + self._run[1] == segment[0]:
+            self._run[1] += segment[1]
+        else:
+            self.flush(handle)
+            self._run = list(segment)
+        return segment[1]
+
+    def flush(self, handle):
+        """Write any pending segments of the previous build output.
+
+        :param file handle: The binary file handle to write to
+
+        """
+        if not self._run:
+            return
+        offset, remaining = self._run
+        self._run = None
+        if not self.source:
+            self.source = open(self.output_path, 'rb')
+        self.source.seek(offset)
+        while remaining:
+            data = self.source.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                raise ValueError('Build cache output is truncated')
+            handle.write(data)
+            remaining -= len(data)
+
+    def lookup(self, file_path, included):
+        """Return the cached segments for the file if its content is
+        unchanged since the last build and it has the same inclusion state.
+        The content is only hashed if the file's modification time or size
+        changed. The segments are ``[main, deferred]`` where ``main`` is the
+        offset and length of the file's own DDL and ``deferred`` maps each
+        deferred child type to the offset and length of its DDL.
+
+        :param str file_path: The project relative path
+        :param bool included: The file's object was included by another file
+        :rtype: list or None
+
+        """
+        value = self.state.get('files', {}).get(file_path)
+        if value and value[3] == included:
+            stamp = list(self._stamp(file_path))
+            if stamp == value[0:2] or \
+                    self.project.digest(file_path) == value[2]:
+                self.hits += 1
+                self.files[file_path] = stamp + value[2:4] + [None, {}]
+                return value[4:6]
+        self.misses += 1
+        return None
+
+    def manifest_digest(self):
+        """Return the content hash of the project manifest.
+
+        :rtype: str
+
+        """
+        value = self.state.get('manifest')
+        if value and list(self._stamp(common.MANIFEST)) == value[0:2]:
+            return value[2]
+        return self.project.digest(common.MANIFEST)
+
+    def plan(self, manifest_digest):
+        """Return the cached build plan for the manifest digest.
+
+        :param str manifest_digest: The digest of the project manifest
+        :rtype: list or None
+
+        """
+        value = self.state.get('manifest')
+        if value and value[2] == manifest_digest:
+            self.hits += 1
+            return self.state['plan']
+        self.misses += 1
+        return None
+
+    def record(self, file_path, included, content):
+        """Record a file whose DDL was read from the project.
+
+        :param str file_path: The project relative path
+        :param bool included: The file's object was included by another file
+        :param bytes content: The file content
+
+        """
+        stat = self.project.stat(file_path)
+        self.stamps[file_path] = stat
+        self.files[file_path] = [
+            stat[0], stat[1], hashlib.sha256(content).hexdigest(),
+            included, None, {}]
+
+    def save(self, manifest_digest, plan, output_path):
+        """Replace the cached build with the new output and state.
+
+        :param str manifest_digest: The digest of the project manifest
+        :param list plan: The build plan
+        :param str output_path: The path of the new build output
+
+        """
+        self.close()
+        os.replace(output_path, self.output_path)
+        self._state = {
+            'manifest': list(self._stamp(common.MANIFEST)) + [
+                manifest_digest],
+            'plan': plan,
+            'files': self.files}
+        save_json(path.join(self.path, 'state.json'), self._state)
+        stamps = array.array('q', self._stamp(common.MANIFEST))
+        for file_path, _included in plan:
+            stamps.extend(self._stamp(file_path))
+        with open(path.join(self.path, 'stamps'), 'wb') as handle:
+            stamps.tofile(handle)
+        with open(path.join(self.path, 'plan'), 'w') as handle:
+            handle.write('\n'.join(file_path for file_path, _ in plan))
+
+    def segment(self, file_path, child_type, start, length):
+        """Record the location of DDL for a file in the new build output.
+
+        :param str file_path: The project relative path
+        :param str child_type: The deferred child type or None for the
+            file's own DDL
+        :param int start: The offset of the DDL in the output
+        :param int length: The length of the DDL
+
+        """
+        if child_type is None:
+            self.files[file_path][4] = [start, length]
+        else:
+            self.files[file_path][5][child_type] = [start, length]
+
+    def temp_path(self):
+        """Return the path to write a new build output to.
+
+        :rtype: str
+
+        """
+        os.makedirs(self.path, exist_ok=True)
+        return path.join(self.path, 'output.sql.{}'.format(os.getpid()))
+
+    def unchanged(self):
+        """Return True if the manifest and every file in the last build have
+        the same modification time and size, in which case the previous
+        output can be used as is.
+
+        :rtype: bool
+
+        """
+        stamps, unchanged = array.array('q'), True
+        try:
+            with open(path.join(self.path, 'plan'), 'r') as handle:
+                paths = handle.read().split('\n')
+            with open(path.join(self.path, 'stamps'), 'rb') as handle:
+                stamps.frombytes(handle.read())
+        except (OSError, ValueError):
+            return False
+        if not path.exists(self.output_path) or \
+                len(stamps) != (len(paths) + 1) * 2:
+            return False
+        for offset, file_path in enumerate([common.MANIFEST] + paths):
+            try:
+                stamp = self._stamp(file_path)
+            except OSError:
+                unchanged = False
+                continue
+            if stamp[0] != stamps[offset * 2] or \
+                    stamp[1] != stamps[offset * 2 + 1]:
+                unchanged = False
+        if unchanged:
+            self.hits += len(paths) + 1
+        return unchanged
+
+    def _stamp(self, file_path):
+        """Return the modification time and size of the project file,
+        reusing the value if the file was already checked.
+
+        """
+        if file_path not in self.stamps:
+            self.stamps[file_path] = self.project.stat(file_path)
+        return self.stamps[file_path]
+
+
+class FingerprintCache:
+    """Fingerprints of the objects defined in each project file, reused
+    while the file has the same modification time and size. The cache can
+    be shared by diffs run in different threads.
+
+    :param pg_lifecycle.project.Project project: The project to cache
+        fingerprints for
+
+    """
+    def __init__(self, project):
+        self.file_path = path.join(project.cache_path, 'fingerprints.json')
+        self.project = project
+        self.hits, self.misses = 0, 0
+        self.lock = threading.Lock()
+        self.values = load_json(self.file_path, {})
+        self._changed = False
+
+    def get(self, file_path, fingerprints):
+        """Return the fingerprints for the project file, calling
+        ``fingerprints`` to calculate them if the file has changed.
+
+        :param str file_path: The project relative path
+        :param callable fingerprints: Returns the file's fingerprints
+        :rtype: list
+
+        """
+        stat = self.project.stat(file_path)
+        value = self.values.get(file_path)
+        if value and value[0:2] == list(stat):
+            with self.lock:
+                self.hits += 1
+            return value[2]
+        value = [stat[0], stat[1], fingerprints()]
+        with self.lock:
+            self.misses += 1
+            self._changed = True
+            self.values[file_path] = value
+        return value[2]
+
+    def save(self):
+        """Save the fingerprints if any were calculated"""
+        with self.lock:
+            if self._changed:
+                save_json(self.file_path, self.values)
+                self._changed = False
+
+
+class DigestCache:
+    """Content hashes of project files, reused while the file has the same
+    modification time and size.
+
+    :param pg_lifecycle.project.Project project: The project to cache
+        content hashes for
+
+    """
+    def __init__(self, project):
+        self.file_path = path.join(project.cache_path, 'digests.json')
+        self.project = project
+        self.values = load_json(self.file_path, {})
+        self._changed = False
+
+    def discard(self, file_path):
+        """Remove the content hash of a project file that was removed.
+
+        :param str file_path: The project relative path
+
+        """
+        if self.values.pop(file_path, None) is not None:
+            self._changed = True
+
+    def get(self, file_path):
+        """Return the content hash of the project file, reading the file if
+        it has changed.
+
+        :param str file_path: The project relative path
+        :rtype: str
+        :raises: OSError
+
+        """
+        stat = self.project.stat(file_path)
+        value = self.values.get(file_path)
+        if value and value[0:2] == list(stat):
+            return value[2]
+        self._changed = True
+        self.values[file_path] = list(stat) + [
+            self.project.digest(file_path)]
+        return self.values[file_path][2]
+
+    def save(self):
+        """Save the content hashes if any were changed"""
+        if self._changed:
+            save_json(self.file_path, self.values)
+            self._changed = False
+
+    def store(self, file_path, digest):
+        """Record the content hash of a project file that was written.
+
+        :param str file_path: The project relative path
+        :param str digest: The SHA-256 hex digest of the file's content
+
+        """
+        self._changed = True
+        self.values[file_path] = list(self.project.stat(file_path)) + [digest]
+
+
+class DumpCache:
+    """Directory format dumps of databases, reused while the fingerprint of
+    the database's catalog is unchanged. The most recent dump is kept for
+    each identity, which names the database and the pg_dump options used.
+
+    :param str cache_path: The directory to cache dumps in
+    :param str identity: The database and pg_dump options being dumped
+
+    """
+    def __init__(self, cache_path, identity):
+        self.path = path.join(cache_path, hashlib.sha256(
+            identity.encode('utf-8')).hexdigest()[:32])
+        self.fingerprint_path = '{}.fingerprint'.format(self.path)
+
+    def lookup(self, fingerprint):
+        """Return the path to the cached dump if it was made when the
+        catalog had the same fingerprint.
+
+        :param str fingerprint: The current catalog fingerprint
+        :rtype: str or None
+
+        """
+        try:
+            with open(self.fingerprint_path, 'r') as handle:
+                value = handle.read()
+        except OSError:
+            return None
+        if value == fingerprint and \
+                path.isfile(path.join(self.path, 'toc.dat')):
+            return self.path
+        return None
+
+    def store(self, temp_path, fingerprint):
+        """Replace the cached dump with the dump in the temporary path,
+        returning the path to the cached dump.
+
+        :param str temp_path: The path the new dump was written to
+        :param str fingerprint: The catalog fingerprint for the new dump
+        :rtype: str
+
+        """
+        if path.exists(self.fingerprint_path):
+            os.unlink(self.fingerprint_path)
+        if path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.rename(temp_path, self.path)
+        with open(self.fingerprint_path, 'w') as handle:
+            handle.write(fingerprint)
+        return self.path
+
+    def temp_path(self):
+        """Return the path to dump the database to before it is stored.
+
+        :rtype: str
+
+        """
+        os.makedirs(path.dirname(self.path), exist_ok=True)
+        return '{}.{}'.format(self.path, os.getpid())
+
+
+def file_digest(file_path):
+    """Return the SHA-256 hex digest of the file's content.
+
+    :param str file_path: The path to the file
+    :rtype: str
+
+    """
+    value = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for data in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            value.update(data)
+    return value.hexdigest()
+
+
+def load_json(file_path, default):
+    """Return the value stored in the JSON cache file, or the default if
+    the file does not exist or is invalid.
+
+    :param str file_path: The path to the cache file
+    :param mixed default: The value to return if the file can not be read
+    :rtype: mixed
+
+    """
+    try:
+        with open(file_path, 'r') as handle:
+            return json.load(handle)
+    except (OSError, ValueError) as error:
+        if path.exists(file_path):
+            LOGGER.warning('Ignoring invalid cache file %s: %s',
+                           file_path, error)
+        return default
+
+
+def save_json(file_path, value):
+    """Atomically replace the JSON cache file with the value.
+
+    :param str file_path: The path to the cache file
+    :param mixed value: The value to save
+
+    """
+    os.makedirs(path.dirname(file_path), exist_ok=True)
+    temp_path = '{}.{}.{}'.format(
+        file_path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'w') as handle:
+        handle.write(json.dumps(value, separators=(',', ':')))
+    os.replace(temp_path, file_path)
@@ -0,0 +1,617 @@
+# coding=utf-8
+"""
+Database Catalog Snapshots
+
+A snapshot holds DDL for the objects in a database, built from the system
+catalog in the same format pg_dump uses so that it can be compared with a
+project. The catalog is read with a fixed number of bulk queries, one per
+class of object, regardless of how many objects the database has.
+
+"""
+import collections
+import hashlib
+import json
+import logging
+
+from pg_lifecycle import common, sql
+
+LOGGER = logging.getLogger(__name__)
+
+VERSION = 1
+
+DESCS = {
+    common.CHECK_CONSTRAINT, common.COMMENT, common.CONSTRAINT,
+    common.DEFAULT, common.DOMAIN, common.EXTENSION, common.FK_CONSTRAINT,
+    common.FUNCTION, common.INDEX, common.MATERIALIZED_VIEW,
+    common.PROCEDURE, common.SCHEMA, common.SEQUENCE,
+    common.SEQUENCE_OWNED_BY, common.TABLE, common.TRIGGER, common.TYPE,
+    common.VIEW}
+
+COMMENT_TARGETS = {
+    common.COLUMN, common.CONSTRAINT, common.DOMAIN, common.EXTENSION,
+    common.FUNCTION, common.INDEX, common.MATERIALIZED_VIEW,
+    common.PROCEDURE, common.SCHEMA, common.SEQUENCE, common.TABLE,
+    common.TRIGGER, common.TYPE, common.VIEW}
+
+RELKINDS = {
+    'm': common.MATERIALIZED_VIEW,
+    'p': common.TABLE,
+    'r': common.TABLE,
+    'S': common.SEQUENCE,
+    'v': common.VIEW}
+
+SEQUENCE_LIMITS = {
+    'bigint': (-9223372036854775808, 9223372036854775807),
+    'integer': (-2147483648, 2147483647),
+    'smallint': (-32768, 32767)}
+
+SCHEMA_FILTER = ("{{0}}.nspname !~ '^pg_' AND {{0}}.nspname NOT IN "
+                 "('information_schema', '{}')".format(common.JOURNAL_SCHEMA))
+
+EXTENSION_FILTER = """NOT EXISTS (
+          SELECT 1 FROM pg_catalog.pg_depend AS x
+           WHERE x.classid = '{0}'::pg_catalog.regclass
+             AND x.objid = {1}.oid AND x.deptype = 'e')"""
+
+COLUMNS = """(
+        SELECT pg_catalog.json_agg(pg_catalog.json_build_array(
+                 pg_catalog.quote_ident(a.attname),
+                 pg_catalog.format_type(a.atttypid, a.atttypmod),
+                 CASE WHEN a.attcollation <> t.typcollation THEN (
+                   SELECT pg_catalog.format('%I.%I', cn.nspname, co.collname)
+                     FROM pg_catalog.pg_collation AS co
+                     JOIN pg_catalog.pg_namespace AS cn
+                       ON cn.oid = co.collnamespace
+                    WHERE co.oid = a.attcollation) END,
+                 a.attnotnull,
+                 pg_catalog.pg_get_expr(d.adbin, d.adrelid),
+                 a.attgenerated <> '',
+                 pg_catalog.col_description(a.attrelid, a.attnum),
+                 EXISTS (
+                   SELECT 1 FROM pg_catalog.pg_depend AS dd
+                     JOIN pg_catalog.pg_depend AS sd
+                       ON sd.objid = dd.refobjid
+                      AND sd.classid = 'pg_class'::pg_catalog.regclass
+                      AND sd.refobjid = a.attrelid AND sd.deptype = 'a'
+                    WHERE dd.classid = 'pg_attrdef'::pg_catalog.regclass
+                      AND dd.objid = d.oid
+                      AND dd.refclassid = 'pg_class'::pg_catalog.regclass))
+                 ORDER BY a.attnum)
+          FROM pg_catalog.pg_attribute AS a
+          JOIN pg_catalog.pg_type AS t ON t.oid = a.atttypid
+          LEFT JOIN pg_catalog.pg_attrdef AS d
+            ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+         WHERE a.attrelid = {} AND a.attnum > 0 AND NOT a.attisdropped)"""
+
+FINGERPRINT_CATALOGS = [
+    'pg_aggregate', 'pg_amop', 'pg_amproc', 'pg_attrdef', 'pg_attribute',
+    'pg_cast', 'pg_class', 'pg_collation', 'pg_constraint', 'pg_conversion',
+    'pg_default_acl', 'pg_description', 'pg_enum', 'pg_event_trigger',
+    'pg_extension', 'pg_foreign_data_wrapper', 'pg_foreign_server',
+    'pg_foreign_table', 'pg_index', 'pg_inherits', 'pg_init_privs',
+    'pg_language', 'pg_namespace', 'pg_opclass', 'pg_operator',
+    'pg_opfamily', 'pg_partitioned_table', 'pg_policy', 'pg_proc',
+    'pg_publication', 'pg_publication_rel', 'pg_range', 'pg_rewrite',
+    'pg_seclabel', 'pg_sequence', 'pg_statistic_ext', 'pg_transform',
+    'pg_trigger', 'pg_ts_config', 'pg_ts_config_map', 'pg_ts_dict',
+    'pg_ts_parser', 'pg_ts_template', 'pg_type']
+
+FINGERPRINT = """\
+SELECT pg_catalog.current_setting('server_version_num'), d.oid::text
+  FROM pg_catalog.pg_database AS d
+ WHERE d.datname = pg_catalog.current_database()
+UNION ALL
+SELECT 'pg_roles', pg_catalog.md5(pg_catalog.string_agg(
+         r.oid::text || ' ' || r.rolname, ',' ORDER BY r.oid))
+  FROM pg_catalog.pg_roles AS r
+""" + ''.join("""UNION ALL
+SELECT '{0}', pg_catalog.concat_ws(
+         ' ', pg_catalog.count(*), pg_catalog.max(xmin::text::bigint),
+         pg_catalog.sum(xmin::text::bigint))
+  FROM pg_catalog.{0}
+""".format(name) for name in FINGERPRINT_CATALOGS)
+
+QUERIES = collections.OrderedDict([
+    ('schemas', """\
+SELECT n.oid, n.nspname AS tag,
+       pg_catalog.quote_ident(n.nspname) AS name,
+       pg_catalog.pg_get_userbyid(n.nspowner) AS owner,
+       n.nspacl::text[] AS acl,
+       COALESCE((SELECT i.initprivs FROM pg_catalog.pg_init_privs AS i
+                  WHERE i.objoid = n.oid AND i.objsubid = 0
+                    AND i.classoid = 'pg_namespace'::pg_catalog.regclass),
+                pg_catalog.acldefault('n', n.nspowner))::text[]
+         AS default_acl,
+       pg_catalog.obj_description(n.oid, 'pg_namespace') AS comment
+  FROM pg_catalog.pg_namespace AS n
+ WHERE {} AND {}
+ ORDER BY n.oid""".format(SCHEMA_FILTER.format('n'),
+                          EXTENSION_FILTER.format('pg_namespace', 'n'))),
+    ('extensions', """\
+SELECT e.oid, e.extname AS tag,
+       pg_catalog.quote_ident(e.extname) AS name,
+       pg_catalog.quote_ident(n.nspname) AS schema,
+       pg_catalog.obj_description(e.oid, 'pg_extension') AS comment
+  FROM pg_catalog.pg_extension AS e
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = e.extnamespace
+ WHERE e.extname <> 'plpgsql'
+ ORDER BY e.oid"""),
+    ('types', """\
+SELECT t.oid, t.typrelid AS relation, t.typtype AS kind,
+       n.nspname AS namespace, t.typname AS tag,
+       pg_catalog.format('%I.%I', n.nspname, t.typname) AS name,
+       pg_catalog.pg_get_userbyid(t.typowner) AS owner,
+       t.typacl::text[] AS acl,
+       pg_catalog.acldefault('T', t.typowner)::text[] AS default_acl,
+       (SELECT pg_catalog.json_agg(e.enumlabel ORDER BY e.enumsortorder)
+          FROM pg_catalog.pg_enum AS e
+         WHERE e.enumtypid = t.oid) AS labels,
+       {} AS columns,
+       pg_catalog.format_type(t.typbasetype, t.typtypmod) AS base_type,
+       t.typnotnull AS not_null,
+       t.typdefault AS default,
+       (SELECT pg_catalog.json_agg(pg_catalog.json_build_array(
+                 pg_catalog.quote_ident(k.conname),
+                 pg_catalog.pg_get_constraintdef(k.oid)) ORDER BY k.conname)
+          FROM pg_catalog.pg_constraint AS k
+         WHERE k.contypid = t.oid) AS checks,
+       pg_catalog.obj_description(t.oid, 'pg_type') AS comment
+  FROM pg_catalog.pg_type AS t
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = t.typnamespace
+  LEFT JOIN pg_catalog.pg_class AS c ON c.oid = t.typrelid
+ WHERE (t.typtype IN ('d', 'e') OR (t.typtype = 'c' AND c.relkind = 'c'))
+   AND {} AND {}
+ ORDER BY t.oid""".format(COLUMNS.format('t.typrelid'),
+                          SCHEMA_FILTER.format('n'),
+                          EXTENSION_FILTER.format('pg_type', 't'))),
+    ('relations', """\
+SELECT c.oid, c.relkind AS kind,
+       c.relpersistence AS persistence,
+       n.nspname AS namespace, c.relname AS tag,
+       pg_catalog.format('%I.%I', n.nspname, c.relname) AS name,
+       pg_catalog.pg_get_userbyid(c.relowner) AS owner,
+       c.relacl::text[] AS acl,
+       pg_catalog.acldefault(CASE WHEN c.relkind = 'S' THEN 's' ELSE 'r' END,
+                             c.relowner)::text[] AS default_acl,
+       CASE WHEN c.relkind IN ('m', 'v')
+            THEN pg_catalog.pg_get_viewdef(c.oid) END AS query,
+       CASE WHEN c.relkind = 'p'
+            THEN pg_catalog.pg_get_partkeydef(c.oid) END AS partition_key,
+       pg_catalog.format_type(s.seqtypid, NULL) AS sequence_type,
+       s.seqstart AS start, s.seqincrement AS increment,
+       s.seqmin AS minimum, s.seqmax AS maximum,
+       s.seqcache AS cache, s.seqcycle AS cycle,
+       (SELECT pg_catalog.format('%I.%I.%I', dn.nspname, dc.relname,
+                                 da.attname)
+          FROM pg_catalog.pg_depend AS d
+          JOIN pg_catalog.pg_class AS dc ON dc.oid = d.refobjid
+          JOIN pg_catalog.pg_namespace AS dn ON dn.oid = dc.relnamespace
+          JOIN pg_catalog.pg_attribute AS da
+            ON da.attrelid = d.refobjid AND da.attnum = d.refobjsubid
+         WHERE d.classid = 'pg_class'::pg_catalog.regclass
+           AND d.objid = c.oid AND d.refobjsubid > 0
+           AND d.deptype = 'a') AS owned_by,
+       {} AS columns,
+       (SELECT pg_catalog.json_agg(pg_catalog.json_build_array(
+                 pg_catalog.quote_ident(k.conname),
+                 pg_catalog.pg_get_constraintdef(k.oid)) ORDER BY k.conname)
+          FROM pg_catalog.pg_constraint AS k
+         WHERE k.conrelid = c.oid AND k.contype = 'c'
+           AND k.conislocal AND k.convalidated) AS checks,
+       pg_catalog.obj_description(c.oid, 'pg_class') AS comment
+  FROM pg_catalog.pg_class AS c
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+  LEFT JOIN pg_catalog.pg_sequence AS s ON s.seqrelid = c.oid
+ WHERE c.relkind IN ('m', 'p', 'r', 'S', 'v')
+   AND NOT EXISTS (
+         SELECT 1 FROM pg_catalog.pg_depend AS i
+          WHERE i.classid = 'pg_class'::pg_catalog.regclass
+            AND i.objid = c.oid AND i.deptype = 'i')
+   AND {} AND {}
+ ORDER BY c.oid""".format(COLUMNS.format('c.oid'),
+                          SCHEMA_FILTER.format('n'),
+                          EXTENSION_FILTER.format('pg_class', 'c'))),
+    ('functions', """\
+SELECT p.oid, CASE p.prokind WHEN 'p' THEN 'PROCEDURE'
+                             ELSE 'FUNCTION' END AS kind,
+       n.nspname AS namespace,
+       pg_catalog.format(
+         '%s(%s)', p.proname,
+         pg_catalog.pg_get_function_identity_arguments(p.oid)) AS tag,
+       pg_catalog.pg_get_userbyid(p.proowner) AS owner,
+       p.proacl::text[] AS acl,
+       pg_catalog.acldefault('f', p.proowner)::text[] AS default_acl,
+       pg_catalog.format(
+         '%I.%I(%s)', n.nspname, p.proname,
+         pg_catalog.pg_get_function_identity_arguments(p.oid)) AS signature,
+       pg_catalog.pg_get_functiondef(p.oid) AS definition,
+       pg_catalog.obj_description(p.oid, 'pg_proc') AS comment
+  FROM pg_catalog.pg_proc AS p
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = p.pronamespace
+ WHERE p.prokind IN ('f', 'p') AND {} AND {}
+ ORDER BY p.oid""".format(SCHEMA_FILTER.format('n'),
+                          EXTENSION_FILTER.format('pg_proc', 'p'))),
+    ('constraints', """\
+SELECT k.oid, k.conrelid AS relation, k.conindid AS index_oid,
+       k.contype AS kind,
+       k.convalidated AS validated,
+       n.nspname AS namespace,
+       pg_catalog.format('%s %s', c.relname, k.conname) AS tag,
+       pg_catalog.format('%I.%I', n.nspname, c.relname) AS table_name,
+       c.relkind AS table_kind,
+       pg_catalog.quote_ident(k.conname) AS name,
+       pg_catalog.pg_get_constraintdef(k.oid) AS definition,
+       pg_catalog.obj_description(k.oid, 'pg_constraint') AS comment
+  FROM pg_catalog.pg_constraint AS k
+  JOIN pg_catalog.pg_class AS c ON c.oid = k.conrelid
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+ WHERE k.contype IN ('c', 'f', 'p', 'u', 'x') AND k.conislocal
+   AND c.relkind IN ('p', 'r') AND {} AND {}
+ ORDER BY k.oid""".format(SCHEMA_FILTER.format('n'),
+                          EXTENSION_FILTER.format('pg_class', 'c'))),
+    ('indexes', """\
+SELECT i.indexrelid AS oid, i.indrelid AS relation,
+       n.nspname AS namespace, ic.relname AS tag,
+       pg_catalog.format('%I.%I', n.nspname, ic.relname) AS name,
+       pg_catalog.pg_get_indexdef(i.indexrelid) AS definition,
+       pg_catalog.obj_description(i.indexrelid, 'pg_class') AS comment
+  FROM pg_catalog.pg_index AS i
+  JOIN pg_catalog.pg_class AS ic ON ic.oid = i.indexrelid
+  JOIN pg_catalog.pg_class AS c ON c.oid = i.indrelid
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = ic.relnamespace
+ WHERE c.relkind IN ('m', 'p', 'r')
+   AND NOT EXISTS (
+         SELECT 1 FROM pg_catalog.pg_constraint AS k
+          WHERE k.conindid = i.indexrelid AND k.contype IN ('p', 'u', 'x'))
+   AND {} AND {}
+ ORDER BY i.indexrelid""".format(SCHEMA_FILTER.format('n'),
+                                 EXTENSION_FILTER.format('pg_class', 'c'))),
+    ('triggers', """\
+SELECT t.oid, t.tgrelid AS relation,
+       n.nspname AS namespace,
+       pg_catalog.format('%s %s', c.relname, t.tgname) AS tag,
+       pg_catalog.format('%I.%I', n.nspname, c.relname) AS table_name,
+       pg_catalog.quote_ident(t.tgname) AS name,
+       pg_catalog.pg_get_triggerdef(t.oid) AS definition,
+       pg_catalog.obj_description(t.oid, 'pg_trigger') AS comment
+  FROM pg_catalog.pg_trigger AS t
+  JOIN pg_catalog.pg_class AS c ON c.oid = t.tgrelid
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+ WHERE NOT t.tgisinternal AND {} AND {}
+ ORDER BY t.oid""".format(SCHEMA_FILTER.format('n'),
+                          EXTENSION_FILTER.format('pg_class', 'c')))])
+
+CatalogObject = collections.namedtuple(
+    'CatalogObject', ['ddl', 'drop', 'statements', 'fingerprint'])
+
+
+class Snapshot:
+    """The objects in a database, keyed by the ``(desc, name)`` tuple that
+    :func:`pg_lifecycle.sql.classify` returns for their DDL.
+
+    :param list objects: The DDL and drop statement for each object
+    :param int server_version: The version of the server the snapshot is of
+
+    """
+    def __init__(self, objects, server_version=None):
+        self.objects = collections.OrderedDict()
+        self.server_version = server_version
+        for ddl, drop in objects:
+            values = sql.objects(ddl)
+            if not values:
+                LOGGER.warning('Ignoring unclassified catalog DDL: %s', ddl)
+                continue
+            key, statements = values[0]
+            self.objects[key] = CatalogObject(
+                ddl, drop, statements, sql.fingerprint(statements[0][1]))
+
+    def __contains__(self, key):
+        return key in self.objects
+
+    def __getitem__(self, key):
+        return self.objects[key]
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def save(self, file_path):
+        """Save the snapshot so that it can be used in place of a database.
+
+        :param str file_path: The path to write the snapshot to
+
+        """
+        with open(file_path, 'w') as handle:
+            handle.write(json.dumps({
+                'version': VERSION,
+                'server_version': self.server_version,
+                'objects': [[value.ddl, value.drop]
+                            for value in self.objects.values()]}))
+
+
+def covered(key, statement):
+    """Return True if objects like the one the statement defines are
+    included in snapshots, in which case the absence of the object from a
+    snapshot means it does not exist in the database.
+
+    :param tuple key: The ``(desc, name)`` key of the object
+    :param str statement: The normalised statement defining the object
+    :rtype: bool
+
+    """
+    if key[0] == common.TYPE:
+        return statement.startswith('CREATE TYPE {} AS '.format(key[1])) \
+            and not statement.startswith(
+                'CREATE TYPE {} AS RANGE '.format(key[1]))
+    elif key[0] == common.COMMENT:
+        for target in COMMENT_TARGETS:
+            if key[1].startswith(target + ' '):
+                return True
+        return False
+    return key[0] in DESCS
+
+
+def fetch(connection):
+    """Return a snapshot of the database, reading the catalog in a single
+    read-only, repeatable read transaction.
+
+    :param psycopg2.extensions.connection connection: The connection to use
+    :rtype: Snapshot
+
+    """
+    connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    objects = []
+    with connection.cursor() as cursor:
+        for name in QUERIES:
+            for row in rows(cursor, name):
+                objects.extend(BUILDERS[name](row))
+    connection.rollback()
+    return Snapshot(objects, connection.server_version)
+
+
+def fingerprint(connection):
+    """Return a fingerprint of the database's catalog that changes when any
+    object in it is created, altered or dropped. Every change to a catalog
+    row writes a new row version with a new transaction id, so the
+    fingerprint is a hash over the number of rows in each catalog and the
+    maximum and sum of their ``xmin``, which only needs an aggregate over
+    each catalog, along with the server version, the database's oid and the
+    names of the roles that own and are granted privileges on objects.
+    ``pg_authid`` can only be read by superusers, so role renames are found
+    by the names in ``pg_roles``.
+
+    :param psycopg2.extensions.connection connection: The connection to use
+    :rtype: str
+    :raises: psycopg2.Error
+
+    """
+    connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    with connection.cursor() as cursor:
+        cursor.execute(FINGERPRINT)
+        rows = cursor.fetchall()
+    connection.rollback()
+    value = '\n'.join('{}\t{}'.format(*row) for row in sorted(rows))
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def load(file_path):
+    """Load a snapshot saved with :meth:`Snapshot.save`.
+
+    :param str file_path: The path to the snapshot
+    :rtype: Snapshot
+    :raises: ValueError
+
+    """
+    with open(file_path, 'r') as handle:
+        value = json.load(handle)
+    if not isinstance(value, dict) or value.get('version') != VERSION:
+        raise ValueError('Unsupported snapshot: {}'.format(file_path))
+    return Snapshot(value['objects'], value.get('server_version'))
+
+
+def rows(cursor, name):
+    """Run the named catalog query, returning each row as a dict.
+
+    :param psycopg2.extensions.cursor cursor: The cursor to use
+    :param str name: The name of the query in :data:`QUERIES`
+    :rtype: list
+    :raises: psycopg2.Error
+
+    """
+    cursor.execute(QUERIES[name])
+    columns = [column.name for column in cursor.description]
+    values = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    LOGGER.debug('Fetched %i %s from the catalog', len(values), name)
+    return values
+
+
+def _comment(target, comment):
+    """Return the DDL and drop statement for a comment"""
+    return ('COMMENT ON {} IS {};'.format(target, sql.quote_literal(comment)),
+            'COMMENT ON {} IS NULL;'.format(target))
+
+
+def _columns(columns, separator):
+    """Return the column definitions for a table or composite type, with
+    the defaults that pg_dump writes in the ``CREATE TABLE`` statement.
+
+    """
+    values = []
+    for name, type_name, collation, not_null, default, generated, _, \
+            separate in columns or []:
+        value = '{} {}'.format(name, type_name)
+        if generated:
+            value += ' GENERATED ALWAYS AS ({}) STORED'.format(default)
+        elif default and not separate:
+            value += ' DEFAULT {}'.format(default)
+        if not_null:
+            value += ' NOT NULL'
+        if collation:
+            value += ' COLLATE {}'.format(collation)
+        values.append(separator + value)
+    return values
+
+
+def _column_objects(name, columns, inline=True):
+    """Return the DDL for column comments and for the column defaults that
+    pg_dump writes separately from the ``CREATE TABLE`` statement: those
+    that use a sequence owned by the table, which pg_dump splits out to
+    break the dependency loop between them, and every default of a view.
+
+    """
+    values = []
+    for column, _, _, _, default, generated, comment, separate in \
+            columns or []:
+        if default and not generated and (separate or not inline):
+            values.append((
+                'ALTER TABLE ONLY {} ALTER COLUMN {} SET DEFAULT {};'.format(
+                    name, column, default),
+                'ALTER TABLE {} ALTER COLUMN {} DROP DEFAULT;'.format(
+                    name, column)))
+        if comment:
+            values.append(_comment(
+                'COLUMN {}.{}'.format(name, column), comment))
+    return values
+
+
+def _constraints(row):
+    if row['kind'] != 'c' or not row['validated']:
+        yield ('ALTER TABLE {}{}\n    ADD CONSTRAINT {} {};'.format(
+            'ONLY ' if row['table_kind'] != 'p' else '', row['table_name'],
+            row['name'], row['definition']),
+               'ALTER TABLE {} DROP CONSTRAINT {};'.format(
+                   row['table_name'], row['name']))
+    if row['comment']:
+        yield _comment('CONSTRAINT {} ON {}'.format(
+            row['name'], row['table_name']), row['comment'])
+
+
+def _extensions(row):
+    yield ('CREATE EXTENSION IF NOT EXISTS {} WITH SCHEMA {};'.format(
+        row['name'], row['schema']),
+           'DROP EXTENSION {};'.format(row['name']))
+    if row['comment']:
+        yield _comment('EXTENSION {}'.format(row['name']), row['comment'])
+
+
+def _functions(row):
+    yield (row['definition'].rstrip() + ';',
+           'DROP {} {};'.format(row['kind'], row['signature']))
+    if row['comment']:
+        yield _comment('{} {}'.format(row['kind'], row['signature']),
+                       row['comment'])
+
+
+def _indexes(row):
+    yield (row['definition'] + ';', 'DROP INDEX {};'.format(row['name']))
+    if row['comment']:
+        yield _comment('INDEX {}'.format(row['name']), row['comment'])
+
+
+def _relations(row):
+    desc = RELKINDS[row['kind']]
+    if desc == common.TABLE:
+        ddl = 'CREATE {}TABLE {} (\n{}\n)'.format(
+            'UNLOGGED ' if row['persistence'] == 'u' else '', row['name'],
+            ',\n'.join(_columns(row['columns'], '    ') + [
+                '    CONSTRAINT {} {}'.format(*check)
+                for check in row['checks'] or []]))
+        if row['partition_key']:
+            ddl += '\nPARTITION BY {}'.format(row['partition_key'])
+        ddl += ';'
+    elif desc == common.SEQUENCE:
+        ddl = _sequence(row)
+    elif desc == common.VIEW:
+        ddl = 'CREATE VIEW {} AS\n{}'.format(row['name'], row['query'])
+    else:
+        ddl = 'CREATE MATERIALIZED VIEW {} AS\n{}\n  WITH NO DATA;'.format(
+            row['name'], row['query'].rstrip(';'))
+    yield ddl, 'DROP {} {};'.format(desc, row['name'])
+    if row['comment']:
+        yield _comment('{} {}'.format(desc, row['name']), row['comment'])
+    if row['owned_by']:
+        yield ('ALTER SEQUENCE {} OWNED BY {};'.format(
+            row['name'], row['owned_by']),
+               'ALTER SEQUENCE {} OWNED BY NONE;'.format(row['name']))
+    for value in _column_objects(row['name'], row['columns'],
+                                 desc == common.TABLE):
+        yield value
+
+
+def _schemas(row):
+    if row['name'] != 'public':
+        yield ('CREATE SCHEMA {};'.format(row['name']),
+               'DROP SCHEMA {};'.format(row['name']))
+    if row['comment'] and not (row['name'] == 'public' and
+                               row['comment'] == 'standard public schema'):
+        yield _comment('SCHEMA {}'.format(row['name']), row['comment'])
+
+
+def _sequence(row):
+    """Return the DDL for a sequence in the format pg_dump uses"""
+    minimum, maximum = SEQUENCE_LIMITS.get(
+        row['sequence_type'], SEQUENCE_LIMITS['bigint'])
+    if row['increment'] > 0:
+        minimum = 1
+    else:
+        maximum = -1
+    lines = ['CREATE SEQUENCE {}'.format(row['name'])]
+    if row['sequence_type'] != 'bigint':
+        lines.append('    AS {}'.format(row['sequence_type']))
+    lines.append('    START WITH {}'.format(row['start']))
+    lines.append('    INCREMENT BY {}'.format(row['increment']))
+    lines.append('    NO MINVALUE' if row['minimum'] == minimum
+                 else '    MINVALUE {}'.format(row['minimum']))
+    lines.append('    NO MAXVALUE' if row['maximum'] == maximum
+                 else '    MAXVALUE {}'.format(row['maximum']))
+    lines.append('    CACHE {}'.format(row['cache']))
+    if row['cycle']:
+        lines.append('    CYCLE')
+    return '\n'.join(lines) + ';'
+
+
+def _triggers(row):
+    yield (row['definition'] + ';', 'DROP TRIGGER {} ON {};'.format(
+        row['name'], row['table_name']))
+    if row['comment']:
+        yield _comment('TRIGGER {} ON {}'.format(
+            row['name'], row['table_name']), row['comment'])
+
+
+def _types(row):
+    if row['kind'] == 'e':
+        ddl = 'CREATE TYPE {} AS ENUM (\n{}\n);'.format(
+            row['name'], ',\n'.join(
+                '    {}'.format(sql.quote_literal(label))
+                for label in row['labels'] or []))
+        desc = common.TYPE
+    elif row['kind'] == 'c':
+        ddl = 'CREATE TYPE {} AS (\n{}\n);'.format(
+            row['name'], ',\n'.join(_columns(row['columns'], '\t')))
+        desc = common.TYPE
+    else:
+        ddl = 'CREATE DOMAIN {} AS {}'.format(row['name'], row['base_type'])
+        if row['not_null']:
+            ddl += ' NOT NULL'
+        if row['default']:
+            ddl += ' DEFAULT {}'.format(row['default'])
+        for check in row['checks'] or []:
+            ddl += '\n\tCONSTRAINT {} {}'.format(*check)
+        ddl += ';'
+        desc = common.DOMAIN
+    yield ddl, 'DROP {} {};'.format(desc, row['name'])
+    if row['comment']:
+        yield _comment('{} {}'.format(desc, row['name']), row['comment'])
+
+
+BUILDERS = {
+    'constraints': _constraints,
+    'extensions': _extensions,
+    'functions': _functions,
+    'indexes': _indexes,
+    'relations': _relations,
+    'schemas': _schemas,
+    'triggers': _triggers,
+    'types': _types}
@@ -2,15 +2,18 @@
 """
 CLI Entry-point
 
+The modules for each action, and the database drivers and dump readers they
+depend upon, are imported when the action is run so that parsing the command
+line and printing help stays fast.
+
 """
 import argparse
 import logging
 import os
 from os import path
 import pwd
-import sys
 
-from pg_lifecycle import build, common, deploy, generate, __version__
+from pg_lifecycle import common, filters, metrics, __version__
 
 LOGGER = logging.getLogger(__name__)
 LOGGING_FORMAT = '[%(asctime)-15s] %(levelname)-8s %(message)s'
@@ -34,6 +37,35 @@ def add_actions_to_parser(parser):
         '--extract',
         action='store_true',
         help='Extract schema from an existing database')
+    gen.add_argument(
+        '--from-dump',
+        action='store',
+        metavar='PATH',
+        help='Generate the project from an existing directory format dump '
+        'instead of running pg_dump')
+    gen.add_argument(
+        '--dump-cache',
+        action='store_true',
+        help='Reuse the dump of the database cached in {} if its catalog '
+        'has not changed'.format(common.DUMP_CACHE_DIR))
+    gen.add_argument(
+        '--archive',
+        action='store_true',
+        help='Write the project as a single archive file at DEST instead '
+        'of a directory')
+    gen.add_argument(
+        '--collapse-partitions',
+        action='store_true',
+        help='Write the partitions of a table that share the same DDL to a '
+        'single partition set file next to the table')
+    gen.add_argument(
+        '--extractor',
+        action='store',
+        choices=['pg_dump', 'catalog'],
+        default='pg_dump',
+        help='Read the database schema with pg_dump or directly from the '
+        'system catalog, using pg_dump when it has objects the catalog '
+        'extractor does not support')
     gen.add_argument(
         '--force',
         action='store_true',
@@ -42,21 +74,129 @@ def add_actions_to_parser(parser):
         '--gitkeep',
         action='store_true',
         help='Create a .gitkeep file in empty directories')
+    gen.add_argument(
+        '-j',
+        '--jobs',
+        action='store',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of concurrent file writes')
     gen.add_argument(
         '--remove-empty',
         action='store_true',
         help='Remove empty directories after generation')
     gen.add_argument(
+        '--update',
+        action='store_true',
+        help='Update an existing project in place, only writing the files '
+        'that changed and removing the files of dropped objects')
+    gen.add_argument(
+        '--streaming',
+        action='store_true',
+        help='Read object DDL from the dump on demand and write each file '
+        'as soon as it is rendered to bound memory usage')
+    add_filter_options_to_parser(gen)
+    gen.add_argument(
+        'dest',
+        nargs=1,
+        metavar='DEST',
+        help='Destination directory or archive file for the new project')
+
+    gen_fleet = sp.add_parser(
+        'generate-fleet',
+        help='Generate a project for each database in a fleet')
+    gen_fleet.add_argument(
+        '--databases-file',
+        action='store',
+        metavar='FILE',
+        help='File with a database name or connection string on each line')
+    gen_fleet.add_argument(
+        '--dump-cache',
+        action='store_true',
+        help='Reuse the dump of a database cached in {} if its catalog '
+        'has not changed'.format(common.DUMP_CACHE_DIR))
+    gen_fleet.add_argument(
+        '--collapse-partitions',
+        action='store_true',
+        help='Write the partitions of a table that share the same DDL to a '
+        'single partition set file next to the table')
+    gen_fleet.add_argument(
+        '--extractor',
+        action='store',
+        choices=['pg_dump', 'catalog'],
+        default='pg_dump',
+        help='Read each database schema with pg_dump or directly from the '
+        'system catalog, using pg_dump when it has objects the catalog '
+        'extractor does not support')
+    gen_fleet.add_argument(
+        '--force',
+        action='store_true',
+        help='Write to destination paths even if they already exist')
+    gen_fleet.add_argument(
+        '--gitkeep',
+        action='store_true',
+        help='Create a .gitkeep file in empty directories')
+    gen_fleet.add_argument(
+        '-j',
+        '--jobs',
+        action='store',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of projects to generate concurrently')
+    gen_fleet.add_argument(
+        '--no-hardlinks',
+        action='store_true',
+        help='Do not replace identical files in different projects with '
+        'hard links')
+    gen_fleet.add_argument(
+        '--remove-empty',
+        action='store_true',
+        help='Remove empty directories after generation')
+    gen_fleet.add_argument(
+        '--update',
+        action='store_true',
+        help='Update existing projects in place, only writing the files '
+        'that changed and removing the files of dropped objects')
+    gen_fleet.add_argument(
+        '--streaming',
+        action='store_true',
+        help='Read object DDL from the dump on demand and write each file '
+        'as soon as it is rendered to bound memory usage')
+    add_filter_options_to_parser(gen_fleet)
+    gen_fleet.add_argument(
         'dest',
         nargs=1,
         metavar='DEST',
-        help='Destination directory for the new project')
+        help='Destination directory for the projects')
+    gen_fleet.add_argument(
+        'databases',
+        nargs='*',
+        metavar='DATABASE',
+        help='Database name or connection string')
 
     build = sp.add_parser('build', help='Build DDL for the project')
     build.add_argument(
         '--diff',
         action='store_true',
         help='Build DDL as changes to the current database')
+    build.add_argument(
+        '--allow-drop-columns',
+        action='store_true',
+        help='Drop columns that are not in the project with --diff')
+    build.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not use or update the build cache')
+    build.add_argument(
+        '--project',
+        action='store',
+        default='.',
+        help='Project directory or archive to build')
+    build.add_argument(
+        '--snapshot',
+        action='store',
+        help='Build changes against a catalog snapshot file instead of the '
+        'database')
     build.add_argument(
         'file',
         nargs='?',
@@ -70,10 +210,145 @@ def add_actions_to_parser(parser):
         '--diff',
         action='store_true',
         help='Deploy DDL changes to the current database')
+    deploy.add_argument(
+        '--allow-drop-columns',
+        action='store_true',
+        help='Drop columns that are not in the project with --diff')
+    deploy.add_argument(
+        '--project',
+        action='store',
+        default='.',
+        help='Project directory or archive to deploy')
+    deploy.add_argument(
+        '-j',
+        '--jobs',
+        action='store',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of files to deploy concurrently')
     deploy.add_argument(
         '--dry-run',
         action='store_true',
         help='Perform a dry-run deployment without actually deploying')
+    add_apply_options_to_parser(deploy)
+
+    deploy_fleet = sp.add_parser(
+        'deploy-fleet',
+        help='Deploy DDL for the project to each database in a fleet')
+    deploy_fleet.add_argument(
+        '--databases-file',
+        action='store',
+        metavar='FILE',
+        help='File with a database name or connection string on each line')
+    deploy_fleet.add_argument(
+        '--diff',
+        action='store_true',
+        help='Deploy DDL changes to the current state of each database')
+    deploy_fleet.add_argument(
+        '--allow-drop-columns',
+        action='store_true',
+        help='Drop columns that are not in the project with --diff')
+    deploy_fleet.add_argument(
+        '--project',
+        action='store',
+        default='.',
+        help='Project directory or archive to deploy')
+    deploy_fleet.add_argument(
+        '-c',
+        '--concurrency',
+        action='store',
+        type=int,
+        default=8,
+        help='Number of databases to deploy to concurrently')
+    deploy_fleet.add_argument(
+        '-j',
+        '--jobs',
+        action='store',
+        type=int,
+        default=4,
+        help='Number of files to deploy concurrently to each database')
+    deploy_fleet.add_argument(
+        '--host-connections',
+        action='store',
+        type=int,
+        metavar='CONNECTIONS',
+        help='Maximum number of connections to each database server')
+    deploy_fleet.add_argument(
+        '--fail-fast',
+        action='store_true',
+        help='Do not start deploying to more databases once a deploy fails')
+    add_apply_options_to_parser(deploy_fleet)
+    deploy_fleet.add_argument(
+        'databases',
+        nargs='*',
+        metavar='DATABASE',
+        help='Database name or connection string')
+
+    compare = sp.add_parser(
+        'compare', help='Compare two projects without connecting to a '
+        'database')
+    compare.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not use or update the hash trees cached in the projects')
+    compare.add_argument(
+        'source',
+        metavar='SOURCE',
+        help='Project directory or archive to compare from')
+    compare.add_argument(
+        'target',
+        metavar='TARGET',
+        help='Project directory or archive to compare to')
+
+    convert = sp.add_parser(
+        'convert-manifest',
+        help='Convert a pickled project manifest to the binary format')
+    convert.add_argument(
+        'project',
+        nargs=1,
+        metavar='PROJECT',
+        help='Project directory containing the manifest')
+
+    snapshot = sp.add_parser(
+        'snapshot', help='Save a catalog snapshot of the database')
+    snapshot.add_argument(
+        'file',
+        nargs=1,
+        metavar='FILE',
+        help='Snapshot file to write')
+
+
+def add_apply_options_to_parser(parser):
+    """Add the options for how DDL is applied to a database to the parser.
+
+    :param argparse.ArgumentParser parser: The parser to add the args to
+
+    """
+    parser.add_argument(
+        '--lock-timeout',
+        action='store',
+        type=int,
+        metavar='MS',
+        help='Maximum time each statement waits for a lock, in '
+        'milliseconds')
+    parser.add_argument(
+        '--statement-timeout',
+        action='store',
+        type=int,
+        metavar='MS',
+        help='Maximum time each statement runs for, in milliseconds')
+    parser.add_argument(
+        '--retries',
+        action='store',
+        type=int,
+        default=5,
+        help='Number of times to retry a step that timed out waiting for a '
+        'lock or was cancelled to resolve a deadlock')
+    parser.add_argument(
+        '--online',
+        action='store_true',
+        help='Build indexes concurrently and validate foreign key and check '
+        'constraints in a separate phase to avoid long exclusive locks')
 
 
 def add_connection_options_to_parser(parser):
@@ -82,12 +357,13 @@ def add_connection_options_to_parser(parser):
     :param argparse.ArgumentParser parser: The parser to add the args to
 
     """
+    username = get_username()
     conn = parser.add_argument_group('Connection Options')
     conn.add_argument(
         '-d',
         '--dbname',
         action='store',
-        default=get_username(),
+        default=username,
         help='database name to connect to')
     conn.add_argument(
         '-h',
@@ -106,7 +382,7 @@ def add_connection_options_to_parser(parser):
         '-U',
         '--username',
         action='store',
-        default=get_username(),
+        default=username,
         help='The PostgreSQL username to operate as')
     conn.add_argument(
         '-w',
@@ -152,6 +428,61 @@ def add_ddl_options_to_parser(parser):
         help='do not include tablespace assignments')
 
 
+def add_filter_options_to_parser(parser):
+    """Add object filter options to the parser.
+
+    :param argparse.ArgumentParser parser: The parser to add the args to
+
+    """
+    group = parser.add_argument_group(title='Filter Options')
+    group.add_argument(
+        '-n',
+        '--schema',
+        action='append',
+        metavar='PATTERN',
+        help='only include objects in schemas matching the pattern')
+    group.add_argument(
+        '-N',
+        '--exclude-schema',
+        action='append',
+        metavar='PATTERN',
+        help='do not include objects in schemas matching the pattern')
+    group.add_argument(
+        '-t',
+        '--table',
+        action='append',
+        metavar='PATTERN',
+        help='only include tables, views and sequences matching the '
+        'pattern')
+    group.add_argument(
+        '-T',
+        '--exclude-table',
+        action='append',
+        metavar='PATTERN',
+        help='do not include tables, views and sequences matching the '
+        'pattern')
+    group.add_argument(
+        '--object',
+        action='append',
+        metavar='PATTERN',
+        help='only include objects with names matching the pattern')
+    group.add_argument(
+        '--exclude-object',
+        action='append',
+        metavar='PATTERN',
+        help='do not include objects with names matching the pattern')
+    group.add_argument(
+        '--object-type',
+        action='append',
+        metavar='TYPE',
+        help='only include objects of the type, such as function')
+    group.add_argument(
+        '--exclude-object-type',
+        action='append',
+        metavar='TYPE',
+        help='do not include objects of the type, such as comment')
+
+
 def add_logging_options_to_parser(parser):
     """Add logging options to the parser.
 
@@ -174,6 +505,32 @@ def add_logging_options_to_parser(parser):
         '--debug', action='store_true', help='Extra verbose debug logging')
 
 
+def add_metrics_options_to_parser(parser):
+    """Add phase timing and metrics options to the parser.
+
+    :param argparse.ArgumentParser parser: The parser to add the args to
+
+    """
+    group = parser.add_argument_group(title='Metrics Options')
+    group.add_argument(
+        '--profile',
+        action='store_true',
+        help='Write the time spent in each phase and the object and file '
+        'counts to STDERR when the action completes')
+    group.add_argument(
+        '--metrics-file',
+        action='store',
+        metavar='FILE',
+        help='Write the phase timings and counters to the file')
+    group.add_argument(
+        '--metrics-format',
+        action='store',
+        choices=['json', 'prometheus'],
+        default='json',
+        help='Format of the metrics file, prometheus writes the text '
+        'format read by the node exporter textfile collector')
+
+
 def configure_logging(args):
     """Configure Python logging.
 
@@ -194,6 +551,19 @@ def configure_logging(args):
                         format=LOGGING_FORMAT)
 
 
+def validate_object_types(args):
+    """Exit if an unknown object type is passed to a filter option
+
+    :param argparse.Namespace args: The parsed cli arguments
+
+    """
+    known = set(common.PATHS) | common.CHILD_OBJ_TYPE_SET
+    for value in (args.object_type or []) + (args.exclude_object_type or []):
+        if filters.normalize_type(value) not in known:
+            common.exit_application(
+                'Unknown object type {!r}'.format(value), 2)
+
+
 def get_username():
     """Return the username of the current process.
 
@@ -216,28 +586,113 @@ def parse_cli_arguments():
     add_connection_options_to_parser(parser)
     add_ddl_options_to_parser(parser)
     add_logging_options_to_parser(parser)
+    add_metrics_options_to_parser(parser)
     parser.add_argument(
         '-V',
         '--version',
-        action='store_true',
+        action='version',
+        version='%(prog)s {}'.format(__version__),
         help='output version information, then exit')
     add_actions_to_parser(parser)
     return parser.parse_args()
 
 
+def save_snapshot(args):
+    """Save a catalog snapshot of the database.
+
+    :param argparse.namespace args: The parsed cli arguments
+
+    """
+    import psycopg2
+
+    from pg_lifecycle import catalog, connection
+
+    try:
+        conn = connection.connect(args)
+        try:
+            snapshot = catalog.fetch(conn)
+        finally:
+            conn.close()
+    except psycopg2.Error as error:
+        common.exit_application(
+            'Failed to read the catalog: {}'.format(str(error).strip()), 3)
+    snapshot.save(args.file[0])
+    LOGGER.info('Saved %i objects to %s', len(snapshot), args.file[0])
+
+
 def run():
     """Main entry-point to the pg_lifecycle application"""
     args = parse_cli_arguments()
     configure_logging(args)
     LOGGER.info('pg_lifecycle v%s starting %s', __version__, args.action)
+    if args.profile or args.metrics_file:
+        metrics.enable(args.action)
+    try:
+        run_action(args)
+    finally:
+        metrics.report(args)
+
+
+def run_action(args):
+    """Run the action specified in the cli arguments
+
+    :param argparse.namespace args: The parsed cli arguments
+
+    """
     if args.action == 'build':
+        from pg_lifecycle import build
         build.Build(args).run()
+    elif args.action == 'compare':
+        from pg_lifecycle import compare
+        compare.Compare(args).run()
+    elif args.action == 'convert-manifest':
+        from pg_lifecycle import manifest
+        file_path = path.join(args.project[0], common.MANIFEST)
+        if not path.exists(file_path):
+            common.exit_application(
+                '{} does not exist'.format(file_path), 3)
+        LOGGER.info('Converted %i manifest records in %s',
+                    manifest.convert(file_path), file_path)
     elif args.action == 'deploy':
+        if args.diff and args.online:
+            common.exit_application(
+                'Can not specify --diff and --online', 2)
+        from pg_lifecycle import deploy
         deploy.Deploy(args).run()
+    elif args.action == 'deploy-fleet':
+        if args.diff and args.online:
+            common.exit_application(
+                'Can not specify --diff and --online', 2)
+        from pg_lifecycle import fleet
+        fleet.FleetDeploy(args).run()
+    elif args.action == 'snapshot':
+        save_snapshot(args)
+    elif args.action == 'generate-fleet':
+        if args.gitkeep and args.remove_empty:
+            common.exit_application(
+                'Can not specify --gitkeep and --remove-empty', 2)
+        validate_object_types(args)
+        from pg_lifecycle import fleet
+        fleet.Fleet(args).run()
     elif args.action == 'generate-project':
-        if args.gitkeep and args.remove_empty_dirs:
+        if args.gitkeep and args.remove_empty:
+            common.exit_application(
+                'Can not specify --gitkeep and --remove-empty', 2)
+        elif args.from_dump and args.dump_cache:
+            common.exit_application(
+                'Can not specify --from-dump and --dump-cache', 2)
+        elif args.archive and (args.gitkeep or args.remove_empty):
+            common.exit_application(
+                'Can not specify --archive with --gitkeep or --remove-empty',
+                2)
+        elif args.archive and args.update:
+            common.exit_application(
+                'Can not specify --archive and --update', 2)
+        elif args.from_dump and args.extractor == 'catalog':
             common.exit_application(
-                'Can not specify --gitkeep and --remove-empty-dirs', 2)
+                'Can not specify --from-dump and --extractor catalog', 2)
+        validate_object_types(args)
+        from pg_lifecycle import generate
         generate.Generate(args).run()
     else:
         common.exit_application('Invalid action specified', 1)
@@ -1,11 +1,18 @@
 # coding=utf-8
 """Common constants and shared methods"""
 import logging
+import os
+from os import path
 import sys
 
 LOGGER = logging.getLogger(__name__)
 
+DUMP_CACHE_DIR = path.join(
+    os.environ.get('XDG_CACHE_HOME') or path.join(
+        path.expanduser('~'), '.cache'), 'pg_lifecycle', 'dumps')
 MANIFEST = 'MANIFEST.pgl'
+SCOPE = 'SCOPE.json'
+JOURNAL_SCHEMA = '_pg_lifecycle'
 
 PRE_DATA = 'Pre-Data'
 DATA = 'Data'
@@ -39,8 +46,10 @@ FOREIGN_TABLE = 'FOREIGN TABLE'
 FK_CONSTRAINT = 'FK CONSTRAINT'
 FUNCTION = 'FUNCTION'
 INDEX = 'INDEX'
+INDEX_ATTACH = 'INDEX ATTACH'
 MATERIALIZED_VIEW = 'MATERIALIZED VIEW'
 OPERATOR = 'OPERATOR'
+PARTITION_SET = 'PARTITION SET'
 POLICY = 'POLICY'
 PL = 'PROCEDURAL LANGUAGE'
 PROCEDURE = 'PROCEDURE'
@@ -58,6 +67,7 @@ SHELL_TYPE = 'SHELL TYPE'
 STDSTRINGS = 'STDSTRINGS'
 SUBSCRIPTION = 'SUBSCRIPTION'
 TABLE = 'TABLE'
+TABLE_ATTACH = 'TABLE ATTACH'
 TABLESPACE = 'TABLESPACE'
 TEXT_SEARCH_DICTIONARY = 'TEXT SEARCH DICTIONARY'
 TEXT_SEARCH_CONFIGURATION = 'TEXT SEARCH CONFIGURATION'
@@ -80,7 +90,18 @@ CHILD_OBJ_TYPES = [
     SERVER,
     FOREIGN_TABLE,
     USER_MAPPING,
-    PUBLICATION_TABLE
+    PUBLICATION_TABLE,
+    TABLE_ATTACH,
+    INDEX_ATTACH
+]
+CHILD_OBJ_TYPE_SET = frozenset(CHILD_OBJ_TYPES)
+
+POST_DATA_OBJ_TYPES = [
+    CONSTRAINT,
+    INDEX,
+    CHECK_CONSTRAINT,
+    FK_CONSTRAINT,
+    INDEX_ATTACH
 ]
 
 PATHS = {
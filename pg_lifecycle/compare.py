@@ -0,0 +1,444 @@
+# coding=utf-8
+"""
+Project Comparison
+
+Compares two generated projects offline using a hash tree of each project.
+Each file in the manifest is a leaf, identified by the hash of its content
+and the paths of the files it depends upon, and each directory is hashed
+from the names and hashes of its entries, so the top-level object type
+directories, their schema directories and the files in them are only
+compared when their hashes differ.
+
+The tree is cached in the ``tree`` directory of the project's cache
+directory, in the same layout as the build cache:
+
+- ``paths`` has the path of each file in the manifest
+- ``stamps`` has the modification time and size of the manifest and of
+  each file, so an unchanged project is detected without loading the rest
+  of the cache
+- ``hashes.json`` has the hash of each directory
+- ``nodes`` has a file for each directory hash with the content hash and
+  dependencies of each file in the directory, which is only loaded when the
+  directory is compared or one of its files changed
+
+"""
+import array
+import bisect
+import collections
+import hashlib
+import logging
+import os
+from os import path
+import sys
+
+from pg_lifecycle import cache, common, metrics, project
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR = 'tree'
+
+ADDED = 'added'
+CHANGED = 'changed'
+DEPENDENCIES = 'dependencies'
+REMOVED = 'removed'
+
+Change = collections.namedtuple(
+    'Change', ['status', 'path', 'added', 'removed'])
+
+
+class Compare:
+    """Compare two projects, writing the files that were added, removed or
+    changed, and the files whose dependencies changed, to STDOUT.
+
+    """
+
+    def __init__(self, args):
+        self.args = args
+
+    def run(self):
+        """Implement as core logic for comparing the projects"""
+        trees = []
+        try:
+            for project_path in (self.args.source, self.args.target):
+                tree = Tree(project.Project(project_path),
+                            not self.args.no_cache)
+                with metrics.phase('tree'):
+                    tree.load()
+                trees.append(tree)
+        except (OSError, ValueError) as error:
+            common.exit_application(
+                'Failed to read {}: {}'.format(project_path, error), 3)
+        finally:
+            for tree in trees:
+                tree.project.close()
+        with metrics.phase('compare'):
+            changes = compare(*trees)
+        for change in changes:
+            if change.status == DEPENDENCIES:
+                sys.stdout.write('{}\t{}\t{}\n'.format(
+                    change.status, change.path, ' '.join(
+                        ['+{}'.format(value) for value in change.added] +
+                        ['-{}'.format(value) for value in change.removed])))
+            else:
+                sys.stdout.write('{}\t{}\n'.format(change.status, change.path))
+        counts = collections.Counter(change.status for change in changes)
+        if not changes:
+            LOGGER.info('%s matches %s', self.args.target, self.args.source)
+            return
+        LOGGER.info('%s differs from %s: %i files added, %i removed, %i '
+                    'changed and %i with changed dependencies',
+                    self.args.target, self.args.source, counts[ADDED],
+                    counts[REMOVED], counts[CHANGED], counts[DEPENDENCIES])
+
+
+class Tree:
+    """Hash tree of the files in a project's manifest
+
+    :param pg_lifecycle.project.Project source: The project
+    :param bool use_cache: Load and save the tree in the project's cache
+        directory
+
+    """
+
+    def __init__(self, source, use_cache=True):
+        self.project = source
+        self.path = path.join(source.cache_path, CACHE_DIR)
+        self.use_cache = use_cache
+        self.hashed = 0
+        self.hashes = {}
+        self.paths = []
+        self.stamps = array.array('q')
+        self._changed = set([])
+        self._directories = None
+        self._nodes = {}
+
+    def children(self, directory):
+        """Return the entries of the directory by name: the hash of each
+        directory, and the content hash and dependencies of each file.
+
+        :param str directory: The project relative directory, ``''`` for
+            the top of the project
+        :rtype: dict
+        :raises: ValueError
+
+        """
+        if directory not in self.hashes:
+            return {}
+        if self._directories is None:
+            self._directories = collections.defaultdict(list)
+            for value in self.hashes:
+                if value:
+                    parent, _sep, name = value.rpartition('/')
+                    self._directories[parent].append(name)
+        values = dict(self._node(directory))
+        for name in self._directories.get(directory, []):
+            values[name] = self.hashes[_join(directory, name)]
+        return values
+
+    def files(self, directory):
+        """Return the paths of the files in the directory and the
+        directories below it.
+
+        :param str directory: The project relative directory
+        :rtype: list
+
+        """
+        prefix = '{}/'.format(directory)
+        offset = bisect.bisect_left(self.paths, prefix)
+        values = []
+        while offset < len(self.paths) and \
+                self.paths[offset].startswith(prefix):
+            values.append(self.paths[offset])
+            offset += 1
+        return values
+
+    def load(self):
+        """Load the cached tree, rebuilding it if the manifest changed, or
+        else hashing the files that changed since it was cached and the
+        directories above them.
+
+        :raises: OSError
+        :raises: ValueError
+
+        """
+        if self.use_cache:
+            self._read()
+        stamp = self.project.stat(common.MANIFEST)
+        if self.hashes and tuple(self.stamps[0:2]) == tuple(stamp):
+            try:
+                self._refresh()
+            except ValueError as error:
+                LOGGER.warning('Rebuilding the hash tree of %s: %s',
+                               self.project.path, error)
+                self._build(stamp)
+        else:
+            self._build(stamp)
+        metrics.count('files_hashed', self.hashed)
+        LOGGER.debug('Hashed %i files of %s', self.hashed, self.project.path)
+        if self._changed and self.use_cache:
+            self._save()
+
+    def _build(self, stamp):
+        """Build the tree from the manifest, reusing the content hash of
+        each file that has the same modification time and size as when the
+        tree was cached.
+
+        :param tuple stamp: The modification time and size of the manifest
+
+        """
+        previous = {}
+        try:
+            for offset, file_path in enumerate(self.paths):
+                parent, _sep, name = file_path.rpartition('/')
+                previous[file_path] = (
+                    self.stamps[offset * 2 + 2], self.stamps[offset * 2 + 3],
+                    self._node(parent)[name][0])
+        except (IndexError, KeyError, ValueError):
+            previous = {}
+        dependencies = self._dependencies()
+        self.paths = sorted(dependencies)
+        self.stamps = array.array('q', stamp)
+        self.hashes, self._directories, self._nodes = {}, None, {}
+        scans = {}
+        for file_path in self.paths:
+            parent, _sep, name = file_path.rpartition('/')
+            if parent not in scans:
+                scans[parent] = self.project.scan(parent)
+            mtime, size = scans[parent].get(name, (-1, -1))
+            self.stamps.extend((mtime, size))
+            value = previous.get(file_path)
+            if value and value[0:2] == (mtime, size):
+                digest = value[2]
+            else:
+                digest = self._digest(file_path, mtime)
+            self._nodes.setdefault(parent, {})[name] = [
+                digest, dependencies[file_path]]
+        self._hash(set(self._nodes))
+
+    def _dependencies(self):
+        """Return the sorted paths of the files each file in the manifest
+        depends upon, resolving dependencies upon objects included in
+        another object's file to that file.
+
+        :rtype: dict
+
+        """
+        manifest = self.project.manifest
+        paths = [manifest.path(offset) for offset in range(0, len(manifest))]
+        owners = {}
+        for offset in range(0, len(manifest)):
+            owners.setdefault(manifest[offset].id, offset)
+        for offset in range(0, len(manifest)):
+            for dump_id in manifest.includes(offset):
+                owners.setdefault(dump_id, offset)
+        owners.pop(-1, None)
+        values = collections.defaultdict(set)
+        for offset, file_path in enumerate(paths):
+            values[file_path].update(
+                paths[owners[dump_id]]
+                for dump_id in manifest.dependencies(offset)
+                if dump_id in owners)
+            values[file_path].discard(file_path)
+        return {file_path: sorted(value)
+                for file_path, value in values.items()}
+
+    def _digest(self, file_path, mtime):
+        """Return the content hash of the file, or None if it does not
+        exist.
+
+        """
+        if mtime < 0:
+            LOGGER.warning('%s is in the manifest of %s but does not exist',
+                           file_path, self.project.path)
+            return None
+        self.hashed += 1
+        return self.project.digest(file_path)
+
+    def _hash(self, dirty):
+        """Hash the directories and the directories above them, deepest
+        first, removing the hashes of directories that no longer have any
+        files.
+
+        :param set dirty: The directories with changed entries
+
+        """
+        directories = set([])
+        for directory in dirty:
+            while directory not in directories:
+                directories.add(directory)
+                if not directory:
+                    break
+                directory = directory.rpartition('/')[0]
+        children = collections.defaultdict(set)
+        for directory in directories | set(self.hashes):
+            if directory:
+                parent, _sep, name = directory.rpartition('/')
+                children[parent].add(name)
+        for directory in sorted(
+                directories, key=lambda value: value.count('/') + bool(value),
+                reverse=True):
+            lines = []
+            for name, value in self._node(directory).items():
+                lines.append('\0'.join(['F', name, value[0] or ''] + value[1]))
+            for name in children[directory]:
+                value = self.hashes.get(_join(directory, name))
+                if value:
+                    lines.append('\0'.join(['D', name, value]))
+            if not lines:
+                self.hashes.pop(directory, None)
+                self._nodes.pop(directory, None)
+                continue
+            value = hashlib.sha256()
+            for line in sorted(lines):
+                value.update('{}\n'.format(line).encode('utf-8'))
+            self.hashes[directory] = value.hexdigest()
+            self._changed.add(directory)
+        self._directories = None
+
+    def _node(self, directory):
+        """Return the content hash and dependencies of each file directly
+        in the directory, loading them from the cache on first use.
+
+        :param str directory: The project relative directory
+        :rtype: dict
+        :raises: ValueError
+
+        """
+        if directory not in self._nodes:
+            if directory not in self.hashes:
+                return self._nodes.setdefault(directory, {})
+            value = cache.load_json(path.join(
+                self.path, 'nodes', '{}.json'.format(
+                    self.hashes[directory])), None)
+            if value is None:
+                raise ValueError('The cached entries of {!r} are '
+                                 'missing'.format(directory))
+            self._nodes[directory] = value
+        return self._nodes[directory]
+
+    def _read(self):
+        """Read the cached paths, stamps and directory hashes"""
+        stamps = array.array('q')
+        try:
+            with open(path.join(self.path, 'paths'), 'r') as handle:
+                paths = handle.read().split('\n')
+            with open(path.join(self.path, 'stamps'), 'rb') as handle:
+                stamps.frombytes(handle.read())
+        except (OSError, ValueError):
+            return
+        if len(stamps) != (len(paths) + 1) * 2:
+            return
+        self.hashes = cache.load_json(
+            path.join(self.path, 'hashes.json'), {})
+        self.paths, self.stamps = paths, stamps
+
+    def _refresh(self):
+        """Hash the files whose modification time or size changed, and the
+        directories above the files whose content changed.
+
+        :raises: ValueError
+
+        """
+        scans, dirty = {}, set([])
+        for offset, file_path in enumerate(self.paths):
+            parent, _sep, name = file_path.rpartition('/')
+            if parent not in scans:
+                scans[parent] = self.project.scan(parent)
+            mtime, size = scans[parent].get(name, (-1, -1))
+            if mtime == self.stamps[offset * 2 + 2] and \
+                    size == self.stamps[offset * 2 + 3]:
+                continue
+            self.stamps[offset * 2 + 2] = mtime
+            self.stamps[offset * 2 + 3] = size
+            self._changed.add(None)
+            value = self._node(parent)[name]
+            digest = self._digest(file_path, mtime)
+            if digest != value[0]:
+                value[0] = digest
+                dirty.add(parent)
+        if dirty:
+            self._hash(dirty)
+
+    def _save(self):
+        """Save the nodes of the directories that were hashed, the paths,
+        stamps and directory hashes, and remove the nodes that are no longer
+        used.
+
+        """
+        nodes_path = path.join(self.path, 'nodes')
+        os.makedirs(nodes_path, exist_ok=True)
+        for directory in self._changed:
+            if directory in self.hashes:
+                cache.save_json(path.join(nodes_path, '{}.json'.format(
+                    self.hashes[directory])), self._nodes[directory])
+        cache.save_json(path.join(self.path, 'hashes.json'), self.hashes)
+        with open(path.join(self.path, 'paths'), 'w') as handle:
+            handle.write('\n'.join(self.paths))
+        with open(path.join(self.path, 'stamps'), 'wb') as handle:
+            self.stamps.tofile(handle)
+        used = set('{}.json'.format(value) for value in self.hashes.values())
+        for name in os.listdir(nodes_path):
+            if name not in used:
+                os.unlink(path.join(nodes_path, name))
+        self._changed = set([])
+
+
+def compare(source, target):
+    """Return the changes from the source project's tree to the target's,
+    in path order, only comparing the entries of directories with different
+    hashes.
+
+    :param Tree source: The tree of the project to compare from
+    :param Tree target: The tree of the project to compare to
+    :rtype: list
+    :raises: ValueError
+
+    """
+    changes, stack = [], ['']
+    if source.hashes.get('') == target.hashes.get(''):
+        return changes
+    while stack:
+        directory = stack.pop()
+        before = source.children(directory)
+        after = target.children(directory)
+        for name in set(before) | set(after):
+            child = _join(directory, name)
+            value, other = before.get(name), after.get(name)
+            if value == other:
+                continue
+            elif isinstance(value, str) and isinstance(other, str):
+                stack.append(child)
+                continue
+            elif isinstance(value, list) and isinstance(other, list):
+                changes += _changes(child, value, other)
+                continue
+            if value is not None:
+                changes += [Change(REMOVED, file_path, [], [])
+                            for file_path in _files(source, child, value)]
+            if other is not None:
+                changes += [Change(ADDED, file_path, [], [])
+                            for file_path in _files(target, child, other)]
+    return sorted(changes, key=lambda value: (value.path, value.status))
+
+
+def _changes(file_path, before, after):
+    """Return the changes to the content and dependencies of a file"""
+    values = []
+    if before[0] != after[0]:
+        values.append(Change(CHANGED, file_path, [], []))
+    if before[1] != after[1]:
+        values.append(Change(
+            DEPENDENCIES, file_path, sorted(set(after[1]) - set(before[1])),
+            sorted(set(before[1]) - set(after[1]))))
+    return values
+
+
+def _files(tree, entry, value):
+    """Return the paths of the files at or below the entry of the tree"""
+    if isinstance(value, str):
+        return tree.files(entry)
+    return [entry]
+
+
+def _join(directory, name):
+    return '{}/{}'.format(directory, name) if directory else name
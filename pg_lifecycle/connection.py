@@ -0,0 +1,82 @@
+# coding=utf-8
+"""
+Database Connections
+
+"""
+import getpass
+import logging
+
+import psycopg2
+from psycopg2 import pool as pg_pool, sql
+
+LOGGER = logging.getLogger(__name__)
+
+APPLICATION_NAME = 'pg_lifecycle'
+
+
+def connect(args):
+    """Return a connection to the database specified in the CLI arguments,
+    assuming the role if one was specified.
+
+    :param argparse.namespace args: The parsed cli arguments
+    :rtype: psycopg2.extensions.connection
+    :raises: psycopg2.Error
+
+    """
+    LOGGER.debug('Connecting to %s:%s/%s as %s', args.host, args.port,
+                 args.dbname, args.username)
+    connection = psycopg2.connect(**parameters(args))
+    prepare(connection, args)
+    return connection
+
+
+def pool(args, size):
+    """Return a thread-safe pool of up to ``size`` connections to the
+    database specified in the CLI arguments. Connections from the pool must
+    be passed to :func:`prepare` before they are first used.
+
+    :param argparse.namespace args: The parsed cli arguments
+    :param int size: The maximum number of connections
+    :rtype: psycopg2.pool.ThreadedConnectionPool
+    :raises: psycopg2.Error
+
+    """
+    LOGGER.debug('Connecting up to %i times to %s:%s/%s as %s', size,
+                 args.host, args.port, args.dbname, args.username)
+    return pg_pool.ThreadedConnectionPool(1, size, **parameters(args))
+
+
+def prepare(connection, args):
+    """Assume the role specified in the CLI arguments, if any.
+
+    :param psycopg2.extensions.connection connection: The connection
+    :param argparse.namespace args: The parsed cli arguments
+    :raises: psycopg2.Error
+
+    """
+    if getattr(args, 'role', None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL('SET ROLE {}').format(
+                sql.Identifier(args.role)))
+        connection.commit()
+
+
+def parameters(args):
+    """Return the psycopg2 connection parameters for the CLI arguments,
+    prompting for the password if ``--password`` was specified.
+
+    :param argparse.namespace args: The parsed cli arguments
+    :rtype: dict
+
+    """
+    values = {
+        'application_name': APPLICATION_NAME,
+        'dbname': args.dbname,
+        'host': args.host,
+        'port': args.port,
+        'user': args.username}
+    if getattr(args, 'password', False) and \
+            not getattr(args, 'no_password', False):
+        values['password'] = getpass.getpass(
+            'Password for {}: '.format(args.username))
+    return values
@@ -3,17 +3,607 @@
 Deploys DDL
 
 """
+import collections
+from concurrent import futures
+import functools
+import heapq
+import logging
+import random
+import sys
+import threading
+import time
+import weakref
 
-from pg_lifecycle import build
+import psycopg2
+from psycopg2 import errorcodes
+
+from pg_lifecycle import (build, cache, common, connection, graph, journal,
+                          metrics, online, sql)
+
+LOGGER = logging.getLogger(__name__)
+
+DIRECTIVES = 'directives.sql'
+
+RETRY_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+RETRYABLE = {errorcodes.DEADLOCK_DETECTED, errorcodes.LOCK_NOT_AVAILABLE}
+
+Task = collections.namedtuple(
+    'Task', ['label', 'node', 'phase', 'ddl', 'dependencies', 'autocommit',
+             'index'])
+
+CONSTRAINT_EXISTS = """\
+SELECT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint
+                WHERE conrelid = pg_catalog.to_regclass(%s)
+                  AND pg_catalog.quote_ident(conname) = %s)"""
+
+INVALID_INDEX = """\
+SELECT NOT indisvalid FROM pg_catalog.pg_index
+ WHERE indexrelid = pg_catalog.to_regclass(%s)"""
 
 
 class Deploy:
-    """Deploy DDL for the project"""
+    """Deploy DDL for the project
+
+    Each file in the project is a node in the manifest dependency graph and
+    is applied in its own transaction. Files are applied concurrently over a
+    bounded pool of connections, starting as soon as every file they depend
+    upon has committed, so unrelated schemas and tables are deployed in
+    parallel. Constraints and indexes are applied once all of the other DDL
+    has committed, one type at a time, with foreign keys last.
+
+    Each file and each type of deferred DDL is recorded in the deploy
+    journal in the transaction that applies it. When a deploy is run again,
+    DDL that the journal shows was already applied unchanged is skipped, so
+    a deploy that failed resumes where it stopped.
 
-    def __init__(self, args):
+    With ``--online``, the deferred DDL is applied with the steps built by
+    :func:`pg_lifecycle.online.steps`, and the constraints added ``NOT
+    VALID`` are validated once all of the deferred DDL has committed. Steps
+    on the same table are applied one at a time since they take
+    self-conflicting locks.
+
+    With ``--lock-timeout`` and ``--statement-timeout``, each statement is
+    limited to waiting for locks and running for the given time. The
+    timeouts are set for the session when a connection is prepared, not
+    around each statement. A step that fails because it could not get a lock
+    in time, or was chosen as the victim of a deadlock, is rolled back and
+    retried after a jittered exponential backoff, without holding a
+    connection, while the steps that do not depend upon it carry on.
+
+    When a :class:`Plan` is passed, the build plan and the DDL of each file
+    are taken from it instead of being read from the project, so that a
+    project deployed to many databases is only read once.
+
+    :param argparse.namespace args: The parsed cli arguments
+    :param Plan plan: The shared plan of the project to deploy
+
+    """
+
+    def __init__(self, args, plan=None):
         self.args = args
-        self.build = build.Build(args)
+        self.build = build.Build(args, plan.project if plan else None)
+        self.applied = 0
+        self.deferred = collections.defaultdict(list)
+        self.journal = None
+        self.lock = threading.Lock()
+        self.online = getattr(args, 'online', False)
+        self.partitioned = set([])
+        self.plan = plan
+        self.pool = None
+        self.preamble = None
+        self.prepared = weakref.WeakSet()
+        self.retries = getattr(args, 'retries', 0)
+        self.retried, self.lock_wait, self.backoff = 0, 0.0, 0.0
 
     def run(self):
         """Implement as core logic for deploying DDL"""
-        raise NotImplementedError
+        try:
+            if self.args.diff:
+                self._deploy_changes()
+            else:
+                self._deploy()
+        finally:
+            if self.retried:
+                LOGGER.info('Retried steps %i times after lock timeouts, '
+                            'waiting %.2f seconds for locks and %.2f seconds '
+                            'between attempts', self.retried, self.lock_wait,
+                            self.backoff)
+            metrics.count('lock_retries', self.retried)
+            metrics.count('lock_wait_seconds', round(self.lock_wait, 6))
+            metrics.count('retry_backoff_seconds', round(self.backoff, 6))
+            if self.journal:
+                self.journal.save()
+            if self.pool:
+                self.pool.closeall()
+            if not self.plan:
+                self.build.project.close()
+
+    def _apply(self, task):
+        """Apply the DDL for the task in a transaction on a connection from
+        the pool.
+
+        :param Task task: The task to apply
+        :raises: psycopg2.Error
+
+        """
+        ddl = task.ddl()
+        if not sql.split(ddl):
+            return
+        digest = None
+        if self.journal and task.node:
+            digest = journal.digest(ddl)
+            if self.journal.applied(task.node.path, task.phase, digest):
+                return
+        conn, start = self.pool.getconn(), time.monotonic()
+        try:
+            if conn not in self.prepared:
+                self._prepare(conn)
+                start = time.monotonic()
+            if task.autocommit:
+                self._apply_online(conn, task, ddl)
+            with conn.cursor() as cursor:
+                if not task.autocommit:
+                    cursor.execute(ddl)
+                duration = time.monotonic() - start
+                if digest:
+                    self.journal.record(
+                        cursor, task.node.dump_id, task.node.path,
+                        task.phase, digest, duration)
+            conn.commit()
+            metrics.count('steps_applied')
+            with self.lock:
+                self.applied += 1
+            if digest:
+                self.journal.committed(
+                    task.node.dump_id, task.node.path, task.phase, digest,
+                    duration)
+        except psycopg2.Error as error:
+            if error.pgcode in RETRYABLE:
+                with self.lock:
+                    self.lock_wait += time.monotonic() - start
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def _apply_online(self, conn, task, ddl):
+        """Apply each statement of the task's DDL outside of a transaction,
+        dropping the index the task builds first if an earlier build of it
+        failed and left it invalid. Each statement takes effect before the
+        step is recorded in the journal, so constraints that already exist
+        are not added again when a deploy that stopped in between resumes.
+
+        :param psycopg2.extensions.connection conn: The connection to use
+        :param Task task: The task to apply
+        :param str ddl: The task's DDL
+        :raises: psycopg2.Error
+
+        """
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                if task.index:
+                    cursor.execute(INVALID_INDEX, (task.index,))
+                    row = cursor.fetchone()
+                    if row and row[0]:
+                        LOGGER.info('Dropping invalid index %s', task.index)
+                        cursor.execute('DROP INDEX CONCURRENTLY {}'.format(
+                            task.index))
+                for statement in sql.split(ddl):
+                    match = online.CONSTRAINT.match(sql.normalize(statement))
+                    if match:
+                        cursor.execute(CONSTRAINT_EXISTS, match.group(1, 2))
+                        if cursor.fetchone()[0]:
+                            LOGGER.info('Constraint %s on %s already exists',
+                                        match.group(2), match.group(1))
+                            continue
+                    cursor.execute(statement)
+        finally:
+            conn.autocommit = False
+
+    def _backoff(self, task, attempt):
+        """Return the number of seconds to wait before retrying the task,
+        a random time of up to double the previous maximum delay.
+
+        :param Task task: The task to retry
+        :param int attempt: The number of the retry
+        :rtype: float
+
+        """
+        delay = random.uniform(0, min(
+            RETRY_MAX_DELAY, RETRY_DELAY * 2 ** (attempt - 1)))
+        LOGGER.warning('Timed out waiting for a lock applying %s, retrying '
+                       'in %.2f seconds (%i of %i)', task.label, delay,
+                       attempt, self.retries)
+        with self.lock:
+            self.retried += 1
+            self.backoff += delay
+        return delay
+
+    def _connect(self, size):
+        """Create the connection pool, exiting if the database can not be
+        connected to.
+
+        :param int size: The maximum number of connections
+
+        """
+        try:
+            self.pool = connection.pool(self.args, size)
+        except psycopg2.Error as error:
+            common.exit_application(
+                'Failed to connect to {}: {}'.format(
+                    self.build.database(), str(error).strip()), 3)
+
+    def _deploy(self):
+        """Deploy every file in the project"""
+        try:
+            nodes = self._nodes()
+        except ValueError as error:
+            common.exit_application(str(error), 3)
+        metrics.count('files', len(nodes))
+        self.journal = journal.Journal(
+            self.build.project.cache_path, self.build.database())
+        if self.args.dry_run:
+            return self._report(nodes)
+        self.preamble = self._directives(nodes)
+        with metrics.phase('connect'):
+            self._connect(self.args.jobs)
+            self._load_journal()
+        start = time.monotonic()
+        with metrics.phase('apply'):
+            self._execute([
+                Task(node.path, node, '',
+                     functools.partial(self._main_ddl, node),
+                     node.dependencies, False, None) for node in nodes])
+        self.journal.save()
+        validations = []
+        for child_type in build.DEFERRED:
+            values = []
+            for node, ddl in self.deferred[child_type]:
+                steps, pending = self._steps(node, child_type, ddl)
+                values += [(node, step) for step in steps]
+                validations += [(node, step) for step in pending]
+            with metrics.phase('apply:{}'.format(child_type)):
+                self._execute(self._tasks(values))
+            self.journal.save()
+        if validations:
+            with metrics.phase('apply:{}'.format(online.VALIDATE)):
+                self._execute(self._tasks(validations))
+            self.journal.save()
+        metrics.count('steps_skipped', self.journal.skipped)
+        if self.journal.skipped:
+            LOGGER.info('Skipped %i steps already applied to %s',
+                        self.journal.skipped, self.build.database())
+        LOGGER.info('Deployed %i files to %s in %.2f seconds', len(nodes),
+                    self.build.database(), time.monotonic() - start)
+
+    def _deploy_changes(self):
+        """Deploy the changes needed for the database to match the project
+        in a single transaction.
+
+        """
+        try:
+            if self.plan:
+                changes = self.build.diff(
+                    self.plan.paths(), self.plan.fingerprint_cache)
+            else:
+                changes = self.build.diff()
+            with metrics.phase('diff'):
+                statements = changes.statements()
+        except ValueError as error:
+            common.exit_application(str(error), 3)
+        if self.args.dry_run:
+            for statement in statements:
+                sys.stdout.write('{};\n\n'.format(statement.rstrip(';')))
+            return
+        elif not statements:
+            LOGGER.info('%s matches the project', self.build.database())
+            return
+        metrics.count('statements', len(statements))
+        self.preamble = self._directives(self._nodes())
+        with metrics.phase('connect'):
+            self._connect(1)
+        ddl = ';\n'.join(value.rstrip(';') for value in statements)
+        with metrics.phase('apply'):
+            self._execute([
+                Task('changes', None, None, functools.partial(str, ddl),
+                     set([]), False, None)])
+        LOGGER.info('Deployed %i statements to %s', len(statements),
+                    self.build.database())
+
+    def _directives(self, nodes):
+        """Return the session settings from the project directives, which
+        are applied to each connection before it is first used.
+
+        :param list nodes: The build plan
+        :rtype: str
+
+        """
+        for node in nodes:
+            if node.path == DIRECTIVES:
+                return ';\n'.join(
+                    statement for statement in sql.split(
+                        self.build.project.read(DIRECTIVES))
+                    if sql.SETTINGS.match(sql.normalize(statement)))
+        return ''
+
+    def _divide(self, node):
+        """Return the DDL for the file divided into the DDL applied in
+        dependency order and the deferred DDL of each child type.
+
+        :param pg_lifecycle.build.Node node: The file to divide
+        :rtype: tuple(str, dict)
+
+        """
+        if self.plan:
+            return self.plan.divide(node)
+        return build.divide(self.build.project.read(node.path), node.included)
+
+    def _execute(self, tasks):
+        """Apply the tasks concurrently, starting each task when all of the
+        tasks it depends upon have committed, exiting if any task fails.
+
+        :param list tasks: The tasks to apply
+
+        """
+        dependencies = graph.Graph([task.dependencies for task in tasks])
+        remaining = [len(dependencies.parents(position))
+                     for position in range(0, len(tasks))]
+        ready = collections.deque(
+            position for position, value in enumerate(remaining) if not value)
+        running, applied, failures = {}, 0, 0
+        attempts, delayed = collections.Counter(), []
+        with futures.ThreadPoolExecutor(self.pool.maxconn) as executor:
+            while ready or running or (delayed and not failures):
+                while delayed and delayed[0][0] <= time.monotonic():
+                    ready.append(heapq.heappop(delayed)[1])
+                while ready and not failures:
+                    position = ready.popleft()
+                    running[executor.submit(
+                        self._apply, tasks[position])] = position
+                timeout = None
+                if delayed and not failures:
+                    timeout = max(0, delayed[0][0] - time.monotonic())
+                if not running:
+                    if timeout is None:
+                        break
+                    time.sleep(timeout)
+                    continue
+                done, _pending = futures.wait(
+                    running, timeout, futures.FIRST_COMPLETED)
+                for future in done:
+                    position = running.pop(future)
+                    try:
+                        future.result()
+                    except psycopg2.Error as error:
+                        if error.pgcode in RETRYABLE and \
+                                attempts[position] < self.retries:
+                            attempts[position] += 1
+                            heapq.heappush(delayed, (
+                                time.monotonic() + self._backoff(
+                                    tasks[position], attempts[position]),
+                                position))
+                            continue
+                        LOGGER.error('Failed to apply %s to %s: %s',
+                                     tasks[position].label,
+                                     self.build.database(),
+                                     str(error).strip())
+                        failures += 1
+                        continue
+                    except OSError as error:
+                        LOGGER.error('Failed to apply %s to %s: %s',
+                                     tasks[position].label,
+                                     self.build.database(),
+                                     str(error).strip())
+                        failures += 1
+                        continue
+                    applied += 1
+                    for child in dependencies.children(position):
+                        remaining[child] -= 1
+                        if not remaining[child]:
+                            ready.append(child)
+        if failures:
+            common.exit_application(
+                'Deploy to {} failed after applying {} of {}'.format(
+                    self.build.database(), applied, len(tasks)), 3)
+
+    def _load_journal(self):
+        """Load the deploy journal from the database, creating the journal
+        table if it does not exist, exiting if it can not be loaded.
+
+        """
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                self.journal.load(cursor)
+            conn.commit()
+        except psycopg2.Error as error:
+            common.exit_application(
+                'Failed to load the deploy journal from {}: {}'.format(
+                    self.build.database(), str(error).strip()), 3)
+        finally:
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def _main_ddl(self, node):
+        """Return the DDL for the file that is applied in dependency order,
+        recording the DDL for deferred children to be applied later.
+
+        :param pg_lifecycle.build.Node node: The file to return the DDL for
+        :rtype: str
+
+        """
+        ddl, deferred = self._divide(node)
+        with self.lock:
+            for child_type, value in deferred.items():
+                self.deferred[child_type].append((node, value))
+            if self.online and online.partitioned(ddl):
+                self.partitioned.add(node.path)
+        return ddl
+
+    def _prepare(self, conn):
+        """Prepare a connection from the pool before it is first used,
+        applying the session settings from the project directives and then
+        the lock and statement timeouts. Prepared connections are tracked by
+        reference, so a connection that replaces one the pool closed is
+        always prepared.
+
+        """
+        connection.prepare(conn, self.args)
+        if self.preamble:
+            with conn.cursor() as cursor:
+                cursor.execute(self.preamble)
+            conn.commit()
+        timeouts = [(name, value) for name, value in [
+            ('lock_timeout', getattr(self.args, 'lock_timeout', None)),
+            ('statement_timeout',
+             getattr(self.args, 'statement_timeout', None))]
+            if value is not None]
+        if timeouts:
+            with conn.cursor() as cursor:
+                cursor.execute(';\n'.join(
+                    'SET {} = {:d}'.format(name, value)
+                    for name, value in timeouts))
+            conn.commit()
+        self.prepared.add(conn)
+
+    def _nodes(self):
+        """Return the build plan as a list of nodes in build order.
+
+        :rtype: list
+        :raises: ValueError
+
+        """
+        if self.plan:
+            return self.plan.nodes
+        return self.build.nodes()
+
+    def _pending(self, node, phase, ddl):
+        """Return True if the DDL for the step has not been applied.
+
+        :param pg_lifecycle.build.Node node: The file the step is for
+        :param str phase: The step's phase
+        :param str ddl: The DDL for the step
+        :rtype: bool
+
+        """
+        return bool(sql.split(ddl)) and not self.journal.applied(
+            node.path, phase, journal.digest(ddl))
+
+    def _steps(self, node, child_type, ddl):
+        """Return the steps that apply the deferred DDL of one type for the
+        file, and the steps that validate constraints once all of the
+        deferred DDL has been applied.
+
+        :param pg_lifecycle.build.Node node: The file the DDL is from
+        :param str child_type: The deferred child type
+        :param str ddl: The deferred DDL
+        :rtype: tuple(list, list)
+
+        """
+        if self.online:
+            return online.steps(
+                child_type, ddl, node.path in self.partitioned)
+        return [online.Step(child_type, ddl, False, None, None)], []
+
+    def _tasks(self, steps):
+        """Return the tasks for the steps, making each step on a table
+        depend upon the step before it on the same table.
+
+        :param list steps: The file nodes and steps to apply
+        :rtype: list
+
+        """
+        tasks, previous = [], {}
+        for node, step in steps:
+            dependencies = set([])
+            if step.table is not None:
+                if step.table in previous:
+                    dependencies.add(previous[step.table])
+                previous[step.table] = len(tasks)
+            tasks.append(Task(
+                '{} ({}{})'.format(node.path, step.phase,
+                                   's' if step.phase in build.DEFERRED
+                                   else ''),
+                node, step.phase, functools.partial(str, step.ddl),
+                dependencies, step.autocommit, step.index))
+        return tasks
+
+    def _report(self, nodes):
+        """Write the files that would be deployed, grouped by the level of
+        the dependency graph they are in. Files in the same level do not
+        depend upon each other and can be applied concurrently. Files that
+        the local deploy journal shows were already applied unchanged are
+        left out, so a failed deploy reports what it would resume.
+
+        :param list nodes: The build plan
+
+        """
+        self.journal.load_file()
+        levels = graph.Graph([node.dependencies for node in nodes]).levels()
+        pending = 0
+        for level, node in sorted(zip(levels, nodes),
+                                  key=lambda value: (value[0], value[1].path)):
+            ddl, deferred = self._divide(node)
+            if self.online and online.partitioned(ddl):
+                self.partitioned.add(node.path)
+            steps = [self._pending(node, '', ddl)]
+            for child_type, value in deferred.items():
+                for values in self._steps(node, child_type, value):
+                    steps += [self._pending(node, step.phase, step.ddl)
+                              for step in values]
+            pending += sum(steps)
+            if any(steps):
+                sys.stdout.write('{}\t{}\n'.format(level, node.path))
+        widths = collections.Counter(levels)
+        LOGGER.info('Would deploy %i files in %i levels with up to %i '
+                    'applied concurrently', len(nodes), len(widths),
+                    max(widths.values()) if widths else 0)
+        if self.journal.skipped:
+            LOGGER.info('Would resume the deploy to %s, skipping %i steps '
+                        'already applied and applying the other %i',
+                        self.build.database(), self.journal.skipped, pending)
+
+
+class Plan:
+    """The files of a project in build order and the divided DDL of each
+    file, read once and shared by the deploys of the project to a fleet of
+    databases.
+
+    :param pg_lifecycle.build.Build builder: The build of the project
+    :raises: ValueError
+
+    """
+    def __init__(self, builder):
+        self.project = builder.project
+        self.nodes = builder.nodes()
+        self.fingerprint_cache = None
+        if getattr(builder.args, 'diff', False):
+            self.fingerprint_cache = cache.FingerprintCache(self.project)
+        self._ddl = {}
+
+    def divide(self, node):
+        """Return the DDL for the file divided into the DDL applied in
+        dependency order and the deferred DDL of each child type, reading
+        the file the first time it is deployed.
+
+        :param pg_lifecycle.build.Node node: The file to divide
+        :rtype: tuple(str, dict)
+
+        """
+        key = node.path, node.included
+        value = self._ddl.get(key)
+        if value is None:
+            value = self._ddl.setdefault(key, build.divide(
+                self.project.read(node.path), node.included))
+        return value
+
+    def paths(self):
+        """Return the build plan as the ordered file paths and if the object
+        each file is for was already included by an earlier file.
+
+        :rtype: list
+
+        """
+        return [[node.path, node.included] for node in self.nodes]
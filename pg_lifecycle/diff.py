@@ -0,0 +1,433 @@
+# coding=utf-8
+"""
+Database Diffs
+
+Compares a project with a catalog snapshot and builds the DDL that changes
+the database to match the project.
+
+"""
+import argparse
+import collections
+import logging
+import re
+
+from pg_lifecycle import catalog, common, filters, sql
+
+LOGGER = logging.getLogger(__name__)
+
+DEFERRED = common.POST_DATA_OBJ_TYPES
+
+DROP_ORDER = [
+    common.COMMENT,
+    common.DEFAULT,
+    common.SEQUENCE_OWNED_BY,
+    common.TRIGGER,
+    common.FK_CONSTRAINT,
+    common.CONSTRAINT,
+    common.CHECK_CONSTRAINT,
+    common.INDEX,
+    common.MATERIALIZED_VIEW,
+    common.VIEW,
+    common.FUNCTION,
+    common.PROCEDURE,
+    common.TABLE,
+    common.SEQUENCE,
+    common.DOMAIN,
+    common.TYPE,
+    common.EXTENSION,
+    common.SCHEMA
+]
+
+OVERWRITE = {common.COMMENT, common.DEFAULT, common.SEQUENCE_OWNED_BY}
+REPLACEABLE = {common.FUNCTION, common.PROCEDURE, common.VIEW}
+
+INDEX_RELATION = re.compile(r' ON (?:ONLY )?({}) '.format(sql.QNAME))
+
+QUALIFIED = re.compile(r'({0})\.({0})'.format(sql.IDENT))
+
+RELATED = filters.RELATIONS | {
+    common.CHECK_CONSTRAINT, common.COLUMN, common.CONSTRAINT,
+    common.DEFAULT, common.FK_CONSTRAINT, common.POLICY, common.RULE,
+    common.SEQUENCE_OWNED_BY, common.TRIGGER}
+
+COLUMN_PATTERN = re.compile(
+    r'^(?:(CONSTRAINT) )?({}) (.*?)(?: DEFAULT (.*?))?'
+    r'( GENERATED (?:ALWAYS|BY DEFAULT) AS '
+    r'(?:IDENTITY(?: \(.*\))?|\(.*\) STORED))?( NOT NULL)?'
+    r'( COLLATE \S+)?$'.format(sql.IDENT))
+
+IDENTITY = re.compile(r'^ GENERATED (?:ALWAYS|BY DEFAULT) AS IDENTITY\b')
+
+UNPARSED = re.compile(r'\b(?:GENERATED|NOT NULL)\b')
+
+
+class Diff:
+    """Builds the DDL that changes a database to match a project
+
+    Objects are compared by fingerprint, so only the project files that
+    define added or changed objects are read. When a fingerprint cache is
+    passed, the fingerprints of unchanged files are not recalculated. Only
+    objects in the scope of the schema and table patterns the project was
+    generated with are dropped. Columns that are not in the project are only
+    dropped when ``drop_columns`` is set, since dropping them loses their
+    data.
+
+    :param pg_lifecycle.project.Project project: The project
+    :param pg_lifecycle.catalog.Snapshot snapshot: The database snapshot
+    :param list plan: The build plan for the project
+    :param pg_lifecycle.cache.FingerprintCache fingerprint_cache: The
+        fingerprint cache
+    :param bool drop_columns: Drop the columns that are not in the project
+
+    """
+    def __init__(self, project, snapshot, plan, fingerprint_cache=None,
+                 drop_columns=False):
+        self.project = project
+        self.snapshot = snapshot
+        self.plan = plan
+        self.fingerprint_cache = fingerprint_cache
+        self.drop_columns = drop_columns
+        self.added, self.changed, self.removed = set([]), set([]), []
+        self.owners = {}
+        self.recreated = []
+        self.filter = filters.Filter(argparse.Namespace(**project.scope()))
+
+    def compare(self):
+        """Compare the fingerprints of the project's objects with the
+        snapshot, returning the paths of the files that define added or
+        changed objects in build order.
+
+        :rtype: list
+
+        """
+        paths = []
+        for file_path, _included in self.plan:
+            changed = False
+            for desc, name, value in self._fingerprints(file_path):
+                key = desc, name
+                if key in self.owners:
+                    continue
+                self.owners[key] = file_path
+                if key not in self.snapshot:
+                    self.added.add(key)
+                elif self.snapshot[key].fingerprint != value:
+                    self.changed.add(key)
+                else:
+                    continue
+                changed = True
+            if changed:
+                paths.append(file_path)
+        self.removed = [key for key in self.snapshot
+                        if key not in self.owners and self._in_scope(key)]
+        if self.fingerprint_cache:
+            self.fingerprint_cache.save()
+        LOGGER.info('Compared %i objects with %i in the database: '
+                    '%i added, %i changed, %i removed', len(self.owners),
+                    len(self.snapshot), len(self.added), len(self.changed),
+                    len(self.removed))
+        return paths
+
+    def statements(self):
+        """Return the statements that change the database to match the
+        project. Removed objects and changed objects that can not be altered
+        are dropped first, followed by the statements for added and changed
+        objects in build order with constraints and indexes last.
+
+        :rtype: list
+
+        """
+        values, deferred = [], collections.defaultdict(list)
+        for file_path in self.compare():
+            for key, statements in sql.objects(self.project.expand(file_path)):
+                if self.owners.get(key) != file_path:
+                    continue
+                elif key in self.added:
+                    changes = [source for source, _ in statements]
+                elif key in self.changed:
+                    changes = self._alter(key, statements)
+                else:
+                    continue
+                if key[0] in DEFERRED:
+                    deferred[key[0]].extend(changes)
+                else:
+                    values.extend(changes)
+        for desc in DEFERRED:
+            values.extend(deferred[desc])
+        return self._drops() + values
+
+    def write(self, handle):
+        """Write the statements that change the database to match the
+        project to the handle, returning the number of statements written.
+
+        :param file handle: The binary file handle to write to
+        :rtype: int
+
+        """
+        statements = self.statements()
+        for statement in statements:
+            handle.write('{};\n\n'.format(
+                statement.rstrip().rstrip(';')).encode('utf-8'))
+        return len(statements)
+
+    def _alter(self, key, statements):
+        """Return the statements that change an object to match the
+        project, recording the object to be dropped and created if it can
+        not be altered.
+
+        :param tuple key: The object key
+        :param list statements: The object's statements from the project
+        :rtype: list
+
+        """
+        desc, (source, normalized) = key[0], statements[0]
+        current = self.snapshot[key].statements[0][1]
+        if desc in REPLACEABLE:
+            return [re.sub(r'^\s*CREATE (?:OR REPLACE )?',
+                           'CREATE OR REPLACE ', source)]
+        elif desc in OVERWRITE:
+            return [source]
+        elif desc == common.SEQUENCE:
+            return [re.sub(r'^\s*CREATE ', 'ALTER ', source)]
+        elif desc == common.TABLE:
+            changes = table_changes(
+                key[1], current, normalized, self.drop_columns)
+            if changes is None:
+                LOGGER.warning('Unable to alter %s to match the project, '
+                               'it must be changed manually', key[1])
+                return []
+            return changes
+        elif desc == common.TYPE:
+            changes = enum_changes(key[1], current, normalized)
+            if changes is not None:
+                return changes
+        self.recreated.append(key)
+        return [value for value, _ in statements]
+
+    def _drops(self):
+        """Return the drop statements for removed and recreated objects,
+        dependent objects first and most recently created first.
+
+        :rtype: list
+
+        """
+        order = {desc: offset for offset, desc in enumerate(DROP_ORDER)}
+        positions = {key: offset for offset, key in enumerate(self.snapshot)}
+        keys = sorted(self.removed + self.recreated, key=lambda key: (
+            order.get(key[0], len(order)), -positions[key]))
+        return [self.snapshot[key].drop for key in keys]
+
+    def _in_scope(self, key):
+        """Return ``True`` if the snapshot object is in the scope of the
+        project.
+
+        :param tuple key: The object key
+        :rtype: bool
+
+        """
+        if not self.filter.active:
+            return True
+        return self.filter.covers(
+            *scope(key, self.snapshot[key].statements[0][1]))
+
+    def _fingerprints(self, file_path):
+        """Return the ``[desc, name, fingerprint]`` values for the objects
+        defined in the project file that snapshots include.
+
+        :param str file_path: The project relative path
+        :rtype: list
+
+        """
+        def fingerprints():
+            return [[key[0], key[1], sql.fingerprint(statements[0][1])]
+                    for key, statements in sql.objects(
+                        self.project.expand(file_path))
+                    if catalog.covered(key, statements[0][1])]
+
+        if self.fingerprint_cache:
+            return self.fingerprint_cache.get(file_path, fingerprints)
+        return fingerprints()
+
+
+def enum_changes(name, current, desired):
+    """Return the statements that add values to an enum, or None if the
+    change is not only the addition of values.
+
+    :param str name: The qualified type name
+    :param str current: The normalised DDL for the type in the database
+    :param str desired: The normalised DDL for the type in the project
+    :rtype: list or None
+
+    """
+    before, after = _labels(current), _labels(desired)
+    if before is None or after is None:
+        return None
+    positions = [after.index(label) for label in before if label in after]
+    if len(positions) != len(before) or positions != sorted(positions):
+        return None
+    values = []
+    for offset, label in enumerate(after):
+        if label in before:
+            continue
+        elif offset:
+            values.append('ALTER TYPE {} ADD VALUE {} AFTER {}'.format(
+                name, label, after[offset - 1]))
+        elif len(after) > 1:
+            values.append('ALTER TYPE {} ADD VALUE {} BEFORE {}'.format(
+                name, label, after[1]))
+        else:
+            values.append('ALTER TYPE {} ADD VALUE {}'.format(name, label))
+    return values
+
+
+def scope(key, statement):
+    """Return the schema of the object for a snapshot key and the name of
+    the relation it is or belongs to, or ``None`` if it is not a relation
+    and does not belong to one.
+
+    :param tuple key: The object key
+    :param str statement: The object's normalised statement
+    :rtype: tuple(str or None, str or None)
+
+    """
+    desc, name = key
+    if desc == common.INDEX:
+        match = INDEX_RELATION.search(statement)
+        if match:
+            desc, name = common.TABLE, match.group(1)
+    match = QUALIFIED.search(name)
+    if not match:
+        if desc == common.SCHEMA:
+            return _unquote(name), None
+        elif name.startswith(filters.SCHEMA_PREFIX):
+            return _unquote(name[len(filters.SCHEMA_PREFIX):]), None
+        return None, None
+    prefix = name[:match.start()].strip()
+    if not prefix:
+        prefix = common.TABLE if desc in sql.ATTACHED else desc
+    if not any(prefix == value or prefix.startswith('{} '.format(value))
+               for value in RELATED):
+        return _unquote(match.group(1)), None
+    return _unquote(match.group(1)), _unquote(match.group(2))
+
+
+def table_changes(name, current, desired, drop_columns=False):
+    """Return the statements that alter a table's columns and inline
+    constraints to match the desired ``CREATE TABLE`` statement, or None if
+    the change is to anything else about the table or can not be made by
+    altering it, such as a change to a generation expression. Columns that
+    are not in the desired statement are only dropped if ``drop_columns`` is
+    set, otherwise a warning is logged.
+
+    :param str name: The qualified table name
+    :param str current: The normalised DDL for the table in the database
+    :param str desired: The normalised DDL for the table in the project
+    :param bool drop_columns: Drop the columns that are not in the project
+    :rtype: list or None
+
+    """
+    before, after = _table(name, current), _table(name, desired)
+    if before is None or after is None or before[0] != after[0] or \
+            before[2] != after[2]:
+        return None
+    drops, columns, alters, constraints = [], [], [], []
+    prefix = 'ALTER TABLE {} '.format(name)
+    for key, value in before[1].items():
+        if key[0] and after[1].get(key) != value:
+            drops.append('{}DROP CONSTRAINT {}'.format(prefix, key[1]))
+        elif not key[0] and key not in after[1]:
+            if drop_columns:
+                drops.append('{}DROP COLUMN {}'.format(prefix, key[1]))
+            else:
+                LOGGER.warning('Not dropping column %s of %s which is not '
+                               'in the project, use --allow-drop-columns '
+                               'to drop it', key[1], name)
+    for key, value in after[1].items():
+        if key[0]:
+            if before[1].get(key) != value:
+                constraints.append('{}ADD CONSTRAINT {} {}'.format(
+                    prefix, key[1], value[0]))
+        elif key not in before[1]:
+            columns.append('{}ADD COLUMN {} {}{}{}{}{}'.format(
+                prefix, key[1], value[0],
+                ' DEFAULT {}'.format(value[3]) if value[3] else '',
+                value[4], value[1], value[2]))
+        else:
+            identity = _identity_changes(key[1], before[1][key][4], value[4])
+            if identity is None:
+                return None
+            alters.extend(prefix + change for change in identity[0])
+            if (value[0], value[2]) != (before[1][key][0],
+                                        before[1][key][2]):
+                alters.append('{}ALTER COLUMN {} TYPE {}{}'.format(
+                    prefix, key[1], value[0], value[2]))
+            if value[3] != before[1][key][3]:
+                alters.append('{}ALTER COLUMN {} {}'.format(
+                    prefix, key[1], 'SET DEFAULT {}'.format(value[3])
+                    if value[3] else 'DROP DEFAULT'))
+            if value[1] != before[1][key][1]:
+                alters.append('{}ALTER COLUMN {} {} NOT NULL'.format(
+                    prefix, key[1], 'SET' if value[1] else 'DROP'))
+            alters.extend(prefix + change for change in identity[1])
+    return drops + columns + alters + constraints
+
+
+def _identity_changes(column, current, desired):
+    """Return the statements that drop a column's identity before the
+    column is altered and that add it after, or None if the column's
+    generation expression or the options of its identity changed, which can
+    not be done without recreating the column or its sequence.
+
+    """
+    if current == desired:
+        return [], []
+    elif any(value and not IDENTITY.match(value)
+             for value in (current, desired)) or (current and desired):
+        return None
+    elif current:
+        return ['ALTER COLUMN {} DROP IDENTITY'.format(column)], []
+    return [], ['ALTER COLUMN {} ADD{}'.format(column, desired)]
+
+
+def _labels(statement):
+    """Return the quoted labels of an enum type's DDL"""
+    offset = statement.find(' AS ENUM (')
+    if offset < 0:
+        return None
+    return sql.elements(sql.parenthesized(statement, offset + 9)[1:-1])
+
+
+def _table(name, statement):
+    """Return the text before the column list of a ``CREATE TABLE``
+    statement, its columns and inline constraints and the text after it.
+    Columns are keyed by ``(None, name)`` with a value of the type, the
+    ``NOT NULL`` clause, the ``COLLATE`` clause, the default expression and
+    the ``GENERATED`` clause of a generated or identity column, and
+    constraints are keyed by ``('CONSTRAINT', name)`` with a value of their
+    definition. Returns None if a column has clauses that are not parsed.
+
+    """
+    offset = statement.find('(', statement.find(name) + len(name))
+    if offset < 0:
+        return None
+    body = sql.parenthesized(statement, offset)
+    elements = collections.OrderedDict()
+    for element in sql.elements(body[1:-1]):
+        match = COLUMN_PATTERN.match(element)
+        if not match or (not match.group(1) and
+                         UNPARSED.search(match.group(3))):
+            return None
+        elif match.group(1):
+            elements[(match.group(1), match.group(2))] = (
+                element[len(match.group(1)) + len(match.group(2)) + 2:],)
+        else:
+            elements[(None, match.group(2))] = (
+                match.group(3), match.group(6) or '', match.group(7) or '',
+                match.group(4), match.group(5) or '')
+    return statement[:offset], elements, statement[offset + len(body):]
+
+
+def _unquote(value):
+    """Return the name of a possibly quoted identifier"""
+    if value.startswith('"'):
+        return value[1:-1].replace('""', '"')
+    return value
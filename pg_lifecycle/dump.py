@@ -0,0 +1,120 @@
+# coding=utf-8
+"""
+Dump Readers
+
+:class:`LazyToC` replaces the private entry readers of pgdumplib's
+``ToC`` class, so it is tied to the table of contents reader in the
+pgdumplib versions listed in ``PGDUMPLIB_VERSIONS``.
+
+"""
+import os
+
+import pgdumplib
+from pgdumplib import directory, toc
+
+PGDUMPLIB_VERSIONS = ['0.2']
+
+
+class Definition:
+    """Location of an entry's DDL definition in the dump's ToC file, read on
+    demand instead of being held in memory.
+
+    :param file handle: The open ToC file handle
+    :param int offset: The offset of the definition in the ToC file
+    :param int length: The length of the definition in bytes
+
+    """
+    __slots__ = ['handle', 'offset', 'length']
+
+    def __init__(self, handle, offset, length):
+        self.handle = handle
+        self.offset = offset
+        self.length = length
+
+    def __repr__(self):
+        return '<Definition offset={} length={}>'.format(
+            self.offset, self.length)
+
+    def read(self):
+        """Read the definition from the ToC file.
+
+        :rtype: str
+
+        """
+        self.handle.seek(self.offset)
+        return self.handle.read(self.length).decode('utf-8')
+
+
+class LazyToC(toc.ToC):
+    """Reads the table of contents into named tuples, replacing each entry's
+    ``defn`` with a :class:`Definition` so that only the entry metadata is
+    kept in memory.
+
+    :param str filename: The path to the ToC file
+    :raises: ValueError
+
+    """
+    def __init__(self, filename):
+        if not supported():
+            raise ValueError(
+                'Streaming is not supported with pgdumplib {}, it requires '
+                'pgdumplib {}'.format(pgdumplib.__version__,
+                                      ' or '.join(PGDUMPLIB_VERSIONS)))
+        super(LazyToC, self).__init__(filename)
+
+    def _read_definition(self):
+        length = self._read_int()
+        if length <= 0:
+            return ''
+        offset = self.handle.tell()
+        self.handle.seek(length, os.SEEK_CUR)
+        return Definition(self.handle, offset, length)
+
+    def _read_entries(self):
+        return [self._read_entry() for _i in range(0, self._read_int())]
+
+    def _read_entry(self):
+        entry = toc.Entry(
+            self._read_int(),
+            self._read_int(),
+            self._read_bytes().decode('utf-8'),
+            self._read_bytes().decode('utf-8'),
+            self._read_bytes().decode('utf-8'),
+            self._read_bytes().decode('utf-8'),
+            toc._SECTIONS[self._read_int() - 1],
+            self._read_definition(),
+            self._read_bytes().decode('utf-8'),
+            self._read_bytes().decode('utf-8'),
+            self._read_bytes().decode('utf-8'),
+            self._read_bytes().decode('utf-8'),
+            self._read_bytes().decode('utf-8'),
+            True if self._read_bytes() == b'true' else False,
+            self._read_dependencies())
+        offset = self._read_int()  # Offset for data alignment
+        if offset:
+            self.handle.read(offset)
+        return entry
+
+
+class LazyReader(directory.Reader):
+    """Reads dumps created with the -Fd option without loading the entry
+    definitions into memory.
+
+    :param str dump_path: The path to the dump directory
+    :raises: ValueError
+
+    """
+    def __init__(self, dump_path):
+        self.directory = dump_path
+        self.toc = LazyToC('{}/toc.dat'.format(dump_path))
+
+
+def supported():
+    """Return ``True`` if the installed pgdumplib version has the table of
+    contents reader that :class:`LazyToC` extends.
+
+    :rtype: bool
+
+    """
+    return '.'.join(pgdumplib.__version__.split('.')[:2]) in \
+        PGDUMPLIB_VERSIONS
@@ -0,0 +1,427 @@
+# coding=utf-8
+"""
+Catalog Extraction
+
+Builds the table of contents of a schema-only dump directly from the system
+catalog with a fixed number of bulk queries, so that a project can be
+generated without running pg_dump and reading its output back from disk.
+
+"""
+import collections
+import logging
+import re
+
+from pgdumplib import toc
+
+from pg_lifecycle import catalog, common, sql
+
+LOGGER = logging.getLogger(__name__)
+
+FIRST_NORMAL_OID = 16384
+
+CATALOG_OIDS = {
+    'pg_class': 1259,
+    'pg_constraint': 2606,
+    'pg_extension': 3079,
+    'pg_namespace': 2615,
+    'pg_proc': 1255,
+    'pg_trigger': 2620,
+    'pg_type': 1247}
+
+CATALOGS = {
+    'constraints': 'pg_constraint',
+    'extensions': 'pg_extension',
+    'functions': 'pg_proc',
+    'indexes': 'pg_class',
+    'relations': 'pg_class',
+    'schemas': 'pg_namespace',
+    'triggers': 'pg_trigger',
+    'types': 'pg_type'}
+
+ACL_PATTERN = re.compile(r'^("(?:[^"]|"")*"|[^=]*)=([^/]*)/(.*)$')
+
+PRIVILEGES = {
+    'FUNCTION': [('X', 'EXECUTE')],
+    'PROCEDURE': [('X', 'EXECUTE')],
+    'SCHEMA': [('C', 'CREATE'), ('U', 'USAGE')],
+    'SEQUENCE': [('r', 'SELECT'), ('U', 'USAGE'), ('w', 'UPDATE')],
+    'TABLE': [('r', 'SELECT'), ('a', 'INSERT'), ('x', 'REFERENCES'),
+              ('d', 'DELETE'), ('t', 'TRIGGER'), ('D', 'TRUNCATE'),
+              ('m', 'MAINTAIN'), ('w', 'UPDATE')],
+    'TYPE': [('U', 'USAGE')]}
+
+ALIASES = """\
+SELECT 'pg_rewrite' AS class, r.oid AS objid,
+       'pg_class' AS ref_class, r.ev_class AS refobjid
+  FROM pg_catalog.pg_rewrite AS r
+ WHERE r.oid >= {0} AND r.rulename = '_RETURN'
+UNION ALL
+SELECT 'pg_type', t.oid, 'pg_class', t.typrelid
+  FROM pg_catalog.pg_type AS t
+  JOIN pg_catalog.pg_class AS c ON c.oid = t.typrelid
+ WHERE t.oid >= {0} AND c.relkind <> 'c'
+UNION ALL
+SELECT 'pg_class', t.typrelid, 'pg_type', t.oid
+  FROM pg_catalog.pg_type AS t
+  JOIN pg_catalog.pg_class AS c ON c.oid = t.typrelid
+ WHERE t.oid >= {0} AND c.relkind = 'c'
+UNION ALL
+SELECT 'pg_type', t.oid, 'pg_type', t.typelem
+  FROM pg_catalog.pg_type AS t
+ WHERE t.oid >= {0} AND t.typcategory = 'A'""".format(FIRST_NORMAL_OID)
+
+ATTRDEFS = """\
+SELECT d.oid, d.adrelid, pg_catalog.quote_ident(a.attname)
+  FROM pg_catalog.pg_attrdef AS d
+  JOIN pg_catalog.pg_attribute AS a
+    ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+ WHERE d.oid >= {}""".format(FIRST_NORMAL_OID)
+
+DEPENDENCIES = """\
+SELECT d.classid::pg_catalog.regclass::text AS class, d.objid,
+       d.refclassid::pg_catalog.regclass::text AS ref_class, d.refobjid,
+       d.deptype
+  FROM pg_catalog.pg_depend AS d
+ WHERE d.deptype IN ('a', 'n') AND d.objid >= {0}
+   AND (d.refobjid >= {0} OR
+        d.refclassid = 'pg_catalog.pg_namespace'::pg_catalog.regclass)
+ ORDER BY d.classid, d.objid, d.refclassid, d.refobjid""".format(
+    FIRST_NORMAL_OID)
+
+DATABASE = """\
+SELECT pg_catalog.current_setting('server_version'),
+       pg_catalog.pg_encoding_to_char(d.encoding)
+  FROM pg_catalog.pg_database AS d
+ WHERE d.datname = pg_catalog.current_database()"""
+
+
+def _filters(catalog_name, alias, namespace=None):
+    values = [catalog.EXTENSION_FILTER.format(catalog_name, alias)]
+    if namespace:
+        values.append(catalog.SCHEMA_FILTER.format('n'))
+        return """pg_catalog.{0} AS {1}
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = {1}.{2}
+ WHERE {3}""".format(catalog_name, alias, namespace, ' AND '.join(values))
+    return 'pg_catalog.{} AS {} WHERE {}.oid >= {} AND {}'.format(
+        catalog_name, alias, alias, FIRST_NORMAL_OID, values[0])
+
+
+def _relation_filter(condition):
+    return """pg_catalog.pg_class AS o
+  JOIN pg_catalog.pg_namespace AS n ON n.oid = o.relnamespace
+ WHERE {} AND {} AND {}""".format(
+        condition, catalog.SCHEMA_FILTER.format('n'),
+        catalog.EXTENSION_FILTER.format('pg_class', 'o'))
+
+
+UNSUPPORTED = [
+    ('aggregates', _filters('pg_proc', 'o', 'pronamespace') +
+     " AND o.prokind IN ('a', 'w')"),
+    ('base or range types', _filters('pg_type', 'o', 'typnamespace') +
+     " AND o.typtype IN ('b', 'r') AND o.typcategory <> 'A'"),
+    ('casts', _filters('pg_cast', 'o')),
+    ('collations', _filters('pg_collation', 'o', 'collnamespace')),
+    ('column privileges', _relation_filter(
+        'o.oid IN (SELECT a.attrelid FROM pg_catalog.pg_attribute AS a '
+        "WHERE a.attacl IS NOT NULL)")),
+    ('conversions', _filters('pg_conversion', 'o', 'connamespace')),
+    ('default privileges', 'pg_catalog.pg_default_acl AS o'),
+    ('event triggers', _filters('pg_event_trigger', 'o')),
+    ('extended statistics',
+     _filters('pg_statistic_ext', 'o', 'stxnamespace')),
+    ('foreign data wrappers', _filters('pg_foreign_data_wrapper', 'o')),
+    ('foreign servers', _filters('pg_foreign_server', 'o')),
+    ('foreign tables', _relation_filter("o.relkind = 'f'")),
+    ('identity columns', _relation_filter(
+        'o.oid IN (SELECT a.attrelid FROM pg_catalog.pg_attribute AS a '
+        "WHERE a.attidentity <> '')")),
+    ('inherited or partitioned tables', _relation_filter(
+        'o.relispartition OR o.relhassubclass')),
+    ('operator classes', _filters('pg_opclass', 'o', 'opcnamespace')),
+    ('operator families', _filters('pg_opfamily', 'o', 'opfnamespace')),
+    ('operators', _filters('pg_operator', 'o', 'oprnamespace')),
+    ('policies', _relation_filter(
+        'o.relrowsecurity OR o.oid IN (SELECT polrelid '
+        'FROM pg_catalog.pg_policy)')),
+    ('procedural languages', _filters('pg_language', 'o') +
+     " AND o.lanname <> 'plpgsql'"),
+    ('publications', 'pg_catalog.pg_publication AS o'),
+    ('rules', _relation_filter(
+        "o.oid IN (SELECT ev_class FROM pg_catalog.pg_rewrite "
+        "WHERE rulename <> '_RETURN')")),
+    ('security labels', 'pg_catalog.pg_seclabel AS o'),
+    ('storage parameters or tablespaces', _relation_filter(
+        "o.relkind IN ('i', 'm', 'p', 'r', 'v') AND "
+        "(o.reloptions IS NOT NULL OR o.reltablespace <> 0)")),
+    ('text search configurations',
+     _filters('pg_ts_config', 'o', 'cfgnamespace')),
+    ('text search dictionaries',
+     _filters('pg_ts_dict', 'o', 'dictnamespace')),
+    ('text search parsers', _filters('pg_ts_parser', 'o', 'prsnamespace')),
+    ('text search templates',
+     _filters('pg_ts_template', 'o', 'tmplnamespace')),
+    ('transforms', _filters('pg_transform', 'o')),
+    ('typed tables', _relation_filter('o.reloftype <> 0'))]
+
+UNSUPPORTED_QUERY = '\nUNION ALL\n'.join(
+    "SELECT '{}', pg_catalog.count(*)\n  FROM {}".format(label, source)
+    for label, source in UNSUPPORTED)
+
+ToC = collections.namedtuple('ToC', ['entries'])
+
+
+class Extractor:
+    """Reads the objects in a database from its system catalog into the same
+    table of contents entries that pg_dump writes, with the DDL for each
+    object built in the format pg_dump uses and the dependencies between
+    entries taken from ``pg_depend``. The extractor can be used in place of
+    a dump reader by :class:`pg_lifecycle.generate.Generate`.
+
+    Only the classes of object that catalog snapshots include, along with
+    their ownership and privileges, are extracted. Call :meth:`unsupported`
+    first to check that the database does not have any other objects.
+
+    :param psycopg2.extensions.connection connection: The connection to use
+    :param argparse.Namespace args: The parsed cli arguments
+
+    """
+    dump_version = None
+
+    def __init__(self, connection, args):
+        self.args = args
+        self.connection = connection
+        self.aliases = {}
+        self.dependencies = collections.defaultdict(set)
+        self.entries = []
+        self.keys = {}
+        self.last_id = 0
+        self.sequences = set([])
+        self.server_version = None
+        self.toc = None
+
+    def extract(self):
+        """Read the catalog in a single read-only, repeatable read
+        transaction, returning the extractor with its table of contents.
+
+        :rtype: Extractor
+        :raises: psycopg2.Error
+
+        """
+        self.connection.set_session(
+            isolation_level='REPEATABLE READ', readonly=True)
+        with self.connection.cursor() as cursor:
+            cursor.execute(DATABASE)
+            self.server_version, encoding = cursor.fetchone()
+            self._directives(encoding)
+            cursor.execute(ALIASES)
+            for row in cursor.fetchall():
+                self.aliases[row[:2]] = row[2:]
+            cursor.execute(ATTRDEFS)
+            for oid, relation, column in cursor.fetchall():
+                self.aliases[('pg_attrdef', oid)] = \
+                    'default', (relation, column)
+                self.aliases[('default', (relation, column))] = \
+                    'pg_class', relation
+            for name in catalog.QUERIES:
+                for row in sorted(catalog.rows(cursor, name), key=lambda row: (
+                        row.get('namespace') or '', row['tag'])):
+                    self._add_object(name, row)
+            cursor.execute(DEPENDENCIES)
+            for row in cursor.fetchall():
+                self._add_dependency(*row)
+        self.connection.rollback()
+        self.toc = ToC([
+            entry._replace(dependencies=sorted(
+                self.dependencies[entry.dump_id]))
+            for entry in self.entries])
+        LOGGER.info('Extracted %i entries from the catalog',
+                    len(self.entries))
+        return self
+
+    def unsupported(self):
+        """Return the number and class of the objects in the database that
+        can not be extracted from the catalog.
+
+        :rtype: list
+        :raises: psycopg2.Error
+
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(UNSUPPORTED_QUERY)
+            values = ['{} {}'.format(count, label)
+                      for label, count in cursor.fetchall() if count]
+        self.connection.rollback()
+        return values
+
+    def _acl(self, kind, name, tag, namespace, row, parent):
+        """Add the entry with the statements that change the object's
+        privileges from the defaults for its owner, or from its initial
+        privileges for objects created by initdb, as pg_dump does.
+
+        """
+        if self.args.no_privileges or row.get('acl') is None:
+            return
+        current, defaults = _acl_items(row['acl']), _acl_items(
+            row['default_acl'])
+        statements = []
+        for grantee in [grantee for grantee in defaults
+                        if defaults[grantee] != current.get(grantee)]:
+            statements.append('REVOKE ALL ON {} {} FROM {};'.format(
+                kind, name, grantee))
+        privileges = PRIVILEGES['TYPE' if kind == 'DOMAIN' else kind]
+        everything = set(defaults.get(
+            sql.quote_ident(row['owner']), current.get(
+                sql.quote_ident(row['owner']), '')).replace('*', ''))
+        for grantee, value in current.items():
+            if defaults.get(grantee) == value:
+                continue
+            granted = set(value.replace('*', ''))
+            with_option = set(re.findall(r'(\w)\*', value))
+            for values, suffix in [(granted - with_option, ''),
+                                   (with_option, ' WITH GRANT OPTION')]:
+                if not values:
+                    continue
+                names = 'ALL' if values == everything else ','.join(
+                    keyword for code, keyword in privileges
+                    if code in values)
+                statements.append('GRANT {} ON {} {} TO {}{};'.format(
+                    names, kind, name, grantee, suffix))
+        if statements:
+            self._add_entry(
+                None, common.ACL, '{} {}'.format(kind, tag), namespace,
+                '\n'.join(statements), '', row['owner'], parent, 'None')
+
+    def _add_dependency(self, class_name, objid, ref_class, refobjid,
+                        deptype):
+        """Add a dependency from ``pg_depend`` between two entries"""
+        if class_name == 'pg_class' and deptype == 'a' and \
+                objid in self.sequences:
+            return
+        dump_id = self._resolve((class_name, objid))
+        dependency = self._resolve((ref_class, refobjid))
+        if dump_id and dependency and dump_id != dependency:
+            self.dependencies[dump_id].add(dependency)
+
+    def _add_entry(self, key, desc, tag, namespace, ddl, drop, owner,
+                   parent=None, section=common.PRE_DATA):
+        """Add a table of contents entry, returning its dump_id"""
+        dump_id = self._reserve()
+        catalog_oid = CATALOG_OIDS.get(key[0]) if key else None
+        self.entries.append(toc.Entry(
+            dump_id, 0, str(catalog_oid or 0),
+            str(key[1]) if catalog_oid else '0', tag, desc, section,
+            ddl.rstrip() + '\n', drop + '\n' if drop else '', '',
+            namespace or '', '',
+            '' if self.args.no_owner else (owner or ''), False, []))
+        if key:
+            self.keys[key] = dump_id
+        if parent:
+            self.dependencies[dump_id].add(parent)
+        return dump_id
+
+    def _add_object(self, name, row):
+        """Add the entries for an object and its children from a row of a
+        catalog snapshot query.
+
+        """
+        key = CATALOGS[name], row['oid']
+        namespace = row.get('namespace')
+        parent = None
+        if name == 'schemas' and row['name'] == 'public':
+            parent = self.keys[key] = self._reserve()
+        elif name == 'constraints':
+            parent = self.keys.get(('pg_class', row['relation']))
+        for ddl, drop in catalog.BUILDERS[name](row):
+            desc, target = sql.classify(sql.normalize(ddl))
+            if desc == common.COMMENT:
+                self._add_entry(
+                    None, desc, _unqualify(target, namespace), namespace,
+                    ddl, drop, row.get('owner'), self.keys.get(key, parent))
+            elif desc == common.DEFAULT:
+                self._add_entry(
+                    ('default', _default_key(row['oid'], target)), desc,
+                    _unqualify(target, namespace), namespace, ddl, drop,
+                    row.get('owner'), self.keys[key])
+            elif desc == common.SEQUENCE_OWNED_BY:
+                self._add_entry(None, desc, row['tag'], namespace, ddl, drop,
+                                row.get('owner'), self.keys[key])
+            else:
+                if desc in {common.FUNCTION, common.PROCEDURE}:
+                    ddl = re.sub(r'^CREATE OR REPLACE ', 'CREATE ', ddl)
+                elif desc == common.SEQUENCE:
+                    self.sequences.add(row['oid'])
+                self._add_entry(
+                    key, desc, row['tag'], namespace, ddl, drop,
+                    row.get('owner'), parent,
+                    common.POST_DATA if desc in common.POST_DATA_OBJ_TYPES
+                    or desc == common.TRIGGER else common.PRE_DATA)
+                if name == 'constraints' and row['index_oid']:
+                    self.aliases[('pg_class', row['index_oid'])] = key
+        if 'acl' in row and key in self.keys:
+            kind = common.SEQUENCE if row.get('kind') == 'S' else \
+                common.TABLE if name == 'relations' else \
+                common.DOMAIN if row.get('kind') == 'd' else \
+                common.TYPE if name == 'types' else \
+                row['kind'] if name == 'functions' else common.SCHEMA
+            self._acl(kind, row.get('signature', row.get('name')),
+                      row['tag'], namespace, row, self.keys[key])
+
+    def _directives(self, encoding):
+        """Add the session settings that pg_dump starts every dump with"""
+        for desc, ddl in [
+                (common.ENCODING,
+                 "SET client_encoding = '{}';".format(encoding)),
+                (common.STDSTRINGS,
+                 "SET standard_conforming_strings = 'on';"),
+                (common.SEARCHPATH,
+                 "SELECT pg_catalog.set_config('search_path', '', false);")]:
+            self._add_entry(None, desc, desc, None, ddl, '', None)
+
+    def _reserve(self):
+        """Reserve a dump_id for an object that does not have an entry, as
+        pg_dump does for the public schema.
+
+        """
+        self.last_id += 1
+        return self.last_id
+
+    def _resolve(self, key):
+        """Return the dump_id of the entry for a catalog object, following
+        aliases such as view rewrite rules, row types and array types to the
+        object they belong to.
+
+        """
+        for _attempt in range(4):
+            if key in self.keys:
+                return self.keys[key]
+            key = self.aliases.get(key)
+            if key is None:
+                return None
+        return None
+
+
+def _acl_items(values):
+    """Return the privileges in an ACL keyed by grantee"""
+    items = collections.OrderedDict()
+    for value in values or []:
+        match = ACL_PATTERN.match(value)
+        if not match:
+            continue
+        grantee = match.group(1)
+        if grantee.startswith('"'):
+            grantee = grantee[1:-1].replace('""', '"')
+        items['PUBLIC' if not grantee else sql.quote_ident(grantee)] = \
+            match.group(2)
+    return items
+
+
+def _default_key(relation, target):
+    """Return the key for a column default that ``pg_attrdef`` aliases"""
+    return relation, target.rsplit(' ', 1)[-1]
+
+
+def _unqualify(target, namespace):
+    """Remove the schema from the names in a comment or default target"""
+    if not namespace:
+        return target
+    return target.replace('{}.'.format(sql.quote_ident(namespace)), '')
@@ -0,0 +1,255 @@
+# coding=utf-8
+"""
+Object Filters
+
+"""
+import logging
+import re
+
+from pg_lifecycle import common
+
+LOGGER = logging.getLogger(__name__)
+
+ATTACHED = common.CHILD_OBJ_TYPE_SET | {common.RULE, common.TRIGGER}
+
+DIRECTIVES = {common.ENCODING, common.SEARCHPATH, common.STDSTRINGS}
+
+RELATIONS = {common.FOREIGN_TABLE, common.MATERIALIZED_VIEW, common.SEQUENCE,
+             common.TABLE, common.VIEW}
+
+SCHEMA_PREFIX = '{} '.format(common.SCHEMA)
+
+SCOPE = ['schema', 'exclude_schema', 'table', 'exclude_table']
+
+
+class Filter:
+    """Selects the objects to generate a project for by schema, object type
+    and name, using the same patterns as pg_dump's ``-n``, ``-N``, ``-t``
+    and ``-T`` options.
+
+    The schema and table patterns can be passed to pg_dump with
+    :meth:`dump_options` so that only the selected objects are dumped. All
+    of the patterns are applied to the table of contents by :meth:`select`
+    before the entries are indexed. Objects that are bundled into the file
+    of another object, such as comments, privileges, constraints, indexes
+    and triggers, are selected with the object they belong to.
+
+    :param argparse.Namespace args: The parsed cli arguments
+
+    """
+    def __init__(self, args):
+        self.args = args
+        self.schemas = _patterns(getattr(args, 'schema', None))
+        self.excluded_schemas = _patterns(
+            getattr(args, 'exclude_schema', None))
+        self.tables = _patterns(getattr(args, 'table', None))
+        self.excluded_tables = _patterns(getattr(args, 'exclude_table', None))
+        self.objects = _patterns(getattr(args, 'object', None))
+        self.excluded_objects = _patterns(
+            getattr(args, 'exclude_object', None))
+        self.types = _types(getattr(args, 'object_type', None))
+        self.excluded_types = _types(
+            getattr(args, 'exclude_object_type', None))
+
+    @property
+    def active(self):
+        """Return ``True`` if any objects are filtered
+
+        :rtype: bool
+
+        """
+        return any([self.schemas, self.excluded_schemas, self.tables,
+                    self.excluded_tables, self.objects,
+                    self.excluded_objects, self.types, self.excluded_types])
+
+    def covers(self, namespace, relation):
+        """Return ``True`` if an object in the schema, which is or belongs to
+        the relation, is in the scope of the schema and table patterns.
+
+        :param str namespace: The schema of the object
+        :param str relation: The relation the object is or belongs to, or
+            ``None`` if it is not a relation or does not belong to one
+        :rtype: bool
+
+        """
+        if self.tables:
+            return relation is not None and \
+                _matches(self.tables, namespace, relation) and \
+                not _matches(self.excluded_tables, namespace, relation)
+        elif relation is not None and _matches(
+                self.excluded_tables, namespace, relation):
+            return False
+        elif namespace is None:
+            return not self.schemas
+        elif self.schemas and not _matches(self.schemas, None, namespace):
+            return False
+        return not _matches(self.excluded_schemas, None, namespace)
+
+    def dump_options(self):
+        """Return the pg_dump options for the schema and table patterns
+
+        :rtype: list
+
+        """
+        options = []
+        for option, name in [('--schema', 'schema'),
+                             ('--exclude-schema', 'exclude_schema'),
+                             ('--table', 'table'),
+                             ('--exclude-table', 'exclude_table')]:
+            for value in getattr(self.args, name, None) or []:
+                options.append('{}={}'.format(option, value))
+        return options
+
+    def scope(self):
+        """Return the schema and table patterns, by option name, for storing
+        with the project.
+
+        :rtype: dict
+
+        """
+        return {name: list(getattr(self.args, name, None) or [])
+                for name in SCOPE}
+
+    def select(self, entries, dumped=False):
+        """Return the table of contents entries for the selected objects in
+        their original order.
+
+        :param list entries: The table of contents entries
+        :param bool dumped: The dump was made with :meth:`dump_options`, so
+            the schema and table patterns have already been applied
+        :rtype: list
+
+        """
+        entries = list(entries)
+        if not self.active:
+            return entries
+        by_id = {entry.dump_id: entry for entry in entries}
+        selected = set(
+            entry.dump_id for entry in entries
+            if entry.desc not in ATTACHED and self._selects(entry, dumped))
+        values = []
+        for entry in entries:
+            if entry.desc in self.types and entry.desc in ATTACHED:
+                if not self._selects(entry, dumped):
+                    continue
+            elif entry.desc in ATTACHED:
+                if entry.desc in self.excluded_types:
+                    continue
+                parents = [by_id[dump_id] for dump_id in entry.dependencies
+                           if dump_id in by_id and
+                           by_id[dump_id].desc not in ATTACHED]
+                relations = [parent for parent in parents
+                             if parent.desc in RELATIONS]
+                parents = relations or parents
+                if parents and not any(parent.dump_id in selected
+                                       for parent in parents):
+                    continue
+                elif not parents and not self._selects(entry, dumped):
+                    continue
+            elif entry.dump_id not in selected:
+                continue
+            values.append(entry)
+        LOGGER.info('Selected %i of %i table of contents entries',
+                    len(values), len(entries))
+        return values
+
+    def _selects(self, entry, dumped):
+        """Return ``True`` if the entry's object is selected"""
+        if entry.desc in DIRECTIVES:
+            return True
+        namespace = entry.namespace or None
+        if entry.desc == common.SCHEMA:
+            namespace = entry.tag
+        elif entry.tag.startswith(SCHEMA_PREFIX) and not namespace:
+            namespace = entry.tag[len(SCHEMA_PREFIX):]
+        if self.types and entry.desc not in self.types:
+            return False
+        elif entry.desc in self.excluded_types:
+            return False
+        elif self.objects and not _matches(
+                self.objects, namespace, entry.tag):
+            return False
+        elif _matches(self.excluded_objects, namespace, entry.tag):
+            return False
+        elif dumped:
+            return True
+        elif self.tables:
+            return entry.desc in RELATIONS and \
+                _matches(self.tables, namespace, entry.tag) and \
+                not _matches(self.excluded_tables, namespace, entry.tag)
+        elif entry.desc in RELATIONS and _matches(
+                self.excluded_tables, namespace, entry.tag):
+            return False
+        elif namespace is None:
+            return not self.schemas
+        elif self.schemas and not _matches(self.schemas, None, namespace):
+            return False
+        return not _matches(self.excluded_schemas, None, namespace)
+
+
+def pattern(value):
+    """Convert a pg_dump style pattern into regular expressions for the
+    schema and name it matches. ``*`` matches any sequence of characters,
+    ``?`` matches any single character and ``.`` separates the schema from
+    the name. Names are folded to lower case unless they are double quoted.
+
+    :param str value: The pattern
+    :rtype: tuple(re.Pattern or None, re.Pattern)
+
+    """
+    parts, current, quoted, offset = [], [], False, 0
+    while offset < len(value):
+        character = value[offset]
+        if character == '"':
+            if quoted and value[offset + 1:offset + 2] == '"':
+                current.append(re.escape('"'))
+                offset += 1
+            else:
+                quoted = not quoted
+        elif quoted:
+            current.append(re.escape(character))
+        elif character == '.':
+            parts.append(current)
+            current = []
+        elif character == '*':
+            current.append('.*')
+        elif character == '?':
+            current.append('.')
+        else:
+            current.append(re.escape(character.lower()))
+        offset += 1
+    parts.append(current)
+    expressions = [re.compile('^{}$'.format(''.join(part)), re.DOTALL)
+                   for part in parts]
+    return (expressions[-2] if len(expressions) > 1 else None,
+            expressions[-1])
+
+
+def normalize_type(value):
+    """Return the table of contents desc for an object type, such as
+    ``MATERIALIZED VIEW`` for ``materialized_view``.
+
+    :param str value: The object type
+    :rtype: str
+
+    """
+    return ' '.join(value.upper().replace('_', ' ').split())
+
+
+def _matches(patterns, namespace, name):
+    """Return ``True`` if any of the patterns match the name"""
+    for schema, expression in patterns:
+        if schema is not None and (
+                namespace is None or not schema.match(namespace)):
+            continue
+        elif expression.match(name):
+            return True
+    return False
+
+
+def _patterns(values):
+    return [pattern(value) for value in values or []]
+
+
+def _types(values):
+    return {normalize_type(value) for value in values or []}
@@ -0,0 +1,405 @@
+# coding=utf-8
+"""
+Generates and Deploys Projects for a Fleet of Databases
+
+"""
+import argparse
+import collections
+from concurrent import futures
+import json
+import logging
+import os
+from os import path
+import sys
+import time
+
+import psycopg2.extensions
+
+from pg_lifecycle import build, cache, common, deploy, generate, metrics
+
+LOGGER = logging.getLogger(__name__)
+
+SUMMARY = 'FLEET.json'
+
+DEPLOYED = 'deployed'
+FAILED = 'failed'
+NOT_STARTED = 'not started'
+UNCHANGED = 'unchanged'
+
+Result = collections.namedtuple(
+    'Result', ['name', 'database', 'status', 'applied', 'skipped', 'retries',
+               'duration'])
+
+Tenant = collections.namedtuple('Tenant', ['name', 'args'])
+
+
+class Fleet:
+    """Generate a project for each database in a fleet
+
+    Each database is dumped and its project generated in a separate process,
+    with up to ``--jobs`` processes running at once. Every file written is
+    hashed, and files with the same content in more than one project are
+    replaced by hard links to a single copy. A summary of the files where
+    each project differs from the rest of the fleet is written to
+    ``FLEET.json`` in the destination directory.
+
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.dest = path.abspath(args.dest[0])
+
+    def run(self):
+        """Implement as core logic for generating the fleet's projects"""
+        tenants = self.tenants()
+        if not tenants:
+            common.exit_application('No databases specified', 2)
+        os.makedirs(self.dest, exist_ok=True)
+        LOGGER.info('Generating %i projects in %s with %i processes',
+                    len(tenants), self.dest, self.args.jobs)
+        digests, failed = {}, []
+        with futures.ProcessPoolExecutor(self.args.jobs) as executor:
+            running = {executor.submit(_generate, tenant.args): tenant
+                       for tenant in tenants}
+            for future in futures.as_completed(running):
+                tenant = running[future]
+                try:
+                    digests[tenant.name] = future.result()
+                except SystemExit as error:
+                    LOGGER.error('Generating %s exited with code %s',
+                                 tenant.name, error.code)
+                    failed.append(tenant.name)
+                    continue
+                except Exception as error:
+                    LOGGER.error('Failed to generate %s: %s',
+                                 tenant.name, error)
+                    failed.append(tenant.name)
+                    continue
+                LOGGER.debug('Generated %i files for %s',
+                             len(digests[tenant.name]), tenant.name)
+        if not self.args.no_hardlinks:
+            self.link(digests)
+        self.summarize(digests, sorted(failed))
+        if failed:
+            common.exit_application(
+                'Failed to generate {} of {} projects'.format(
+                    len(failed), len(tenants)), 3)
+
+    def link(self, digests):
+        """Replace files that have the same content in more than one project
+        with hard links to the first copy.
+
+        :param dict digests: The file digests for each project
+
+        """
+        copies, linked, saved = {}, 0, 0
+        for name in sorted(digests):
+            for file_path, digest in sorted(digests[name].items()):
+                file_path = path.join(self.dest, name, file_path)
+                source = copies.setdefault(digest, file_path)
+                if source == file_path or path.samefile(source, file_path):
+                    continue
+                temp_path = '{}.{}'.format(file_path, os.getpid())
+                os.link(source, temp_path)
+                saved += os.stat(file_path).st_size
+                os.replace(temp_path, file_path)
+                linked += 1
+        LOGGER.info('Linked %i duplicate files to %i unique files, saving '
+                    '%i bytes', linked, len(copies), saved)
+
+    def summarize(self, digests, failed):
+        """Write the summary of where each project differs from the rest of
+        the fleet. A file is divergent when its content differs from the
+        content most projects have for that path, missing when most projects
+        have the file and extra when most projects do not.
+
+        :param dict digests: The file digests for each project
+        :param list failed: The projects that could not be generated
+
+        """
+        counts = collections.defaultdict(collections.Counter)
+        for values in digests.values():
+            for file_path, digest in values.items():
+                counts[file_path][digest] += 1
+        common_files = {}
+        for file_path, values in counts.items():
+            if sum(values.values()) * 2 > len(digests):
+                common_files[file_path] = values.most_common(1)[0][0]
+        projects, divergent = collections.OrderedDict(), 0
+        for name in sorted(digests):
+            values = digests[name]
+            summary = collections.OrderedDict([
+                ('divergent', sorted(
+                    file_path for file_path, digest in values.items()
+                    if common_files.get(file_path, digest) != digest)),
+                ('missing', sorted(set(common_files) - set(values))),
+                ('extra', sorted(set(values) - set(common_files)))])
+            if any(summary.values()):
+                divergent += 1
+                LOGGER.info('%s diverges from the fleet: %i changed, %i '
+                            'missing and %i extra files', name,
+                            len(summary['divergent']),
+                            len(summary['missing']), len(summary['extra']))
+            projects[name] = summary
+        with open(path.join(self.dest, SUMMARY), 'w') as handle:
+            json.dump(collections.OrderedDict([
+                ('projects', len(digests)),
+                ('divergent', divergent),
+                ('files', sum(len(values) for values in digests.values())),
+                ('unique', len(set(
+                    digest for values in digests.values()
+                    for digest in values.values()))),
+                ('failed', failed),
+                ('diverges', collections.OrderedDict(
+                    (name, value) for name, value in projects.items()
+                    if any(value.values())))]), handle, indent=2)
+        LOGGER.info('%i of %i projects diverge from the fleet, see %s',
+                    divergent, len(digests), path.join(self.dest, SUMMARY))
+
+    def tenants(self):
+        """Return the databases to generate projects for, each with the
+        generate-project arguments for writing its project to a directory
+        named for the database.
+
+        :rtype: list
+
+        """
+        result = tenants(self.args)
+        for tenant in result:
+            tenant.args.jobs, tenant.args.from_dump = 1, None
+            tenant.args.dest = [path.join(self.dest, tenant.name)]
+        return result
+
+
+class FleetDeploy:
+    """Deploy a project to each database in a fleet
+
+    The project's build plan is ordered once and the DDL of each file is
+    read once, then deployed to up to ``--concurrency`` databases at once,
+    each over a pool of up to ``--jobs`` connections. With ``--diff``, the
+    changes for each database are built against its own catalog.
+
+    With ``--host-connections``, the connections to each server are capped:
+    a database is started once its server has enough connections to spare,
+    while the databases on other servers carry on. With ``--fail-fast``, no
+    more databases are started once a deploy fails, otherwise every
+    database is deployed to. A table of the result for each database is
+    written to STDOUT.
+
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.size = args.jobs
+        if args.host_connections:
+            self.size = max(1, min(args.jobs, args.host_connections))
+
+    def run(self):
+        """Implement as core logic for deploying to the fleet"""
+        targets = tenants(self.args)
+        if not targets:
+            common.exit_application('No databases specified', 2)
+        builder = build.Build(self.args)
+        try:
+            try:
+                plan = deploy.Plan(builder)
+            except ValueError as error:
+                common.exit_application(str(error), 3)
+            start = time.monotonic()
+            LOGGER.info('Deploying to %i databases, up to %i at once with '
+                        '%i connections each', len(targets),
+                        self.args.concurrency, self.size)
+            results = self.deploy(plan, targets)
+        finally:
+            builder.project.close()
+        self.report(results)
+        counts = collections.Counter(result.status for result in results)
+        for status, count in sorted(counts.items()):
+            metrics.count('databases', count, result=status)
+        LOGGER.info('Deployed to %i of %i databases in %.2f seconds',
+                    counts[DEPLOYED] + counts[UNCHANGED], len(results),
+                    time.monotonic() - start)
+        if counts[FAILED]:
+            common.exit_application(
+                'Failed to deploy to {} of {} databases{}'.format(
+                    counts[FAILED], len(results),
+                    ', {} not started'.format(counts[NOT_STARTED])
+                    if counts[NOT_STARTED] else ''), 3)
+
+    def deploy(self, plan, targets):
+        """Deploy the plan to the databases, starting each database when
+        fewer than ``--concurrency`` are being deployed to and its server
+        has connections to spare, returning the result for each database.
+
+        :param pg_lifecycle.deploy.Plan plan: The plan to deploy
+        :param list targets: The databases to deploy to
+        :rtype: list
+
+        """
+        limit = self.args.host_connections or 0
+        available = collections.defaultdict(lambda: limit)
+        pending, running, results, failed = list(targets), {}, {}, False
+        with futures.ThreadPoolExecutor(self.args.concurrency) as executor:
+            while pending or running:
+                if not (failed and self.args.fail_fast):
+                    for target in list(pending):
+                        if len(running) >= self.args.concurrency:
+                            break
+                        host = _host(target.args)
+                        if limit and available[host] < self.size:
+                            continue
+                        pending.remove(target)
+                        available[host] -= self.size
+                        running[executor.submit(
+                            self._deploy, plan, target)] = target
+                if not running:
+                    break
+                done, _pending = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    target = running.pop(future)
+                    available[_host(target.args)] += self.size
+                    results[target.name] = future.result()
+                    failed = failed or \
+                        results[target.name].status == FAILED
+        for target in pending:
+            results[target.name] = Result(
+                target.name, _database(target.args), NOT_STARTED, 0, 0, 0,
+                0.0)
+        return [results[target.name] for target in targets]
+
+    def report(self, results):
+        """Write a table of the result of the deploy to each database.
+
+        :param list results: The result for each database
+
+        """
+        rows = [('DATABASE', 'SERVER', 'RESULT', 'APPLIED', 'SKIPPED',
+                 'RETRIES', 'SECONDS')]
+        rows += [(result.name, result.database, result.status,
+                  str(result.applied), str(result.skipped),
+                  str(result.retries), '{:.2f}'.format(result.duration))
+                 for result in results]
+        widths = [max(len(row[column]) for row in rows)
+                  for column in range(0, len(rows[0]))]
+        for row in rows:
+            sys.stdout.write('{}\n'.format('  '.join(
+                value.ljust(width) if column < 3 else value.rjust(width)
+                for column, (value, width) in enumerate(
+                    zip(row, widths))).rstrip()))
+        sys.stdout.flush()
+
+    def _deploy(self, plan, target):
+        """Deploy the plan to a database in a worker thread, returning the
+        result.
+
+        :param pg_lifecycle.deploy.Plan plan: The plan to deploy
+        :param Tenant target: The database to deploy to
+        :rtype: Result
+
+        """
+        target.args.jobs, target.args.dry_run = self.size, False
+        start, status = time.monotonic(), DEPLOYED
+        value = deploy.Deploy(target.args, plan)
+        try:
+            value.run()
+        except SystemExit as error:
+            if error.code:
+                status = FAILED
+        except Exception as error:
+            LOGGER.error('Failed to deploy to %s: %s', target.name, error)
+            status = FAILED
+        if status == DEPLOYED and not value.applied:
+            status = UNCHANGED
+        return Result(
+            target.name, _database(target.args), status, value.applied,
+            value.journal.skipped if value.journal else 0, value.retried,
+            time.monotonic() - start)
+
+
+def tenants(args):
+    """Return the databases of the fleet, each with a copy of the arguments
+    for connecting to it. Each database is specified by name, using the
+    connection options for the server, or by a connection string. Databases
+    are named for their database name, or for the server and database when
+    the same database name is used on more than one server.
+
+    :param argparse.Namespace args: The parsed cli arguments
+    :rtype: list
+
+    """
+    values = list(args.databases)
+    if args.databases_file:
+        with open(args.databases_file, 'r') as handle:
+            values += [line.strip() for line in handle
+                       if line.strip() and not line.startswith('#')]
+    values = [_tenant_args(args, value) for value in values]
+    names = collections.Counter(value.dbname for value in values)
+    result, seen = [], set([])
+    for value in values:
+        name = value.dbname
+        if names[name] > 1:
+            name = '{}_{}_{}'.format(value.host, value.port, value.dbname)
+        if name in seen:
+            common.exit_application(
+                'Database {} specified more than once'.format(name), 2)
+        seen.add(name)
+        result.append(Tenant(name, value))
+    return result
+
+
+def _database(args):
+    """Return the server and database name for the arguments"""
+    return '{}:{}/{}'.format(args.host, args.port, args.dbname)
+
+
+def _host(args):
+    """Return the server the arguments connect to"""
+    return args.host, args.port
+
+
+def _tenant_args(args, value):
+    """Return a copy of the arguments for a database name or connection
+    string.
+
+    :param argparse.Namespace args: The parsed cli arguments
+    :param str value: The database name or connection string
+    :rtype: argparse.Namespace
+
+    """
+    args = argparse.Namespace(**vars(args))
+    if '=' in value or '://' in value:
+        try:
+            parameters = psycopg2.extensions.parse_dsn(value)
+        except psycopg2.ProgrammingError as error:
+            common.exit_application(
+                'Invalid connection string {!r}: {}'.format(
+                    value, str(error).strip()), 2)
+        args.host = parameters.get('host', args.host)
+        args.port = int(parameters.get('port', args.port))
+        args.dbname = parameters.get('dbname', args.dbname)
+        args.username = parameters.get('user', args.username)
+    else:
+        args.dbname = value
+    return args
+
+
+def _generate(args):
+    """Generate the project for a database in a worker process, returning
+    the content digest of each file in the project.
+
+    :param argparse.Namespace args: The generate-project arguments
+    :rtype: dict
+
+    """
+    generate.Generate(args).run()
+    project_path = args.dest[0]
+    digests = {}
+    for dir_path, dirs, files in os.walk(project_path):
+        if cache.CACHE_DIR in dirs:
+            dirs.remove(cache.CACHE_DIR)
+        for name in files:
+            file_path = path.join(dir_path, name)
+            digests[path.relpath(file_path, project_path)] = \
+                cache.file_digest(file_path)
+    return digests
@@ -3,18 +3,21 @@
 Generates Project Structure
 
 """
+import collections
+import json
 import logging
 import os
 from os import path
-import pickle
 import shutil
 import subprocess
 import tempfile
-import toposort
 
 from pgdumplib import directory, toc
+import psycopg2
 
-from pg_lifecycle import common
+from pg_lifecycle import (archive, cache, catalog, common, connection, dump,
+                          extract, filters, graph, index, manifest, metrics,
+                          partitions, sql, writer)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,53 +27,112 @@ class Generate:
 
     def __init__(self, args):
         self.args = args
-        self.dump_path = path.join(
-            tempfile.gettempdir(), 'pg-lifecycle-{}'.format(os.getpid()))
+        self.dump_path = None
         self.dump_reader = None
+        self.filter = filters.Filter(args)
+        self.filtered_dump = False
         self.included = set({})
+        self.index = None
         self.project_path = path.abspath(args.dest[0])
         self.public_id = None
+        self.temporary_dump = False
+        if getattr(args, 'archive', False):
+            self.writer = archive.Writer(
+                self.project_path, args.jobs * 2 if args.streaming else None)
+        elif getattr(args, 'update', False):
+            self.writer = writer.UpdateWriter(
+                self.project_path, args.jobs,
+                args.jobs * 2 if args.streaming else None)
+        else:
+            self.writer = writer.Writer(
+                self.project_path, args.jobs,
+                args.jobs * 2 if args.streaming else None)
 
     def run(self):
         """Implement as core logic for generating the project"""
-        if path.exists(self.project_path) and not self.args.force:
+        if path.exists(self.project_path) and not self.args.force and \
+                not getattr(self.args, 'update', False):
             common.exit_application(
                 '{} already exists'.format(self.project_path), 3)
+        elif getattr(self.args, 'archive', False) and \
+                path.isdir(self.project_path):
+            common.exit_application(
+                '{} is a directory'.format(self.project_path), 3)
+        elif getattr(self.args, 'update', False) and \
+                path.isfile(self.project_path):
+            common.exit_application(
+                '{} is not a project directory'.format(self.project_path), 3)
         LOGGER.info('Generating project in %s', self.project_path)
-        self._dump_database()
-        self._create_directories()
-
-        self.dump_reader = directory.Reader(self.dump_path)
-        self._generate_ddl()
-
-        # self._cleanup_dump()
+        try:
+            with metrics.phase('dump'):
+                self._prepare_dump()
+            self._create_directories()
+            with metrics.phase('toc_load'):
+                if self.dump_reader is None and self.args.streaming:
+                    try:
+                        self.dump_reader = dump.LazyReader(self.dump_path)
+                    except ValueError as error:
+                        common.exit_application(str(error), 3)
+                elif self.dump_reader is None:
+                    self.dump_reader = directory.Reader(self.dump_path)
+            self._generate_ddl()
+        except BaseException:
+            self.writer.abort()
+            raise
+        finally:
+            if self.temporary_dump:
+                self._cleanup_dump()
+        if getattr(self.args, 'update', False):
+            LOGGER.info('DDL project updated in %s after processing %i '
+                        'objects: %s', self.args.dest[0], len(self.included),
+                        self.writer.summary())
+            return
         LOGGER.info('DDL project generated in %s after processing %i objects',
                     self.args.dest[0], len(self.included))
 
     def _create_directories(self):
+        if getattr(self.args, 'archive', False):
+            return
         LOGGER.debug('Creating %s', self.project_path)
-        os.makedirs(self.project_path, exist_ok=self.args.force)
+        exist_ok = self.args.force or getattr(self.args, 'update', False)
+        os.makedirs(self.project_path, exist_ok=exist_ok)
         for value in common.PATHS.values():
             subdir_path = path.join(self.project_path, value)
             try:
-                os.makedirs(subdir_path, exist_ok=self.args.force)
+                os.makedirs(subdir_path, exist_ok=exist_ok)
             except FileExistsError:
                 pass
-            if self.args.gitkeep:
-                gitkeep_path = path.join(subdir_path, '.gitkeep')
+            gitkeep_path = path.join(subdir_path, '.gitkeep')
+            if self.args.gitkeep and not path.exists(gitkeep_path):
                 open(gitkeep_path, 'w').close()
 
+    def _catalog_fingerprint(self):
+        """Return the fingerprint of the database's catalog, exiting if it
+        can not be read.
+
+        :rtype: str
+
+        """
+        try:
+            conn = connection.connect(self.args)
+            try:
+                return catalog.fingerprint(conn)
+            finally:
+                conn.close()
+        except psycopg2.Error as error:
+            common.exit_application(
+                'Failed to fingerprint {}:{}/{}: {}'.format(
+                    self.args.host, self.args.port, self.args.dbname,
+                    str(error).strip()), 3)
+
     def _cleanup_dump(self):
         """Remove the temp files used in creation"""
-        LOGGER.debug('Removing dump from %s', self.dump_path)
-        shutil.rmtree(self.dump_path)
+        if path.exists(self.dump_path):
+            LOGGER.debug('Removing dump from %s', self.dump_path)
+            shutil.rmtree(self.dump_path)
 
     def _dump_database(self):
-        """Return the pg_dump command to run to backup the database.
-
-        :param argparse.namespace args: The CLI arguments
-
-        """
+        """Run pg_dump to dump the database to the dump path."""
         LOGGER.info('Dumping %s:%s/%s to %s',
                     self.args.host, self.args.port, self.args.dbname,
                     self.dump_path)
@@ -83,6 +145,7 @@ class Generate:
                          self.args.host, self.args.port, self.args.dbname,
                          error.returncode, output.strip())
             raise
+        self.filtered_dump = True
 
     def _dump_command(self):
         """Return the pg_dump command to run to backup the database.
@@ -106,9 +169,53 @@ class Generate:
                 command += ['--{}'.format(optional.replace('_', '-'))]
         if self.args.role:
             command += ['--role', self.args.role]
+        command += self.filter.dump_options()
         LOGGER.debug('Dump command: %r', ' '.join(command))
         return command
 
+    def _dump_identity(self):
+        """Return the identity that dumps are cached by, the database and
+        the pg_dump options that change the dump's content.
+
+        :rtype: str
+
+        """
+        options = ['{}={}'.format(name, getattr(self.args, name, None))
+                   for name in ['host', 'port', 'dbname', 'username', 'role',
+                                'no_owner', 'no_privileges',
+                                'no_security_labels', 'no_tablespaces',
+                                'schema', 'exclude_schema', 'table',
+                                'exclude_table']]
+        return '\n'.join(options + [self._pg_dump_version()])
+
+    def _extract(self):
+        """Read the table of contents from the database's catalog instead of
+        dumping it, returning ``False`` if the database has objects that the
+        catalog extractor does not support.
+
+        :rtype: bool
+
+        """
+        try:
+            conn = connection.connect(self.args)
+            try:
+                extractor = extract.Extractor(conn, self.args)
+                unsupported = extractor.unsupported()
+                if unsupported:
+                    LOGGER.warning(
+                        'Dumping with pg_dump, the catalog extractor does '
+                        'not support %s', ', '.join(unsupported))
+                    return False
+                self.dump_reader = extractor.extract()
+            finally:
+                conn.close()
+        except psycopg2.Error as error:
+            common.exit_application(
+                'Failed to extract {}:{}/{}: {}'.format(
+                    self.args.host, self.args.port, self.args.dbname,
+                    str(error).strip()), 3)
+        return True
+
     @staticmethod
     def _function_filename(tag, filenames):
         """Create a filename for a function file, using an auto-incrementing
@@ -133,10 +240,22 @@ class Generate:
 
     def _generate_ddl(self):
         """Top-level iterator for generating DDL files"""
-        LOGGER.info('Generating DDL generated with pg_dump v%s/PostgreSQL v%s',
-                    self.dump_reader.dump_version,
-                    self.dump_reader.server_version)
-
+        if self.dump_reader.dump_version:
+            LOGGER.info(
+                'Generating DDL generated with pg_dump v%s/PostgreSQL v%s',
+                self.dump_reader.dump_version,
+                self.dump_reader.server_version)
+        else:
+            LOGGER.info('Generating DDL extracted from the catalog of '
+                        'PostgreSQL v%s', self.dump_reader.server_version)
+
+        with metrics.phase('index'):
+            self.index = index.TOCIndex(self.filter.select(
+                self.dump_reader.toc.entries, self.filtered_dump))
+        metrics.count('toc_entries', len(self.dump_reader.toc.entries))
+        for desc, value in collections.Counter(
+                entry.desc for entry in self.index.entries).items():
+            metrics.count('objects', value, desc=desc)
         files = list([])
         for obj_type in [common.AGGREGATE,
                          common.CAST,
@@ -161,29 +280,59 @@ class Generate:
                          common.TYPE,
                          common.TRIGGER,
                          common.VIEW]:
-            files += self._generate_common(obj_type)
-        directives = self._generate_directives()
+            with metrics.phase('generate:{}'.format(obj_type)):
+                files += self._generate_common(obj_type)
+        with metrics.phase('generate:directives'):
+            directives = self._generate_directives()
         if directives:
-            files.append(directives)
+            files.insert(0, directives)
 
-        operators = self._generate_operators()
+        with metrics.phase('generate:operators'):
+            operators = self._generate_operators()
         if operators:
             files.append(operators)
 
-        self._generate_manifest(files)
+        with metrics.phase('manifest'):
+            self._generate_manifest(files)
+            self._generate_scope()
+            self.writer.close()
 
         if self.args.gitkeep:
             self._remove_unneeded_gitkeeps()
         if self.args.remove_empty:
             self._remove_empty_directories()
 
-        for entry in self.dump_reader.toc.entries:
+        for entry in self.index.entries:
             if entry.dump_id not in self.included:
                 if entry.desc == common.SHELL_TYPE:
                     LOGGER.warning('Ignoring shell type for %s', entry.tag)
                 else:
                     LOGGER.warning('Unprocessed entry: %r', entry)
 
+    def _add_public_schema(self, ddl):
+        """Special case for the public schema, the create is not included in
+        the dump but its ACLs and comments are, so add a placeholder entry
+        for them to be attached to.
+
+        :param dict ddl: The collection of schema DDL to add the entry to
+
+        """
+        for entry in self.index.public_schema:
+            dump_id = entry.dependencies[0]
+            if dump_id in self.index or dump_id in self.included:
+                continue
+            self.included.add(dump_id)
+            self.public_id = dump_id
+            ddl[dump_id] = {
+                'filename': path.join(
+                    common.PATHS[common.SCHEMA], 'public.sql'),
+                'dependencies': [],
+                'includes': [],
+                'entry': toc.Entry(
+                    dump_id, None, None, None, entry.tag, common.SCHEMA,
+                    None, '', None, None, None, None, None, None, [])
+            }
+
     def _generate_common(self, obj_type):
         """Generate the SQL files for the given object type, returning the list
         of files that were generated.
@@ -195,47 +344,100 @@ class Generate:
         """
         LOGGER.debug('Generating DDL for %s', obj_type)
         ddl, files, filenames = {}, [], set({})
-        for entry in self.dump_reader.toc.entries:
-            if entry.desc == obj_type:
-                self.included.add(entry.dump_id)
-                if obj_type in (common.FUNCTION, common.TYPE):
-                    base_name = self._function_filename(entry.tag, filenames)
-                else:
-                    base_name = '{}.sql'.format(entry.tag.replace(' ', '-'))
-                filename = path.join(common.PATHS[obj_type], base_name)
-                if entry.namespace:
-                    filename = path.join(
-                        common.PATHS[obj_type], entry.namespace,
-                        base_name)
-                filenames.add(base_name)
-                ddl[entry.dump_id] = {
-                    'filename': filename,
-                    'dependencies': entry.dependencies,
-                    'includes': [],
-                    'entry': entry
-                }
-            elif entry.desc in [common.ACL, common.COMMENT] and \
-                    entry.tag == 'SCHEMA public':
-                # Special case for public schema, create not included in dump
-                if entry.dependencies[0] not in self.included:
-                    self.included.add(entry.dependencies[0])
-                    ddl[entry.dependencies[0]] = {
-                        'filename': path.join(
-                            common.PATHS[common.SCHEMA], 'public.sql'),
-                        'dependencies': [],
-                        'includes': [],
-                        'entry': toc.Entry(
-                            entry.dependencies[0], None, None, None, entry.tag,
-                            common.SCHEMA, None, '', None, None, None, None,
-                            None, None, [])
-                    }
-                self._maybe_add_entity(ddl, entry, entry.desc)
+        for entry in self.index.get(obj_type):
+            self.included.add(entry.dump_id)
+            if obj_type in (common.FUNCTION, common.TYPE):
+                base_name = self._function_filename(entry.tag, filenames)
             else:
-                for child_type in common.CHILD_OBJ_TYPES:
-                    if entry.desc == child_type:
-                        self._maybe_add_entity(ddl, entry, child_type)
-                        break
-        return self._generate_files(ddl)
+                base_name = '{}.sql'.format(entry.tag.replace(' ', '-'))
+            filename = path.join(common.PATHS[obj_type], base_name)
+            if entry.namespace:
+                filename = path.join(
+                    common.PATHS[obj_type], entry.namespace, base_name)
+            filenames.add(base_name)
+            ddl[entry.dump_id] = {
+                'filename': filename,
+                'dependencies': list(entry.dependencies),
+                'includes': [],
+                'entry': entry
+            }
+        if obj_type == common.SCHEMA:
+            self._add_public_schema(ddl)
+        with metrics.phase('attach:{}'.format(obj_type)):
+            for dump_id, obj in ddl.items():
+                for entry in self.index.dependents_of(
+                        dump_id, common.CHILD_OBJ_TYPE_SET):
+                    if entry.desc != obj_type and \
+                            entry.dump_id not in self.included and \
+                            self._attaches_to(obj, entry):
+                        self._add_child_entity(obj, entry)
+                self._add_index_attachments(obj)
+        if obj_type == common.TABLE and \
+                getattr(self.args, 'collapse_partitions', False):
+            files += self._generate_partition_sets(ddl)
+        for dump_id, obj in ddl.items():
+            files.append(self._generate_file(dump_id, obj))
+        self.writer.flush()
+        return files
+
+    def _generate_partition_sets(self, ddl):
+        """Write the partitions of each table that have the same file
+        content, once their names and bounds are replaced by placeholders,
+        to a partition set file next to the table's file. The partitions are
+        removed from the collection of table DDL, and the list of partition
+        set files that were generated is returned.
+
+        :param dict ddl: The collection of table DDL
+        :rtype: list([dump_id, filename])
+
+        """
+        groups = collections.OrderedDict()
+        for dump_id, obj in ddl.items():
+            value = self._partition_bound(obj)
+            if not value:
+                continue
+            name = sql.quote_ident(obj['entry'].tag)
+            template = partitions.template(
+                self._render_file(obj), name, value[1])
+            if template is not None:
+                groups.setdefault((value[0], template), []).append(
+                    (dump_id, name, value[1]))
+        files, filenames = [], set([])
+        for (parent, template), members in groups.items():
+            if len(members) < 2:
+                continue
+            entry = self._partitioned_table(ddl[members[0][0]], parent)
+            base_name = '{}.partitions'.format(entry.tag.replace(' ', '-'))
+            filename = path.join(
+                common.PATHS[common.TABLE], entry.namespace or '',
+                '{}.sql'.format(base_name))
+            counter = 2
+            while filename in filenames:
+                filename = path.join(
+                    common.PATHS[common.TABLE], entry.namespace or '',
+                    '{}-{}.sql'.format(base_name, counter))
+                counter += 1
+            filenames.add(filename)
+            includes, dependencies = set([]), set([])
+            for dump_id, _name, _bound in members:
+                obj = ddl.pop(dump_id)
+                includes.add(dump_id)
+                includes.update(obj['includes'])
+                dependencies.update(obj['dependencies'])
+            self.writer.add(filename, partitions.dumps(
+                parent, template,
+                [(name, value) for _dump_id, name, value in members]))
+            files.append(DDLFile(
+                members[0][0], filename, includes,
+                dependencies.difference(includes), common.PARTITION_SET,
+                entry.namespace, entry.tag))
+            LOGGER.debug('Collapsed %i partitions of %s into %s',
+                         len(members), parent, filename)
+        if files:
+            LOGGER.info('Collapsed %i partitions into %i partition sets',
+                        sum(len(value) for value in groups.values()
+                            if len(value) > 1), len(files))
+        return files
 
     def _generate_directives(self):
         """Generate the SQL files for the given object type, returning the list
@@ -245,25 +447,26 @@ class Generate:
 
         """
         filename = 'directives.sql'
-        databases, output = [], []
-        for entry in self.dump_reader.toc.entries:
-            if (entry.desc in [common.ENCODING,
-                               common.STDSTRINGS,
-                               common.SEARCHPATH] and
-                    entry.section == common.PRE_DATA):
-                self.included.add(entry.dump_id)
-                output.append(entry.defn)
-            elif entry.desc == common.DATABASE:
-                self.included.add(entry.dump_id)
-                databases.append(entry.dump_id)
-            elif entry.desc == common.COMMENT and \
-                    any([d in databases for d in entry.dependencies]):
-                self.included.add(entry.dump_id)
-                output.append(entry.defn)
+        entries = {}
+        for entry in self.index.select(common.ENCODING,
+                                       common.STDSTRINGS,
+                                       common.SEARCHPATH):
+            if entry.section == common.PRE_DATA:
+                entries[entry.dump_id] = entry
+        for database in self.index.get(common.DATABASE):
+            self.included.add(database.dump_id)
+            for entry in self.index.dependents_of(
+                    database.dump_id, {common.COMMENT}):
+                entries[entry.dump_id] = entry
+        output = []
+        for entry in self.index.ordered(entries.values()):
+            self.included.add(entry.dump_id)
+            output.append(self._definition(entry))
         if output:
-            with open(path.join(self.project_path, filename), 'w') as handle:
-                handle.write('-- Common Directives / Settings\n\n')
-                handle.write(''.join(output))
+            self.writer.add(
+                filename,
+                '-- Common Directives / Settings\n\n{}'.format(
+                    ''.join(output)))
             return DDLFile(-1, filename, set([]), set([]))
 
     def _generate_operators(self):
@@ -274,81 +477,240 @@ class Generate:
 
         """
         filename = 'operators.sql'
-        entries, dependencies, includes = {}, set({}), set([])
-        for entry in self.dump_reader.toc.entries:
-            if entry.desc.startswith(common.OPERATOR):
-                self.included.add(entry.dump_id)
-                entries[entry.dump_id] = entry
+        entries, dependencies, includes = {}, set([]), set([])
+        for entry in self.index.prefixed(common.OPERATOR):
+            self.included.add(entry.dump_id)
+            entries[entry.dump_id] = entry
         if entries:
-            values = {e.dump_id: set(e.dependencies) for e in entries.values()}
-            includes = toposort.toposort_flatten(values)
-            with open(path.join(self.project_path, filename), 'w') as handle:
-                handle.write('-- Operators\n\n')
-                for dump_id in includes:
-                    if dump_id not in entries:
-                        dependencies.add(dump_id)
-                        continue
-                    handle.write('{}\n'.format(entries[dump_id].defn))
-                    dependencies.update(set(entries[dump_id].dependencies))
+            keys = sorted(entries)
+            operators = graph.Graph.from_dependencies(
+                keys, [entries[dump_id].dependencies for dump_id in keys])
+            output = ['-- Operators\n\n']
+            for wave in operators.waves():
+                for position in wave:
+                    entry = entries[keys[position]]
+                    includes.add(entry.dump_id)
+                    output.append('{}\n'.format(self._definition(entry)))
+                    dependencies.update(entry.dependencies)
+            self.writer.add(filename, ''.join(output))
             return DDLFile(-1, filename, includes,
-                           dependencies.difference(includes))
+                           dependencies.difference(entries))
 
-    def _generate_files(self, ddl):
-        """Generic SQL file generation for building object specific SQL files.
+    def _generate_file(self, dump_id, obj):
+        """Render the object specific SQL file and hand it to the writer,
+        returning the manifest entry for the file.
 
-        :param dict ddl: The DDL to generate files for
-        :rtype: list([dump_id, filename])
+        :param int dump_id: The dump_id of the object
+        :param dict obj: The object to generate the file for
+        :rtype: DDLFile
 
         """
-        files = []
-        for dump_id, obj in ddl.items():
-            files.append(
-                DDLFile(dump_id, obj['filename'], set(obj['includes']),
-                        set(obj['dependencies'])))
-            file_path = path.join(self.project_path, obj['filename'])
-            if not path.exists(path.dirname(file_path)):
-                os.makedirs(path.dirname(file_path))
-            if path.exists(file_path):
-                raise ValueError('Path Already Exists: {}'.format(file_path))
-            with open(file_path, 'w') as handle:
-                tag = obj['entry'].tag if not obj['entry'].namespace \
-                    else '{}.{}'.format(
-                        obj['entry'].namespace, obj['entry'].tag)
-                handle.write('-- DDL for {}\n\n'.format(tag))
-                handle.write(obj['entry'].defn)
-                for child_type in common.CHILD_OBJ_TYPES:
-                    if obj.get(child_type):
-                        handle.write('\n-- {}s for {}\n\n{}'.format(
-                            child_type, tag, ''.join(obj[child_type])))
-        return files
+        self.writer.add(obj['filename'], self._render_file(obj))
+        return DDLFile(dump_id, obj['filename'], set(obj['includes']),
+                       set(obj['dependencies']), obj['entry'].desc,
+                       obj['entry'].namespace, obj['entry'].tag)
 
     def _generate_manifest(self, files):
-        """Generate the manifest file for all of the DDL."""
-        file_path = path.join(self.project_path, common.MANIFEST)
-        with open(file_path, 'wb') as handle:
-            pickle.dump(files, handle)
+        """Generate the manifest file for all of the DDL. When updating a
+        project, the manifest is only rewritten if it has changed.
+
+        """
+        if getattr(self.args, 'archive', False) or \
+                getattr(self.args, 'update', False):
+            self.writer.add(common.MANIFEST, manifest.dumps(files))
+        else:
+            manifest.write(
+                path.join(self.project_path, common.MANIFEST), files)
+
+    def _generate_scope(self):
+        """Write the schema and table patterns the project was generated
+        with, so that diffs only drop objects in the project's scope.
+
+        """
+        self.writer.add(common.SCOPE, json.dumps(
+            self.filter.scope(), indent=2, sort_keys=True))
+
+    def _add_index_attachments(self, obj):
+        """Add the ``INDEX ATTACH`` entries for the indexes and constraints
+        of a partition to the partition's file, matching them by the name of
+        the partition's index.
+
+        :param dict obj: The partition to add the index attachments to
+
+        """
+        names, dump_ids = set([]), [obj['entry'].dump_id]
+        for entry in obj.get(common.INDEX, []):
+            names.add(entry.tag)
+            dump_ids.append(entry.dump_id)
+        for entry in obj.get(common.CONSTRAINT, []):
+            names.add(entry.tag[len(obj['entry'].tag) + 1:])
+            dump_ids.append(entry.dump_id)
+        for dump_id in dump_ids:
+            for entry in self.index.dependents_of(
+                    dump_id, {common.INDEX_ATTACH}):
+                if entry.tag in names and entry.dump_id not in self.included:
+                    self._add_child_entity(obj, entry)
+
+    @staticmethod
+    def _attaches_to(obj, entry):
+        """Return ``True`` if the child entry belongs in the object's file.
+        ``TABLE ATTACH`` entries depend on both the partition and the
+        partitioned table and belong in the partition's file, and ``INDEX
+        ATTACH`` entries are added by :meth:`_add_index_attachments`.
+
+        :param dict obj: The object to add the child to
+        :param pgdumplib.toc.Entry entry: The child entry
+        :rtype: bool
+
+        """
+        if entry.desc == common.TABLE_ATTACH:
+            return entry.tag == obj['entry'].tag and \
+                entry.namespace == obj['entry'].namespace
+        return entry.desc != common.INDEX_ATTACH
+
+    def _add_child_entity(self, obj, entry):
+        """Add a child entry to the list of entries for its parent entity.
+        A child that depends on more than one object, such as a column
+        default that uses a sequence, is only bundled with the first parent
+        it is found for, so it is written to one file and built once. The
+        dependencies of children that are not deferred to post-data are
+        added to the parent so the file is ordered after all of the child's
+        other parents.
+
+        :param dict obj: The parent entity to add the child to
+        :param pgdumplib.toc.Entry entry: The child entry to add
 
-    def _maybe_add_entity(self, ddl, entry, object_type):
-        """Maybe Add an entry to a list of entries for a parent entity
-        if the dependency match is made.
+        """
+        if entry.desc not in obj:
+            obj[entry.desc] = list([])
+        obj['includes'].append(entry.dump_id)
+        obj[entry.desc].append(entry)
+        if entry.desc not in common.POST_DATA_OBJ_TYPES:
+            obj['dependencies'].extend(
+                dependency for dependency in entry.dependencies
+                if dependency != obj['entry'].dump_id)
+        self.included.add(entry.dump_id)
+
+    def _definition(self, entry):
+        """Return the DDL definition for the entry, reading it from the dump
+        when it was not loaded into memory.
+
+        :param pgdumplib.toc.Entry entry: The entry to get the DDL for
+        :rtype: str
+
+        """
+        if isinstance(entry.defn, dump.Definition):
+            return entry.defn.read()
+        return entry.defn
+
+    def _render_file(self, obj):
+        """Render the content of an object specific SQL file.
+
+        :param dict obj: The object to render the SQL file for
+        :rtype: str
+
+        """
+        tag = obj['entry'].tag if not obj['entry'].namespace \
+            else '{}.{}'.format(obj['entry'].namespace, obj['entry'].tag)
+        output = ['-- DDL for {}\n\n'.format(tag),
+                  self._definition(obj['entry'])]
+        for child_type in common.CHILD_OBJ_TYPES:
+            if obj.get(child_type):
+                output.append('\n-- {}s for {}\n\n{}'.format(
+                    child_type, tag, ''.join(
+                        self._definition(e) for e in obj[child_type])))
+        return ''.join(output)
+
+    def _partition_bound(self, obj):
+        """Return the partitioned table and bounds of a table, or ``None``
+        if it is not a partition.
+
+        :param dict obj: The table
+        :rtype: tuple(str, str) or None
+
+        """
+        for entry in obj.get(common.TABLE_ATTACH, []):
+            value = partitions.bound(self._definition(entry))
+            if value:
+                return value
+        return partitions.bound(self._definition(obj['entry']))
 
-        :param dict ddl: The collection of DDL to check for parents in
-        :param pgdumplib.tog.Entry entry: The entry to examine
-        :param object_type: The type of object being examined
+    def _partitioned_table(self, obj, parent):
+        """Return the entry for the partitioned table of a partition,
+        falling back to the partition's own entry if it is not in the dump.
+
+        :param dict obj: The partition
+        :param str parent: The quoted name of the partitioned table
+        :rtype: pgdumplib.toc.Entry
+
+        """
+        dump_ids = set(obj['entry'].dependencies)
+        for entry in obj.get(common.TABLE_ATTACH, []):
+            dump_ids.update(entry.dependencies)
+        for dump_id in sorted(dump_ids):
+            entry = self.index.by_id.get(dump_id)
+            if entry is not None and entry.desc == common.TABLE and \
+                    '{}.{}'.format(sql.quote_ident(entry.namespace or ''),
+                                   sql.quote_ident(entry.tag)) == parent:
+                return entry
+        return obj['entry']
+
+    @staticmethod
+    def _pg_dump_version():
+        """Return the version of pg_dump that dumps the database.
+
+        :rtype: str
+
+        """
+        try:
+            return subprocess.check_output(
+                ['pg_dump', '--version']).decode('utf-8').strip()
+        except (OSError, subprocess.CalledProcessError) as error:
+            common.exit_application(
+                'Failed to run pg_dump: {}'.format(error), 3)
+
+    def _prepare_dump(self):
+        """Set the dump to generate the project from. An existing dump is
+        used if one was specified with ``--from-dump``. When ``--dump-cache``
+        is specified, the cached dump of the database is used if the
+        catalog's fingerprint has not changed since it was made, otherwise
+        the new dump replaces it. Dumps that are not cached are written to a
+        temporary directory that is removed after the project is generated.
+        With ``--extractor catalog``, no dump is made unless the database has
+        objects that the catalog extractor does not support.
 
         """
-        if entry.desc == object_type:
-            for parent in ddl.keys():
-                if parent in entry.dependencies:
-                    if object_type not in ddl[parent]:
-                        ddl[parent][object_type] = list([])
-                    ddl[parent]['includes'].append(entry.dump_id)
-                    ddl[parent][object_type].append(entry.defn)
-                    self.included.add(entry.dump_id)
-                    for dependency in entry.dependencies:
-                        if dependency not in entry.dependencies and \
-                                dependency != parent:
-                            ddl[parent]['dependencies'].append(dependency)
+        if getattr(self.args, 'extractor', 'pg_dump') == 'catalog' and \
+                self._extract():
+            return
+        elif self.args.from_dump:
+            self.dump_path = path.abspath(self.args.from_dump)
+            if not path.isfile(path.join(self.dump_path, 'toc.dat')):
+                common.exit_application(
+                    '{} is not a directory format dump'.format(
+                        self.args.from_dump), 3)
+            LOGGER.info('Using the dump in %s', self.dump_path)
+        elif self.args.dump_cache:
+            dump_cache = cache.DumpCache(
+                common.DUMP_CACHE_DIR, self._dump_identity())
+            fingerprint = self._catalog_fingerprint()
+            self.dump_path = dump_cache.lookup(fingerprint)
+            if self.dump_path:
+                LOGGER.info('Using the cached dump in %s, the catalog of '
+                            '%s:%s/%s has not changed', self.dump_path,
+                            self.args.host, self.args.port, self.args.dbname)
+                self.filtered_dump = True
+                return
+            self.dump_path = dump_cache.temp_path()
+            self.temporary_dump = True
+            self._dump_database()
+            self.dump_path = dump_cache.store(self.dump_path, fingerprint)
+            self.temporary_dump = False
+        else:
+            self.dump_path = path.join(
+                tempfile.gettempdir(), 'pg-lifecycle-{}'.format(os.getpid()))
+            self.temporary_dump = True
+            self._dump_database()
 
     def _remove_empty_directories(self):
         """Remove any empty directories"""
@@ -374,13 +736,18 @@ class Generate:
 
 class DDLFile:
     """Class used for managing dependencies in the manifest"""
-    __slots__ = ['id', 'path', 'dependencies', 'includes']
+    __slots__ = ['id', 'path', 'dependencies', 'includes', 'desc',
+                 'namespace', 'tag']
 
-    def __init__(self, id_value, path_value, includes, dependencies):
+    def __init__(self, id_value, path_value, includes, dependencies,
+                 desc=None, namespace=None, tag=None):
         self.id = id_value
         self.path = path_value
         self.includes = includes
         self.dependencies = dependencies
+        self.desc = desc
+        self.namespace = namespace
+        self.tag = tag
 
     def __repr__(self):
         return '<DDLFile {} path={} dependencies={}>'.format(
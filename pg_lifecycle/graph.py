@@ -0,0 +1,237 @@
+# coding=utf-8
+"""
+Dependency Graph
+
+A directed graph of objects and the objects they depend upon, stored as two
+compressed sparse row adjacency lists in integer arrays: one of the parents
+of each node and one of the nodes that depend upon it. Nodes are numbered
+by position and can carry a key, such as the dump_id of the object or the
+offset of the file in the manifest.
+
+"""
+import array
+import collections
+import itertools
+import logging
+import operator
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CycleError(ValueError):
+    """Raised when the graph can not be ordered because of a dependency
+    cycle. ``cycle`` has the keys of the nodes in the cycle, in dependency
+    order, starting and ending with the same node.
+
+    :param list cycle: The keys of the nodes in the cycle
+    :param str message: The error message
+
+    """
+    def __init__(self, cycle, message):
+        super(CycleError, self).__init__(message)
+        self.cycle = cycle
+
+
+class Graph:
+    """Dependency graph with linear time ordering, grouping into levels and
+    transitive dependency queries.
+
+    :param list parents: The positions of the nodes each node depends upon
+    :param list keys: The key of each node, defaulting to its position
+    :raises: IndexError
+
+    """
+    def __init__(self, parents, keys=None):
+        values = list(map(sorted, map(set, parents)))
+        self.count = len(values)
+        self.keys = keys
+        self.parent_offsets, self.parent_targets = _compress(values)
+        if self.parent_targets and (
+                min(self.parent_targets) < 0 or
+                max(self.parent_targets) >= self.count):
+            raise IndexError('Dependency on a node that is not in the graph')
+        children = [[] for _offset in range(0, self.count)]
+        for position, targets in enumerate(values):
+            for target in targets:
+                children[target].append(position)
+        self.child_offsets, self.child_targets = _compress(children)
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def from_dependencies(cls, keys, dependencies):
+        """Create a graph keyed by dump_id. Dependencies upon keys that are
+        not in the graph and upon the node itself are ignored.
+
+        :param list keys: The key of each node
+        :param list dependencies: The keys each node depends upon
+        :rtype: Graph
+
+        """
+        positions = {key: position for position, key in enumerate(keys)}
+        return cls([
+            [positions[key] for key in values
+             if key in positions and positions[key] != position]
+            for position, values in enumerate(dependencies)], list(keys))
+
+    def ancestors(self, positions):
+        """Return the positions of every node that the nodes depend upon,
+        directly or transitively, in ascending order.
+
+        :param list positions: The positions of the nodes
+        :rtype: list
+
+        """
+        return _reachable(positions, self.parent_offsets, self.parent_targets)
+
+    def children(self, position):
+        """Return the positions of the nodes that directly depend upon the
+        node.
+
+        :param int position: The node position
+        :rtype: array.array
+
+        """
+        return self.child_targets[
+            self.child_offsets[position]:self.child_offsets[position + 1]]
+
+    def descendants(self, positions):
+        """Return the positions of every node that depends upon the nodes,
+        directly or transitively, in ascending order.
+
+        :param list positions: The positions of the nodes
+        :rtype: list
+
+        """
+        return _reachable(positions, self.child_offsets, self.child_targets)
+
+    def key(self, position):
+        """Return the key of the node.
+
+        :param int position: The node position
+        :rtype: int
+
+        """
+        return self.keys[position] if self.keys is not None else position
+
+    def levels(self):
+        """Return the level of each node: 0 for nodes without dependencies,
+        otherwise one more than the highest level of the nodes it depends
+        upon. Nodes in the same level do not depend upon each other.
+
+        :rtype: array.array
+        :raises: CycleError
+
+        """
+        return self._sort(True)[1]
+
+    def order(self):
+        """Return the node positions in dependency order, with the nodes
+        without dependencies first in position order, followed by the other
+        nodes in the order they become ready.
+
+        :rtype: list
+        :raises: CycleError
+
+        """
+        return self._sort(False)[0]
+
+    def parents(self, position):
+        """Return the positions of the nodes the node directly depends upon.
+
+        :param int position: The node position
+        :rtype: array.array
+
+        """
+        return self.parent_targets[
+            self.parent_offsets[position]:self.parent_offsets[position + 1]]
+
+    def waves(self):
+        """Return the node positions grouped by level, each level in
+        position order.
+
+        :rtype: list
+        :raises: CycleError
+
+        """
+        levels = self.levels()
+        return [list(positions) for _level, positions in itertools.groupby(
+            sorted(range(0, self.count), key=levels.__getitem__),
+            levels.__getitem__)]
+
+    def _cycle(self, in_degree):
+        """Return the positions of a cycle among the nodes that could not be
+        ordered, following the dependencies of the first such node until a
+        node repeats.
+
+        """
+        position = next(position for position in range(0, self.count)
+                        if in_degree[position])
+        seen, path = {}, []
+        while position not in seen:
+            seen[position] = len(path)
+            path.append(position)
+            position = next(
+                parent for parent in self.parents(position)
+                if in_degree[parent])
+        return path[seen[position]:] + [position]
+
+    def _sort(self, with_levels):
+        """Order the nodes using Kahn's algorithm, returning the order and
+        when requested the level of each node.
+
+        :param bool with_levels: Calculate the level of each node
+        :rtype: tuple(list, array.array)
+        :raises: CycleError
+
+        """
+        offsets, targets = self.child_offsets, self.child_targets
+        in_degree = list(map(operator.sub, self.parent_offsets[1:],
+                             self.parent_offsets))
+        levels = None
+        if with_levels:
+            levels = array.array('l', bytes(self.count * offsets.itemsize))
+        queue = collections.deque(
+            position for position, value in enumerate(in_degree)
+            if not value)
+        order = []
+        while queue:
+            position = queue.popleft()
+            order.append(position)
+            for child in targets[offsets[position]:offsets[position + 1]]:
+                in_degree[child] -= 1
+                if levels is not None and levels[child] <= levels[position]:
+                    levels[child] = levels[position] + 1
+                if not in_degree[child]:
+                    queue.append(child)
+        if len(order) < self.count:
+            cycle = [self.key(position) for position in self._cycle(in_degree)]
+            raise CycleError(cycle, 'Dependency cycle: {}'.format(
+                ' -> '.join(str(key) for key in cycle)))
+        return order, levels
+
+
+def _compress(values):
+    """Return the offsets and targets arrays of the adjacency lists"""
+    return (array.array('l', itertools.chain(
+        [0], itertools.accumulate(map(len, values)))),
+            array.array('l', itertools.chain.from_iterable(values)))
+
+
+def _reachable(positions, offsets, targets):
+    """Return the positions reachable from the positions, not including
+    the positions themselves unless they are reachable from another.
+
+    """
+    seen = bytearray(len(offsets) - 1)
+    stack = []
+    for position in positions:
+        stack.extend(targets[offsets[position]:offsets[position + 1]])
+    while stack:
+        position = stack.pop()
+        if seen[position]:
+            continue
+        seen[position] = 1
+        stack.extend(targets[offsets[position]:offsets[position + 1]])
+    return [position for position in range(0, len(seen)) if seen[position]]
@@ -0,0 +1,108 @@
+# coding=utf-8
+"""
+Indexed Table of Contents
+
+"""
+import collections
+import heapq
+
+from pg_lifecycle import common
+
+
+class TOCIndex:
+    """Index of the pg_dump table of contents that is built in a single pass
+    over the entries. Entries are bucketed by ``desc`` and mapped by
+    ``dump_id`` so each generation phase only visits the entries it needs.
+    Dependents are indexed by the ``dump_id`` they depend upon so that child
+    objects can be resolved to their parents by direct lookup.
+
+    :param list entries: The TOC entries to index
+
+    """
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.by_desc = collections.defaultdict(list)
+        self.by_id = {}
+        self.dependents = collections.defaultdict(list)
+        self.position = {}
+        self.public_schema = []
+        for offset, entry in enumerate(self.entries):
+            self.by_desc[entry.desc].append(entry)
+            self.by_id[entry.dump_id] = entry
+            self.position[entry.dump_id] = offset
+            for dependency in sorted(set(entry.dependencies)):
+                self.dependents[dependency].append(entry)
+            if entry.desc in [common.ACL, common.COMMENT] and \
+                    entry.tag == 'SCHEMA public':
+                self.public_schema.append(entry)
+
+    def __contains__(self, dump_id):
+        return dump_id in self.by_id
+
+    def __len__(self):
+        return len(self.entries)
+
+    def dependencies_of(self, dump_id):
+        """Return the ``dump_id`` values the given entry depends upon.
+
+        :param int dump_id: The entry to return the dependencies for
+        :rtype: list
+
+        """
+        entry = self.by_id.get(dump_id)
+        return entry.dependencies if entry else []
+
+    def dependents_of(self, dump_id, descs=None):
+        """Return the entries that depend upon the given ``dump_id`` in TOC
+        order, optionally limited to the given set of ``desc`` values.
+
+        :param int dump_id: The entry to return the dependents of
+        :param set descs: Limit the dependents to these object types
+        :rtype: list
+
+        """
+        dependents = self.dependents.get(dump_id, [])
+        if descs is None:
+            return dependents
+        return [entry for entry in dependents if entry.desc in descs]
+
+    def get(self, desc):
+        """Return the entries for the given ``desc`` in TOC order.
+
+        :param str desc: The entry description (object type)
+        :rtype: list
+
+        """
+        return self.by_desc.get(desc, [])
+
+    def ordered(self, entries):
+        """Return the given entries sorted into TOC order.
+
+        :param list entries: The entries to sort
+        :rtype: list
+
+        """
+        return sorted(entries, key=lambda entry: self.position[entry.dump_id])
+
+    def prefixed(self, prefix):
+        """Return the entries with a ``desc`` starting with ``prefix`` in
+        TOC order.
+
+        :param str prefix: The entry description prefix
+        :rtype: list
+
+        """
+        return self.select(
+            *[desc for desc in self.by_desc if desc.startswith(prefix)])
+
+    def select(self, *descs):
+        """Return the entries for all of the given ``desc`` values, merged
+        back into TOC order.
+
+        :param str descs: The entry descriptions to select
+        :rtype: list
+
+        """
+        return list(heapq.merge(
+            *[self.get(desc) for desc in descs],
+            key=lambda entry: self.position[entry.dump_id]))
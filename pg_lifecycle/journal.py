@@ -0,0 +1,166 @@
+# coding=utf-8
+"""
+Deploy Journal
+
+Records the DDL applied by each step of a deploy so that a deploy that fails
+can be resumed without applying the steps that already committed.
+
+"""
+import logging
+from os import path
+import threading
+
+from pg_lifecycle import cache, common, sql
+
+LOGGER = logging.getLogger(__name__)
+
+TABLE = '{}.journal'.format(common.JOURNAL_SCHEMA)
+
+CREATE = """\
+CREATE SCHEMA IF NOT EXISTS {0};
+CREATE TABLE IF NOT EXISTS {1} (
+  path TEXT NOT NULL,
+  phase TEXT NOT NULL,
+  dump_id INTEGER NOT NULL,
+  hash TEXT NOT NULL,
+  duration DOUBLE PRECISION NOT NULL,
+  applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (path, phase))""".format(common.JOURNAL_SCHEMA, TABLE)
+
+INSERT = """\
+INSERT INTO {} (path, phase, dump_id, hash, duration)
+     VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (path, phase)
+  DO UPDATE SET dump_id = EXCLUDED.dump_id,
+                hash = EXCLUDED.hash,
+                duration = EXCLUDED.duration,
+                applied_at = EXCLUDED.applied_at""".format(TABLE)
+
+SELECT = 'SELECT path, phase, dump_id, hash, duration FROM {}'.format(TABLE)
+
+_SAVE_LOCK = threading.Lock()
+
+
+class Journal:
+    """The steps applied to a database. Each step is a project file's main
+    DDL, with an empty phase, or its deferred children of one type, with the
+    child type as the phase.
+
+    The journal table in the database is written in the same transaction as
+    the DDL for each step and is authoritative. A copy is kept in the
+    project's cache directory, keyed by database, so that a dry-run
+    can report what would be resumed without connecting.
+
+    :param str cache_path: The cache directory of the project being
+        deployed
+    :param str database: The database being deployed to
+
+    """
+    def __init__(self, cache_path, database):
+        self.file_path = path.join(cache_path, 'journal.json')
+        self.database = database
+        self.lock = threading.Lock()
+        self.skipped = 0
+        self.steps = {}
+        self._changed = False
+
+    def applied(self, file_path, phase, digest):
+        """Return True if the step was applied with the same DDL, counting
+        it as skipped.
+
+        :param str file_path: The project relative path
+        :param str phase: The step's phase
+        :param str digest: The hash of the step's DDL
+        :rtype: bool
+
+        """
+        value = self.steps.get(_key(file_path, phase))
+        if value is None or value[1] != digest:
+            return False
+        with self.lock:
+            self.skipped += 1
+        return True
+
+    def load(self, cursor):
+        """Create the journal table if it does not exist and load the steps
+        that have been applied to the database.
+
+        :param psycopg2.extensions.cursor cursor: The cursor to use
+        :raises: psycopg2.Error
+
+        """
+        cursor.execute(CREATE)
+        cursor.execute(SELECT)
+        self.steps = {_key(file_path, phase): [dump_id, digest, duration]
+                      for file_path, phase, dump_id, digest, duration
+                      in cursor.fetchall()}
+        self._changed = True
+        LOGGER.debug('Loaded %i journal entries from %s', len(self.steps),
+                     self.database)
+
+    def load_file(self):
+        """Load the steps recorded in the local journal file for the
+        database.
+
+        """
+        self.steps = cache.load_json(self.file_path, {}).get(
+            self.database, {})
+
+    def record(self, cursor, dump_id, file_path, phase, digest, duration):
+        """Record the step in the journal table, in the transaction that
+        applied it. Call :meth:`committed` once the transaction commits.
+
+        :param psycopg2.extensions.cursor cursor: The cursor to use
+        :param int dump_id: The dump_id of the file's object
+        :param str file_path: The project relative path
+        :param str phase: The step's phase
+        :param str digest: The hash of the step's DDL
+        :param float duration: The time it took to apply the step
+        :raises: psycopg2.Error
+
+        """
+        cursor.execute(INSERT, (file_path, phase, dump_id, digest, duration))
+
+    def committed(self, dump_id, file_path, phase, digest, duration):
+        """Record that the step's transaction committed.
+
+        :param int dump_id: The dump_id of the file's object
+        :param str file_path: The project relative path
+        :param str phase: The step's phase
+        :param str digest: The hash of the step's DDL
+        :param float duration: The time it took to apply the step
+
+        """
+        with self.lock:
+            self.steps[_key(file_path, phase)] = [
+                dump_id, digest, round(duration, 6)]
+            self._changed = True
+
+    def save(self):
+        """Save the steps to the local journal file if they changed. The
+        file is shared by the journals of every database the project is
+        deployed to, so saves are serialized.
+
+        """
+        with _SAVE_LOCK:
+            with self.lock:
+                if not self._changed:
+                    return
+                values = cache.load_json(self.file_path, {})
+                values[self.database] = dict(self.steps)
+                self._changed = False
+            cache.save_json(self.file_path, values)
+
+
+def digest(ddl):
+    """Return the hash of the DDL applied by a step.
+
+    :param str ddl: The DDL
+    :rtype: str
+
+    """
+    return sql.fingerprint(ddl)
+
+
+def _key(file_path, phase):
+    return '{}\t{}'.format(file_path, phase)
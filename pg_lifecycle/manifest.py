@@ -0,0 +1,304 @@
+# coding=utf-8
+"""
+Project Manifest
+
+The manifest is stored in a versioned binary format that can be memory-mapped
+and queried without materialising every file in the project:
+
+- A fixed size header with the format version, the record count and the
+  offset of each section
+- One fixed size record per file with the dump_id and the offset and length
+  of its strings and integer arrays
+- A little-endian int32 array holding the dependencies and includes
+- A UTF-8 string table holding paths, object types, namespaces and tags
+- An index of record numbers sorted by dump_id
+- An index of record numbers sorted by path
+
+"""
+import array
+import collections
+import logging
+import mmap
+import pickle
+import struct
+import sys
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'PGLM'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHIQQQQQ')
+_RECORD = struct.Struct('<i12I')
+_INDEX = struct.Struct('<I')
+_INT = struct.Struct('<i')
+
+Entry = collections.namedtuple(
+    'Entry', ['id', 'path', 'desc', 'namespace', 'tag', 'includes',
+              'dependencies'])
+
+
+class Manifest:
+    """Read-only access to a binary manifest, looking up records directly in
+    the underlying buffer.
+
+    :param buffer: The manifest data
+    :type buffer: bytes or mmap.mmap
+    :raises: ValueError
+
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        (magic, version, _flags, self.count, self._records, self._ints,
+         self._strings, self._id_index,
+         self._path_index) = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('Invalid manifest header')
+        if version > VERSION:
+            raise ValueError(
+                'Unsupported manifest version: {}'.format(version))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, offset):
+        if not 0 <= offset < self.count:
+            raise IndexError('manifest record out of range')
+        return self._entry(offset)
+
+    def __iter__(self):
+        for offset in range(0, self.count):
+            yield self._entry(offset)
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def open(cls, file_path):
+        """Memory-map the manifest file, converting it in memory if it is in
+        the legacy pickle format.
+
+        :param str file_path: The path to the manifest
+        :rtype: Manifest
+
+        """
+        with open(file_path, 'rb') as handle:
+            if handle.read(len(MAGIC)) != MAGIC:
+                LOGGER.debug('Loading legacy manifest from %s', file_path)
+                handle.seek(0)
+                return cls(dumps(pickle.load(handle)))
+            return cls(mmap.mmap(
+                handle.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        """Release the underlying buffer if it is memory-mapped"""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def dependencies(self, offset):
+        """Return the dependencies for the record at the given offset.
+
+        :param int offset: The record offset
+        :rtype: tuple
+
+        """
+        record = self._record(offset)
+        return self._read_ints(record[9], record[10])
+
+    def find(self, file_path):
+        """Return the entry for the given project relative path.
+
+        :param str file_path: The path to find
+        :rtype: Entry or None
+
+        """
+        value = file_path.encode('utf-8')
+        offset = self._search(
+            self._path_index, value,
+            lambda record: self._read_bytes(record[1], record[2]))
+        return self._entry(offset) if offset is not None else None
+
+    def get(self, dump_id):
+        """Return the entry for the given dump_id.
+
+        :param int dump_id: The dump_id to find
+        :rtype: Entry or None
+
+        """
+        offset = self.offset(dump_id)
+        return self._entry(offset) if offset is not None else None
+
+    def includes(self, offset):
+        """Return the includes for the record at the given offset.
+
+        :param int offset: The record offset
+        :rtype: tuple
+
+        """
+        record = self._record(offset)
+        return self._read_ints(record[11], record[12])
+
+    def offset(self, dump_id):
+        """Return the record offset for the given dump_id.
+
+        :param int dump_id: The dump_id to find
+        :rtype: int or None
+
+        """
+        return self._search(self._id_index, dump_id,
+                            lambda record: record[0])
+
+    def path(self, offset):
+        """Return the file path for the record at the given offset.
+
+        :param int offset: The record offset
+        :rtype: str
+
+        """
+        record = self._record(offset)
+        return self._read_str(record[1], record[2])
+
+    def _entry(self, offset):
+        record = self._record(offset)
+        return Entry(
+            record[0],
+            self._read_str(record[1], record[2]),
+            self._read_str(record[3], record[4]),
+            self._read_str(record[5], record[6]),
+            self._read_str(record[7], record[8]),
+            self._read_ints(record[11], record[12]),
+            self._read_ints(record[9], record[10]))
+
+    def _read_bytes(self, offset, length):
+        start = self._strings + offset
+        return bytes(self.buffer[start:start + length])
+
+    def _read_ints(self, offset, length):
+        if not length:
+            return ()
+        return struct.unpack_from(
+            '<{}i'.format(length), self.buffer,
+            self._ints + offset * _INT.size)
+
+    def _read_str(self, offset, length):
+        if not length:
+            return None
+        return self._read_bytes(offset, length).decode('utf-8')
+
+    def _record(self, offset):
+        return _RECORD.unpack_from(
+            self.buffer, self._records + offset * _RECORD.size)
+
+    def _search(self, index, value, key):
+        """Binary search of a sorted index, returning the record offset of
+        the first match.
+
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = _INDEX.unpack_from(
+                self.buffer, index + middle * _INDEX.size)[0]
+            if key(self._record(offset)) < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            offset = _INDEX.unpack_from(
+                self.buffer, index + low * _INDEX.size)[0]
+            if key(self._record(offset)) == value:
+                return offset
+        return None
+
+
+def convert(source, destination=None):
+    """Convert a legacy pickled manifest to the binary format, returning the
+    number of records written.
+
+    :param str source: The path to the pickled manifest
+    :param str destination: Where to write the binary manifest, defaults to
+        overwriting the source
+    :rtype: int
+
+    """
+    with open(source, 'rb') as handle:
+        if handle.read(len(MAGIC)) == MAGIC:
+            LOGGER.info('%s is already in the binary format', source)
+            return 0
+        handle.seek(0)
+        files = pickle.load(handle)
+    write(destination or source, files)
+    return len(files)
+
+
+def dumps(files):
+    """Return the binary manifest for the given files.
+
+    :param list files: The :class:`~pg_lifecycle.generate.DDLFile` values
+    :rtype: bytes
+
+    """
+    files = list(files)
+    strings, string_offsets = bytearray(), {}
+    ints, records = array.array('i'), []
+
+    def add_string(value):
+        if not value:
+            return 0, 0
+        data = value.encode('utf-8')
+        if data not in string_offsets:
+            string_offsets[data] = len(strings)
+            strings.extend(data)
+        return string_offsets[data], len(data)
+
+    def add_ints(values):
+        offset = len(ints)
+        ints.extend(sorted(values or []))
+        return offset, len(ints) - offset
+
+    for ddl_file in files:
+        records.append(
+            (ddl_file.id,) +
+            add_string(ddl_file.path) +
+            add_string(getattr(ddl_file, 'desc', None)) +
+            add_string(getattr(ddl_file, 'namespace', None)) +
+            add_string(getattr(ddl_file, 'tag', None)) +
+            add_ints(ddl_file.dependencies) +
+            add_ints(ddl_file.includes))
+    if sys.byteorder != 'little':
+        ints.byteswap()
+
+    count = len(records)
+    records_offset = _HEADER.size
+    ints_offset = records_offset + count * _RECORD.size
+    strings_offset = ints_offset + len(ints) * _INT.size
+    id_index_offset = strings_offset + len(strings)
+    path_index_offset = id_index_offset + count * _INDEX.size
+
+    output = bytearray(_HEADER.pack(
+        MAGIC, VERSION, 0, count, records_offset, ints_offset,
+        strings_offset, id_index_offset, path_index_offset))
+    for record in records:
+        output.extend(_RECORD.pack(*record))
+    output.extend(ints.tobytes())
+    output.extend(strings)
+    for offset in sorted(range(0, count), key=lambda o: records[o][0]):
+        output.extend(_INDEX.pack(offset))
+    for offset in sorted(range(0, count),
+                         key=lambda o: files[o].path.encode('utf-8')):
+        output.extend(_INDEX.pack(offset))
+    return bytes(output)
+
+
+def write(file_path, files):
+    """Write the binary manifest for the given files.
+
+    :param str file_path: The path to write the manifest to
+    :param list files: The :class:`~pg_lifecycle.generate.DDLFile` values
+
+    """
+    with open(file_path, 'wb') as handle:
+        handle.write(dumps(files))
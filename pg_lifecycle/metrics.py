@@ -0,0 +1,270 @@
+# coding=utf-8
+"""
+Phase Metrics
+
+Records the wall time, CPU time and memory high-water mark of each phase of
+a command, along with counters such as the number of objects of each type
+and the files and bytes written. Nothing is recorded unless metrics are
+enabled, so the hooks are left in place.
+
+"""
+import collections
+import contextlib
+import json
+import logging
+import os
+from os import path
+import resource
+import sys
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+PREFIX = 'pg_lifecycle'
+
+COUNTERS = {
+    'bytes_written': 'Bytes written to project files',
+    'cache_hits': 'Build cache hits',
+    'cache_misses': 'Build cache misses',
+    'ddl_bytes': 'Bytes of DDL written by a build',
+    'databases': 'Databases deployed to by a fleet deploy, by result',
+    'files': 'Project files deployed',
+    'files_added': 'Project files added by an update',
+    'files_changed': 'Project files changed by an update',
+    'files_hashed': 'Project files hashed by a compare',
+    'files_removed': 'Project files removed by an update',
+    'files_unchanged': 'Project files left unchanged by an update',
+    'files_written': 'Project files written',
+    'lock_retries': 'Deploy steps retried after a lock timeout or deadlock',
+    'lock_wait_seconds': 'Time deploy steps waited for locks before timing '
+                         'out',
+    'objects': 'Table of contents entries of each type',
+    'retry_backoff_seconds': 'Time waited between deploy step retries',
+    'statements': 'Statements in the changes to a database',
+    'steps_applied': 'Deploy steps applied',
+    'steps_skipped': 'Deploy steps skipped as already applied',
+    'toc_entries': 'Table of contents entries before filtering'}
+
+Phase = collections.namedtuple(
+    'Phase', ['name', 'parent', 'calls', 'wall', 'cpu', 'max_rss'])
+
+
+class Metrics:
+    """Phase timings and counters for one run of a command. Phases may be
+    nested, in which case the time of the inner phase is also counted in
+    the outer phase. A phase that is entered more than once accumulates
+    its times. Counters can be updated from any thread.
+
+    """
+    def __init__(self):
+        self.command = None
+        self.counters = collections.OrderedDict()
+        self.enabled = False
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.phases = collections.OrderedDict()
+        self.started = None
+
+    def count(self, name, value=1, **labels):
+        """Add the value to a counter.
+
+        :param str name: The counter name
+        :param int value: The value to add
+        :param labels: The labels that identify the counter
+
+        """
+        if not self.enabled:
+            return
+        key = name, tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def enable(self, command):
+        """Start recording metrics for the command.
+
+        :param str command: The command being run
+
+        """
+        self.command = command
+        self.enabled = True
+        self.started = time.perf_counter(), time.process_time()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the time spent in the block as the named phase.
+
+        :param str name: The phase name
+
+        """
+        if not self.enabled:
+            yield
+            return
+        stack = self.local.__dict__.setdefault('stack', [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        with self.lock:
+            if name not in self.phases:
+                self.phases[name] = Phase(name, parent, 0, 0.0, 0.0, 0)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            stack.pop()
+            with self.lock:
+                value = self.phases[name]
+                self.phases[name] = value._replace(
+                    calls=value.calls + 1, wall=value.wall + wall,
+                    cpu=value.cpu + cpu, max_rss=max_rss())
+
+    def as_dict(self):
+        """Return the metrics as a dict that can be serialized as JSON.
+
+        :rtype: dict
+
+        """
+        return {
+            'command': self.command,
+            'wall_seconds': round(time.perf_counter() - self.started[0], 6),
+            'cpu_seconds': round(time.process_time() - self.started[1], 6),
+            'max_rss_bytes': max_rss(),
+            'phases': [{
+                'name': value.name,
+                'parent': value.parent,
+                'calls': value.calls,
+                'wall_seconds': round(value.wall, 6),
+                'cpu_seconds': round(value.cpu, 6),
+                'max_rss_bytes': value.max_rss}
+                for value in self.phases.values()],
+            'counters': [{
+                'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self.counters.items()]}
+
+    def summary(self):
+        """Return a human readable summary of the phase timings and
+        counters.
+
+        :rtype: str
+
+        """
+        values = self.as_dict()
+        lines = ['{} took {:.3f}s wall, {:.3f}s CPU, {:.1f} MB peak'.format(
+            self.command, values['wall_seconds'], values['cpu_seconds'],
+            values['max_rss_bytes'] / 1048576)]
+        for value in values['phases']:
+            lines.append(
+                '  {:<36} {:>7} calls {:>10.3f}s wall {:>10.3f}s CPU'.format(
+                    value['name'], value['calls'], value['wall_seconds'],
+                    value['cpu_seconds']))
+        for value in values['counters']:
+            lines.append('  {:<36} {:>7}'.format(
+                _label(value['name'], value['labels']), value['value']))
+        return '\n'.join(lines) + '\n'
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format, for
+        the node exporter's textfile collector.
+
+        :rtype: str
+
+        """
+        values = self.as_dict()
+        command = {'command': self.command}
+        lines = []
+
+        def add(name, help_text, samples):
+            name = '{}_{}'.format(PREFIX, name)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} gauge'.format(name))
+            for labels, value in samples:
+                lines.append('{}{} {}'.format(
+                    name, _labels(dict(command, **labels)), value))
+
+        add('wall_seconds', 'Wall time of the command',
+            [({}, values['wall_seconds'])])
+        add('cpu_seconds', 'CPU time of the command',
+            [({}, values['cpu_seconds'])])
+        add('max_rss_bytes', 'Memory high-water mark of the command',
+            [({}, values['max_rss_bytes'])])
+        for key, help_text in [
+                ('wall_seconds', 'Wall time of each phase'),
+                ('cpu_seconds', 'CPU time of each phase'),
+                ('max_rss_bytes',
+                 'Memory high-water mark at the end of each phase'),
+                ('calls', 'Number of times each phase was entered')]:
+            add('phase_{}'.format(key), help_text,
+                [({'phase': value['name']}, value[key])
+                 for value in values['phases']])
+        names = collections.OrderedDict()
+        for value in values['counters']:
+            names.setdefault(value['name'], []).append(
+                (value['labels'], value['value']))
+        for name, samples in names.items():
+            add(name, COUNTERS.get(name, name), samples)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, file_path, output_format='json'):
+        """Atomically write the metrics to the file.
+
+        :param str file_path: The path to write the metrics to
+        :param str output_format: ``json`` or ``prometheus``
+
+        """
+        if output_format == 'prometheus':
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.as_dict(), indent=2) + '\n'
+        temp_path = '{}.{}'.format(file_path, os.getpid())
+        with open(temp_path, 'w') as handle:
+            handle.write(content)
+        os.replace(temp_path, file_path)
+        LOGGER.debug('Wrote metrics to %s', file_path)
+
+
+def max_rss():
+    """Return the memory high-water mark of the process in bytes
+
+    :rtype: int
+
+    """
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return value if sys.platform == 'darwin' else value * 1024
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _label(name, labels):
+    return '{}{}'.format(name, _labels(labels) if labels else '')
+
+
+def _labels(labels):
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(key, _escape(value))
+        for key, value in sorted(labels.items())))
+
+
+_METRICS = Metrics()
+
+count = _METRICS.count
+enable = _METRICS.enable
+phase = _METRICS.phase
+
+
+def report(args):
+    """Log and write the metrics as requested by the cli arguments
+
+    :param argparse.Namespace args: The parsed cli arguments
+
+    """
+    if not _METRICS.enabled:
+        return
+    if getattr(args, 'profile', False):
+        sys.stderr.write(_METRICS.summary())
+    if getattr(args, 'metrics_file', None):
+        _METRICS.write(path.abspath(args.metrics_file),
+                       getattr(args, 'metrics_format', 'json'))
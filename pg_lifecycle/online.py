@@ -0,0 +1,140 @@
+# coding=utf-8
+"""
+Online Deployment
+
+Rewrites the deferred constraint and index DDL of a project file into steps
+that do not hold ``ACCESS EXCLUSIVE`` locks while large existing tables are
+scanned:
+
+- Indexes are built with ``CREATE INDEX CONCURRENTLY`` outside of a
+  transaction
+- Primary keys and unique constraints are added ``USING INDEX`` with a
+  unique index that is built concurrently first
+- Foreign key and check constraints are added ``NOT VALID`` and validated
+  in a later phase, which only takes a ``SHARE UPDATE EXCLUSIVE`` lock
+
+Indexes and constraints on partitioned tables, and statements in any other
+form, are applied in a transaction as usual.
+
+"""
+import collections
+import logging
+import re
+
+from pg_lifecycle import common, sql
+
+LOGGER = logging.getLogger(__name__)
+
+VALIDATE = 'VALIDATE'
+
+Step = collections.namedtuple(
+    'Step', ['phase', 'ddl', 'autocommit', 'table', 'index'])
+
+CONSTRAINT = re.compile(
+    r'^ALTER TABLE ONLY ({}) ADD CONSTRAINT ({}) (.*)$'.format(
+        sql.QNAME, sql.IDENT), re.DOTALL)
+
+INDEX = re.compile(
+    r'^CREATE (UNIQUE )?INDEX ({}) ON (?!ONLY )({}) (.*)$'.format(
+        sql.IDENT, sql.QNAME), re.DOTALL)
+
+KEY = re.compile(r'^(PRIMARY KEY|UNIQUE) (\([^()]*\))$')
+
+PARTITIONED = re.compile(r'\)\s*PARTITION BY ', re.IGNORECASE)
+
+NOT_VALID = re.compile(r'\bNOT VALID$')
+
+
+def partitioned(ddl):
+    """Return True if the DDL creates a partitioned table.
+
+    :param str ddl: The main DDL of a project file
+    :rtype: bool
+
+    """
+    return PARTITIONED.search(ddl) is not None
+
+
+def steps(child_type, ddl, is_partitioned=False):
+    """Return the steps that apply the deferred DDL of one child type of a
+    project file online, and the steps that validate the constraints that
+    were added ``NOT VALID``, which are applied once every type has been
+    applied.
+
+    Statements that are applied online each have their own step, named by
+    the child type and object name. The other statements are applied in a
+    single step with the child type as its phase.
+
+    :param str child_type: The deferred child type
+    :param str ddl: The deferred DDL of the type
+    :param bool is_partitioned: The file's table is partitioned
+    :rtype: tuple(list, list)
+
+    """
+    values, validations, remaining = [], [], []
+    for statement in sql.split(ddl):
+        normalized = sql.normalize(statement)
+        if child_type == common.INDEX:
+            step = _index(normalized)
+        elif child_type == common.CONSTRAINT and not is_partitioned:
+            step = _key(normalized)
+        elif child_type in (common.CHECK_CONSTRAINT, common.FK_CONSTRAINT):
+            step = None
+            match = CONSTRAINT.match(normalized)
+            if match and not NOT_VALID.search(normalized):
+                statement = '{} NOT VALID'.format(normalized)
+                validations.append(Step(
+                    '{} {}'.format(VALIDATE, match.group(2)),
+                    'ALTER TABLE ONLY {} VALIDATE CONSTRAINT {}'.format(
+                        match.group(1), match.group(2)),
+                    False, match.group(1), None))
+        else:
+            step = None
+        if step:
+            values.append(step)
+        else:
+            remaining.append('{};\n'.format(statement))
+    if remaining:
+        values.insert(0, Step(child_type, ''.join(remaining), False, None,
+                              None))
+    return values, validations
+
+
+def _index(statement):
+    """Return the step that builds the index concurrently, if the
+    statement is a ``CREATE INDEX`` for a table that is not partitioned.
+
+    """
+    match = INDEX.match(statement)
+    if not match:
+        return None
+    unique, name, table, definition = match.groups()
+    return Step(
+        '{} {}'.format(common.INDEX, name),
+        'CREATE {}INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}'.format(
+            unique or '', name, table, definition),
+        True, table, _qualify(table, name))
+
+
+def _key(statement):
+    """Return the step that builds the index of a primary key or unique
+    constraint concurrently and adds the constraint using it.
+
+    """
+    match = CONSTRAINT.match(statement)
+    key = KEY.match(match.group(3)) if match else None
+    if not key:
+        return None
+    table, name = match.group(1), match.group(2)
+    return Step(
+        '{} {}'.format(common.CONSTRAINT, name),
+        'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {0} ON {1} {2};\n'
+        'ALTER TABLE ONLY {1} ADD CONSTRAINT {0} {3} USING INDEX {0}'.format(
+            name, table, key.group(2), key.group(1)),
+        True, table, _qualify(table, name))
+
+
+def _qualify(table, name):
+    """Return the index name qualified by the schema of its table"""
+    schema = sql.schema(table)
+    return '{}.{}'.format(schema, name) if schema else name
@@ -0,0 +1,114 @@
+# coding=utf-8
+"""
+Partition Sets
+
+A partition set is a project file that holds every partition of a table that
+has the same DDL once the partition's name and bounds are removed. The file
+has a single template for the partitions' files followed by the name and
+bounds of each partition, and is split back into one file per partition when
+the project is read.
+
+"""
+import json
+import logging
+import re
+
+LOGGER = logging.getLogger(__name__)
+
+HEADER = '-- Partition set for {}\n\n'
+HEADER_PREFIX = HEADER.split('{}')[0]
+BOUNDS = '\n-- Bounds\n\n'
+
+BOUND = '{{bound}}'
+NAME = '{{name}}'
+
+ATTACH_PATTERN = re.compile(
+    r'^ALTER TABLE ONLY (.+?) ATTACH PARTITION (.+?) '
+    r'(FOR VALUES .+|DEFAULT);\s*$', re.DOTALL)
+PARTITION_OF_PATTERN = re.compile(
+    r'^CREATE (?:UNLOGGED )?TABLE (.+?) PARTITION OF ([^\s(]+)', re.DOTALL)
+PARTITION_BOUND_PATTERN = re.compile(
+    r'^(FOR VALUES .+?|DEFAULT)(?:;|\nPARTITION BY )', re.DOTALL |
+    re.MULTILINE)
+
+
+def bound(defn):
+    """Return the parent table and bounds of a partition from the DDL of a
+    ``TABLE ATTACH`` entry, or of a table that pg_dump created with
+    ``PARTITION OF``, or ``None`` if the DDL is not for a partition.
+
+    :param str defn: The entry DDL
+    :rtype: tuple(str, str) or None
+
+    """
+    match = ATTACH_PATTERN.match(defn.strip())
+    if match:
+        return match.group(1), match.group(3)
+    match = PARTITION_OF_PATTERN.match(defn.strip())
+    if match:
+        value = PARTITION_BOUND_PATTERN.search(defn, match.end())
+        if value:
+            return match.group(2), value.group(1)
+    return None
+
+
+def dumps(parent, template, partitions):
+    """Return the content of a partition set file.
+
+    :param str parent: The name of the partitioned table
+    :param str template: The template for each partition's file
+    :param list partitions: The ``(name, bound)`` of each partition
+    :rtype: str
+
+    """
+    return ''.join(
+        [HEADER.format(parent), template, BOUNDS] +
+        ['{}\n'.format(json.dumps([name, value]))
+         for name, value in partitions])
+
+
+def render(template, name, value):
+    """Return the file content for a partition from the template.
+
+    :param str template: The partition set template
+    :param str name: The quoted name of the partition
+    :param str value: The partition bounds
+    :rtype: str
+
+    """
+    return template.replace(NAME, name).replace(BOUND, value)
+
+
+def split(content):
+    """Return the file content for each partition in a partition set, or
+    the content in a list if it is not a partition set.
+
+    :param str content: The project file content
+    :rtype: list
+
+    """
+    if not content.startswith(HEADER_PREFIX):
+        return [content]
+    head, _bounds, tail = content.rpartition(BOUNDS)
+    template = head.split('\n\n', 1)[1]
+    return [render(template, *json.loads(line))
+            for line in tail.splitlines() if line]
+
+
+def template(content, name, value):
+    """Return the template for a partition's file content, replacing its
+    name and bounds with placeholders, or ``None`` if the content can not be
+    restored from the template.
+
+    :param str content: The partition's file content
+    :param str name: The quoted name of the partition
+    :param str value: The partition bounds
+    :rtype: str or None
+
+    """
+    if '{{' in content or BOUNDS in content:
+        return None
+    result = content.replace(value, BOUND).replace(name, NAME)
+    if render(result, name, value) != content:
+        return None
+    return result
@@ -0,0 +1,212 @@
+# coding=utf-8
+"""
+Project Access
+
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+from os import path
+import re
+
+from pg_lifecycle import archive, cache, common, manifest, partitions
+
+LOGGER = logging.getLogger(__name__)
+
+SECTION_PATTERN = re.compile(
+    r'^-- ({})s for .*\n\n'.format(
+        '|'.join(re.escape(value) for value in common.CHILD_OBJ_TYPES)),
+    re.MULTILINE)
+
+
+class Project:
+    """Read access to a generated project directory or project archive
+
+    :param str project_path: The path to the project
+
+    """
+    def __init__(self, project_path):
+        self.path = path.abspath(project_path)
+        self.archive = None
+        if archive.is_archive(self.path):
+            self.archive = archive.Archive(self.path)
+        self._manifest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def manifest(self):
+        """Return the project manifest, opening it on first access.
+
+        :rtype: pg_lifecycle.manifest.Manifest
+
+        """
+        if self._manifest is None and self.archive:
+            try:
+                self._manifest = manifest.Manifest(
+                    self.archive.read(common.MANIFEST))
+            except FileNotFoundError as error:
+                raise ValueError(str(error))
+        elif self._manifest is None:
+            file_path = path.join(self.path, common.MANIFEST)
+            if not path.exists(file_path):
+                raise ValueError('{} does not exist'.format(file_path))
+            self._manifest = manifest.Manifest.open(file_path)
+        return self._manifest
+
+    @property
+    def cache_path(self):
+        """Return the directory the project's caches are stored in. The
+        caches of an archive are stored next to it.
+
+        :rtype: str
+
+        """
+        if self.archive:
+            return '{}{}'.format(self.path, cache.CACHE_DIR)
+        return path.join(self.path, cache.CACHE_DIR)
+
+    def close(self):
+        """Close the manifest and archive if they were opened"""
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+        if self.archive:
+            self.archive.close()
+
+    def digest(self, file_path):
+        """Return the SHA-256 hex digest of the project file's content.
+
+        :param str file_path: The project relative path
+        :rtype: str
+
+        """
+        if self.archive:
+            return hashlib.sha256(self.read_bytes(file_path)).hexdigest()
+        return cache.file_digest(path.join(self.path, file_path))
+
+    def open(self, file_path):
+        """Open the project file for reading in binary mode.
+
+        :param str file_path: The project relative path
+        :rtype: file
+
+        """
+        if self.archive:
+            return io.BytesIO(self.archive.read(file_path))
+        return open(path.join(self.path, file_path), 'rb')
+
+    def expand(self, file_path):
+        """Return the content of the project file, with partition sets
+        expanded to the content of each partition's file.
+
+        :param str file_path: The project relative path
+        :rtype: str
+
+        """
+        return ''.join(partitions.split(self.read(file_path)))
+
+    def read(self, file_path):
+        """Return the content of the project file.
+
+        :param str file_path: The project relative path
+        :rtype: str
+
+        """
+        return self.read_bytes(file_path).decode('utf-8')
+
+    def read_bytes(self, file_path):
+        """Return the raw content of the project file.
+
+        :param str file_path: The project relative path
+        :rtype: bytes
+
+        """
+        if self.archive:
+            return self.archive.read(file_path)
+        with self.open(file_path) as handle:
+            return handle.read()
+
+    def scope(self):
+        """Return the schema and table patterns the project was generated
+        with, by option name, or an empty dict if it was not filtered.
+
+        :rtype: dict
+
+        """
+        try:
+            return json.loads(self.read(common.SCOPE))
+        except FileNotFoundError:
+            return {}
+
+    def scan(self, directory):
+        """Return the modification time in nanoseconds and the size of
+        each file directly in the project directory, by name, or an empty
+        dict if the directory does not exist.
+
+        :param str directory: The project relative directory, ``''`` for
+            the top of the project
+        :rtype: dict
+
+        """
+        if self.archive:
+            return self.archive.scan(directory)
+        values = {}
+        try:
+            for entry in os.scandir(path.join(self.path, directory)):
+                if entry.is_file():
+                    value = entry.stat()
+                    values[entry.name] = value.st_mtime_ns, value.st_size
+        except FileNotFoundError:
+            pass
+        return values
+
+    def size(self, file_path):
+        """Return the size of the project file in bytes.
+
+        :param str file_path: The project relative path
+        :rtype: int
+
+        """
+        return self.stat(file_path)[1]
+
+    def stat(self, file_path):
+        """Return the modification time in nanoseconds and the size of the
+        project file.
+
+        :param str file_path: The project relative path
+        :rtype: tuple(int, int)
+        :raises: OSError
+
+        """
+        if self.archive:
+            return self.archive.stat(file_path)
+        value = os.stat(path.join(self.path, file_path))
+        return value.st_mtime_ns, value.st_size
+
+
+def sections(content):
+    """Split the content of a generated object file into the DDL for the
+    object itself and the DDL for each type of child object, returning a
+    list of ``(child_type, ddl)`` tuples. The object's own DDL has a
+    ``child_type`` of ``None``. The files of the partitions in a partition
+    set are split in turn.
+
+    :param str content: The file content
+    :rtype: list
+
+    """
+    values = []
+    for part in partitions.split(content):
+        child_type, offset = None, 0
+        for match in SECTION_PATTERN.finditer(part):
+            values.append((child_type, part[offset:match.start()]))
+            child_type, offset = match.group(1), match.end()
+        values.append((child_type, part[offset:]))
+    return values
@@ -0,0 +1,306 @@
+# coding=utf-8
+"""
+SQL Statement Handling
+
+Splits DDL into statements, normalises statements for comparison and
+classifies each statement by the object it defines.
+
+"""
+import hashlib
+import logging
+import re
+
+from pg_lifecycle import common
+
+LOGGER = logging.getLogger(__name__)
+
+OWNER = 'OWNER'
+
+TOKEN_PATTERN = re.compile(
+    r"""(?P<text>[^'";$/-]+)
+       |(?P<comment>--[^\n]*|/\*.*?\*/)
+       |(?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+       |(?P<dollar>\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$)
+       |(?P<semicolon>;)
+       |(?P<other>.)""", re.DOTALL | re.VERBOSE)
+
+IDENT = r'(?:"(?:[^"]|"")*"|[^\s"(),;.]+)'
+QNAME = r'{0}(?:\.{0})*'.format(IDENT)
+
+ATTACHED = {common.ACL, OWNER, common.SECURITY_LABEL}
+
+OBJECTS = [
+    common.TABLE, common.VIEW, common.MATERIALIZED_VIEW, common.SEQUENCE,
+    common.SCHEMA, common.EXTENSION, common.TYPE, common.DOMAIN,
+    common.FOREIGN_TABLE, common.COLLATION, common.CONVERSION,
+    common.PUBLICATION, common.SUBSCRIPTION, common.SERVER,
+    common.FOREIGN_DATA_WRAPPER, common.EVENT_TRIGGER,
+    common.TEXT_SEARCH_CONFIGURATION, common.TEXT_SEARCH_DICTIONARY,
+    'TEXT SEARCH PARSER', 'TEXT SEARCH TEMPLATE', 'LANGUAGE']
+
+SETTINGS = re.compile(r'^(?:SET |SELECT pg_catalog\.set_config\()')
+
+PATTERNS = [
+    ('signature', re.compile(
+        r'^CREATE (?:OR REPLACE )?(FUNCTION|PROCEDURE|AGGREGATE) '
+        r'({})\('.format(QNAME))),
+    (common.INDEX, re.compile(
+        r'^CREATE (?:UNIQUE )?INDEX (?:CONCURRENTLY )?(?:IF NOT EXISTS )?'
+        r'({}) ON (?:ONLY )?({})'.format(IDENT, QNAME))),
+    (common.CONSTRAINT, re.compile(
+        r'^ALTER TABLE (?:ONLY )?({}) ADD CONSTRAINT ({}) (.*)$'.format(
+            QNAME, IDENT))),
+    (common.DEFAULT, re.compile(
+        r'^ALTER TABLE (?:ONLY )?({}) ALTER COLUMN ({}) SET DEFAULT '.format(
+            QNAME, IDENT))),
+    (common.SEQUENCE_OWNED_BY, re.compile(
+        r'^ALTER SEQUENCE ({}) OWNED BY '.format(QNAME))),
+    (common.TRIGGER, re.compile(
+        r'^CREATE (?:CONSTRAINT )?TRIGGER ({}) (?:BEFORE|AFTER|INSTEAD OF) '
+        r'.*? ON ({}) '.format(IDENT, QNAME))),
+    (common.POLICY, re.compile(
+        r'^CREATE POLICY ({}) ON ({})'.format(IDENT, QNAME))),
+    (common.RULE, re.compile(
+        r'^CREATE (?:OR REPLACE )?RULE ({}) AS ON \w+ TO ({})'.format(
+            IDENT, QNAME))),
+    (common.COMMENT, re.compile(r"^COMMENT ON (.+?) IS (?:NULL$|E?')")),
+    (common.SECURITY_LABEL, re.compile(
+        r'^SECURITY LABEL (?:FOR \S+ )?ON (.+?) IS ')),
+    (common.ACL, re.compile(r'^(?:GRANT|REVOKE) .*? ON (.+?) (?:TO|FROM) ')),
+    (OWNER, re.compile(r'^ALTER (.+?) OWNER TO ')),
+    ('object', re.compile(
+        r'^CREATE (?:OR REPLACE )?(?:(?:UNLOGGED|TEMPORARY|TEMP|RECURSIVE|'
+        r'TRUSTED|PROCEDURAL) )*({}) (?:IF NOT EXISTS )?({})'.format(
+            '|'.join(OBJECTS), QNAME))),
+    (common.TABLE, re.compile(
+        r'^ALTER (?:FOREIGN )?TABLE (?:ONLY )?(?:IF EXISTS )?({})'.format(
+            QNAME)))]
+
+
+def classify(statement):
+    """Return the ``(desc, name)`` key of the object the normalised
+    statement defines or ``None`` if the statement can not be classified.
+    Ownership, privileges and security labels are classified by the object
+    they are for, with their own desc.
+
+    :param str statement: The normalised statement
+    :rtype: tuple or None
+
+    """
+    for desc, pattern in PATTERNS:
+        match = pattern.match(statement)
+        if not match:
+            continue
+        elif desc == 'signature':
+            return match.group(1), match.group(2) + parenthesized(
+                statement, match.end() - 1)
+        elif desc == 'object':
+            value = match.group(1)
+            if value == 'LANGUAGE':
+                value = common.PL
+            return value, match.group(2)
+        elif desc == common.INDEX:
+            return desc, '{}.{}'.format(
+                schema(match.group(2)), match.group(1))
+        elif desc == common.CONSTRAINT:
+            if match.group(3).startswith('FOREIGN KEY'):
+                desc = common.FK_CONSTRAINT
+            elif match.group(3).startswith('CHECK'):
+                desc = common.CHECK_CONSTRAINT
+            return desc, '{} {}'.format(match.group(1), match.group(2))
+        elif match.lastindex == 2:
+            return desc, '{} {}'.format(match.group(2), match.group(1)) \
+                if desc in {common.TRIGGER, common.POLICY, common.RULE} \
+                else '{} {}'.format(match.group(1), match.group(2))
+        return desc, match.group(1)
+    return None
+
+
+def elements(value):
+    """Split a comma separated list, such as the body of a ``CREATE TABLE``
+    statement, into its elements. Commas in parentheses, quoted strings and
+    identifiers do not separate elements.
+
+    :param str value: The list to split
+    :rtype: list
+
+    """
+    values, depth, start, offset = [], 0, 0, 0
+    while offset < len(value):
+        match = TOKEN_PATTERN.match(value, offset)
+        offset = match.end()
+        if match.lastgroup == 'text':
+            for position, character in enumerate(match.group()):
+                if character == '(':
+                    depth += 1
+                elif character == ')':
+                    depth -= 1
+                elif character == ',' and not depth:
+                    values.append(value[start:match.start() + position])
+                    start = match.start() + position + 1
+    if value[start:].strip():
+        values.append(value[start:])
+    return [item.strip() for item in values]
+
+
+def fingerprint(statement):
+    """Return the fingerprint of the normalised statement.
+
+    :param str statement: The normalised statement
+    :rtype: str
+
+    """
+    return hashlib.sha256(statement.encode('utf-8')).hexdigest()
+
+
+def normalize(statement):
+    """Return the statement with comments removed, whitespace collapsed,
+    dollar quoting made uniform and ``CREATE OR REPLACE`` reduced to
+    ``CREATE`` so that DDL from pg_dump and DDL built from the catalog
+    compare equal.
+
+    :param str statement: The statement to normalise
+    :rtype: str
+
+    """
+    parts, offset = [], 0
+    while offset < len(statement):
+        match = TOKEN_PATTERN.match(statement, offset)
+        kind, offset = match.lastgroup, match.end()
+        if kind == 'comment':
+            parts.append(' ')
+        elif kind == 'dollar':
+            end = statement.find(match.group(), offset)
+            end = len(statement) if end < 0 else end
+            parts.append('$$' + statement[offset:end] + '$$')
+            offset = end + len(match.group())
+        else:
+            parts.append(match.group())
+    value = ' '.join(''.join(parts).split())
+    if value.startswith('CREATE OR REPLACE '):
+        value = 'CREATE ' + value[18:]
+    return value.replace('( ', '(').replace(' )', ')')
+
+
+def objects(ddl):
+    """Split the DDL into statements and group them by the object they
+    define, returning a list of ``(key, statements)`` tuples in the order
+    each object is first defined. Each statement is a tuple of its source
+    text and normalised form.
+
+    Session settings are skipped. Statements that can not be classified
+    belong to the object defined before them. Ownership, privileges and
+    security labels belong to the object they name, or to the first object
+    in the DDL if that object is not defined in it.
+
+    :param str ddl: The DDL to group
+    :rtype: list
+
+    """
+    values, grouped, names, current = [], {}, {}, None
+    for statement in split(ddl):
+        normalized = normalize(statement)
+        if SETTINGS.match(normalized):
+            continue
+        key = classify(normalized)
+        if key is not None and key[0] in ATTACHED:
+            key = names.get(key[1], values[0][0] if values else None)
+        elif key is None:
+            key = current
+        elif key not in grouped:
+            grouped[key] = []
+            names['{} {}'.format(*key)] = key
+            values.append((key, grouped[key]))
+        if key is None:
+            LOGGER.debug('Ignoring unattached statement: %s', normalized)
+            continue
+        current = key
+        grouped[key].append((statement, normalized))
+    return values
+
+
+def parenthesized(statement, offset):
+    """Return the balanced parenthesized text that starts at the offset of
+    the normalised statement.
+
+    :param str statement: The normalised statement
+    :param int offset: The offset of the opening parenthesis
+    :rtype: str
+
+    """
+    depth = 0
+    for position in range(offset, len(statement)):
+        if statement[position] == '(':
+            depth += 1
+        elif statement[position] == ')':
+            depth -= 1
+            if not depth:
+                return statement[offset:position + 1]
+    return statement[offset:]
+
+
+def quote_ident(value):
+    """Return the value quoted as a SQL identifier if it needs to be.
+
+    :param str value: The identifier to quote
+    :rtype: str
+
+    """
+    if re.match(r'^[a-z_][a-z0-9_$]*$', value):
+        return value
+    return '"{}"'.format(value.replace('"', '""'))
+
+
+def quote_literal(value):
+    """Return the value quoted as a SQL string literal.
+
+    :param str value: The value to quote
+    :rtype: str
+
+    """
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def schema(name):
+    """Return the schema of a qualified name.
+
+    :param str name: The qualified name
+    :rtype: str or None
+
+    """
+    parts = re.findall(IDENT, name)
+    return '.'.join(parts[:-1]) if len(parts) > 1 else None
+
+
+def split(ddl):
+    """Return the statements in the DDL, without the terminating semicolon
+    and any comments or whitespace before each statement. Semicolons in
+    quoted strings, identifiers, dollar quoted bodies and comments do not
+    end a statement.
+
+    :param str ddl: The DDL to split
+    :rtype: list
+
+    """
+    values, start, offset, length = [], None, 0, len(ddl)
+    while offset < length:
+        match = TOKEN_PATTERN.match(ddl, offset)
+        kind, offset = match.lastgroup, match.end()
+        if kind == 'semicolon':
+            if start is not None:
+                values.append(ddl[start:match.start()].rstrip())
+            start = None
+            continue
+        elif kind == 'comment' or (kind == 'text' and
+                                   match.group().isspace()):
+            continue
+        elif start is None:
+            start = match.start() + (
+                len(match.group()) - len(match.group().lstrip())
+                if kind == 'text' else 0)
+        if kind == 'dollar':
+            end = ddl.find(match.group(), offset)
+            offset = length if end < 0 else end + len(match.group())
+    if start is not None and ddl[start:].strip():
+        values.append(ddl[start:].rstrip())
+    return values
@@ -0,0 +1,273 @@
+# coding=utf-8
+"""
+Project File Writer
+
+"""
+from concurrent import futures
+import hashlib
+import logging
+import os
+from os import path
+import threading
+
+from pg_lifecycle import cache, common, metrics, project
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Writer:
+    """Collects rendered project files and writes them in batches using a
+    bounded pool of threads. Each directory is created or listed exactly once
+    and the listing is used to detect paths that already exist.
+
+    When ``max_pending`` is set, the pending files are flushed as soon as
+    that many have been added, bounding the rendered content held in memory.
+
+    :param str project_path: The path to write the files in
+    :param int jobs: The maximum number of concurrent writes
+    :param int max_pending: Flush after this many files have been added
+
+    """
+    def __init__(self, project_path, jobs=1, max_pending=None):
+        self.project_path = project_path
+        self.jobs = max(1, jobs or 1)
+        self.max_pending = max_pending
+        self.directories = {}
+        self.executor = None
+        self.pending = []
+
+    def add(self, filename, content):
+        """Add a file to be written on the next flush.
+
+        :param str filename: The path of the file relative to the project
+        :param str|bytes content: The file content
+        :raises: ValueError
+
+        """
+        file_path = path.join(self.project_path, filename)
+        dir_path, name = path.split(file_path)
+        existing = self._directory(dir_path)
+        if name in existing:
+            raise ValueError('Path Already Exists: {}'.format(file_path))
+        existing.add(name)
+        self.pending.append((file_path, content))
+        if self.max_pending and len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def abort(self):
+        """Discard the pending files and shutdown the thread pool"""
+        self.pending = []
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def close(self):
+        """Flush any pending files and shutdown the thread pool"""
+        self.flush()
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def flush(self):
+        """Write all of the pending files, returning the number of files
+        that were written.
+
+        :rtype: int
+
+        """
+        pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+        with metrics.phase('write'):
+            if self.jobs == 1 or len(pending) < 2:
+                written = sum(self._write(value) for value in pending)
+            else:
+                if not self.executor:
+                    self.executor = futures.ThreadPoolExecutor(self.jobs)
+                written = sum(self.executor.map(self._write, pending))
+        metrics.count('files_written', len(pending))
+        metrics.count('bytes_written', written)
+        LOGGER.debug('Wrote %i files', len(pending))
+        return len(pending)
+
+    def _directory(self, dir_path):
+        """Return the set of filenames in the directory, creating it if it
+        does not exist.
+
+        :param str dir_path: The directory path
+        :rtype: set
+
+        """
+        if dir_path not in self.directories:
+            try:
+                self.directories[dir_path] = set(os.listdir(dir_path))
+            except FileNotFoundError:
+                os.makedirs(dir_path)
+                self.directories[dir_path] = set({})
+        return self.directories[dir_path]
+
+    @staticmethod
+    def _write(value):
+        """Write the file content to a temporary file that then replaces the
+        file, so a file that is hard linked into other projects by
+        ``generate-fleet`` is unlinked rather than changed in place. Returns
+        the number of bytes written.
+
+        :param tuple value: The file path and content to write
+        :rtype: int
+
+        """
+        content = value[1]
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        temp_path = '{}.{}.{}'.format(
+            value[0], os.getpid(), threading.get_ident())
+        with open(temp_path, 'wb') as handle:
+            handle.write(content)
+        os.replace(temp_path, value[0])
+        return len(content)
+
+
+class UpdateWriter(Writer):
+    """Writes rendered project files over an existing project, only writing
+    the files whose content differs from the file on disk. The files are
+    compared by content hash, with the hash of each existing file cached by
+    its modification time and size so that unchanged files are not read.
+    When the writer is closed, the files in the previous manifest that were
+    not added are removed, along with any directories that are left empty.
+
+    :param str project_path: The path of the project to update
+    :param int jobs: The maximum number of concurrent writes
+    :param int max_pending: Flush after this many files have been added
+
+    """
+    def __init__(self, project_path, jobs=1, max_pending=None):
+        super(UpdateWriter, self).__init__(project_path, jobs, max_pending)
+        self.project = project.Project(project_path)
+        self.digests = cache.DigestCache(self.project)
+        self.added, self.changed, self.removed = [], [], []
+        self.filenames = set({})
+        self.manifest_changed = False
+        self.previous = self._previous()
+        self.unchanged = 0
+        self.written = []
+
+    def add(self, filename, content):
+        """Add a file to be written on the next flush if it is new or its
+        content has changed.
+
+        :param str filename: The path of the file relative to the project
+        :param str|bytes content: The file content
+        :raises: ValueError
+
+        """
+        file_path = path.join(self.project_path, filename)
+        if filename in self.filenames:
+            raise ValueError('Path Already Exists: {}'.format(file_path))
+        self.filenames.add(filename)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        try:
+            existing = self.digests.get(filename)
+        except FileNotFoundError:
+            existing = None
+        if filename == common.MANIFEST:
+            self.manifest_changed = existing != digest
+        elif existing == digest:
+            self.unchanged += 1
+        else:
+            (self.added if existing is None else self.changed).append(
+                filename)
+        if existing == digest:
+            return
+        self._directory(path.dirname(file_path))
+        self.written.append((filename, digest))
+        self.pending.append((file_path, content))
+        if self.max_pending and len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def close(self):
+        """Flush any pending files, remove the files of objects that are no
+        longer in the project and save the content hashes.
+
+        """
+        super(UpdateWriter, self).close()
+        for filename in sorted(self.previous - self.filenames):
+            LOGGER.debug('Removing %s', filename)
+            try:
+                os.unlink(path.join(self.project_path, filename))
+            except FileNotFoundError:
+                pass
+            self.digests.discard(filename)
+            self.removed.append(filename)
+        self._remove_empty_directories()
+        self.digests.save()
+        self.project.close()
+        for name, value in [('files_added', len(self.added)),
+                            ('files_changed', len(self.changed)),
+                            ('files_removed', len(self.removed)),
+                            ('files_unchanged', self.unchanged)]:
+            metrics.count(name, value)
+
+    def flush(self):
+        """Write all of the pending files and record their content hashes,
+        returning the number of files that were written.
+
+        :rtype: int
+
+        """
+        written, self.written = self.written, []
+        count = super(UpdateWriter, self).flush()
+        for filename, digest in written:
+            self.digests.store(filename, digest)
+        return count
+
+    def summary(self):
+        """Return a summary of the files that were added, changed, removed
+        and left unchanged, and if the manifest was rewritten.
+
+        :rtype: str
+
+        """
+        return '{} added, {} changed, {} removed and {} unchanged ' \
+            'files, manifest {}'.format(
+                len(self.added), len(self.changed), len(self.removed),
+                self.unchanged,
+                'rewritten' if self.manifest_changed else 'unchanged')
+
+    def _previous(self):
+        """Return the paths of the files in the previous manifest"""
+        try:
+            manifest = self.project.manifest
+        except ValueError:
+            if path.exists(self.project_path):
+                LOGGER.warning('%s does not have a manifest, files for '
+                               'dropped objects will not be removed',
+                               self.project_path)
+            return set({})
+        try:
+            return set(manifest.path(offset)
+                       for offset in range(0, len(manifest)))
+        finally:
+            self.project.close()
+
+    def _remove_empty_directories(self):
+        """Remove the directories that were emptied by removing files,
+        keeping the top-level directories of the project.
+
+        """
+        keep = set(path.join(self.project_path, value)
+                   for value in common.PATHS.values())
+        keep.add(self.project_path)
+        for dir_path in sorted(set(
+                path.dirname(path.join(self.project_path, filename))
+                for filename in self.removed), reverse=True):
+            while dir_path not in keep and \
+                    dir_path.startswith(self.project_path):
+                try:
+                    os.rmdir(dir_path)
+                except OSError:
+                    break
+                LOGGER.debug('Removed empty directory %s', dir_path)
+                dir_path = path.dirname(dir_path)
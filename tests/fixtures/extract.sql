@@ -0,0 +1,74 @@
+-- Objects the catalog extractor supports, loaded by tests/test_extract.py and
+-- benchmarks/extract.py to compare its table of contents with the one pg_dump
+-- writes.
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto WITH SCHEMA public;
+
+CREATE SCHEMA app;
+COMMENT ON SCHEMA app IS 'Application schema';
+
+CREATE ROLE pg_lifecycle_reader NOLOGIN;
+GRANT USAGE ON SCHEMA app TO pg_lifecycle_reader;
+
+CREATE TYPE app.status AS ENUM ('active', 'disabled');
+CREATE TYPE app.point3 AS (x double precision, y double precision,
+                           z double precision);
+CREATE DOMAIN app.email AS text NOT NULL
+  CONSTRAINT email_check CHECK (VALUE ~ '@');
+COMMENT ON DOMAIN app.email IS 'An e-mail address';
+
+CREATE TABLE app.accounts (
+  id serial PRIMARY KEY,
+  email app.email UNIQUE,
+  status app.status NOT NULL DEFAULT 'active',
+  created_at timestamp with time zone NOT NULL DEFAULT now(),
+  location app.point3,
+  CONSTRAINT created_check CHECK (created_at > '2000-01-01')
+);
+COMMENT ON TABLE app.accounts IS 'Accounts';
+COMMENT ON COLUMN app.accounts.email IS 'Login';
+GRANT SELECT ON app.accounts TO pg_lifecycle_reader;
+GRANT SELECT, UPDATE ON app.accounts_id_seq TO pg_lifecycle_reader;
+
+CREATE TABLE app.sessions (
+  id bigint NOT NULL,
+  account_id integer NOT NULL REFERENCES app.accounts (id),
+  token text NOT NULL DEFAULT encode(public.gen_random_bytes(16), 'hex'),
+  CONSTRAINT sessions_pkey PRIMARY KEY (id)
+);
+CREATE INDEX sessions_account ON app.sessions (account_id);
+COMMENT ON INDEX app.sessions_account IS 'Sessions by account';
+
+CREATE SEQUENCE app.session_ids AS bigint START 1000 CACHE 10
+  OWNED BY app.sessions.id;
+ALTER TABLE app.sessions
+  ALTER COLUMN id SET DEFAULT nextval('app.session_ids');
+
+CREATE UNLOGGED TABLE app.events (
+  id bigint NOT NULL,
+  payload jsonb
+);
+ALTER TABLE app.events
+  ADD CONSTRAINT payload_check CHECK (payload IS NOT NULL) NOT VALID;
+
+CREATE VIEW app.active_accounts AS
+  SELECT id, email FROM app.accounts WHERE status = 'active';
+CREATE MATERIALIZED VIEW app.account_counts AS
+  SELECT status, count(*) FROM app.accounts GROUP BY status WITH NO DATA;
+
+CREATE FUNCTION app.touch() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.created_at = now();
+  RETURN NEW;
+END;
+$$;
+REVOKE ALL ON FUNCTION app.touch() FROM PUBLIC;
+
+CREATE PROCEDURE app.disable(account integer) LANGUAGE sql AS $$
+  UPDATE app.accounts SET status = 'disabled' WHERE id = account;
+$$;
+COMMENT ON PROCEDURE app.disable(integer) IS 'Disable an account';
+
+CREATE TRIGGER accounts_touch BEFORE INSERT ON app.accounts
+  FOR EACH ROW EXECUTE FUNCTION app.touch();
+COMMENT ON TRIGGER accounts_touch ON app.accounts IS 'Set created_at';
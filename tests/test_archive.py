@@ -0,0 +1,144 @@
+# coding=utf-8
+import argparse
+import os
+from os import path
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from pg_lifecycle import archive, build, common, generate, project
+
+from tests import utils
+
+
+def dump():
+    """Return the entries of a dump with a schema, a table and its
+    constraint and comment.
+
+    """
+    value = utils.Dump()
+    schema = value.add(common.SCHEMA, 'app', 'CREATE SCHEMA app;\n')
+    table = value.add(common.TABLE, 'accounts',
+                      'CREATE TABLE app.accounts (\n    id integer NOT NULL'
+                      '\n);\n', 'app', [schema])
+    value.add(common.CONSTRAINT, 'accounts accounts_pkey',
+              'ALTER TABLE ONLY app.accounts\n    ADD CONSTRAINT '
+              'accounts_pkey PRIMARY KEY (id);\n', 'app', [table],
+              common.POST_DATA)
+    value.add(common.COMMENT, 'TABLE accounts',
+              "COMMENT ON TABLE app.accounts IS 'Accounts';\n", 'app',
+              [table])
+    return value
+
+
+class ArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.archive_path = path.join(self.tempdir.name, 'app #1?.pgl')
+        self.directory_path = path.join(self.tempdir.name, 'app')
+        utils.generate_project(self.archive_path, dump().reader(),
+                               archive=True)
+        utils.generate_project(self.directory_path, dump().reader())
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def build(self, project_path):
+        output_path = path.join(self.tempdir.name, 'output.sql')
+        build.Build(argparse.Namespace(
+            diff=False, file=output_path, no_cache=True,
+            project=project_path)).run()
+        with open(output_path) as handle:
+            return handle.read()
+
+    def test_is_archive(self):
+        self.assertTrue(archive.is_archive(self.archive_path))
+        self.assertFalse(archive.is_archive(self.directory_path))
+        self.assertFalse(archive.is_archive(
+            path.join(self.directory_path, common.MANIFEST)))
+        self.assertEqual(os.listdir(self.tempdir.name).count(
+            path.basename(self.archive_path)), 1)
+
+    def test_round_trip(self):
+        archived = project.Project(self.archive_path)
+        directory = project.Project(self.directory_path)
+        try:
+            self.assertEqual(
+                [value.path for value in archived.manifest],
+                [value.path for value in directory.manifest])
+            for value in directory.manifest:
+                self.assertEqual(archived.read(value.path),
+                                 directory.read(value.path))
+            self.assertEqual(sorted(archived.scan('tables/app')),
+                             ['accounts.sql'])
+            self.assertEqual(
+                archived.stat('tables/app/accounts.sql')[1],
+                directory.stat('tables/app/accounts.sql')[1])
+        finally:
+            archived.close()
+            directory.close()
+
+    def test_build(self):
+        self.assertEqual(self.build(self.archive_path),
+                         self.build(self.directory_path))
+
+    def test_read_only(self):
+        value = archive.Archive(self.archive_path)
+        try:
+            self.assertIn(b'CREATE SCHEMA app;',
+                          value.read('schemata/app.sql'))
+            with self.assertRaises(FileNotFoundError):
+                value.read('schemata/other.sql')
+            with self.assertRaises(FileNotFoundError):
+                value.stat('schemata/other.sql')
+            with self.assertRaises(sqlite3.OperationalError):
+                value.connection.execute(
+                    archive.INSERT, ('schemata/other.sql', b'', 0))
+        finally:
+            value.close()
+
+
+class ArchiveWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.archive_path = path.join(self.tempdir.name, 'app.pgl')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_duplicate_path(self):
+        writer = archive.Writer(self.archive_path)
+        writer.add('schemata/app.sql', 'CREATE SCHEMA app;\n')
+        with self.assertRaises(ValueError):
+            writer.add('schemata/app.sql', 'CREATE SCHEMA app;\n')
+        writer.abort()
+
+    def test_abort(self):
+        writer = archive.Writer(self.archive_path, 1)
+        writer.add('schemata/app.sql', 'CREATE SCHEMA app;\n')
+        self.assertTrue(path.exists(writer.temp_path))
+        writer.abort()
+        self.assertEqual(os.listdir(self.tempdir.name), [])
+
+    def test_failed_generation(self):
+        for error in [RuntimeError('failed'), SystemExit(3)]:
+            with mock.patch.object(generate.Generate, '_generate_manifest',
+                                   side_effect=error):
+                with self.assertRaises(type(error)):
+                    utils.generate_project(
+                        self.archive_path, dump().reader(), archive=True)
+            self.assertEqual(os.listdir(self.tempdir.name), [])
+
+    def test_failed_generation_keeps_the_archive(self):
+        utils.generate_project(self.archive_path, dump().reader(),
+                               archive=True)
+        with mock.patch.object(generate.Generate, '_generate_manifest',
+                               side_effect=RuntimeError('failed')):
+            with self.assertRaises(RuntimeError):
+                utils.generate_project(
+                    self.archive_path, dump().reader(), archive=True)
+        self.assertEqual(os.listdir(self.tempdir.name), ['app.pgl'])
+        self.assertTrue(archive.is_archive(self.archive_path))
@@ -0,0 +1,240 @@
+# coding=utf-8
+import argparse
+import os
+from os import path
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from pg_lifecycle import build, cache, catalog, project
+
+from tests import utils
+
+TABLE = """\
+CREATE TABLE app.table_{0} (
+    id integer NOT NULL,
+    value text
+);
+
+-- CONSTRAINTs for app.table_{0}
+
+ALTER TABLE ONLY app.table_{0}
+    ADD CONSTRAINT table_{0}_pkey PRIMARY KEY (id);
+
+-- INDEXs for app.table_{0}
+
+CREATE INDEX table_{0}_value_idx ON app.table_{0} USING btree (value);
+"""
+
+
+class BuildCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = path.join(self.tempdir.name, 'project')
+        self.output_path = path.join(self.tempdir.name, 'output.sql')
+        utils.write_project(self.project_path, [
+            (1, 'schemata/app.sql', 'CREATE SCHEMA app;\n', [], [])] + [
+            (dump_id, 'tables/app/table_{}.sql'.format(dump_id),
+             TABLE.format(dump_id), [dump_id * 10, dump_id * 10 + 1], [1])
+            for dump_id in range(2, 6)])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def build(self, no_cache=False):
+        """Build the project, returning the cache hits and misses"""
+        args = argparse.Namespace(diff=False, file=self.output_path,
+                                  no_cache=no_cache,
+                                  project=self.project_path)
+        with self.assertLogs('pg_lifecycle.build', 'INFO') as logs:
+            build.Build(args).run()
+        for line in logs.output:
+            match = re.search(r'Build cache: (\d+) hits, (\d+) misses', line)
+            if match:
+                return int(match.group(1)), int(match.group(2))
+        return None
+
+    def output(self):
+        with open(self.output_path, 'r') as handle:
+            return handle.read()
+
+    def touch(self, file_path, offset=10):
+        value = os.stat(path.join(self.project_path, file_path))
+        os.utime(path.join(self.project_path, file_path), ns=(
+            value.st_atime_ns, value.st_mtime_ns + offset * 1000000000))
+
+    def test_cold_build(self):
+        self.assertEqual(self.build(), (0, 6))
+        cached = self.output()
+        self.build(no_cache=True)
+        self.assertEqual(cached, self.output())
+
+    def test_deferred_children_last(self):
+        self.build()
+        value = self.output()
+        self.assertLess(value.rindex('CREATE TABLE'),
+                        value.index('ADD CONSTRAINT'))
+        self.assertLess(value.rindex('ADD CONSTRAINT'),
+                        value.index('CREATE INDEX'))
+
+    def test_files_read_once(self):
+        for no_cache in [True, False]:
+            with mock.patch.object(project.Project, 'read',
+                                   autospec=True,
+                                   side_effect=project.Project.read) as read, \
+                    mock.patch.object(project.Project, 'read_bytes',
+                                      autospec=True,
+                                      side_effect=project.Project.read_bytes) \
+                    as read_bytes:
+                self.build(no_cache)
+            file_paths = [call[0][1] for call in
+                          read.call_args_list + read_bytes.call_args_list]
+            self.assertEqual(len(file_paths), len(set(file_paths)))
+
+    def test_unchanged(self):
+        self.build()
+        self.assertEqual(self.build(), (6, 0))
+
+    def test_touched_without_change(self):
+        self.build()
+        expected = self.output()
+        for dump_id in range(2, 6):
+            self.touch('tables/app/table_{}.sql'.format(dump_id))
+        self.assertEqual(self.build(), (6, 0))
+        self.assertEqual(self.output(), expected)
+        self.assertEqual(self.build(), (6, 0))
+
+    def test_changed(self):
+        self.build()
+        with open(path.join(self.project_path,
+                            'tables/app/table_3.sql'), 'a') as handle:
+            handle.write('\nCOMMENT ON TABLE app.table_3 IS NULL;\n')
+        self.touch('tables/app/table_3.sql')
+        self.assertEqual(self.build(), (5, 1))
+        self.assertIn('COMMENT ON TABLE app.table_3 IS NULL;',
+                      self.output())
+        cached = self.output()
+        self.build(no_cache=True)
+        self.assertEqual(cached, self.output())
+
+
+class ProjectCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        utils.write_project(self.tempdir.name, [
+            (1, 'schemata/app.sql', 'CREATE SCHEMA app;\n', [], [])])
+        self.project = project.Project(self.tempdir.name)
+        os.makedirs(self.project.cache_path)
+
+    def tearDown(self):
+        self.project.close()
+        self.tempdir.cleanup()
+
+
+class FingerprintCacheTestCase(ProjectCacheTestCase):
+
+    def get(self, value):
+        fingerprints = cache.FingerprintCache(self.project)
+        result = fingerprints.get('schemata/app.sql', lambda: value)
+        fingerprints.save()
+        return result, fingerprints.hits, fingerprints.misses
+
+    def test_hits_and_misses(self):
+        self.assertEqual(self.get(['a']), (['a'], 0, 1))
+        self.assertEqual(self.get(['b']), (['a'], 1, 0))
+        with open(path.join(self.tempdir.name,
+                            'schemata/app.sql'), 'a') as handle:
+            handle.write('\n')
+        self.assertEqual(self.get(['b']), (['b'], 0, 1))
+
+
+class DigestCacheTestCase(ProjectCacheTestCase):
+
+    def test_hits_and_misses(self):
+        digests = cache.DigestCache(self.project)
+        expectation = self.project.digest('schemata/app.sql')
+        self.assertEqual(digests.get('schemata/app.sql'), expectation)
+        digests.save()
+        digests = cache.DigestCache(self.project)
+        with mock.patch.object(self.project, 'digest') as digest:
+            self.assertEqual(digests.get('schemata/app.sql'), expectation)
+            digest.assert_not_called()
+        digests.discard('schemata/app.sql')
+        with mock.patch.object(self.project, 'digest',
+                               return_value='changed'):
+            self.assertEqual(digests.get('schemata/app.sql'), 'changed')
+
+
+class DumpCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dumps = cache.DumpCache(self.tempdir.name, 'host=db\ndbname=app')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def store(self, fingerprint, content):
+        temp_path = self.dumps.temp_path()
+        os.makedirs(temp_path)
+        with open(path.join(temp_path, 'toc.dat'), 'w') as handle:
+            handle.write(content)
+        return self.dumps.store(temp_path, fingerprint)
+
+    def test_lookup(self):
+        self.assertIsNone(self.dumps.lookup('a'))
+        dump_path = self.store('a', 'first')
+        self.assertEqual(self.dumps.lookup('a'), dump_path)
+        self.assertIsNone(self.dumps.lookup('b'))
+
+    def test_store_replaces(self):
+        self.store('a', 'first')
+        dump_path = self.store('b', 'second')
+        self.assertIsNone(self.dumps.lookup('a'))
+        self.assertEqual(self.dumps.lookup('b'), dump_path)
+        with open(path.join(dump_path, 'toc.dat')) as handle:
+            self.assertEqual(handle.read(), 'second')
+        self.assertEqual(sorted(os.listdir(self.tempdir.name)), [
+            path.basename(dump_path),
+            '{}.fingerprint'.format(path.basename(dump_path))])
+
+    def test_incomplete_dump(self):
+        dump_path = self.store('a', 'first')
+        os.unlink(path.join(dump_path, 'toc.dat'))
+        self.assertIsNone(self.dumps.lookup('a'))
+
+    def test_identity(self):
+        other = cache.DumpCache(self.tempdir.name, 'host=db\ndbname=other')
+        self.store('a', 'first')
+        self.assertIsNone(other.lookup('a'))
+
+
+class CatalogFingerprintTestCase(unittest.TestCase):
+
+    def fingerprint(self, rows):
+        conn = mock.MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = rows
+        value = catalog.fingerprint(conn)
+        cursor.execute.assert_called_once_with(catalog.FINGERPRINT)
+        conn.rollback.assert_called_once_with()
+        return value
+
+    def test_query(self):
+        self.assertIn('FROM pg_catalog.pg_roles', catalog.FINGERPRINT)
+        self.assertNotIn('ctid', catalog.FINGERPRINT)
+        for name in catalog.FINGERPRINT_CATALOGS:
+            self.assertIn('FROM pg_catalog.{}\n'.format(name),
+                          catalog.FINGERPRINT)
+
+    def test_fingerprint(self):
+        rows = [('130004', '16384'), ('pg_class', '412 1042 201553'),
+                ('pg_roles', 'b1946ac92492d2347c6235b4d2611184')]
+        value = self.fingerprint(rows)
+        self.assertEqual(self.fingerprint(list(reversed(rows))), value)
+        self.assertNotEqual(self.fingerprint(
+            rows[:2] + [('pg_roles', '591785b794601e212b260e25925636fd')]),
+            value)
@@ -0,0 +1,39 @@
+# coding=utf-8
+"""
+Tests for CLI startup
+
+"""
+import os
+from os import path
+import subprocess
+import sys
+import unittest
+
+PROJECT_PATH = path.dirname(path.dirname(path.abspath(__file__)))
+
+DEFERRED = ['pg_lifecycle.build', 'pg_lifecycle.deploy',
+            'pg_lifecycle.generate', 'pgdumplib', 'psycopg2']
+
+IMPORTED = """\
+import sys
+from pg_lifecycle import cli
+print(','.join(name for name in {!r} if name in sys.modules))
+""".format(DEFERRED)
+
+RUN = 'from pg_lifecycle import cli; cli.run()'
+
+
+class StartupTestCase(unittest.TestCase):
+    """The timing of startup is measured by benchmarks/startup.py"""
+
+    def execute(self, *arguments):
+        """Run the python interpreter, returning the output"""
+        return subprocess.check_output(
+            [sys.executable] + list(arguments),
+            env=dict(os.environ, PYTHONPATH=PROJECT_PATH)).decode('utf-8')
+
+    def test_dependencies_are_deferred(self):
+        self.assertEqual(self.execute('-c', IMPORTED).strip(), '')
+
+    def test_help(self):
+        self.assertIn('usage:', self.execute('-c', RUN, '--help'))
@@ -0,0 +1,187 @@
+# coding=utf-8
+import argparse
+import io
+import os
+from os import path
+import tempfile
+import unittest
+from unittest import mock
+
+from pg_lifecycle import compare, project
+
+from tests import utils
+
+SOURCE = [
+    (1, 'schemata/app.sql', 'CREATE SCHEMA app;\n', [], []),
+    (2, 'tables/app/a.sql', 'CREATE TABLE app.a ();\n', [], [1]),
+    (3, 'tables/app/b.sql', 'CREATE TABLE app.b ();\n', [], [1]),
+    (4, 'views/app/v.sql', 'CREATE VIEW app.v AS SELECT 1;\n', [], [2]),
+    (5, 'functions/app/f.sql', 'CREATE FUNCTION app.f() ...;\n', [], [1])]
+
+TARGET = [
+    (1, 'schemata/app.sql', 'CREATE SCHEMA app;\n', [], []),
+    (2, 'tables/app/a.sql', 'CREATE TABLE app.a ();\n', [], [1]),
+    (3, 'tables/app/b.sql', 'CREATE TABLE app.b (id integer);\n', [], [1]),
+    (4, 'views/app/v.sql', 'CREATE VIEW app.v AS SELECT 1;\n', [], [3]),
+    (6, 'tables/app/c.sql', 'CREATE TABLE app.c ();\n', [], [1]),
+    (7, 'sequences/app/s.sql', 'CREATE SEQUENCE app.s;\n', [], [1])]
+
+
+class CompareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.source = path.join(self.tempdir.name, 'source')
+        self.target = path.join(self.tempdir.name, 'target')
+        utils.write_project(self.source, SOURCE)
+        utils.write_project(self.target, TARGET)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def run_compare(self, source, target, no_cache=False):
+        output = io.StringIO()
+        with mock.patch.object(compare.sys, 'stdout', output):
+            compare.Compare(argparse.Namespace(
+                no_cache=no_cache, source=source, target=target)).run()
+        return output.getvalue()
+
+    def test_output(self):
+        self.assertEqual(self.run_compare(self.source, self.target), (
+            'removed\tfunctions/app/f.sql\n'
+            'added\tsequences/app/s.sql\n'
+            'changed\ttables/app/b.sql\n'
+            'added\ttables/app/c.sql\n'
+            'dependencies\tviews/app/v.sql\t+tables/app/b.sql '
+            '-tables/app/a.sql\n'))
+
+    def test_reversed(self):
+        self.assertEqual(self.run_compare(self.target, self.source), (
+            'added\tfunctions/app/f.sql\n'
+            'removed\tsequences/app/s.sql\n'
+            'changed\ttables/app/b.sql\n'
+            'removed\ttables/app/c.sql\n'
+            'dependencies\tviews/app/v.sql\t+tables/app/a.sql '
+            '-tables/app/b.sql\n'))
+
+    def test_unchanged(self):
+        with self.assertLogs('pg_lifecycle.compare', 'INFO') as logs:
+            self.assertEqual(self.run_compare(self.source, self.source), '')
+        self.assertIn('matches', logs.output[-1])
+
+    def test_no_cache(self):
+        self.run_compare(self.source, self.target, True)
+        for project_path in [self.source, self.target]:
+            self.assertFalse(path.exists(path.join(
+                project_path, '.pgl-cache', compare.CACHE_DIR)))
+
+    def test_missing_project(self):
+        with self.assertRaises(SystemExit) as context:
+            self.run_compare(self.source, path.join(self.tempdir.name, 'x'))
+        self.assertEqual(context.exception.code, 3)
+
+
+class TreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = self.tempdir.name
+        utils.write_project(self.project_path, SOURCE)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def load(self, use_cache=True):
+        value = compare.Tree(project.Project(self.project_path), use_cache)
+        try:
+            value.load()
+        finally:
+            value.project.close()
+        return value
+
+    def nodes(self):
+        return sorted(os.listdir(path.join(
+            self.project_path, '.pgl-cache', compare.CACHE_DIR, 'nodes')))
+
+    def write(self, file_path, content):
+        file_path = path.join(self.project_path, file_path)
+        with open(file_path, 'w') as handle:
+            handle.write(content)
+        stat = os.stat(file_path)
+        os.utime(file_path, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + 1000000000))
+
+    def test_tree(self):
+        value = self.load()
+        self.assertEqual(value.hashed, 5)
+        self.assertEqual(sorted(value.hashes), [
+            '', 'functions', 'functions/app', 'schemata', 'tables',
+            'tables/app', 'views', 'views/app'])
+        self.assertEqual(value.files('tables'), [
+            'tables/app/a.sql', 'tables/app/b.sql'])
+        self.assertEqual(value.children('views/app')['v.sql'][1],
+                         ['tables/app/a.sql'])
+        self.assertEqual(self.nodes(), sorted(
+            '{}.json'.format(digest) for digest in value.hashes.values()))
+
+    def test_cache_is_reused(self):
+        expectation = self.load().hashes
+        with mock.patch.object(project.Project, 'digest') as digest:
+            value = self.load()
+            digest.assert_not_called()
+        self.assertEqual(value.hashed, 0)
+        self.assertEqual(value.hashes, expectation)
+
+    def test_changed_file_is_refreshed(self):
+        before = self.load()
+        nodes = self.nodes()
+        self.write('tables/app/b.sql', 'CREATE TABLE app.b (id integer);\n')
+        value = self.load()
+        self.assertEqual(value.hashed, 1)
+        for directory in ['', 'tables', 'tables/app']:
+            self.assertNotEqual(value.hashes[directory],
+                                before.hashes[directory])
+        self.assertEqual(value.hashes['views/app'],
+                         before.hashes['views/app'])
+        self.assertNotIn('{}.json'.format(before.hashes['tables/app']),
+                         self.nodes())
+        self.assertEqual(len(self.nodes()), len(nodes))
+        self.assertEqual(self.load().hashes, value.hashes)
+
+    def test_touched_file_is_not_rehashed_twice(self):
+        before = self.load()
+        self.write('tables/app/b.sql', 'CREATE TABLE app.b ();\n')
+        self.assertEqual(self.load().hashed, 1)
+        value = self.load()
+        self.assertEqual(value.hashed, 0)
+        self.assertEqual(value.hashes, before.hashes)
+
+    def test_changed_manifest_is_rebuilt(self):
+        before = self.load()
+        utils.write_project(self.project_path, SOURCE[:4])
+        value = self.load()
+        self.assertNotIn('functions', value.hashes)
+        self.assertEqual(value.hashes['tables/app'],
+                         before.hashes['tables/app'])
+        self.assertNotIn('{}.json'.format(before.hashes['functions/app']),
+                         self.nodes())
+
+    def test_missing_nodes_are_rebuilt(self):
+        before = self.load()
+        os.unlink(path.join(
+            self.project_path, '.pgl-cache', compare.CACHE_DIR, 'nodes',
+            '{}.json'.format(before.hashes['tables/app'])))
+        self.write('tables/app/b.sql', 'CREATE TABLE app.b (id integer);\n')
+        with self.assertLogs('pg_lifecycle.compare', 'WARNING'):
+            value = self.load()
+        self.assertEqual(value.hashed, 5)
+        self.assertIn('{}.json'.format(value.hashes['tables/app']),
+                      self.nodes())
+
+    def test_missing_file(self):
+        os.unlink(path.join(self.project_path, 'views/app/v.sql'))
+        with self.assertLogs('pg_lifecycle.compare', 'WARNING'):
+            value = self.load(False)
+        self.assertIsNone(value.children('views/app')['v.sql'][0])
+        self.assertFalse(path.exists(path.join(
+            self.project_path, '.pgl-cache', compare.CACHE_DIR)))
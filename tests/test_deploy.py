@@ -0,0 +1,286 @@
+# coding=utf-8
+import argparse
+import gc
+import tempfile
+import unittest
+from unittest import mock
+
+import psycopg2
+from psycopg2 import errorcodes
+
+from pg_lifecycle import common, deploy, online
+
+
+class Cursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, statement, parameters=None):
+        self.conn.statements.append(
+            statement if parameters is None else
+            (statement, tuple(parameters)))
+        if self.conn.errors.get(statement):
+            raise self.conn.errors[statement].pop(0)
+        self.row = self.conn.rows.get(statement)
+
+    def fetchone(self):
+        return self.row
+
+
+class Connection:
+    """Records the statements executed on it, returning the row for each
+    query in ``rows`` and raising the next of the errors for a statement in
+    ``errors``.
+
+    """
+    def __init__(self, rows=None, errors=None):
+        self.autocommit = False
+        self.closed = 0
+        self.errors = errors if errors is not None else {}
+        self.rows = rows or {}
+        self.statements = []
+
+    def close(self):
+        self.closed = 1
+
+    def commit(self):
+        pass
+
+    def cursor(self):
+        return Cursor(self)
+
+    def rollback(self):
+        pass
+
+
+class Pool:
+    """Hands out idle connections, opening new ones as needed. The errors
+    are shared by the connections.
+
+    """
+    maxconn = 2
+
+    def __init__(self, rows=None, errors=None):
+        self.idle, self.opened = [], []
+        self.errors = errors if errors is not None else {}
+        self.rows = rows
+
+    def closeall(self):
+        self.idle = []
+
+    def getconn(self):
+        if self.idle:
+            return self.idle.pop()
+        conn = Connection(self.rows, self.errors)
+        self.opened.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        if close:
+            conn.close()
+        else:
+            self.idle.append(conn)
+
+
+class PrepareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.deploy = deploy.Deploy(argparse.Namespace(
+            lock_timeout=500, project=self.tempdir.name, role=None,
+            statement_timeout=None))
+        self.deploy.pool = Pool()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def apply(self, ddl):
+        self.deploy._apply(deploy.Task(
+            ddl, None, None, lambda: ddl, [], False, None))
+
+    def test_prepared_once(self):
+        self.apply('CREATE TABLE a ()')
+        self.apply('CREATE TABLE b ()')
+        self.assertEqual(self.deploy.pool.opened[0].statements, [
+            'SET lock_timeout = 500', 'CREATE TABLE a ()',
+            'CREATE TABLE b ()'])
+
+    def test_replaced_connection_is_prepared(self):
+        for offset in range(0, 20):
+            self.apply('CREATE TABLE t{} ()'.format(offset))
+            conn = self.deploy.pool.idle.pop()
+            self.deploy.pool.putconn(conn, close=True)
+            self.deploy.pool.opened = []
+            del conn
+            gc.collect()
+        self.apply('CREATE TABLE t ()')
+        self.assertEqual(self.deploy.pool.opened[0].statements, [
+            'SET lock_timeout = 500', 'CREATE TABLE t ()'])
+
+
+class OnlineTestCase(unittest.TestCase):
+
+    CONSTRAINT = ('ALTER TABLE ONLY app.t\n'
+                  '    ADD CONSTRAINT t_pkey PRIMARY KEY (id);\n')
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.deploy = deploy.Deploy(argparse.Namespace(
+            project=self.tempdir.name, role=None))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def apply(self, exists=False, invalid=False):
+        """Apply the online step for the primary key, returning the
+        statements executed.
+
+        """
+        self.deploy.pool = Pool({deploy.CONSTRAINT_EXISTS: (exists,),
+                                 deploy.INVALID_INDEX: (invalid,)})
+        steps, _validations = online.steps(common.CONSTRAINT,
+                                           self.CONSTRAINT)
+        self.assertEqual(len(steps), 1)
+        step = steps[0]
+        self.deploy._apply(deploy.Task(
+            step.phase, None, step.phase, lambda: step.ddl, [],
+            step.autocommit, step.index))
+        return self.deploy.pool.opened[0].statements
+
+    def test_add_constraint(self):
+        self.assertEqual(self.apply(), [
+            (deploy.INVALID_INDEX, ('app.t_pkey',)),
+            'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS t_pkey ON app.t '
+            '(id)',
+            (deploy.CONSTRAINT_EXISTS, ('app.t', 't_pkey')),
+            'ALTER TABLE ONLY app.t ADD CONSTRAINT t_pkey PRIMARY KEY USING '
+            'INDEX t_pkey'])
+
+    def test_existing_constraint(self):
+        self.assertEqual(self.apply(exists=True)[-1],
+                         (deploy.CONSTRAINT_EXISTS, ('app.t', 't_pkey')))
+
+    def test_invalid_index(self):
+        self.assertEqual(self.apply(invalid=True)[1:3], [
+            'DROP INDEX CONCURRENTLY app.t_pkey',
+            'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS t_pkey ON app.t '
+            '(id)'])
+
+    def test_not_valid_constraints_are_transactional(self):
+        steps, validations = online.steps(
+            common.FK_CONSTRAINT, 'ALTER TABLE ONLY app.t\n    ADD '
+            'CONSTRAINT t_fk FOREIGN KEY (id) REFERENCES app.u(id);\n')
+        self.assertEqual([step.autocommit for step in steps + validations],
+                         [False, False])
+
+
+class Error(psycopg2.Error):
+    """An error with the SQLSTATE the server would send"""
+
+    def __init__(self, pgcode):
+        super(Error, self).__init__('Error {}'.format(pgcode))
+        self._pgcode = pgcode
+
+    @property
+    def pgcode(self):
+        return self._pgcode
+
+
+class RetryTestCase(unittest.TestCase):
+    """Step ``a`` is applied first, step ``b`` depends upon it and step
+    ``c`` does not.
+
+    """
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.deploy = deploy.Deploy(argparse.Namespace(
+            dbname='app', host='localhost', port=5432,
+            project=self.tempdir.name, retries=3, role=None))
+        self.patches = [
+            mock.patch.object(deploy, 'RETRY_DELAY', 0.001),
+            mock.patch.object(deploy, 'RETRY_MAX_DELAY', 0.003),
+            mock.patch.object(deploy.random, 'uniform',
+                              side_effect=lambda low, high: high)]
+        for value in self.patches:
+            value.start()
+
+    def tearDown(self):
+        for value in self.patches:
+            value.stop()
+        self.tempdir.cleanup()
+
+    def execute(self, *errors):
+        """Apply the steps, raising the errors applying step ``a``, and
+        return the statements executed in order.
+
+        """
+        ddl = {name: 'CREATE TABLE {} ()'.format(name) for name in 'abc'}
+        self.deploy.pool = Pool(errors={
+            ddl['a']: [Error(value) for value in errors]})
+        self.deploy._execute([
+            deploy.Task('a', None, None, lambda: ddl['a'], set(), False,
+                        None),
+            deploy.Task('b', None, None, lambda: ddl['b'], {0}, False, None),
+            deploy.Task('c', None, None, lambda: ddl['c'], set(), False,
+                        None)])
+
+    def statements(self):
+        return sorted(statement for conn in self.deploy.pool.opened
+                      for statement in conn.statements)
+
+    def test_lock_timeouts_are_retried(self):
+        with self.assertLogs('pg_lifecycle.deploy', 'WARNING') as logs:
+            self.execute(errorcodes.LOCK_NOT_AVAILABLE,
+                         errorcodes.DEADLOCK_DETECTED)
+        self.assertEqual(self.statements(), [
+            'CREATE TABLE a ()', 'CREATE TABLE a ()', 'CREATE TABLE a ()',
+            'CREATE TABLE b ()', 'CREATE TABLE c ()'])
+        self.assertEqual(self.deploy.applied, 3)
+        self.assertEqual(self.deploy.retried, 2)
+        self.assertAlmostEqual(self.deploy.backoff, 0.003)
+        self.assertIn('(1 of 3)', logs.output[0])
+        self.assertIn('(2 of 3)', logs.output[1])
+
+    def test_dependents_wait_for_the_retry(self):
+        applied, apply = [], self.deploy._apply
+
+        def record(task):
+            apply(task)
+            applied.append(task.label)
+
+        with mock.patch.object(self.deploy, '_apply', record):
+            self.execute(errorcodes.LOCK_NOT_AVAILABLE)
+        self.assertEqual(sorted(applied), ['a', 'b', 'c'])
+        self.assertLess(applied.index('a'), applied.index('b'))
+
+    def test_delay_is_capped(self):
+        with mock.patch.object(self.deploy, 'retries', 5):
+            self.execute(*[errorcodes.LOCK_NOT_AVAILABLE] * 5)
+        self.assertAlmostEqual(self.deploy.backoff,
+                               0.001 + 0.002 + 0.003 * 3)
+
+    def test_other_errors_are_not_retried(self):
+        with self.assertRaises(SystemExit) as context:
+            self.execute(errorcodes.UNIQUE_VIOLATION)
+        self.assertEqual(context.exception.code, 3)
+        self.assertEqual(self.statements(), [
+            'CREATE TABLE a ()', 'CREATE TABLE c ()'])
+        self.assertEqual(self.deploy.retried, 0)
+
+    def test_retries_give_up(self):
+        with self.assertLogs('pg_lifecycle.deploy', 'ERROR'):
+            with self.assertRaises(SystemExit) as context:
+                self.execute(*[errorcodes.LOCK_NOT_AVAILABLE] * 4)
+        self.assertEqual(context.exception.code, 3)
+        self.assertEqual(self.statements(), [
+            'CREATE TABLE a ()', 'CREATE TABLE a ()', 'CREATE TABLE a ()',
+            'CREATE TABLE a ()', 'CREATE TABLE c ()'])
+        self.assertEqual(self.deploy.retried, 3)
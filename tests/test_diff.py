@@ -0,0 +1,307 @@
+# coding=utf-8
+import argparse
+import json
+from os import path
+import tempfile
+import unittest
+
+from pg_lifecycle import build, catalog, common, diff, filters, sql
+
+from tests import utils
+
+SEQUENCE = """\
+CREATE SEQUENCE app.accounts_id_seq
+    AS integer
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+"""
+
+TABLE = """\
+CREATE TABLE app.accounts (
+    id integer NOT NULL,
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    name text
+);
+"""
+
+NEXTVAL = "nextval('app.accounts_id_seq'::regclass)"
+
+
+def dump():
+    """Return the entries pg_dump writes for a table with a serial column
+    and an inline default.
+
+    """
+    value = utils.Dump()
+    schema = value.add(common.SCHEMA, 'app', 'CREATE SCHEMA app;\n')
+    table = value.add(common.TABLE, 'accounts', TABLE, 'app', [schema])
+    sequence = value.add(common.SEQUENCE, 'accounts_id_seq', SEQUENCE,
+                         'app', [schema])
+    value.add(common.SEQUENCE_OWNED_BY, 'accounts_id_seq',
+              'ALTER SEQUENCE app.accounts_id_seq OWNED BY '
+              'app.accounts.id;\n', 'app', [sequence])
+    value.add(common.DEFAULT, 'accounts id',
+              'ALTER TABLE ONLY app.accounts ALTER COLUMN id SET DEFAULT '
+              '{};\n'.format(NEXTVAL), 'app', [table, sequence])
+    value.add(common.CONSTRAINT, 'accounts accounts_pkey',
+              'ALTER TABLE ONLY app.accounts\n'
+              '    ADD CONSTRAINT accounts_pkey PRIMARY KEY (id);\n',
+              'app', [table], common.POST_DATA)
+    return value
+
+
+def snapshot(created_at='now()', extra=False, legacy=False):
+    """Return the catalog snapshot of the database the dump is of, with a
+    table in the app schema and a schema that are not in the dump if
+    ``extra`` is set and a column that is not in the dump if ``legacy`` is
+    set.
+
+    """
+    columns = [
+        ['id', 'integer', None, True, NEXTVAL, False, None, True],
+        ['created_at', 'timestamp with time zone', None, True,
+         created_at, False, None, False],
+        ['name', 'text', None, False, None, False, None, False]]
+    if legacy:
+        columns.append(
+            ['legacy', 'text', None, False, None, False, None, False])
+    objects = []
+    objects.extend(catalog._schemas({'name': 'app', 'comment': None}))
+    objects.extend(catalog._relations({
+        'kind': 'r', 'persistence': 'p', 'name': 'app.accounts',
+        'query': None, 'partition_key': None, 'owned_by': None,
+        'checks': None, 'comment': None, 'columns': columns}))
+    objects.extend(catalog._relations({
+        'kind': 'S', 'persistence': 'p', 'name': 'app.accounts_id_seq',
+        'sequence_type': 'integer', 'start': 1, 'increment': 1,
+        'minimum': 1, 'maximum': 2147483647, 'cache': 1, 'cycle': False,
+        'owned_by': 'app.accounts.id', 'columns': None, 'comment': None}))
+    objects.extend(catalog._constraints({
+        'kind': 'p', 'validated': True, 'table_name': 'app.accounts',
+        'table_kind': 'r', 'name': 'accounts_pkey',
+        'definition': 'PRIMARY KEY (id)', 'comment': None}))
+    if extra:
+        objects.extend(catalog._schemas({'name': 'other', 'comment': None}))
+        objects.extend(catalog._relations({
+            'kind': 'r', 'persistence': 'p', 'name': 'app.extra',
+            'query': None, 'partition_key': None, 'owned_by': None,
+            'checks': None, 'comment': None, 'columns': [
+                ['id', 'integer', None, False, None, False, None, False]]}))
+    return catalog.Snapshot(objects)
+
+
+class ColumnDefaultTestCase(unittest.TestCase):
+
+    def test_inline_default(self):
+        ddl = [value[0] for value in snapshot().objects.values()]
+        self.assertIn('    created_at timestamp with time zone DEFAULT now() '
+                      'NOT NULL,', ddl[1].splitlines())
+        self.assertIn('ALTER TABLE ONLY app.accounts ALTER COLUMN id SET '
+                      'DEFAULT {};'.format(NEXTVAL), ddl)
+        self.assertNotIn('created_at SET DEFAULT', '\n'.join(ddl))
+
+    def test_view_defaults_are_separate(self):
+        values = list(catalog._relations({
+            'kind': 'v', 'name': 'app.v', 'query': ' SELECT 1 AS a;',
+            'owned_by': None, 'comment': None, 'columns': [
+                ['a', 'integer', None, False, '0', False, None, False]]}))
+        self.assertEqual(values[1][0], 'ALTER TABLE ONLY app.v ALTER COLUMN '
+                                       'a SET DEFAULT 0;')
+
+    def test_table_default_is_parsed(self):
+        value = diff._table('app.t', 'CREATE TABLE app.t (a timestamp with '
+                            'time zone DEFAULT now() NOT NULL COLLATE "C")')
+        self.assertEqual(value[1][(None, 'a')],
+                         ('timestamp with time zone', ' NOT NULL',
+                          ' COLLATE "C"', 'now()', ''))
+
+    def test_table_default_changes(self):
+        self.assertEqual(diff.table_changes(
+            'app.t', 'CREATE TABLE app.t (a integer DEFAULT 1, b text)',
+            'CREATE TABLE app.t (a integer, b text DEFAULT \'x\' NOT NULL, '
+            'c integer DEFAULT 0 NOT NULL)'), [
+                'ALTER TABLE app.t ADD COLUMN c integer DEFAULT 0 NOT NULL',
+                'ALTER TABLE app.t ALTER COLUMN a DROP DEFAULT',
+                'ALTER TABLE app.t ALTER COLUMN b SET DEFAULT \'x\'',
+                'ALTER TABLE app.t ALTER COLUMN b SET NOT NULL'])
+
+
+class GeneratedColumnTestCase(unittest.TestCase):
+
+    def test_generated_column_is_parsed(self):
+        value = diff._table('app.t', 'CREATE TABLE app.t (a integer, b '
+                            'integer GENERATED ALWAYS AS ((a * 2)) STORED '
+                            'NOT NULL)')
+        self.assertEqual(value[1][(None, 'b')], (
+            'integer', ' NOT NULL', '', None,
+            ' GENERATED ALWAYS AS ((a * 2)) STORED'))
+
+    def test_identity_column_is_parsed(self):
+        value = diff._table('app.t', 'CREATE TABLE app.t (a bigint GENERATED '
+                            'BY DEFAULT AS IDENTITY (START WITH 10) NOT '
+                            'NULL)')
+        self.assertEqual(value[1][(None, 'a')], (
+            'bigint', ' NOT NULL', '', None,
+            ' GENERATED BY DEFAULT AS IDENTITY (START WITH 10)'))
+
+    def test_unparsed_clauses_are_refused(self):
+        self.assertIsNone(diff._table(
+            'app.t', 'CREATE TABLE app.t (a integer NOT NULL GENERATED '
+            'ALWAYS AS IDENTITY)'))
+
+    def test_type_change_of_generated_column(self):
+        self.assertEqual(diff.table_changes(
+            'app.t', 'CREATE TABLE app.t (a integer, b integer GENERATED '
+            'ALWAYS AS ((a * 2)) STORED)',
+            'CREATE TABLE app.t (a integer, b bigint GENERATED ALWAYS AS '
+            '((a * 2)) STORED)'), [
+                'ALTER TABLE app.t ALTER COLUMN b TYPE bigint'])
+
+    def test_add_generated_column(self):
+        self.assertEqual(diff.table_changes(
+            'app.t', 'CREATE TABLE app.t (a integer)',
+            'CREATE TABLE app.t (a integer, b integer GENERATED ALWAYS AS '
+            '((a * 2)) STORED)'), [
+                'ALTER TABLE app.t ADD COLUMN b integer GENERATED ALWAYS AS '
+                '((a * 2)) STORED'])
+
+    def test_changed_expression_is_refused(self):
+        for current, desired in [
+                ('b integer GENERATED ALWAYS AS ((a * 2)) STORED',
+                 'b integer GENERATED ALWAYS AS ((a * 3)) STORED'),
+                ('b integer', 'b integer GENERATED ALWAYS AS ((a * 2)) '
+                 'STORED'),
+                ('b integer GENERATED ALWAYS AS ((a * 2)) STORED',
+                 'b integer')]:
+            self.assertIsNone(diff.table_changes(
+                'app.t', 'CREATE TABLE app.t (a integer, {})'.format(current),
+                'CREATE TABLE app.t (a integer, {})'.format(desired)),
+                desired)
+
+    def test_add_identity(self):
+        self.assertEqual(diff.table_changes(
+            'app.t', 'CREATE TABLE app.t (a integer DEFAULT 0)',
+            'CREATE TABLE app.t (a integer GENERATED ALWAYS AS IDENTITY NOT '
+            'NULL)'), [
+                'ALTER TABLE app.t ALTER COLUMN a DROP DEFAULT',
+                'ALTER TABLE app.t ALTER COLUMN a SET NOT NULL',
+                'ALTER TABLE app.t ALTER COLUMN a ADD GENERATED ALWAYS AS '
+                'IDENTITY'])
+
+    def test_drop_identity(self):
+        self.assertEqual(diff.table_changes(
+            'app.t', 'CREATE TABLE app.t (a integer GENERATED ALWAYS AS '
+            'IDENTITY NOT NULL)',
+            'CREATE TABLE app.t (a bigint DEFAULT 0 NOT NULL)'), [
+                'ALTER TABLE app.t ALTER COLUMN a DROP IDENTITY',
+                'ALTER TABLE app.t ALTER COLUMN a TYPE bigint',
+                'ALTER TABLE app.t ALTER COLUMN a SET DEFAULT 0'])
+
+    def test_changed_identity_is_refused(self):
+        self.assertIsNone(diff.table_changes(
+            'app.t', 'CREATE TABLE app.t (a integer GENERATED ALWAYS AS '
+            'IDENTITY NOT NULL)',
+            'CREATE TABLE app.t (a integer GENERATED BY DEFAULT AS IDENTITY '
+            'NOT NULL)'))
+
+
+class DropColumnTestCase(unittest.TestCase):
+
+    CURRENT = 'CREATE TABLE app.t (a integer, b text)'
+    DESIRED = 'CREATE TABLE app.t (a integer)'
+
+    def test_column_is_not_dropped(self):
+        with self.assertLogs('pg_lifecycle.diff', 'WARNING') as logs:
+            self.assertEqual(
+                diff.table_changes('app.t', self.CURRENT, self.DESIRED), [])
+        self.assertIn('Not dropping column b of app.t', logs.output[0])
+
+    def test_column_is_dropped(self):
+        self.assertEqual(diff.table_changes(
+            'app.t', self.CURRENT, self.DESIRED, True), [
+                'ALTER TABLE app.t DROP COLUMN b'])
+
+
+class SnapshotDiffTestCase(unittest.TestCase):
+
+    SCOPE = {}
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = path.join(self.tempdir.name, 'project')
+        self.snapshot_path = path.join(self.tempdir.name, 'snapshot.json')
+        utils.generate_project(self.project_path, dump().reader(),
+                               **self.SCOPE)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def statements(self, value, allow_drop_columns=False):
+        value.save(self.snapshot_path)
+        builder = build.Build(argparse.Namespace(
+            allow_drop_columns=allow_drop_columns, diff=True, file='stdout',
+            no_cache=True, project=self.project_path,
+            snapshot=self.snapshot_path))
+        try:
+            return builder.diff().statements()
+        finally:
+            builder.project.close()
+
+    def test_unchanged_database(self):
+        self.assertEqual(self.statements(snapshot()), [])
+
+    def test_changed_default(self):
+        self.assertEqual(
+            self.statements(snapshot('pg_catalog.clock_timestamp()')),
+            ['ALTER TABLE app.accounts ALTER COLUMN created_at SET DEFAULT '
+             'now()'])
+
+    def test_removed_objects(self):
+        self.assertEqual(self.statements(snapshot(extra=True)), [
+            'DROP TABLE app.extra;', 'DROP SCHEMA other;'])
+
+    def test_removed_column(self):
+        with self.assertLogs('pg_lifecycle.diff', 'WARNING'):
+            self.assertEqual(self.statements(snapshot(legacy=True)), [])
+        self.assertEqual(self.statements(snapshot(legacy=True), True), [
+            'ALTER TABLE app.accounts DROP COLUMN legacy'])
+
+
+class SchemaScopeDiffTestCase(SnapshotDiffTestCase):
+
+    SCOPE = {'schema': ['app']}
+
+    def test_scope_is_stored(self):
+        with open(path.join(self.project_path, common.SCOPE)) as handle:
+            self.assertEqual(json.load(handle), {
+                'exclude_schema': [], 'exclude_table': [], 'schema': ['app'],
+                'table': []})
+
+    def test_removed_objects(self):
+        self.assertEqual(self.statements(snapshot(extra=True)), [
+            'DROP TABLE app.extra;'])
+
+
+class TableScopeDiffTestCase(unittest.TestCase):
+
+    def test_scope(self):
+        value = filters.Filter(argparse.Namespace(table=['app.accounts']))
+        for statement, expectation in [
+                ('CREATE SCHEMA app', False),
+                ('CREATE TABLE app.extra (id integer)', False),
+                ('CREATE SEQUENCE app.accounts_id_seq', False),
+                ('CREATE FUNCTION app.accounts() RETURNS integer', False),
+                ('CREATE TABLE app.accounts (id integer)', True),
+                ('CREATE INDEX accounts_idx ON app.accounts USING btree '
+                 '(id)', True),
+                ('COMMENT ON COLUMN app.accounts.id IS NULL', True),
+                ('CREATE TRIGGER accounts_trigger BEFORE INSERT ON '
+                 'app.accounts FOR EACH ROW EXECUTE PROCEDURE app.f()',
+                 True)]:
+            key = sql.classify(statement)
+            self.assertEqual(
+                value.covers(*diff.scope(key, statement)), expectation,
+                statement)
@@ -0,0 +1,85 @@
+# coding=utf-8
+import os
+from os import path
+import tempfile
+import unittest
+from unittest import mock
+
+from pg_lifecycle import common, dump, index
+
+from tests import utils
+
+
+class LazyReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dump_path = path.join(self.tempdir.name, 'dump')
+        self.dump = utils.benchmark('generate').tables(25)
+        self.dump.write(self.dump_path)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def expectation(self):
+        """Return the synthetic dump's entries as tuples of the dump_id, tag,
+        desc, section, definition, namespace and dependencies
+
+        """
+        return [tuple(value) for value in self.dump.entries]
+
+    def test_entries(self):
+        reader = dump.LazyReader(self.dump_path)
+        self.assertEqual(reader.server_version, '13.4')
+        values = []
+        for entry in reader.toc.entries:
+            if entry.defn:
+                self.assertIsInstance(entry.defn, dump.Definition)
+            values.append((
+                entry.dump_id, entry.tag, entry.desc, entry.section,
+                entry.defn.read() if entry.defn else '', entry.namespace,
+                entry.dependencies))
+        self.assertEqual(values, self.expectation())
+
+    def test_definitions_read_out_of_order(self):
+        reader = dump.LazyReader(self.dump_path)
+        toc_index = index.TOCIndex(reader.toc.entries)
+        expectation = {value[0]: value[4] for value in self.expectation()}
+        for entry in reversed(toc_index.select(
+                common.TABLE, common.CONSTRAINT, common.INDEX)):
+            self.assertEqual(entry.defn.read(), expectation[entry.dump_id])
+        self.assertEqual(len(toc_index.get(common.TABLE)), 25)
+        self.assertEqual(len(toc_index.get(common.FK_CONSTRAINT)), 24)
+
+    def test_streamed_project_matches(self):
+        streamed = path.join(self.tempdir.name, 'streamed')
+        loaded = path.join(self.tempdir.name, 'loaded')
+        utils.generate_project(streamed, None, streaming=True,
+                               from_dump=self.dump_path)
+        reader = dump.LazyReader(self.dump_path)
+        utils.generate_project(loaded, utils.Reader(
+            reader.dump_version, reader.server_version, utils.ToC(
+                [entry._replace(defn=entry.defn.read() if entry.defn
+                                else '') for entry in reader.toc.entries])))
+        self.assertEqual(files(streamed), files(loaded))
+
+    def test_unsupported_version(self):
+        with mock.patch.object(dump.pgdumplib, '__version__', '0.3.0'):
+            self.assertFalse(dump.supported())
+            with self.assertRaises(ValueError):
+                dump.LazyReader(self.dump_path)
+
+    def test_supported_version(self):
+        with mock.patch.object(dump.pgdumplib, '__version__', '0.2.1'):
+            self.assertTrue(dump.supported())
+
+
+def files(project_path):
+    """Return the content of each file in the project by path"""
+    values = {}
+    for dir_path, _dirs, names in os.walk(project_path):
+        for name in names:
+            file_path = path.join(dir_path, name)
+            with open(file_path, 'rb') as handle:
+                values[path.relpath(file_path, project_path)] = handle.read()
+    return values
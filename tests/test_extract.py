@@ -0,0 +1,189 @@
+# coding=utf-8
+import argparse
+import collections
+import json
+import os
+from os import path
+import shutil
+import subprocess
+import tempfile
+import unittest
+import uuid
+
+from pgdumplib import directory
+import psycopg2
+
+from pg_lifecycle import catalog, common, extract, sql
+
+from tests import utils
+
+FIXTURES = path.join(path.dirname(path.abspath(__file__)), 'fixtures')
+
+Column = collections.namedtuple('Column', ['name'])
+
+
+class Cursor:
+    """Returns the recorded results of the catalog queries"""
+
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.description = []
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query):
+        queries = {extract.ALIASES: 'aliases',
+                   extract.ATTRDEFS: 'attrdefs',
+                   extract.DEPENDENCIES: 'dependencies'}
+        if query == extract.DATABASE:
+            self.results = [tuple(self.fixture['database'])]
+        elif query == extract.UNSUPPORTED_QUERY:
+            self.results = [(label, 0) for label, _ in extract.UNSUPPORTED]
+        elif query in queries:
+            self.results = [tuple(row)
+                            for row in self.fixture[queries[query]]]
+        else:
+            name = [key for key, value in catalog.QUERIES.items()
+                    if value == query][0]
+            rows = self.fixture['catalog'][name]
+            self.description = [Column(key) for key in sorted(
+                rows[0] if rows else {'oid': None})]
+            self.results = [tuple(row[column.name]
+                                  for column in self.description)
+                            for row in rows]
+
+    def fetchall(self):
+        return self.results
+
+    def fetchone(self):
+        return self.results[0]
+
+
+class Connection:
+    """Stands in for the connection to the recorded database"""
+
+    def __init__(self, fixture):
+        self.fixture = fixture
+
+    def cursor(self):
+        return Cursor(self.fixture)
+
+    def rollback(self):
+        pass
+
+    def set_session(self, **kwargs):
+        pass
+
+
+def entries(reader):
+    """Return the entries of a table of contents keyed for comparison"""
+    return {(entry.desc, entry.namespace or '', entry.tag):
+            sql.normalize(entry.defn or '')
+            for entry in reader.toc.entries
+            if entry.desc not in {'DATABASE', 'DATABASE PROPERTIES'}}
+
+
+class ExtractorParityTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(path.join(FIXTURES, 'catalog.json'), 'r') as handle:
+            self.fixture = json.load(handle)
+        self.extractor = extract.Extractor(
+            Connection(self.fixture),
+            argparse.Namespace(no_owner=False, no_privileges=False))
+        self.expected = utils.Dump()
+        for desc, namespace, tag, defn in self.fixture['pg_dump']:
+            self.expected.add(desc, tag, defn, namespace)
+
+    def test_unsupported(self):
+        self.assertEqual(self.extractor.unsupported(), [])
+
+    def test_entries_match_pg_dump(self):
+        self.assertDictEqual(entries(self.extractor.extract()),
+                             entries(self.expected.reader()))
+
+    def test_inline_defaults(self):
+        values = entries(self.extractor.extract())
+        self.assertEqual(
+            [key for key in values if key[0] == common.DEFAULT],
+            [(common.DEFAULT, 'app', 'accounts id')])
+
+    def test_inline_default_dependencies(self):
+        self.fixture['dependencies'] = [
+            row for row in self.fixture['dependencies']
+            if row[:3] != ['pg_class', 16393, 'pg_type']]
+        self.extractor.extract()
+        keys = {entry.dump_id: (entry.desc, entry.tag)
+                for entry in self.extractor.toc.entries}
+        for entry in self.extractor.toc.entries:
+            if entry.desc == common.TABLE:
+                self.assertIn((common.TYPE, 'status'), [
+                    keys[dump_id] for dump_id in entry.dependencies])
+            elif entry.desc == common.DEFAULT:
+                self.assertEqual(
+                    sorted(keys[dump_id] for dump_id in entry.dependencies),
+                    [(common.SEQUENCE, 'accounts_id_seq'),
+                     (common.TABLE, 'accounts')])
+
+    def test_generated_table_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            utils.generate_project(tmpdir, self.extractor.extract())
+            with open(path.join(tmpdir, 'tables', 'app',
+                                'accounts.sql'), 'r') as handle:
+                content = handle.read()
+        self.assertIn("    status app.status DEFAULT 'active'::app.status "
+                      "NOT NULL,\n", content)
+        self.assertNotIn('ALTER COLUMN status SET DEFAULT', content)
+
+
+class ServerParityTestCase(unittest.TestCase):
+    """Compares the extractor with pg_dump for the fixture schema on the
+    server the libpq environment variables point to, if there is one.
+
+    """
+    def setUp(self):
+        if not shutil.which('pg_dump'):
+            raise unittest.SkipTest('pg_dump is not installed')
+        try:
+            self.admin = psycopg2.connect(
+                dbname=os.environ.get('PGDATABASE', 'postgres'),
+                connect_timeout=3)
+        except psycopg2.OperationalError as error:
+            raise unittest.SkipTest('No PostgreSQL server: {}'.format(
+                str(error).strip()))
+        self.admin.autocommit = True
+        self.dbname = 'pg_lifecycle_test_{}'.format(uuid.uuid4().hex[:8])
+        with self.admin.cursor() as cursor:
+            cursor.execute('CREATE DATABASE {}'.format(self.dbname))
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+        with self.admin.cursor() as cursor:
+            cursor.execute('DROP DATABASE {}'.format(self.dbname))
+            cursor.execute('DROP ROLE IF EXISTS pg_lifecycle_reader')
+        self.admin.close()
+
+    def test_entries_match_pg_dump(self):
+        conn = psycopg2.connect(dbname=self.dbname)
+        try:
+            conn.autocommit = True
+            with open(path.join(FIXTURES, 'extract.sql'), 'r') as handle, \
+                    conn.cursor() as cursor:
+                cursor.execute(handle.read())
+            conn.autocommit = False
+            extractor = extract.Extractor(conn, argparse.Namespace(
+                no_owner=False, no_privileges=False))
+            self.assertEqual(extractor.unsupported(), [])
+            actual = entries(extractor.extract())
+        finally:
+            conn.close()
+        dump_path = path.join(self.tempdir.name, 'dump')
+        subprocess.check_call(['pg_dump', '-Fd', '--schema-only', '-w',
+                               '-f', dump_path, self.dbname])
+        self.assertDictEqual(actual, entries(directory.Reader(dump_path)))
@@ -0,0 +1,213 @@
+# coding=utf-8
+import argparse
+import unittest
+
+from pg_lifecycle import common, filters
+
+from tests import utils
+
+
+def dump():
+    """Return the entries of a dump with two schemas, one of them mixed
+    case, and the objects attached to the tables.
+
+    """
+    value = utils.Dump()
+    value.add(common.ENCODING, 'ENCODING', "SET client_encoding = 'UTF8';\n")
+    app = value.add(common.SCHEMA, 'app', 'CREATE SCHEMA app;\n')
+    other = value.add(common.SCHEMA, 'Other', 'CREATE SCHEMA "Other";\n')
+    value.add(common.COMMENT, 'SCHEMA app', "COMMENT ON SCHEMA app IS 'x';\n",
+              '', [app])
+    accounts = value.add(common.TABLE, 'accounts',
+                         'CREATE TABLE app.accounts (id integer);\n', 'app',
+                         [app])
+    users = value.add(common.TABLE, 'users',
+                      'CREATE TABLE app.users (id integer);\n', 'app', [app])
+    value.add(common.TABLE, 'Mixed',
+              'CREATE TABLE "Other"."Mixed" (id integer);\n', 'Other',
+              [other])
+    sequence = value.add(common.SEQUENCE, 'accounts_id_seq',
+                         'CREATE SEQUENCE app.accounts_id_seq;\n', 'app',
+                         [app])
+    function = value.add(common.FUNCTION, 'audit()',
+                         'CREATE FUNCTION app.audit() ...;\n', 'app', [app])
+    value.add(common.DEFAULT, 'accounts id',
+              'ALTER TABLE ONLY app.accounts ALTER COLUMN id SET DEFAULT '
+              "nextval('app.accounts_id_seq'::regclass);\n", 'app',
+              [accounts, sequence])
+    value.add(common.CONSTRAINT, 'accounts accounts_pkey',
+              'ALTER TABLE ONLY app.accounts ADD CONSTRAINT accounts_pkey '
+              'PRIMARY KEY (id);\n', 'app', [accounts], common.POST_DATA)
+    value.add(common.INDEX, 'users_id_idx',
+              'CREATE INDEX users_id_idx ON app.users USING btree (id);\n',
+              'app', [users], common.POST_DATA)
+    value.add(common.COMMENT, 'TABLE accounts',
+              "COMMENT ON TABLE app.accounts IS 'x';\n", 'app', [accounts])
+    value.add(common.TRIGGER, 'accounts audit',
+              'CREATE TRIGGER audit AFTER INSERT ON app.accounts FOR EACH '
+              'ROW EXECUTE FUNCTION app.audit();\n', 'app',
+              [accounts, function], common.POST_DATA)
+    return value
+
+
+class PatternTestCase(unittest.TestCase):
+
+    def matches(self, value, namespace, name):
+        return filters._matches([filters.pattern(value)], namespace, name)
+
+    def test_wildcards(self):
+        self.assertTrue(self.matches('acc*', 'app', 'accounts'))
+        self.assertTrue(self.matches('user?', 'app', 'users'))
+        self.assertFalse(self.matches('user?', 'app', 'user'))
+        self.assertFalse(self.matches('acc', 'app', 'accounts'))
+
+    def test_case_folding(self):
+        self.assertTrue(self.matches('ACCOUNTS', 'app', 'accounts'))
+        self.assertFalse(self.matches('Mixed', 'Other', 'Mixed'))
+        self.assertTrue(self.matches('"Mixed"', 'Other', 'Mixed'))
+        self.assertTrue(self.matches('"Mi"xed', 'Other', 'Mixed'))
+
+    def test_quoting(self):
+        self.assertTrue(self.matches('"acc*"', 'app', 'acc*'))
+        self.assertFalse(self.matches('"acc*"', 'app', 'accounts'))
+        self.assertTrue(self.matches('"a""b"', 'app', 'a"b'))
+        self.assertTrue(self.matches('"a.b"', 'app', 'a.b'))
+
+    def test_schema(self):
+        schema, name = filters.pattern('app.accounts')
+        self.assertTrue(schema.match('app'))
+        self.assertTrue(name.match('accounts'))
+        self.assertIsNone(filters.pattern('accounts')[0])
+        self.assertTrue(self.matches('app.acc*', 'app', 'accounts'))
+        self.assertFalse(self.matches('app.acc*', 'other', 'accounts'))
+        self.assertFalse(self.matches('app.acc*', None, 'accounts'))
+        self.assertTrue(self.matches('"Other".*', 'Other', 'Mixed'))
+        self.assertTrue(self.matches('*.accounts', 'app', 'accounts'))
+
+    def test_database_is_ignored(self):
+        schema, name = filters.pattern('db.app.accounts')
+        self.assertTrue(schema.match('app'))
+        self.assertTrue(name.match('accounts'))
+
+    def test_normalize_type(self):
+        self.assertEqual(filters.normalize_type('materialized_view'),
+                         common.MATERIALIZED_VIEW)
+        self.assertEqual(filters.normalize_type('fk  constraint'),
+                         common.FK_CONSTRAINT)
+
+
+class SelectTestCase(unittest.TestCase):
+
+    def select(self, dumped=False, **kwargs):
+        value = filters.Filter(argparse.Namespace(**kwargs))
+        return [(entry.desc, entry.namespace, entry.tag)
+                for entry in value.select(dump().entries, dumped)]
+
+    def test_inactive(self):
+        self.assertEqual(len(self.select()), len(dump().entries))
+
+    def test_schema(self):
+        self.assertEqual(self.select(schema=['app']), [
+            (common.ENCODING, '', 'ENCODING'),
+            (common.SCHEMA, '', 'app'),
+            (common.COMMENT, '', 'SCHEMA app'),
+            (common.TABLE, 'app', 'accounts'),
+            (common.TABLE, 'app', 'users'),
+            (common.SEQUENCE, 'app', 'accounts_id_seq'),
+            (common.FUNCTION, 'app', 'audit()'),
+            (common.DEFAULT, 'app', 'accounts id'),
+            (common.CONSTRAINT, 'app', 'accounts accounts_pkey'),
+            (common.INDEX, 'app', 'users_id_idx'),
+            (common.COMMENT, 'app', 'TABLE accounts'),
+            (common.TRIGGER, 'app', 'accounts audit')])
+
+    def test_schema_case_folding(self):
+        self.assertEqual(self.select(schema=['Other']), [
+            (common.ENCODING, '', 'ENCODING')])
+        self.assertEqual(self.select(schema=['"Other"']), [
+            (common.ENCODING, '', 'ENCODING'),
+            (common.SCHEMA, '', 'Other'),
+            (common.TABLE, 'Other', 'Mixed')])
+
+    def test_excluded_schema(self):
+        self.assertNotIn((common.COMMENT, '', 'SCHEMA app'),
+                         self.select(exclude_schema=['app']))
+        self.assertEqual(self.select(exclude_schema=['app']), [
+            (common.ENCODING, '', 'ENCODING'),
+            (common.SCHEMA, '', 'Other'),
+            (common.TABLE, 'Other', 'Mixed')])
+
+    def test_children_follow_their_relation(self):
+        self.assertEqual(self.select(table=['app.accounts']), [
+            (common.ENCODING, '', 'ENCODING'),
+            (common.TABLE, 'app', 'accounts'),
+            (common.DEFAULT, 'app', 'accounts id'),
+            (common.CONSTRAINT, 'app', 'accounts accounts_pkey'),
+            (common.COMMENT, 'app', 'TABLE accounts'),
+            (common.TRIGGER, 'app', 'accounts audit')])
+
+    def test_children_of_an_excluded_relation(self):
+        values = self.select(schema=['app'], exclude_table=['accounts'])
+        self.assertIn((common.TABLE, 'app', 'users'), values)
+        self.assertIn((common.INDEX, 'app', 'users_id_idx'), values)
+        self.assertIn((common.DEFAULT, 'app', 'accounts id'), values)
+        for value in [(common.TABLE, 'app', 'accounts'),
+                      (common.CONSTRAINT, 'app', 'accounts accounts_pkey'),
+                      (common.COMMENT, 'app', 'TABLE accounts'),
+                      (common.TRIGGER, 'app', 'accounts audit')]:
+            self.assertNotIn(value, values)
+
+    def test_attached_object_type(self):
+        self.assertEqual(self.select(object_type=['constraint', 'index']), [
+            (common.ENCODING, '', 'ENCODING'),
+            (common.CONSTRAINT, 'app', 'accounts accounts_pkey'),
+            (common.INDEX, 'app', 'users_id_idx')])
+
+    def test_excluded_attached_object_type(self):
+        values = self.select(schema=['app'], exclude_object_type=['comment'])
+        self.assertIn((common.TABLE, 'app', 'accounts'), values)
+        self.assertNotIn((common.COMMENT, '', 'SCHEMA app'), values)
+        self.assertNotIn((common.COMMENT, 'app', 'TABLE accounts'), values)
+
+    def test_object(self):
+        self.assertEqual(self.select(object=['app.users']), [
+            (common.ENCODING, '', 'ENCODING'),
+            (common.TABLE, 'app', 'users'),
+            (common.INDEX, 'app', 'users_id_idx')])
+
+    def test_dumped(self):
+        self.assertEqual(
+            self.select(True, schema=['app'], table=['app.accounts']),
+            self.select())
+        self.assertEqual(self.select(True, table=['app.accounts'],
+                                     exclude_object_type=['table']), [
+            (common.ENCODING, '', 'ENCODING'),
+            (common.SCHEMA, '', 'app'),
+            (common.SCHEMA, '', 'Other'),
+            (common.COMMENT, '', 'SCHEMA app'),
+            (common.SEQUENCE, 'app', 'accounts_id_seq'),
+            (common.FUNCTION, 'app', 'audit()'),
+            (common.DEFAULT, 'app', 'accounts id')])
+
+
+class ScopeTestCase(unittest.TestCase):
+
+    def test_covers(self):
+        value = filters.Filter(argparse.Namespace(
+            schema=['app'], exclude_table=['app.users']))
+        self.assertTrue(value.covers('app', None))
+        self.assertTrue(value.covers('app', 'accounts'))
+        self.assertFalse(value.covers('app', 'users'))
+        self.assertFalse(value.covers('other', None))
+        self.assertFalse(value.covers(None, None))
+
+    def test_dump_options(self):
+        value = filters.Filter(argparse.Namespace(
+            schema=['app'], exclude_schema=['tmp*'], table=['app.t'],
+            exclude_table=['"Mixed"'], object=['f']))
+        self.assertEqual(value.dump_options(), [
+            '--schema=app', '--exclude-schema=tmp*', '--table=app.t',
+            '--exclude-table="Mixed"'])
+        self.assertEqual(value.scope(), {
+            'exclude_schema': ['tmp*'], 'exclude_table': ['"Mixed"'],
+            'schema': ['app'], 'table': ['app.t']})
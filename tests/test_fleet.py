@@ -0,0 +1,268 @@
+# coding=utf-8
+import argparse
+import collections
+from concurrent import futures
+import io
+import json
+import os
+from os import path
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from pg_lifecycle import fleet, writer
+
+from tests import utils
+
+PROJECTS = {
+    'tenant_1': {'schemata/app.sql': 'CREATE SCHEMA app;\n',
+                 'tables/app/t.sql': 'CREATE TABLE app.t ();\n',
+                 'views/app/v.sql': 'CREATE VIEW app.v AS SELECT 1;\n'},
+    'tenant_2': {'schemata/app.sql': 'CREATE SCHEMA app;\n',
+                 'tables/app/t.sql': 'CREATE TABLE app.t ();\n',
+                 'views/app/v.sql': 'CREATE VIEW app.v AS SELECT 1;\n',
+                 'tables/app/extra.sql': 'CREATE TABLE app.extra ();\n'},
+    'tenant_3': {'schemata/app.sql': 'CREATE SCHEMA app;\n',
+                 'tables/app/t.sql': 'CREATE TABLE app.t (id integer);\n'}}
+
+
+class Generate:
+    """Writes the files of the database's project, failing for databases
+    that are not in ``PROJECTS``.
+
+    """
+    def __init__(self, args):
+        self.args = args
+
+    def run(self):
+        if self.args.dbname == 'exits':
+            raise SystemExit(3)
+        elif self.args.dbname not in PROJECTS:
+            raise RuntimeError('could not connect')
+        for file_path, content in PROJECTS[self.args.dbname].items():
+            file_path = path.join(self.args.dest[0], file_path)
+            os.makedirs(path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w') as handle:
+                handle.write(content)
+
+
+class Deploy:
+    """Records the databases that are deployed to at once, failing for the
+    databases named ``exits`` and ``broken`` and applying nothing to the
+    database named ``unchanged``.
+
+    """
+    lock = threading.Lock()
+    running = collections.Counter()
+    peak = collections.Counter()
+    started = []
+
+    def __init__(self, args, plan):
+        self.args = args
+        self.plan = plan
+        self.applied, self.retried = 0, 0
+        self.journal = None
+
+    @classmethod
+    def reset(cls):
+        cls.running.clear()
+        cls.peak.clear()
+        del cls.started[:]
+
+    def run(self):
+        host = self.args.host
+        with self.lock:
+            self.started.append((self.args.dbname, self.args.jobs))
+            self.running[host] += 1
+            self.running[None] += 1
+            for key in [host, None]:
+                self.peak[key] = max(self.peak[key], self.running[key])
+        try:
+            time.sleep(0.05)
+            if self.args.dbname == 'exits':
+                raise SystemExit(3)
+            elif self.args.dbname == 'broken':
+                raise RuntimeError('could not connect')
+            elif self.args.dbname != 'unchanged':
+                self.applied, self.retried = 2, 1
+                self.journal = mock.Mock(skipped=3)
+        finally:
+            with self.lock:
+                self.running[host] -= 1
+                self.running[None] -= 1
+
+
+class GenerateFleetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dest = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def run_fleet(self, databases, no_hardlinks=False):
+        args = argparse.Namespace(
+            databases=databases, databases_file=None, dbname='postgres',
+            dest=[self.dest], host='localhost', jobs=2,
+            no_hardlinks=no_hardlinks, port=5432, username='postgres')
+        with mock.patch.object(fleet.futures, 'ProcessPoolExecutor',
+                               futures.ThreadPoolExecutor), \
+                mock.patch.object(fleet.generate, 'Generate', Generate):
+            fleet.Fleet(args).run()
+
+    def file_path(self, name, file_path):
+        return path.join(self.dest, name, file_path)
+
+    def summary(self):
+        with open(path.join(self.dest, fleet.SUMMARY)) as handle:
+            return json.load(handle)
+
+    def test_summary(self):
+        self.run_fleet(sorted(PROJECTS))
+        self.assertEqual(self.summary(), {
+            'projects': 3, 'divergent': 2, 'files': 9, 'unique': 5,
+            'failed': [], 'diverges': {
+                'tenant_2': {'divergent': [], 'missing': [],
+                             'extra': ['tables/app/extra.sql']},
+                'tenant_3': {'divergent': ['tables/app/t.sql'],
+                             'missing': ['views/app/v.sql'], 'extra': []}}})
+
+    def test_identical_files_are_linked(self):
+        self.run_fleet(sorted(PROJECTS))
+        for name in ['tenant_2', 'tenant_3']:
+            self.assertTrue(path.samefile(
+                self.file_path('tenant_1', 'schemata/app.sql'),
+                self.file_path(name, 'schemata/app.sql')))
+        self.assertFalse(path.samefile(
+            self.file_path('tenant_1', 'tables/app/t.sql'),
+            self.file_path('tenant_3', 'tables/app/t.sql')))
+
+    def test_writing_a_linked_file_does_not_change_the_others(self):
+        self.run_fleet(sorted(PROJECTS))
+        value = writer.Writer(path.join(self.dest, 'tenant_2'))
+        value._write((self.file_path('tenant_2', 'schemata/app.sql'),
+                      'CREATE SCHEMA app2;\n'))
+        for name, expectation in [('tenant_1', 'CREATE SCHEMA app;\n'),
+                                  ('tenant_2', 'CREATE SCHEMA app2;\n'),
+                                  ('tenant_3', 'CREATE SCHEMA app;\n')]:
+            with open(self.file_path(name, 'schemata/app.sql')) as handle:
+                self.assertEqual(handle.read(), expectation)
+
+    def test_no_hardlinks(self):
+        self.run_fleet(sorted(PROJECTS), True)
+        self.assertFalse(path.samefile(
+            self.file_path('tenant_1', 'schemata/app.sql'),
+            self.file_path('tenant_2', 'schemata/app.sql')))
+
+    def test_failed_databases(self):
+        with self.assertRaises(SystemExit) as context:
+            self.run_fleet(['exits', 'tenant_1', 'broken', 'tenant_2'])
+        self.assertEqual(context.exception.code, 3)
+        summary = self.summary()
+        self.assertEqual(summary['failed'], ['broken', 'exits'])
+        self.assertEqual(summary['projects'], 2)
+        self.assertTrue(path.exists(
+            self.file_path('tenant_2', 'views/app/v.sql')))
+
+    def test_no_databases(self):
+        with self.assertRaises(SystemExit) as context:
+            self.run_fleet([])
+        self.assertEqual(context.exception.code, 2)
+
+
+class FleetDeployTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        utils.write_project(self.tempdir.name, [
+            (1, 'schemata/app.sql', 'CREATE SCHEMA app;\n', [], [])])
+        Deploy.reset()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def deploy(self, databases, concurrency=8, fail_fast=False,
+               host_connections=None, jobs=2):
+        """Deploy to the databases, returning the report written"""
+        args = argparse.Namespace(
+            concurrency=concurrency, databases=databases,
+            databases_file=None, dbname='postgres', diff=False,
+            fail_fast=fail_fast, host='localhost',
+            host_connections=host_connections, jobs=jobs, no_cache=True,
+            port=5432, project=self.tempdir.name, username='postgres')
+        output = io.StringIO()
+        with mock.patch.object(fleet.deploy, 'Deploy', Deploy), \
+                mock.patch.object(fleet.sys, 'stdout', output):
+            try:
+                fleet.FleetDeploy(args).run()
+            finally:
+                self.output = output.getvalue()
+
+    def results(self):
+        return [line.split()[2:4] for line in self.output.splitlines()[1:]]
+
+    def test_concurrency(self):
+        self.deploy(['d{}'.format(offset) for offset in range(0, 6)],
+                    concurrency=2)
+        self.assertEqual(Deploy.peak[None], 2)
+        self.assertEqual(len(Deploy.started), 6)
+        self.assertEqual(self.results(), [['deployed', '2']] * 6)
+
+    def test_host_connections(self):
+        databases = ['host={} dbname=d{}'.format(host, offset)
+                     for offset in range(0, 4) for host in ['a', 'b']]
+        self.deploy(databases, host_connections=5, jobs=2)
+        self.assertEqual(Deploy.peak['a'], 2)
+        self.assertEqual(Deploy.peak['b'], 2)
+        self.assertEqual(Deploy.peak[None], 4)
+        self.assertEqual(len(Deploy.started), 8)
+
+    def test_host_connections_cap_jobs(self):
+        self.deploy(['d1', 'd2', 'd3'], host_connections=3, jobs=8)
+        self.assertEqual(Deploy.peak[None], 1)
+        self.assertEqual(sorted(Deploy.started),
+                         [('d1', 3), ('d2', 3), ('d3', 3)])
+
+    def test_failures(self):
+        with self.assertLogs('pg_lifecycle.fleet', 'ERROR'):
+            with self.assertRaises(SystemExit) as context:
+                self.deploy(['exits', 'd1', 'broken', 'unchanged'],
+                            concurrency=1)
+        self.assertEqual(context.exception.code, 3)
+        self.assertEqual(self.results(), [
+            ['failed', '0'], ['deployed', '2'], ['failed', '0'],
+            ['unchanged', '0']])
+
+    def test_fail_fast(self):
+        with self.assertLogs('pg_lifecycle', 'ERROR') as logs:
+            with self.assertRaises(SystemExit) as context:
+                self.deploy(['d1', 'exits', 'd2', 'd3'], concurrency=1,
+                            fail_fast=True)
+        self.assertEqual(context.exception.code, 3)
+        self.assertIn('Failed to deploy to 1 of 4 databases, 2 not started',
+                      logs.output[-1])
+        self.assertEqual([value[0] for value in Deploy.started],
+                         ['d1', 'exits'])
+        self.assertEqual(self.results(), [
+            ['deployed', '2'], ['failed', '0'], ['not', 'started'],
+            ['not', 'started']])
+
+    def test_report(self):
+        output = io.StringIO()
+        with mock.patch.object(fleet.sys, 'stdout', output):
+            fleet.FleetDeploy(argparse.Namespace(
+                host_connections=None, jobs=4)).report([
+                    fleet.Result('app', 'localhost:5432/app',
+                                 fleet.DEPLOYED, 12, 3, 1, 1.5),
+                    fleet.Result('tenant_10', 'db:6432/tenant_10',
+                                 fleet.NOT_STARTED, 0, 0, 0, 0.0)])
+        self.assertEqual(output.getvalue(), (
+            'DATABASE   SERVER              RESULT       APPLIED  SKIPPED  '
+            'RETRIES  SECONDS\n'
+            'app        localhost:5432/app  deployed          12        3  '
+            '      1     1.50\n'
+            'tenant_10  db:6432/tenant_10   not started        0        0  '
+            '      0     0.00\n'))
@@ -0,0 +1,175 @@
+# coding=utf-8
+import argparse
+import os
+from os import path
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pg_lifecycle import build, common, generate, manifest
+
+from tests import utils
+
+NEXTVAL = "nextval('app.accounts_id_seq'::regclass)"
+
+SCHEMAS = ['schema_0', 'schema_1', 'schema_2']
+
+
+class ChildLayoutTestCase(unittest.TestCase):
+    """A column default that depends on both its table and its sequence is
+    bundled with the first of them that is generated, the sequence, which
+    is ordered after the table.
+
+    """
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = path.join(self.tempdir.name, 'project')
+        dump = utils.Dump()
+        schema = dump.add(common.SCHEMA, 'app', 'CREATE SCHEMA app;\n')
+        self.table = dump.add(
+            common.TABLE, 'accounts',
+            'CREATE TABLE app.accounts (\n    id integer NOT NULL\n);\n',
+            'app', [schema])
+        self.sequence = dump.add(
+            common.SEQUENCE, 'accounts_id_seq',
+            'CREATE SEQUENCE app.accounts_id_seq AS integer;\n', 'app',
+            [schema])
+        self.default = dump.add(
+            common.DEFAULT, 'accounts id',
+            'ALTER TABLE ONLY app.accounts ALTER COLUMN id SET DEFAULT '
+            '{};\n'.format(NEXTVAL), 'app', [self.table, self.sequence])
+        self.comment = dump.add(
+            common.COMMENT, 'TABLE accounts',
+            "COMMENT ON TABLE app.accounts IS 'Accounts';\n", 'app',
+            [self.table])
+        utils.generate_project(self.project_path, dump.reader())
+        self.manifest = manifest.Manifest.open(
+            path.join(self.project_path, common.MANIFEST))
+
+    def tearDown(self):
+        self.manifest.close()
+        self.tempdir.cleanup()
+
+    def read(self, file_path):
+        with open(path.join(self.project_path, file_path)) as handle:
+            return handle.read()
+
+    def test_child_is_bundled_once(self):
+        sequence = self.manifest.get(self.sequence)
+        table = self.manifest.get(self.table)
+        self.assertEqual(sequence.path, 'sequences/app/accounts_id_seq.sql')
+        self.assertEqual(sequence.includes, (self.default,))
+        self.assertEqual(table.includes, (self.comment,))
+        self.assertIn('SET DEFAULT', self.read(sequence.path))
+        self.assertNotIn('SET DEFAULT', self.read(table.path))
+
+    def test_child_dependencies_are_added_to_the_file(self):
+        self.assertIn(self.table,
+                      self.manifest.get(self.sequence).dependencies)
+
+    def test_build_order(self):
+        output_path = path.join(self.tempdir.name, 'output.sql')
+        build.Build(argparse.Namespace(
+            diff=False, file=output_path, no_cache=True,
+            project=self.project_path)).run()
+        with open(output_path) as handle:
+            value = handle.read()
+        self.assertEqual(value.count('SET DEFAULT'), 1)
+        self.assertLess(value.index('CREATE TABLE app.accounts'),
+                        value.index('SET DEFAULT'))
+        self.assertLess(value.index('CREATE SEQUENCE'),
+                        value.index('SET DEFAULT'))
+
+
+class PrepareDumpTestCase(unittest.TestCase):
+    """pg_dump is not run, the database is dumped by copying a synthetic
+    dump written by benchmarks/generate.py.
+
+    """
+    FINGERPRINT = 'a'
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.source = path.join(self.tempdir.name, 'source')
+        self.project_path = path.join(self.tempdir.name, 'project')
+        self.temp_path = path.join(self.tempdir.name, 'tmp')
+        os.makedirs(self.temp_path)
+        utils.benchmark('generate').tables(3).write(self.source)
+        self.dumped = []
+        self.patches = [
+            mock.patch.object(common, 'DUMP_CACHE_DIR',
+                              path.join(self.tempdir.name, 'dumps')),
+            mock.patch.object(generate.tempfile, 'gettempdir',
+                              return_value=self.temp_path),
+            mock.patch.object(generate.Generate, '_catalog_fingerprint',
+                              lambda _self: self.FINGERPRINT),
+            mock.patch.object(generate.Generate, '_dump_database',
+                              lambda generator: self.dump(generator)),
+            mock.patch.object(generate.Generate, '_pg_dump_version',
+                              return_value='pg_dump (PostgreSQL) 13.4')]
+        for value in self.patches:
+            value.start()
+
+    def tearDown(self):
+        for value in self.patches:
+            value.stop()
+        self.tempdir.cleanup()
+
+    def dump(self, generator):
+        self.dumped.append(generator.dump_path)
+        shutil.copytree(self.source, generator.dump_path)
+        generator.filtered_dump = True
+
+    def generate(self, **kwargs):
+        values = {'dbname': 'app', 'host': 'localhost', 'port': 5432,
+                  'streaming': True, 'username': 'postgres'}
+        values.update(kwargs)
+        if path.exists(self.project_path):
+            shutil.rmtree(self.project_path)
+        utils.generate_project(self.project_path, None, **values)
+
+    def tables(self):
+        return sorted(os.listdir(path.join(self.project_path, 'tables')))
+
+    def test_from_dump(self):
+        self.generate(from_dump=self.source)
+        self.assertEqual(self.dumped, [])
+        self.assertEqual(self.tables(), SCHEMAS)
+        self.assertTrue(path.isfile(path.join(self.source, 'toc.dat')))
+
+    def test_from_dump_is_not_a_dump(self):
+        with self.assertRaises(SystemExit) as context:
+            self.generate(from_dump=self.temp_path)
+        self.assertEqual(context.exception.code, 3)
+        self.assertEqual(self.dumped, [])
+
+    def test_temporary_dump_is_removed(self):
+        self.generate()
+        self.assertEqual(len(self.dumped), 1)
+        self.assertEqual(path.dirname(self.dumped[0]), self.temp_path)
+        self.assertEqual(self.tables(), SCHEMAS)
+        self.assertEqual(os.listdir(self.temp_path), [])
+
+    def test_temporary_dump_is_removed_on_failure(self):
+        with mock.patch.object(generate.Generate, '_generate_ddl',
+                               side_effect=RuntimeError('failed')):
+            with self.assertRaises(RuntimeError):
+                self.generate()
+        self.assertEqual(len(self.dumped), 1)
+        self.assertEqual(os.listdir(self.temp_path), [])
+
+    def test_dump_cache(self):
+        self.generate(dump_cache=True)
+        self.generate(dump_cache=True)
+        self.assertEqual(len(self.dumped), 1)
+        self.assertEqual(self.tables(), SCHEMAS)
+        self.FINGERPRINT = 'b'
+        self.generate(dump_cache=True)
+        self.assertEqual(len(self.dumped), 2)
+        self.assertEqual(path.dirname(self.dumped[1]), path.join(
+            self.tempdir.name, 'dumps'))
+        self.assertFalse(path.exists(self.dumped[1]))
+        self.assertEqual(os.listdir(self.temp_path), [])
+        self.assertEqual(len(os.listdir(path.join(
+            self.tempdir.name, 'dumps'))), 2)
@@ -0,0 +1,51 @@
+# coding=utf-8
+import unittest
+
+from pg_lifecycle import graph
+
+
+class GraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # 0 <- 1 <- 3, 0 <- 2 <- 3, 4 independent
+        self.graph = graph.Graph([[], [0], [0], [1, 2, 2], []])
+
+    def test_order(self):
+        self.assertEqual(self.graph.order(), [0, 4, 1, 2, 3])
+
+    def test_levels(self):
+        self.assertEqual(list(self.graph.levels()), [0, 1, 1, 2, 0])
+
+    def test_waves(self):
+        self.assertEqual(self.graph.waves(), [[0, 4], [1, 2], [3]])
+
+    def test_parents_and_children(self):
+        self.assertEqual(list(self.graph.parents(3)), [1, 2])
+        self.assertEqual(list(self.graph.children(0)), [1, 2])
+        self.assertEqual(list(self.graph.children(4)), [])
+
+    def test_ancestors_and_descendants(self):
+        self.assertEqual(list(self.graph.ancestors([3])), [0, 1, 2])
+        self.assertEqual(list(self.graph.descendants([1])), [3])
+        self.assertEqual(list(self.graph.descendants([4])), [])
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(IndexError):
+            graph.Graph([[], [2]])
+
+    def test_from_dependencies(self):
+        value = graph.Graph.from_dependencies(
+            [10, 20, 30], [[20, 99], [20], [10, 20]])
+        self.assertEqual(value.order(), [1, 0, 2])
+        self.assertEqual([value.key(position) for position in value.order()],
+                         [20, 10, 30])
+
+    def test_cycle(self):
+        value = graph.Graph.from_dependencies(
+            [10, 20, 30, 40], [[], [40, 10], [20], [30]])
+        with self.assertRaises(graph.CycleError) as context:
+            value.order()
+        self.assertEqual(context.exception.cycle, [20, 40, 30, 20])
+        self.assertIn('20 -> 40 -> 30 -> 20', str(context.exception))
+        with self.assertRaises(graph.CycleError):
+            value.levels()
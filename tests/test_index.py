@@ -0,0 +1,66 @@
+# coding=utf-8
+import unittest
+
+from pg_lifecycle import common, index
+
+from tests import utils
+
+
+def entries():
+    """Return the entries for a schema, a table with a comment and an index
+    and a function.
+
+    """
+    value = utils.Dump()
+    schema = value.add(common.SCHEMA, 'app', 'CREATE SCHEMA app;\n')
+    table = value.add(common.TABLE, 'accounts', '', 'app', [schema])
+    value.add(common.FUNCTION, 'f()', '', 'app', [schema])
+    value.add(common.COMMENT, 'TABLE accounts', '', 'app', [table, schema])
+    value.add(common.INDEX, 'accounts_idx', '', 'app', [table, table],
+              common.POST_DATA)
+    value.add(common.COMMENT, 'SCHEMA public', '', '', [])
+    return value.entries
+
+
+class TOCIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = entries()
+        self.index = index.TOCIndex(reversed(self.entries))
+
+    def dump_ids(self, values):
+        return [entry.dump_id for entry in values]
+
+    def test_contains(self):
+        self.assertIn(1, self.index)
+        self.assertNotIn(7, self.index)
+        self.assertEqual(len(self.index), 6)
+
+    def test_dependencies_of(self):
+        self.assertEqual(self.index.dependencies_of(4), [2, 1])
+        self.assertEqual(self.index.dependencies_of(7), [])
+
+    def test_dependents_of(self):
+        self.assertEqual(self.dump_ids(self.index.dependents_of(2)), [5, 4])
+        self.assertEqual(self.dump_ids(
+            self.index.dependents_of(2, {common.INDEX})), [5])
+        self.assertEqual(self.index.dependents_of(6), [])
+
+    def test_get(self):
+        self.assertEqual(self.dump_ids(self.index.get(common.COMMENT)),
+                         [6, 4])
+        self.assertEqual(self.index.get(common.VIEW), [])
+
+    def test_ordered(self):
+        self.assertEqual(self.dump_ids(self.index.ordered(self.entries)),
+                         [6, 5, 4, 3, 2, 1])
+
+    def test_prefixed(self):
+        self.assertEqual(self.dump_ids(self.index.prefixed('COMM')), [6, 4])
+
+    def test_public_schema(self):
+        self.assertEqual(self.dump_ids(self.index.public_schema), [6])
+
+    def test_select(self):
+        self.assertEqual(self.dump_ids(self.index.select(
+            common.SCHEMA, common.COMMENT, common.TABLE)), [6, 4, 2, 1])
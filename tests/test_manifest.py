@@ -0,0 +1,94 @@
+# coding=utf-8
+from os import path
+import pickle
+import tempfile
+import unittest
+
+from pg_lifecycle import generate, manifest
+
+
+def files():
+    return [
+        generate.DDLFile(3, 'tables/app/accounts.sql', {3, 7}, {1},
+                         'TABLE', 'app', 'accounts'),
+        generate.DDLFile(1, 'schemata/app.sql', set(), set(), 'SCHEMA', '',
+                         'app'),
+        generate.DDLFile(2, 'functions/app/f.sql', {2}, {1, 3},
+                         'FUNCTION', 'app', 'f()')]
+
+
+class ManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.file_path = path.join(self.tempdir.name, 'MANIFEST.pgl')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def assertManifest(self, value):
+        self.assertEqual(len(value), 3)
+        self.assertEqual(list(value), [
+            manifest.Entry(3, 'tables/app/accounts.sql', 'TABLE', 'app',
+                           'accounts', (3, 7), (1,)),
+            manifest.Entry(1, 'schemata/app.sql', 'SCHEMA', None, 'app',
+                           (), ()),
+            manifest.Entry(2, 'functions/app/f.sql', 'FUNCTION', 'app',
+                           'f()', (2,), (1, 3))])
+        self.assertEqual(value.get(2).path, 'functions/app/f.sql')
+        self.assertIsNone(value.get(4))
+        self.assertEqual(value.find('schemata/app.sql').id, 1)
+        self.assertIsNone(value.find('schemata/other.sql'))
+        self.assertEqual(value.offset(3), 0)
+        self.assertEqual(value.path(2), 'functions/app/f.sql')
+        self.assertEqual(tuple(value.dependencies(2)), (1, 3))
+        self.assertEqual(tuple(value.includes(0)), (3, 7))
+
+    def test_round_trip(self):
+        self.assertManifest(manifest.Manifest(manifest.dumps(files())))
+
+    def test_open(self):
+        manifest.write(self.file_path, files())
+        with manifest.Manifest.open(self.file_path) as value:
+            self.assertManifest(value)
+
+    def test_out_of_range(self):
+        value = manifest.Manifest(manifest.dumps(files()))
+        with self.assertRaises(IndexError):
+            value[3]
+
+    def test_invalid_header(self):
+        with self.assertRaises(ValueError):
+            manifest.Manifest(b'XXXX' + manifest.dumps(files())[4:])
+
+    def test_unsupported_version(self):
+        value = bytearray(manifest.dumps(files()))
+        value[4:6] = (manifest.VERSION + 1).to_bytes(2, 'little')
+        with self.assertRaises(ValueError):
+            manifest.Manifest(bytes(value))
+
+    def test_open_legacy(self):
+        with open(self.file_path, 'wb') as handle:
+            pickle.dump(files(), handle)
+        with manifest.Manifest.open(self.file_path) as value:
+            self.assertManifest(value)
+
+    def test_open_legacy_without_object(self):
+        value = generate.DDLFile(1, 'schemata/app.sql', set(), set())
+        for name in ['desc', 'namespace', 'tag']:
+            delattr(value, name)
+        with open(self.file_path, 'wb') as handle:
+            pickle.dump([value], handle)
+        with manifest.Manifest.open(self.file_path) as value:
+            self.assertEqual(list(value), [manifest.Entry(
+                1, 'schemata/app.sql', None, None, None, (), ())])
+
+    def test_convert_legacy(self):
+        with open(self.file_path, 'wb') as handle:
+            pickle.dump(files(), handle)
+        self.assertEqual(manifest.convert(self.file_path), 3)
+        with open(self.file_path, 'rb') as handle:
+            self.assertEqual(handle.read(4), manifest.MAGIC)
+        with manifest.Manifest.open(self.file_path) as value:
+            self.assertManifest(value)
+        self.assertEqual(manifest.convert(self.file_path), 0)
@@ -0,0 +1,213 @@
+# coding=utf-8
+import io
+import json
+import os
+from os import path
+import tempfile
+import unittest
+from unittest import mock
+
+from pg_lifecycle import cli, metrics
+
+from tests import utils
+
+FILES = [
+    (1, 'schemata/app.sql', 'CREATE SCHEMA app;\n', [], []),
+    (2, 'tables/app/a.sql', 'CREATE TABLE app.a ();\n', [], [1]),
+    (3, 'views/app/v.sql', 'CREATE VIEW app.v AS SELECT 1;\n', [], [2])]
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.metrics = metrics.Metrics()
+        self.metrics.enable('build')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def record(self):
+        with self.metrics.phase('assemble'):
+            with self.metrics.phase('order'):
+                pass
+            with self.metrics.phase('order'):
+                pass
+        self.metrics.count('files_written', 2)
+        self.metrics.count('files_written')
+        self.metrics.count('objects', 4, desc='TABLE')
+        self.metrics.count('objects', 1, desc='"x"\\\n')
+
+    def test_disabled(self):
+        value = metrics.Metrics()
+        with value.phase('assemble'):
+            value.count('files_written')
+        self.assertEqual(value.phases, {})
+        self.assertEqual(value.counters, {})
+
+    def test_phases(self):
+        self.record()
+        self.assertEqual(
+            [(value.name, value.parent, value.calls)
+             for value in self.metrics.phases.values()],
+            [('assemble', None, 1), ('order', 'assemble', 2)])
+        assemble, order = self.metrics.phases.values()
+        self.assertGreaterEqual(assemble.wall, order.wall)
+        self.assertGreater(order.max_rss, 0)
+
+    def test_counters(self):
+        self.record()
+        self.assertEqual(self.metrics.as_dict()['counters'], [
+            {'name': 'files_written', 'labels': {}, 'value': 3},
+            {'name': 'objects', 'labels': {'desc': 'TABLE'}, 'value': 4},
+            {'name': 'objects', 'labels': {'desc': '"x"\\\n'}, 'value': 1}])
+
+    def test_summary(self):
+        self.record()
+        lines = self.metrics.summary().splitlines()
+        self.assertRegex(
+            lines[0], r'^build took \d+\.\d{3}s wall, \d+\.\d{3}s CPU, '
+                      r'\d+\.\d MB peak$')
+        self.assertRegex(
+            lines[1], r'^  assemble {29} {6}1 calls +\d+\.\d{3}s wall '
+                      r'+\d+\.\d{3}s CPU$')
+        self.assertRegex(lines[2], r'^  order {32} {6}2 calls ')
+        self.assertEqual(lines[3:], [
+            '  files_written                              3',
+            '  objects{desc="TABLE"}                      4',
+            '  objects{desc="\\"x\\"\\\\\\n"}                  1'])
+
+    def test_prometheus(self):
+        self.record()
+        lines = self.metrics.prometheus().splitlines()
+        self.assertEqual(lines[:2], [
+            '# HELP pg_lifecycle_wall_seconds Wall time of the command',
+            '# TYPE pg_lifecycle_wall_seconds gauge'])
+        self.assertRegex(
+            lines[2], r'^pg_lifecycle_wall_seconds\{command="build"\} '
+                      r'\d+\.\d+$')
+        self.assertIn('pg_lifecycle_phase_calls{command="build",'
+                      'phase="order"} 2', lines)
+        self.assertEqual(lines[-7:], [
+            '# HELP pg_lifecycle_files_written Project files written',
+            '# TYPE pg_lifecycle_files_written gauge',
+            'pg_lifecycle_files_written{command="build"} 3',
+            '# HELP pg_lifecycle_objects Table of contents entries of each '
+            'type',
+            '# TYPE pg_lifecycle_objects gauge',
+            'pg_lifecycle_objects{command="build",desc="TABLE"} 4',
+            'pg_lifecycle_objects{command="build",desc="\\"x\\"\\\\\\n"} 1'])
+
+    def test_write(self):
+        self.record()
+        file_path = path.join(self.tempdir.name, 'metrics.json')
+        self.metrics.write(file_path)
+        with open(file_path) as handle:
+            value = json.load(handle)
+        self.assertEqual(value['command'], 'build')
+        self.assertEqual([phase['name'] for phase in value['phases']],
+                         ['assemble', 'order'])
+        file_path = path.join(self.tempdir.name, 'metrics.prom')
+        self.metrics.write(file_path, 'prometheus')
+        with open(file_path) as handle:
+            self.assertIn('pg_lifecycle_files_written{command="build"} 3\n',
+                          handle.read())
+        self.assertEqual(sorted(os.listdir(self.tempdir.name)),
+                         ['metrics.json', 'metrics.prom'])
+
+
+class CommandMetricsTestCase(unittest.TestCase):
+    """Runs the build and compare commands through the cli with the
+    metrics options.
+
+    """
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = path.join(self.tempdir.name, 'project')
+        utils.write_project(self.project_path, FILES)
+        metrics._METRICS.__init__()
+
+    def tearDown(self):
+        metrics._METRICS.__init__()
+        self.tempdir.cleanup()
+
+    def run_cli(self, *arguments):
+        stderr = io.StringIO()
+        with mock.patch('sys.argv', ['pg-lifecycle'] + list(arguments)), \
+                mock.patch.object(metrics.sys, 'stderr', stderr), \
+                mock.patch.object(cli, 'configure_logging'):
+            cli.run()
+        return stderr.getvalue()
+
+    def build(self, *arguments):
+        return self.run_cli(*(list(arguments) + [
+            'build', '--project', self.project_path,
+            path.join(self.tempdir.name, 'output.sql')]))
+
+    def read(self, file_name):
+        with open(path.join(self.tempdir.name, file_name)) as handle:
+            return handle.read()
+
+    def test_not_enabled(self):
+        self.assertEqual(self.build(), '')
+        self.assertFalse(metrics._METRICS.enabled)
+        self.assertEqual(metrics._METRICS.phases, {})
+        self.assertEqual(metrics._METRICS.counters, {})
+
+    def test_profile(self):
+        lines = self.build('--profile').splitlines()
+        self.assertTrue(lines[0].startswith('build took '))
+        self.assertEqual([line.split()[0] for line in lines[1:]], [
+            'cache_check', 'order', 'assemble', 'output', 'ddl_bytes',
+            'cache_hits', 'cache_misses'])
+        self.assertEqual(lines[-3].split(), [
+            'ddl_bytes', str(len(self.read('output.sql')))])
+        self.assertEqual(lines[-1].split(), ['cache_misses', '4'])
+
+    def test_metrics_file(self):
+        file_path = path.join(self.tempdir.name, 'metrics.json')
+        self.assertEqual(self.build('--metrics-file', file_path), '')
+        value = json.loads(self.read('metrics.json'))
+        self.assertEqual(value['command'], 'build')
+        self.assertEqual(
+            [(phase['name'], phase['parent'], phase['calls'])
+             for phase in value['phases']],
+            [('cache_check', None, 1), ('order', None, 1),
+             ('assemble', None, 1), ('output', None, 1)])
+        self.assertEqual(value['counters'][1:], [
+            {'name': 'cache_hits', 'labels': {}, 'value': 0},
+            {'name': 'cache_misses', 'labels': {}, 'value': 4}])
+
+    def test_cached_build(self):
+        self.build()
+        file_path = path.join(self.tempdir.name, 'metrics.json')
+        self.build('--metrics-file', file_path)
+        value = json.loads(self.read('metrics.json'))
+        self.assertEqual([phase['name'] for phase in value['phases']],
+                         ['cache_check', 'output'])
+        self.assertEqual(value['counters'], [
+            {'name': 'cache_hits', 'labels': {}, 'value': 4},
+            {'name': 'cache_misses', 'labels': {}, 'value': 0}])
+
+    def test_metrics_file_is_written_on_failure(self):
+        file_path = path.join(self.tempdir.name, 'metrics.json')
+        with self.assertRaises(SystemExit):
+            self.run_cli('--metrics-file', file_path, 'compare',
+                         self.project_path,
+                         path.join(self.tempdir.name, 'missing'))
+        self.assertEqual(json.loads(self.read('metrics.json'))['command'],
+                         'compare')
+
+    def test_prometheus(self):
+        file_path = path.join(self.tempdir.name, 'metrics.prom')
+        self.run_cli('--metrics-file', file_path, '--metrics-format',
+                     'prometheus', 'compare', self.project_path,
+                     self.project_path)
+        lines = self.read('metrics.prom').splitlines()
+        self.assertIn('pg_lifecycle_phase_calls{command="compare",'
+                      'phase="tree"} 2', lines)
+        self.assertEqual(lines[-3:], [
+            '# HELP pg_lifecycle_files_hashed Project files hashed by a '
+            'compare',
+            '# TYPE pg_lifecycle_files_hashed gauge',
+            'pg_lifecycle_files_hashed{command="compare"} 3'])
@@ -0,0 +1,202 @@
+# coding=utf-8
+import argparse
+from os import path
+import tempfile
+import unittest
+
+from pg_lifecycle import build, common, manifest, partitions, project
+
+from tests import utils
+
+ATTACH = """\
+ALTER TABLE ONLY app.events ATTACH PARTITION app.{0} FOR VALUES FROM \
+('{1}-01-01') TO ('{2}-01-01');
+"""
+
+PARTITION = """\
+CREATE TABLE app.{0} (
+    id integer NOT NULL,
+    created date NOT NULL
+);
+"""
+
+PRIMARY_KEY = """\
+ALTER TABLE ONLY app.{0}
+    ADD CONSTRAINT {0}_pkey PRIMARY KEY (id, created);
+"""
+
+TEMPLATE = """\
+-- DDL for app.{{name}}
+
+CREATE TABLE app.{{name}} (
+    id integer NOT NULL,
+    created date NOT NULL
+);
+
+-- TABLE ATTACHs for app.{{name}}
+
+ALTER TABLE ONLY app.events ATTACH PARTITION app.{{name}} {{bound}};
+"""
+
+
+class PartitionsTestCase(unittest.TestCase):
+
+    BOUND = "FOR VALUES FROM ('2020-01-01') TO ('2021-01-01')"
+
+    def content(self, name):
+        return partitions.render(TEMPLATE, name, self.BOUND)
+
+    def test_bound_of_attach(self):
+        self.assertEqual(
+            partitions.bound(ATTACH.format('events_2020', 2020, 2021)),
+            ('app.events', self.BOUND))
+        self.assertEqual(partitions.bound(
+            'ALTER TABLE ONLY app.events ATTACH PARTITION app.events_other '
+            'DEFAULT;\n'), ('app.events', 'DEFAULT'))
+
+    def test_bound_of_partition_of(self):
+        self.assertEqual(partitions.bound(
+            'CREATE TABLE app.events_2020 PARTITION OF app.events (\n'
+            '    CONSTRAINT positive CHECK (id > 0)\n)\n'
+            '{};\n'.format(self.BOUND)), ('app.events', self.BOUND))
+        self.assertEqual(partitions.bound(
+            'CREATE TABLE app.events_2020 PARTITION OF app.events\n'
+            '{}\nPARTITION BY LIST (id);\n'.format(self.BOUND)),
+            ('app.events', self.BOUND))
+
+    def test_not_a_partition(self):
+        self.assertIsNone(partitions.bound(PARTITION.format('events')))
+
+    def test_template_round_trip(self):
+        content = self.content('events_2020')
+        self.assertEqual(partitions.template(
+            content, 'events_2020', self.BOUND), TEMPLATE)
+
+    def test_template_is_refused(self):
+        content = self.content('events_2020')
+        self.assertIsNone(partitions.template(
+            content + "COMMENT ON TABLE app.events_2020 IS '{{x}}';\n",
+            'events_2020', self.BOUND))
+        self.assertIsNone(partitions.template(
+            content + partitions.BOUNDS, 'events_2020', self.BOUND))
+
+    def test_split(self):
+        members = [('events_2020', self.BOUND), ('"Events"', 'DEFAULT')]
+        content = partitions.dumps('app.events', TEMPLATE, members)
+        self.assertTrue(content.startswith(
+            '-- Partition set for app.events\n\n'))
+        self.assertEqual(partitions.split(content), [
+            partitions.render(TEMPLATE, name, value)
+            for name, value in members])
+        self.assertEqual(partitions.split(TEMPLATE), [TEMPLATE])
+
+    def test_sections(self):
+        content = partitions.dumps('app.events', TEMPLATE, [
+            ('events_2020', self.BOUND), ('events_2021', 'DEFAULT')])
+        self.assertEqual(
+            [(child_type, ddl.strip().splitlines()[0])
+             for child_type, ddl in project.sections(content)], [
+                (None, '-- DDL for app.events_2020'),
+                (common.TABLE_ATTACH, 'ALTER TABLE ONLY app.events ATTACH '
+                                      'PARTITION app.events_2020 FOR VALUES '
+                                      "FROM ('2020-01-01') TO "
+                                      "('2021-01-01');"),
+                (None, '-- DDL for app.events_2021'),
+                (common.TABLE_ATTACH, 'ALTER TABLE ONLY app.events ATTACH '
+                                      'PARTITION app.events_2021 DEFAULT;')])
+
+
+class CollapsePartitionsTestCase(unittest.TestCase):
+    """Two partitions of app.events share the same file content and are
+    collapsed into a partition set, a third has an index of its own and is
+    written to its own file.
+
+    """
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        dump = utils.Dump()
+        schema = dump.add(common.SCHEMA, 'app', 'CREATE SCHEMA app;\n')
+        events = dump.add(
+            common.TABLE, 'events',
+            'CREATE TABLE app.events (\n    id integer NOT NULL,\n'
+            '    created date NOT NULL\n)\nPARTITION BY RANGE (created);\n',
+            'app', [schema])
+        self.members = {}
+        for year in [2020, 2021, 2022]:
+            name = 'events_{}'.format(year)
+            table = dump.add(common.TABLE, name, PARTITION.format(name),
+                             'app', [schema])
+            self.members[name] = [
+                table,
+                dump.add(common.TABLE_ATTACH, name,
+                         ATTACH.format(name, year, year + 1), 'app',
+                         [events, table]),
+                dump.add(common.CONSTRAINT, '{0} {0}_pkey'.format(name),
+                         PRIMARY_KEY.format(name), 'app', [table],
+                         common.POST_DATA)]
+        self.members['events_2022'].append(dump.add(
+            common.INDEX, 'events_2022_id_idx',
+            'CREATE INDEX events_2022_id_idx ON app.events_2022 USING btree '
+            '(id);\n', 'app', [self.members['events_2022'][0]],
+            common.POST_DATA))
+        self.collapsed = path.join(self.tempdir.name, 'collapsed')
+        self.expanded = path.join(self.tempdir.name, 'expanded')
+        utils.generate_project(self.collapsed, dump.reader(),
+                               collapse_partitions=True)
+        utils.generate_project(self.expanded, dump.reader())
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def build(self, project_path):
+        output_path = path.join(self.tempdir.name, 'output.sql')
+        build.Build(argparse.Namespace(
+            diff=False, file=output_path, no_cache=True,
+            project=project_path)).run()
+        with open(output_path) as handle:
+            return handle.read()
+
+    def read(self, project_path, file_path):
+        with open(path.join(project_path, file_path)) as handle:
+            return handle.read()
+
+    def test_files(self):
+        with manifest.Manifest.open(
+                path.join(self.collapsed, common.MANIFEST)) as value:
+            paths = sorted(value.path(offset)
+                           for offset in range(len(value)))
+            partition_set = value.get(self.members['events_2020'][0])
+            self.assertEqual(partition_set.path,
+                             'tables/app/events.partitions.sql')
+            self.assertEqual(
+                sorted(partition_set.includes),
+                sorted(self.members['events_2020'] +
+                       self.members['events_2021']))
+        self.assertEqual(paths, [
+            'schemata/app.sql', 'tables/app/events.partitions.sql',
+            'tables/app/events.sql', 'tables/app/events_2022.sql'])
+
+    def test_partition_set(self):
+        content = self.read(self.collapsed, 'tables/app/events.partitions.sql')
+        self.assertEqual(content.count('CREATE TABLE'), 1)
+        self.assertIn('CREATE TABLE app.{{name}} (', content)
+        self.assertTrue(content.endswith(
+            '\n-- Bounds\n\n'
+            '["events_2020", "FOR VALUES FROM (\'2020-01-01\') TO '
+            '(\'2021-01-01\')"]\n'
+            '["events_2021", "FOR VALUES FROM (\'2021-01-01\') TO '
+            '(\'2022-01-01\')"]\n'))
+
+    def test_partition_set_is_expanded(self):
+        value = project.Project(self.collapsed)
+        try:
+            expanded = value.expand('tables/app/events.partitions.sql')
+        finally:
+            value.close()
+        self.assertEqual(expanded, ''.join(
+            self.read(self.expanded, 'tables/app/{}.sql'.format(name))
+            for name in ['events_2020', 'events_2021']))
+
+    def test_build(self):
+        self.assertEqual(self.build(self.collapsed),
+                         self.build(self.expanded))
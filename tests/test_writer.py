@@ -0,0 +1,197 @@
+# coding=utf-8
+import os
+from os import path
+import tempfile
+import unittest
+from unittest import mock
+
+from pg_lifecycle import common, writer
+
+from tests import utils
+
+
+class WriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def read(self, file_path):
+        with open(path.join(self.project_path, file_path), 'rb') as handle:
+            return handle.read()
+
+    def test_files_are_written_through_the_pool(self):
+        value = writer.Writer(self.project_path, jobs=4)
+        for offset in range(0, 20):
+            value.add('tables/app/t{}.sql'.format(offset),
+                      'CREATE TABLE app.t{} ();\n'.format(offset))
+        value.add('schemata/app.sql', b'CREATE SCHEMA app;\n')
+        self.assertIsNone(value.executor)
+        self.assertEqual(value.flush(), 21)
+        self.assertIsNotNone(value.executor)
+        value.close()
+        self.assertIsNone(value.executor)
+        self.assertEqual(self.read('tables/app/t7.sql'),
+                         b'CREATE TABLE app.t7 ();\n')
+        self.assertEqual(self.read('schemata/app.sql'),
+                         b'CREATE SCHEMA app;\n')
+        self.assertEqual(len(os.listdir(
+            path.join(self.project_path, 'tables', 'app'))), 20)
+
+    def test_abort(self):
+        value = writer.Writer(self.project_path, jobs=4)
+        value.add('tables/app/t1.sql', 'CREATE TABLE app.t1 ();\n')
+        value.add('tables/app/t2.sql', 'CREATE TABLE app.t2 ();\n')
+        value.flush()
+        value.add('tables/app/t3.sql', 'CREATE TABLE app.t3 ();\n')
+        value.abort()
+        self.assertIsNone(value.executor)
+        self.assertEqual(value.pending, [])
+        self.assertEqual(sorted(os.listdir(
+            path.join(self.project_path, 'tables', 'app'))),
+            ['t1.sql', 't2.sql'])
+
+    def test_directories_are_listed_once(self):
+        value = writer.Writer(self.project_path)
+        with mock.patch('os.listdir', wraps=os.listdir) as listdir:
+            for offset in range(0, 5):
+                value.add('tables/app/t{}.sql'.format(offset), '')
+                value.add('views/app/v{}.sql'.format(offset), '')
+        self.assertEqual(
+            sorted(call[0][0] for call in listdir.call_args_list),
+            [path.join(self.project_path, 'tables', 'app'),
+             path.join(self.project_path, 'views', 'app')])
+        value.close()
+        self.assertTrue(path.isdir(path.join(self.project_path, 'views',
+                                             'app')))
+
+    def test_existing_path(self):
+        os.makedirs(path.join(self.project_path, 'schemata'))
+        with open(path.join(self.project_path, 'schemata', 'app.sql'),
+                  'w') as handle:
+            handle.write('CREATE SCHEMA app;\n')
+        value = writer.Writer(self.project_path)
+        with self.assertRaises(ValueError):
+            value.add('schemata/app.sql', 'CREATE SCHEMA other;\n')
+        value.add('schemata/other.sql', 'CREATE SCHEMA other;\n')
+        with self.assertRaises(ValueError):
+            value.add('schemata/other.sql', 'CREATE SCHEMA other;\n')
+        value.close()
+        self.assertEqual(self.read('schemata/app.sql'),
+                         b'CREATE SCHEMA app;\n')
+
+    def test_max_pending(self):
+        value = writer.Writer(self.project_path, jobs=2, max_pending=3)
+        for offset in range(0, 7):
+            value.add('tables/app/t{}.sql'.format(offset), '')
+        self.assertEqual(len(value.pending), 1)
+        self.assertEqual(len(os.listdir(
+            path.join(self.project_path, 'tables', 'app'))), 6)
+        value.close()
+        self.assertEqual(value.pending, [])
+
+
+class UpdateWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = self.tempdir.name
+        utils.write_project(self.project_path, [
+            (1, 'schemata/app.sql', 'CREATE SCHEMA app;\n', [], []),
+            (2, 'tables/app/a.sql', 'CREATE TABLE app.a ();\n', [], [1]),
+            (3, 'views/app/v.sql', 'CREATE VIEW app.v AS SELECT 1;\n', [],
+             [1])])
+        self.stamps = {file_path: self.stat(file_path) for file_path in
+                       ['schemata/app.sql', 'tables/app/a.sql']}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def read(self, file_path):
+        with open(path.join(self.project_path, file_path)) as handle:
+            return handle.read()
+
+    def stat(self, file_path):
+        return os.stat(path.join(self.project_path, file_path)).st_mtime_ns
+
+    def update(self, files):
+        value = writer.UpdateWriter(self.project_path)
+        for file_path, content in files:
+            value.add(file_path, content)
+        value.add(common.MANIFEST, b'')
+        value.close()
+        return value
+
+    def test_update(self):
+        value = self.update([
+            ('schemata/app.sql', 'CREATE SCHEMA app;\n'),
+            ('tables/app/a.sql', 'CREATE TABLE app.a (id integer);\n'),
+            ('tables/app/b.sql', 'CREATE TABLE app.b ();\n')])
+        self.assertEqual(value.added, ['tables/app/b.sql'])
+        self.assertEqual(value.changed, ['tables/app/a.sql'])
+        self.assertEqual(value.removed, ['views/app/v.sql'])
+        self.assertEqual(value.unchanged, 1)
+        self.assertTrue(value.manifest_changed)
+        self.assertEqual(value.summary(),
+                         '1 added, 1 changed, 1 removed and 1 unchanged '
+                         'files, manifest rewritten')
+        self.assertEqual(self.stat('schemata/app.sql'),
+                         self.stamps['schemata/app.sql'])
+        self.assertEqual(self.read('tables/app/a.sql'),
+                         'CREATE TABLE app.a (id integer);\n')
+        self.assertEqual(self.read('tables/app/b.sql'),
+                         'CREATE TABLE app.b ();\n')
+
+    def test_empty_directories_are_removed(self):
+        os.makedirs(path.join(self.project_path, 'views', 'other'))
+        self.update([('schemata/app.sql', 'CREATE SCHEMA app;\n')])
+        self.assertFalse(path.exists(
+            path.join(self.project_path, 'views', 'app')))
+        self.assertFalse(path.exists(
+            path.join(self.project_path, 'tables', 'app')))
+        self.assertTrue(path.isdir(path.join(self.project_path, 'views')))
+        self.assertTrue(path.isdir(
+            path.join(self.project_path, 'views', 'other')))
+
+    def test_duplicate_path(self):
+        value = writer.UpdateWriter(self.project_path)
+        value.add('schemata/app.sql', 'CREATE SCHEMA app;\n')
+        with self.assertRaises(ValueError):
+            value.add('schemata/app.sql', 'CREATE SCHEMA app;\n')
+        value.close()
+
+
+class GenerateUpdateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_path = path.join(self.tempdir.name, 'project')
+        self.dump = utils.Dump()
+        self.dump.add(common.SCHEMA, 'app', 'CREATE SCHEMA app;\n')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def stamps(self):
+        values = {}
+        for dir_path, _dirs, files in os.walk(self.project_path):
+            for name in files:
+                file_path = path.join(dir_path, name)
+                values[path.relpath(file_path, self.project_path)] = \
+                    os.stat(file_path).st_mtime_ns
+        return values
+
+    def test_unchanged_files_are_not_rewritten(self):
+        utils.generate_project(self.project_path, self.dump.reader(),
+                               schema=['app'])
+        expectation = self.stamps()
+        self.assertIn(common.SCOPE, expectation)
+        utils.generate_project(self.project_path, self.dump.reader(),
+                               schema=['app'], update=True)
+        values = self.stamps()
+        for file_path in [common.MANIFEST, common.SCOPE, 'schemata/app.sql']:
+            self.assertEqual(values[file_path], expectation[file_path],
+                             file_path)
@@ -0,0 +1,84 @@
+# coding=utf-8
+"""
+Test Helpers
+
+"""
+import argparse
+import collections
+import importlib.util
+import os
+from os import path
+
+from pgdumplib import toc
+
+from pg_lifecycle import common, generate, manifest
+
+BENCHMARKS = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                       'benchmarks')
+
+Reader = collections.namedtuple(
+    'Reader', ['dump_version', 'server_version', 'toc'])
+ToC = collections.namedtuple('ToC', ['entries'])
+
+
+class Dump:
+    """Table of contents entries for a dump, in the format pg_dump writes"""
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, desc, tag, defn, namespace='', dependencies=(),
+            section=common.PRE_DATA, drop=''):
+        """Add an entry, returning its dump_id"""
+        dump_id = len(self.entries) + 1
+        self.entries.append(toc.Entry(
+            dump_id, 0, '0', '0', tag, desc, section, defn, drop, '',
+            namespace, '', 'postgres', False, list(dependencies)))
+        return dump_id
+
+    def reader(self):
+        """Return a stand-in for a dump reader of the entries"""
+        return Reader('16.4', '16.4', ToC(self.entries))
+
+
+def benchmark(name):
+    """Import and return the benchmark module, for its synthetic dumps"""
+    spec = importlib.util.spec_from_file_location(
+        'benchmarks.{}'.format(name), path.join(BENCHMARKS, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_project(project_path, reader, **kwargs):
+    """Generate a project from the dump reader, or the dump passed as
+    ``from_dump`` if the reader is ``None``, without running pg_dump
+
+    """
+    values = {'archive': False, 'collapse_partitions': False,
+              'dump_cache': False, 'force': True, 'from_dump': None,
+              'gitkeep': False, 'jobs': 1, 'remove_empty': False,
+              'streaming': False, 'update': False}
+    values.update(kwargs)
+    generator = generate.Generate(
+        argparse.Namespace(dest=[project_path], **values))
+    if reader is not None:
+        generator.dump_reader = reader
+        generator._prepare_dump = lambda: None
+    generator.run()
+
+
+def write_project(project_path, files):
+    """Write a project with the given files and its manifest. Each file is
+    a tuple of the dump_id, path, content, includes and dependencies.
+
+    """
+    values = []
+    for dump_id, file_path, content, includes, dependencies in files:
+        os.makedirs(path.join(project_path, path.dirname(file_path)),
+                    exist_ok=True)
+        with open(path.join(project_path, file_path), 'w') as handle:
+            handle.write(content)
+        values.append(generate.DDLFile(
+            dump_id, file_path, set(includes), set(dependencies)))
+    manifest.write(path.join(project_path, common.MANIFEST), values)